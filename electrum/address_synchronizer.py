@@ -25,7 +25,7 @@ import asyncio
 import threading
 import asyncio
 import itertools
-from collections import defaultdict
+from collections import defaultdict, deque
 from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequence, List
 
 from . import bitcoin
@@ -65,6 +65,11 @@ class HistoryItem(NamedTuple):
     balance: Optional[int]
 
 
+class HistoryChanges(NamedTuple):
+    txids: Set[str]
+    addresses: Set[str]
+
+
 class AddressSynchronizer(Logger):
     """
     inherited by wallet
@@ -89,6 +94,13 @@ class AddressSynchronizer(Logger):
         self.threadlocal_cache = threading.local()
 
         self._get_addr_balance_cache = {}
+        # bumped whenever transactions, heights or timestamps in the history change
+        self._history_version = 0
+        # recent changes, as (version, txid, addresses). Older changes are forgotten,
+        # below _history_changes_floor we do not know what changed.
+        self._history_changes = deque(maxlen=10000)
+        self._history_changes_floor = 0
+        self._history_changes_lock = threading.Lock()
 
         self.load_and_cleanup()
 
@@ -367,9 +379,11 @@ class AddressSynchronizer(Logger):
                     # make tx local
                     self.unverified_tx.pop(tx_hash, None)
                     self.db.remove_verified_tx(tx_hash)
+                    self._bump_history_version(txid=tx_hash)
                     if self.verifier:
                         self.verifier.remove_spv_proof_for_tx(tx_hash)
             self.db.set_addr_history(addr, hist)
+            self._bump_history_version(addresses=[addr])
 
         for tx_hash, tx_height in hist:
             # add it in case it was previously unconfirmed
@@ -416,6 +430,7 @@ class AddressSynchronizer(Logger):
         with self.lock:
             with self.transaction_lock:
                 self.db.clear_history()
+                self._bump_history_version(unknown_changes=True)
 
     def get_txpos(self, tx_hash):
         """Returns (height, txpos) tuple, even if the tx is unverified."""
@@ -490,7 +505,9 @@ class AddressSynchronizer(Logger):
 
     def _add_tx_to_local_history(self, txid):
         with self.transaction_lock:
-            for addr in itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid)):
+            addresses = list(itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid)))
+            self._bump_history_version(txid=txid, addresses=addresses)
+            for addr in addresses:
                 cur_hist = self._history_local.get(addr, set())
                 cur_hist.add(txid)
                 self._history_local[addr] = cur_hist
@@ -498,7 +515,9 @@ class AddressSynchronizer(Logger):
 
     def _remove_tx_from_local_history(self, txid):
         with self.transaction_lock:
-            for addr in itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid)):
+            addresses = list(itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid)))
+            self._bump_history_version(txid=txid, addresses=addresses)
+            for addr in addresses:
                 cur_hist = self._history_local.get(addr, set())
                 try:
                     cur_hist.remove(txid)
@@ -507,6 +526,46 @@ class AddressSynchronizer(Logger):
                 else:
                     self._history_local[addr] = cur_hist
 
+    def _bump_history_version(self, *, txid: str = None, addresses: Sequence[str] = (),
+                              unknown_changes: bool = False) -> None:
+        with self._history_changes_lock:
+            self._history_version += 1
+            version = self._history_version
+            if unknown_changes:
+                self._history_changes.clear()
+                self._history_changes_floor = version
+                return
+            if len(self._history_changes) == self._history_changes.maxlen:
+                self._history_changes_floor = self._history_changes[0][0]
+            self._history_changes.append((version, txid, tuple(addresses)))
+
+    def get_history_version(self) -> int:
+        """Changes whenever the history may have changed.
+        Use it to invalidate caches derived from the whole history.
+        """
+        return self._history_version
+
+    def get_history_changes_since(self, version: int) -> Optional[HistoryChanges]:
+        """Returns the txids and addresses whose history changed after
+        the given history version, or None if that is not known anymore.
+        Changes to a txid also count as changes to its addresses.
+        """
+        with self._history_changes_lock:
+            if version < self._history_changes_floor:
+                return None
+            changes = [c for c in self._history_changes if c[0] > version]
+        txids = set()
+        addresses = set()
+        for _version, txid, addrs in changes:
+            addresses.update(addrs)
+            if txid is not None:
+                txids.add(txid)
+        with self.transaction_lock:
+            for txid in txids:
+                addresses.update(self.db.get_txi_addresses(txid))
+                addresses.update(self.db.get_txo_addresses(txid))
+        return HistoryChanges(txids=txids, addresses=addresses)
+
     def _mark_address_history_changed(self, addr: str) -> None:
         # history for this address changed, wake up coroutines:
         self._address_history_changed_events[addr].set()
@@ -527,24 +586,30 @@ class AddressSynchronizer(Logger):
             if tx_height in (TX_HEIGHT_UNCONFIRMED, TX_HEIGHT_UNCONF_PARENT):
                 with self.lock:
                     self.db.remove_verified_tx(tx_hash)
+                    self._bump_history_version(txid=tx_hash)
                 if self.verifier:
                     self.verifier.remove_spv_proof_for_tx(tx_hash)
         else:
             with self.lock:
                 # tx will be verified only if height > 0
                 self.unverified_tx[tx_hash] = tx_height
+                self._bump_history_version(txid=tx_hash)
+            if self.verifier:
+                self.verifier.wake_up()
 
     def remove_unverified_tx(self, tx_hash, tx_height):
         with self.lock:
             new_height = self.unverified_tx.get(tx_hash)
             if new_height == tx_height:
                 self.unverified_tx.pop(tx_hash, None)
+                self._bump_history_version(txid=tx_hash)
 
     def add_verified_tx(self, tx_hash: str, info: TxMinedInfo):
         # Remove from the unverified map and add to the verified map
         with self.lock:
             self.unverified_tx.pop(tx_hash, None)
             self.db.add_verified_tx(tx_hash, info)
+            self._bump_history_version(txid=tx_hash)
         tx_mined_status = self.get_tx_height(tx_hash)
         self.network.trigger_callback('verified', self, tx_hash, tx_mined_status)
 
@@ -575,6 +640,7 @@ class AddressSynchronizer(Logger):
                         # a status update, that will overwrite it.
                         self.unverified_tx[tx_hash] = tx_height
                         txs.add(tx_hash)
+                        self._bump_history_version(txid=tx_hash)
         return txs
 
     def get_local_height(self) -> int:
@@ -31,6 +31,7 @@ from . import util
 from .bitcoin import hash_encode, int_to_hex, rev_hex
 from .crypto import sha256d
 from . import constants
+from . import metrics
 from .util import bfh, bh2u
 from .simple_config import SimpleConfig
 from .logging import get_logger, Logger
@@ -690,6 +691,7 @@ class Blockchain(Logger):
 
         return True
 
+    @metrics.timed('blockchain.connect_chunk')
     def connect_chunk(self, idx: int, hexdata: str) -> bool:
         assert idx >= 0, idx
         try:
@@ -698,6 +700,7 @@ class Blockchain(Logger):
             self.save_chunk(idx, data)
             return True
         except BaseException as e:
+            metrics.inc('blockchain.connect_chunk_failures')
             self.logger.info(f'verify_chunk idx {idx} failed: {repr(e)}')
             return False
 
@@ -35,10 +35,11 @@ import asyncio
 
 from .sql_db import SqlDB, sql
 from . import constants
+from . import metrics
 from .util import bh2u, profiler, get_headers_dir, bfh, is_ip_address, list_enabled_bits
 from .logging import Logger
-from .lnutil import LN_GLOBAL_FEATURES_KNOWN_SET, LNPeerAddr, format_short_channel_id, ShortChannelID
-from .lnverifier import LNChannelVerifier, verify_sig_for_channel_update
+from .lnutil import LN_GLOBAL_FEATURES_KNOWN_SET, LNPeerAddr, format_short_channel_id, ShortChannelID, FundingOutput
+from .lnverifier import LNChannelVerifier, FundingOutputWatcher, verify_sig_for_channel_update
 
 if TYPE_CHECKING:
     from .network import Network
@@ -202,6 +203,25 @@ capacity_sat INTEGER,
 PRIMARY KEY(short_channel_id)
 )"""
 
+# schema version, in PRAGMA user_version:
+#  1: funding_output has a txid column
+DB_VERSION = 1
+
+create_funding_output = """
+CREATE TABLE IF NOT EXISTS funding_output (
+short_channel_id VARCHAR(64),
+txid VARCHAR(64) NOT NULL,
+script VARCHAR(128) NOT NULL,
+value_sat INTEGER NOT NULL,
+PRIMARY KEY(short_channel_id)
+)"""
+
+create_spent_channel = """
+CREATE TABLE IF NOT EXISTS spent_channel (
+short_channel_id VARCHAR(64),
+PRIMARY KEY(short_channel_id)
+)"""
+
 create_policy = """
 CREATE TABLE IF NOT EXISTS policy (
 key VARCHAR(66),
@@ -246,6 +266,7 @@ class ChannelDB(SqlDB):
         self.num_channels = 0
         self._channel_updates_for_private_channels = {}  # type: Dict[Tuple[bytes, bytes], dict]
         self.ca_verifier = LNChannelVerifier(network, self)
+        self.funding_watcher = FundingOutputWatcher(network, self)
         # initialized in load_data
         self._channels = {}  # type: Dict[bytes, ChannelInfo]
         self._policies = {}
@@ -253,6 +274,10 @@ class ChannelDB(SqlDB):
         # node_id -> (host, port, ts)
         self._addresses = defaultdict(set)  # type: Dict[bytes, Set[Tuple[str, int, int]]]
         self._channels_for_node = defaultdict(set)
+        # funding outputs verified by ca_verifier, and watched by funding_watcher
+        self._funding_outputs = {}  # type: Dict[ShortChannelID, FundingOutput]
+        # channels whose funding output was spent
+        self._spent_channels = set()  # type: Set[ShortChannelID]
         self.data_loaded = asyncio.Event()
         self.network = network # only for callback
 
@@ -260,6 +285,9 @@ class ChannelDB(SqlDB):
         self.num_nodes = len(self._nodes)
         self.num_channels = len(self._channels)
         self.num_policies = len(self._policies)
+        metrics.set_gauge('channel_db.nodes', self.num_nodes)
+        metrics.set_gauge('channel_db.channels', self.num_channels)
+        metrics.set_gauge('channel_db.policies', self.num_policies)
         self.network.trigger_callback('channel_db', self.num_nodes, self.num_channels, self.num_policies)
 
     def get_channel_ids(self):
@@ -300,14 +328,18 @@ class ChannelDB(SqlDB):
     #       even slower; especially as servers will start throttling us.
     #       It would probably put significant strain on servers if all clients
     #       verified the complete gossip.
+    @metrics.timed('gossip.add_channel_announcement')
     def add_channel_announcement(self, msg_payloads, *, trusted=True):
         if type(msg_payloads) is dict:
             msg_payloads = [msg_payloads]
+        metrics.inc('gossip.messages', len(msg_payloads), type='channel_announcement')
         added = 0
         for msg in msg_payloads:
             short_channel_id = ShortChannelID(msg['short_channel_id'])
             if short_channel_id in self._channels:
                 continue
+            if short_channel_id in self._spent_channels:
+                continue
             if constants.net.rev_genesis_bytes() != msg['chain_hash']:
                 self.logger.info("ChanAnn has unexpected chain_hash {}".format(bh2u(msg['chain_hash'])))
                 continue
@@ -353,6 +385,7 @@ class ChannelDB(SqlDB):
         if old_policy.message_flags != new_policy.message_flags:
             self.logger.info(f'message_flags: {old_policy.message_flags} -> {new_policy.message_flags}')
 
+    @metrics.timed('gossip.add_channel_updates')
     def add_channel_updates(self, payloads, max_age=None, verify=True) -> CategorizedChannelUpdates:
         orphaned = []
         expired = []
@@ -395,6 +428,11 @@ class ChannelDB(SqlDB):
             self.save_policy(policy)
         #
         self.update_counts()
+        metrics.inc('gossip.messages', len(payloads), type='channel_update')
+        metrics.inc('gossip.channel_updates', len(good), result='good')
+        metrics.inc('gossip.channel_updates', len(orphaned), result='orphaned')
+        metrics.inc('gossip.channel_updates', len(expired), result='expired')
+        metrics.inc('gossip.channel_updates', len(deprecated), result='deprecated')
         return CategorizedChannelUpdates(
             orphaned=orphaned,
             expired=expired,
@@ -414,8 +452,23 @@ class ChannelDB(SqlDB):
         c.execute(create_address)
         c.execute(create_policy)
         c.execute(create_channel_info)
+        self.upgrade_database(c)
+        c.execute(create_funding_output)
+        c.execute(create_spent_channel)
+        c.execute(f"PRAGMA user_version = {DB_VERSION}")
         self.conn.commit()
 
+    def upgrade_database(self, c):
+        c.execute("PRAGMA user_version")
+        version = c.fetchone()[0]
+        if version < 1:
+            # funding outputs were first stored without their txid, which
+            # cannot be recovered: their channels are verified again
+            c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='funding_output'")
+            if c.fetchone():
+                c.execute("DELETE FROM channel_info WHERE short_channel_id IN (SELECT short_channel_id FROM funding_output)")
+                c.execute("DROP TABLE funding_output")
+
     @sql
     def save_policy(self, policy):
         c = self.conn.cursor()
@@ -437,6 +490,21 @@ class ChannelDB(SqlDB):
         c = self.conn.cursor()
         c.execute("""DELETE FROM channel_info WHERE short_channel_id=?""", (short_channel_id,))
 
+    @sql
+    def save_funding_output(self, short_channel_id, funding_output):
+        c = self.conn.cursor()
+        c.execute("REPLACE INTO funding_output (short_channel_id, txid, script, value_sat) VALUES (?,?,?,?)", (short_channel_id, *funding_output))
+
+    @sql
+    def delete_funding_output(self, short_channel_id):
+        c = self.conn.cursor()
+        c.execute("""DELETE FROM funding_output WHERE short_channel_id=?""", (short_channel_id,))
+
+    @sql
+    def save_spent_channel(self, short_channel_id):
+        c = self.conn.cursor()
+        c.execute("REPLACE INTO spent_channel (short_channel_id) VALUES (?)", (short_channel_id,))
+
     @sql
     def save_node(self, node_info):
         c = self.conn.cursor()
@@ -464,9 +532,11 @@ class ChannelDB(SqlDB):
         if not verify_sig_for_channel_update(payload, payload['start_node']):
             raise Exception(f'failed verifying channel update for {short_channel_id}')
 
+    @metrics.timed('gossip.add_node_announcement')
     def add_node_announcement(self, msg_payloads):
         if type(msg_payloads) is dict:
             msg_payloads = [msg_payloads]
+        metrics.inc('gossip.messages', len(msg_payloads), type='node_announcement')
         old_addr = None
         new_nodes = {}
         for msg_payload in msg_payloads:
@@ -546,6 +616,38 @@ class ChannelDB(SqlDB):
         # delete from database
         self.delete_channel(short_channel_id)
 
+    def get_funding_output(self, short_channel_id: ShortChannelID) -> Optional[FundingOutput]:
+        """Returns the funding output of the channel, if it was verified before."""
+        return self._funding_outputs.get(short_channel_id)
+
+    def get_funding_outputs(self) -> Dict[ShortChannelID, FundingOutput]:
+        return dict(self._funding_outputs)
+
+    def add_funding_output(self, short_channel_id: ShortChannelID, funding_output: FundingOutput) -> None:
+        self._funding_outputs[short_channel_id] = funding_output
+        self.save_funding_output(short_channel_id, funding_output)
+        self.funding_watcher.watch(short_channel_id, funding_output)
+
+    def is_channel_spent(self, short_channel_id: ShortChannelID) -> bool:
+        return short_channel_id in self._spent_channels
+
+    def remove_spent_channel(self, short_channel_id: ShortChannelID) -> None:
+        """The funding output of the channel was spent: the channel and
+        its policies are removed, and its announcements are ignored from
+        now on."""
+        self._spent_channels.add(short_channel_id)
+        self.save_spent_channel(short_channel_id)
+        if self._funding_outputs.pop(short_channel_id, None):
+            self.delete_funding_output(short_channel_id)
+        channel_info = self._channels.get(short_channel_id)
+        if channel_info:
+            for node_id in (channel_info.node1_id, channel_info.node2_id):
+                if self._policies.pop((node_id, short_channel_id), None):
+                    self.delete_policy(node_id, short_channel_id)
+            self.remove_channel(short_channel_id)
+        metrics.inc('channel_db.spent_channels')
+        self.update_counts()
+
     def get_node_addresses(self, node_id):
         return self._addresses.get(node_id)
 
@@ -562,6 +664,13 @@ class ChannelDB(SqlDB):
             x = (ShortChannelID.normalize(x[0]), *x[1:])
             ci = ChannelInfo(*x)
             self._channels[ci.short_channel_id] = ci
+        c.execute("""SELECT short_channel_id, txid, script, value_sat FROM funding_output""")
+        for x in c:
+            short_channel_id, txid, script, value_sat = x
+            self._funding_outputs[ShortChannelID.normalize(short_channel_id)] = FundingOutput(txid, script, value_sat)
+        c.execute("""SELECT * FROM spent_channel""")
+        for x in c:
+            self._spent_channels.add(ShortChannelID.normalize(x[0]))
         c.execute("""SELECT * FROM node_info""")
         for x in c:
             ni = NodeInfo(*x)
@@ -0,0 +1,217 @@
+# Copyright (C) 2020 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+"""Execution of JSON-RPC commands in the daemon.
+
+Commands run concurrently. Those that only read a wallet share its
+lock, as do the few that modify it in a way that is safe with readers
+(see commands.Command). Other commands that may modify it hold it
+exclusively, and commands that do not use a wallet do not wait at all. Commands marked as CPU-heavy
+(see commands.Command) run in a pool of worker threads, so that they
+do not stall the event loop and the other clients.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Callable, Awaitable, Optional, TYPE_CHECKING
+
+from . import metrics
+from .logging import Logger
+from .util import UserFacingException
+
+if TYPE_CHECKING:
+    from .commands import Command
+    from .simple_config import SimpleConfig
+
+
+DEFAULT_WORKERS = 4
+DEFAULT_TIMEOUT = 600  # seconds
+
+
+class CommandTimeout(UserFacingException):
+    pass
+
+
+class ReadWriteLock:
+    """asyncio lock shared by readers, or held by a single writer.
+    Waiters are served in arrival order, so that a stream of readers
+    cannot starve a writer.
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._writer = False
+        self._waiters = deque()  # of (future, is_writer)
+
+    def _can_acquire(self, write: bool) -> bool:
+        if write:
+            return not self._writer and self._readers == 0
+        return not self._writer
+
+    async def acquire(self, *, write: bool) -> None:
+        if not self._waiters and self._can_acquire(write):
+            self._grant(write)
+            return
+        fut = asyncio.get_event_loop().create_future()
+        self._waiters.append((fut, write))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # granted while being cancelled
+                self.release(write=write)
+            else:
+                try:
+                    self._waiters.remove((fut, write))
+                except ValueError:
+                    pass  # already skipped by _wake_up
+                self._wake_up()
+            raise
+
+    def release(self, *, write: bool) -> None:
+        if write:
+            self._writer = False
+        else:
+            self._readers -= 1
+        self._wake_up()
+
+    def _grant(self, write: bool) -> None:
+        if write:
+            self._writer = True
+        else:
+            self._readers += 1
+
+    def _wake_up(self) -> None:
+        while self._waiters:
+            fut, write = self._waiters[0]
+            if fut.done():  # cancelled
+                self._waiters.popleft()
+                continue
+            if not self._can_acquire(write):
+                return
+            self._waiters.popleft()
+            self._grant(write)
+            fut.set_result(None)
+
+    def locked(self) -> bool:
+        return self._writer or self._readers > 0
+
+
+_in_command = contextvars.ContextVar('in_command', default=False)
+
+
+class CommandExecutor(Logger):
+
+    def __init__(self, config: 'SimpleConfig'):
+        Logger.__init__(self)
+        self.timeout = config.get('rpc_command_timeout', DEFAULT_TIMEOUT) or None
+        workers = config.get('rpc_workers', DEFAULT_WORKERS)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                           thread_name_prefix='rpc_worker')
+        self._thread_local = threading.local()
+        self._locks = weakref.WeakKeyDictionary()  # wallet -> ReadWriteLock
+        self._queued = 0
+        self._queued_by_command = {}
+
+    def get_lock(self, wallet) -> ReadWriteLock:
+        lock = self._locks.get(wallet)
+        if lock is None:
+            lock = self._locks[wallet] = ReadWriteLock()
+        return lock
+
+    async def run(self, cmd: 'Command', wallet, make_coro: Callable[[], Awaitable]):
+        """Runs the command coroutine returned by make_coro, holding the
+        lock of wallet, if any, and in a worker thread if the command is
+        CPU-heavy. Raises CommandTimeout if it does not complete in time.
+        """
+        if _in_command.get():
+            # called by another command, which holds the lock already
+            return await make_coro()
+        token = _in_command.set(True)
+        try:
+            return await self._run(cmd, wallet, make_coro)
+        finally:
+            _in_command.reset(token)
+
+    async def _run(self, cmd: 'Command', wallet, make_coro: Callable[[], Awaitable]):
+        loop = asyncio.get_event_loop()
+        t0 = time.perf_counter()
+        deadline = t0 + self.timeout if self.timeout else None
+        lock = self.get_lock(wallet) if wallet is not None else None
+        write = not cmd.shares_wallet_lock
+        self._set_queued(cmd, +1)
+        try:
+            if lock is not None:
+                await asyncio.wait_for(lock.acquire(write=write), self._remaining(deadline))
+        except asyncio.TimeoutError:
+            metrics.inc('rpc.timeouts', command=cmd.name)
+            raise CommandTimeout(f'{cmd.name}: timed out waiting for the wallet')
+        finally:
+            self._set_queued(cmd, -1)
+        t1 = time.perf_counter()
+        metrics.observe('rpc.wait', t1 - t0, command=cmd.name)
+
+        def release(*args):
+            if lock is not None:
+                lock.release(write=write)
+        # The lock is held until the command is actually over. Worker
+        # threads cannot be interrupted: on timeout or cancellation the
+        # client is answered, but the lock is only released later.
+        try:
+            if cmd.is_cpu_heavy:
+                cfut = self._pool.submit(contextvars.copy_context().run, self._run_in_thread, make_coro)
+                cfut.add_done_callback(lambda f: loop.call_soon_threadsafe(release))
+                fut = asyncio.wrap_future(cfut)
+                cancel = cfut.cancel  # only if not started yet
+            else:
+                fut = asyncio.ensure_future(make_coro())
+                fut.add_done_callback(release)
+                cancel = fut.cancel
+        except BaseException:
+            release()
+            raise
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), self._remaining(deadline))
+        except asyncio.TimeoutError:
+            cancel()
+            self.logger.info(f'{cmd.name} timed out after {self.timeout} seconds')
+            metrics.inc('rpc.timeouts', command=cmd.name)
+            raise CommandTimeout(f'{cmd.name}: timed out after {self.timeout} seconds')
+        except asyncio.CancelledError:
+            cancel()
+            raise
+        except BaseException:
+            metrics.inc('rpc.errors', command=cmd.name)
+            raise
+        finally:
+            metrics.observe('rpc.latency', time.perf_counter() - t1, command=cmd.name)
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else max(0, deadline - time.perf_counter())
+
+    def _set_queued(self, cmd: 'Command', delta: int) -> None:
+        self._queued += delta
+        self._queued_by_command[cmd.name] = n = self._queued_by_command.get(cmd.name, 0) + delta
+        metrics.set_gauge('rpc.queue_depth', self._queued)
+        metrics.set_gauge('rpc.queued', n, command=cmd.name)
+
+    def _run_in_thread(self, make_coro: Callable[[], Awaitable]):
+        # each worker has its own event loop, for commands that await
+        # coroutines local to them
+        loop = getattr(self._thread_local, 'loop', None)
+        if loop is None:
+            loop = self._thread_local.loop = asyncio.new_event_loop()
+        return loop.run_until_complete(make_coro())
+
+    def get_queue_depth(self) -> int:
+        return self._queued
+
+    def stop(self) -> None:
+        self._pool.shutdown(wait=False)
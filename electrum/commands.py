@@ -24,6 +24,7 @@
 # SOFTWARE.
 
 import sys
+import time
 import datetime
 import copy
 import argparse
@@ -38,7 +39,7 @@ from itertools import repeat
 from decimal import Decimal
 from typing import Optional, TYPE_CHECKING, Dict, List
 
-from .import util, ecc
+from .import util, ecc, metrics
 from .util import bfh, bh2u, format_satoshis, json_decode, json_encode, is_hash256_str, is_hex_str, to_bytes, timestamp_to_datetime
 from .util import standardize_path
 from . import bitcoin
@@ -63,10 +64,13 @@ from .simple_config import SimpleConfig
 if TYPE_CHECKING:
     from .network import Network
     from .daemon import Daemon
+    from .command_executor import CommandExecutor
 
 
 known_commands = {}  # type: Dict[str, Command]
 
+PAGE_LIMIT = 100  # default page size, when a listing is paginated
+
 
 def satoshis(amount):
     # satoshi conversion must not be performed by the parser
@@ -87,6 +91,15 @@ class Command:
         self.requires_network = 'n' in s
         self.requires_wallet = 'w' in s
         self.requires_password = 'p' in s
+        # for the daemon's CommandExecutor: the command does not modify the
+        # wallet ('r'), or modifies it but may share the wallet lock with
+        # readers ('s'), or is CPU-heavy and must not await the event loop ('h').
+        # Lightning payments are 's': they change the wallet through the
+        # lnworker only, without awaiting in between, and must not hold the
+        # wallet lock while waiting for the network.
+        self.is_read_only = 'r' in s
+        self.shares_wallet_lock = self.is_read_only or 's' in s
+        self.is_cpu_heavy = 'h' in s
         self.description = func.__doc__
         self.help = self.description.split('.')[0] if self.description else None
         varnames = func.__code__.co_varnames[1:func.__code__.co_argcount]
@@ -127,6 +140,8 @@ def command(s):
                 wallet = kwargs.get('wallet')
             if cmd.requires_password and password is None and wallet.has_password():
                 raise Exception('Password required')
+            if cmd_runner.executor:
+                return await cmd_runner.executor.run(cmd, kwargs.get('wallet'), partial(func, *args, **kwargs))
             return await func(*args, **kwargs)
         return func_wrapper
     return decorator
@@ -136,11 +151,13 @@ class Commands:
 
     def __init__(self, *, config: 'SimpleConfig',
                  network: 'Network' = None,
-                 daemon: 'Daemon' = None, callback=None):
+                 daemon: 'Daemon' = None, callback=None,
+                 executor: 'CommandExecutor' = None):
         self.config = config
         self.daemon = daemon
         self.network = network
         self._callback = callback
+        self.executor = executor
 
     def _run(self, method, args, password_getter=None, **kwargs):
         """This wrapper is called from unit tests and the Qt python console."""
@@ -193,6 +210,17 @@ class Commands:
         }
         return response
 
+    @command('')
+    async def getmetrics(self, reset=False):
+        """Return the metrics collected by this process: counters, gauges,
+        and latency histograms (in seconds). Collection is off unless the
+        'metrics' config variable is set."""
+        registry = metrics.get_registry()
+        result = registry.to_json()
+        if reset:
+            registry.reset()
+        return result
+
     @command('n')
     async def stop(self):
         """Stop daemon"""
@@ -219,7 +247,7 @@ class Commands:
         """Close wallet"""
         return self.daemon.stop_wallet(wallet_path)
 
-    @command('')
+    @command('h')
     async def create(self, passphrase=None, password=None, encrypt_file=True, seed_type=None, wallet_path=None):
         """Create a new wallet.
         If you want to be prompted for an argument, type '?' or ':' (concealed)
@@ -236,7 +264,7 @@ class Commands:
             'msg': d['msg'],
         }
 
-    @command('')
+    @command('h')
     async def restore(self, text, passphrase=None, password=None, encrypt_file=True, wallet_path=None):
         """Restore a wallet from text. Text can be a seed phrase, a master
         public key, a master private key, a list of LBRY Credits addresses
@@ -265,7 +293,7 @@ class Commands:
         wallet.save_db()
         return {'password':wallet.has_password()}
 
-    @command('w')
+    @command('wr')
     async def get(self, key, wallet: Abstract_Wallet = None):
         """Return item from wallet storage"""
         return wallet.db.get(key)
@@ -290,6 +318,8 @@ class Commands:
         """Set a configuration variable. 'value' may be a string or a Python expression."""
         value = self._setconfig_normalize_value(key, value)
         self.config.set_key(key, value)
+        if key == 'metrics':
+            metrics.set_enabled(value)
         return True
 
     @command('')
@@ -307,7 +337,7 @@ class Commands:
         sh = bitcoin.address_to_scripthash(address)
         return await self.network.get_history_for_scripthash(sh)
 
-    @command('w')
+    @command('wr')
     async def listunspent(self, wallet: Abstract_Wallet = None):
         """List unspent outputs. Returns the list of unspent transaction
         outputs in your wallet."""
@@ -327,7 +357,7 @@ class Commands:
         sh = bitcoin.address_to_scripthash(address)
         return await self.network.listunspent_for_scripthash(sh)
 
-    @command('')
+    @command('h')
     async def serialize(self, jsontx):
         """Create a transaction from json inputs.
         Inputs must have a redeemPubkey.
@@ -361,7 +391,7 @@ class Commands:
         tx.sign(keypairs)
         return tx.serialize()
 
-    @command('wp')
+    @command('wph')
     async def signtransaction(self, tx, privkey=None, password=None, wallet: Abstract_Wallet = None):
         """Sign a transaction. The wallet keys will be used unless a private key is provided."""
         tx = PartialTransaction(tx)
@@ -404,7 +434,7 @@ class Commands:
         """Unfreeze address. Unfreeze the funds at one of your wallet\'s address"""
         return wallet.set_frozen_state_of_addresses([address], False)
 
-    @command('wp')
+    @command('wpr')
     async def getprivatekeys(self, address, password=None, wallet: Abstract_Wallet = None):
         """Get private keys of addresses. You may pass a single wallet address, or a list of wallet addresses."""
         if isinstance(address, str):
@@ -414,7 +444,7 @@ class Commands:
         domain = address
         return [wallet.export_private_key(address, password) for address in domain]
 
-    @command('w')
+    @command('wr')
     async def ismine(self, address, wallet: Abstract_Wallet = None):
         """Check if address is in wallet. Return true if and only address is in wallet"""
         return wallet.is_mine(address)
@@ -429,12 +459,12 @@ class Commands:
         """Check that an address is valid. """
         return is_address(address)
 
-    @command('w')
+    @command('wr')
     async def getpubkeys(self, address, wallet: Abstract_Wallet = None):
         """Return the public keys for a wallet address. """
         return wallet.get_public_keys(address)
 
-    @command('w')
+    @command('wr')
     async def getbalance(self, wallet: Abstract_Wallet = None):
         """Return the balance of your wallet. """
         c, u, x = wallet.get_balance()
@@ -476,12 +506,12 @@ class Commands:
         from .version import ELECTRUM_VERSION
         return ELECTRUM_VERSION
 
-    @command('w')
+    @command('wr')
     async def getmpk(self, wallet: Abstract_Wallet = None):
         """Get master public key. Return your wallet\'s master public key"""
         return wallet.get_master_public_key()
 
-    @command('wp')
+    @command('wpr')
     async def getmasterprivate(self, password=None, wallet: Abstract_Wallet = None):
         """Get master private key. Return your wallet\'s master private key"""
         return str(wallet.keystore.get_master_private_key(password))
@@ -495,7 +525,7 @@ class Commands:
             raise Exception('xkey should be a master public/private key')
         return node._replace(xtype=xtype).to_xkey()
 
-    @command('wp')
+    @command('wpr')
     async def getseed(self, password=None, wallet: Abstract_Wallet = None):
         """Get seed phrase. Print the generation seed of your wallet."""
         s = wallet.get_seed(password)
@@ -521,25 +551,38 @@ class Commands:
             raise Exception('cannot verify alias', x)
         return out['address']
 
-    @command('n')
-    async def sweep(self, privkey, destination, fee=None, nocheck=False, imax=100):
+    @command('nh')
+    async def sweep(self, privkey, destination, fee=None, nocheck=False, imax=None, feerate=None, batch=False):
         """Sweep private keys. Returns a transaction that spends UTXOs from
         privkey to a destination address. The transaction is not
-        broadcasted."""
-        from .wallet import sweep
+        broadcasted. With batch, all UTXOs are swept, by a list of
+        transactions of at most imax inputs each."""
+        from .wallet import sweep, sweep_batch, SWEEP_MAX_TX_INPUTS
         tx_fee = satoshis(fee)
         privkeys = privkey.split()
         self.nocheck = nocheck
         #dest = self._resolver(destination)
+        if batch:
+            if fee is not None:
+                raise Exception("Cannot specify an absolute 'fee' with 'batch', use 'feerate'")
+            txs = sweep_batch(privkeys,
+                              network=self.network,
+                              config=self.config,
+                              to_address=destination,
+                              fee_per_kb=1000 * Decimal(feerate) if feerate is not None else None,
+                              max_inputs=SWEEP_MAX_TX_INPUTS if imax is None else imax)
+            return [tx.serialize() for tx in txs]
+        if feerate is not None:
+            raise Exception("'feerate' is only supported with 'batch'")
         tx = sweep(privkeys,
                    network=self.network,
                    config=self.config,
                    to_address=destination,
                    fee=tx_fee,
-                   imax=imax)
+                   imax=100 if imax is None else imax)
         return tx.serialize() if tx else None
 
-    @command('wp')
+    @command('wpr')
     async def signmessage(self, address, message, password=None, wallet: Abstract_Wallet = None):
         """Sign a message with a key. Use quotes if your message contains
         whitespaces"""
@@ -588,7 +631,7 @@ class Commands:
             wallet.sign_transaction(tx, password)
         return tx
 
-    @command('wp')
+    @command('wph')
     async def payto(self, destination, amount, fee=None, feerate=None, from_addr=None, from_coins=None, change_addr=None,
                     nocheck=False, unsigned=False, rbf=None, password=None, locktime=None, wallet: Abstract_Wallet = None):
         """Create a transaction. """
@@ -609,7 +652,7 @@ class Commands:
                         locktime=locktime)
         return tx.serialize()
 
-    @command('wp')
+    @command('wph')
     async def paytomany(self, outputs, fee=None, feerate=None, from_addr=None, from_coins=None, change_addr=None,
                         nocheck=False, unsigned=False, rbf=None, password=None, locktime=None, wallet: Abstract_Wallet = None):
         """Create a multi-output transaction. """
@@ -630,23 +673,53 @@ class Commands:
                         locktime=locktime)
         return tx.serialize()
 
-    @command('w')
-    async def onchain_history(self, year=None, show_addresses=False, show_fiat=False, wallet: Abstract_Wallet = None):
-        """Wallet onchain history. Returns the transaction history of your wallet."""
-        kwargs = {
-            'show_addresses': show_addresses,
-        }
+    @command('wrh')
+    async def onchain_history(self, year=None, show_addresses=False, show_fiat=False,
+                              from_timestamp=None, to_timestamp=None, from_height=None, to_height=None,
+                              address=None, min_amount=None, limit=None, cursor=None,
+                              wallet: Abstract_Wallet = None):
+        """Wallet onchain history. Returns the transaction history of your wallet.
+        With limit or cursor, or with filters other than year, returns a page of
+        at most limit transactions (default 100), without summary, and a cursor
+        for the next page."""
         if year:
-            import time
             start_date = datetime.datetime(year, 1, 1)
             end_date = datetime.datetime(year+1, 1, 1)
-            kwargs['from_timestamp'] = time.mktime(start_date.timetuple())
-            kwargs['to_timestamp'] = time.mktime(end_date.timetuple())
+            from_timestamp = time.mktime(start_date.timetuple())
+            to_timestamp = time.mktime(end_date.timetuple())
+        fx = None
         if show_fiat:
             from .exchange_rate import FxThread
             fx = FxThread(self.config, None)
-            kwargs['fx'] = fx
-        return json_normalize(wallet.get_detailed_history(**kwargs))
+        filters = {k: v for k, v in (('from_timestamp', from_timestamp), ('to_timestamp', to_timestamp),
+                                     ('from_height', from_height), ('to_height', to_height),
+                                     ('address', address), ('min_amount', satoshis(min_amount)))
+                   if v is not None}
+        if limit is None and cursor is None and set(filters) <= {'from_timestamp', 'to_timestamp'}:
+            return json_normalize(wallet.get_detailed_history(fx=fx, show_addresses=show_addresses, **filters))
+        query = dict(filters, show_addresses=show_addresses, show_fiat=show_fiat)
+        version = wallet.get_history_version()
+        start = util.read_page_cursor(cursor, 'onchain_history', version, query) if cursor else 0
+        version, items, next_start = wallet.get_detailed_history_page(
+            start=start, limit=self._page_limit(limit), fx=fx, show_addresses=show_addresses, **filters)
+        return json_normalize({
+            'transactions': items,
+            'next_cursor': self._next_cursor('onchain_history', version, query, next_start),
+        })
+
+    @staticmethod
+    def _page_limit(limit):
+        if limit is None:
+            return PAGE_LIMIT
+        if limit < 1:
+            raise Exception('limit must be at least 1')
+        return limit
+
+    @staticmethod
+    def _next_cursor(kind, version, query, position):
+        if position is None:
+            return None
+        return util.make_page_cursor(kind, version, query, position)
 
     @command('w')
     async def init_lightning(self, wallet: Abstract_Wallet = None):
@@ -659,11 +732,41 @@ class Commands:
         """Disable lightning payments"""
         wallet.remove_lightning()
 
-    @command('w')
-    async def lightning_history(self, show_fiat=False, wallet: Abstract_Wallet = None):
-        """ lightning history """
-        lightning_history = wallet.lnworker.get_history() if wallet.lnworker else []
-        return json_normalize(lightning_history)
+    @command('wr')
+    async def lightning_history(self, from_timestamp=None, to_timestamp=None, min_amount=None,
+                                limit=None, cursor=None, wallet: Abstract_Wallet = None):
+        """ lightning history
+        With limit, cursor or filters, returns a page of at most limit items
+        (default 100), and a cursor for the next page."""
+        if not wallet.lnworker:
+            history = []
+            if limit is None and cursor is None:
+                return history
+            return {'transactions': history, 'next_cursor': None}
+        min_amount_msat = 1000 * satoshis(min_amount) if min_amount is not None else None
+        if limit is None and cursor is None and from_timestamp is None and to_timestamp is None and min_amount is None:
+            return json_normalize(wallet.lnworker.get_history())
+        query = {'from_timestamp': from_timestamp, 'to_timestamp': to_timestamp, 'min_amount_msat': min_amount_msat}
+        now = time.time()
+
+        def predicate(item):
+            timestamp = item['timestamp'] or now
+            if from_timestamp is not None and timestamp < from_timestamp:
+                return False
+            if to_timestamp is not None and timestamp >= to_timestamp:
+                return False
+            if min_amount_msat is not None and abs(item['amount_msat']) < min_amount_msat:
+                return False
+            return True
+        start = 0
+        if cursor:
+            version = wallet.lnworker.ledger.version
+            start = util.read_page_cursor(cursor, 'lightning_history', version, query)
+        version, items, next_start = wallet.lnworker.get_history_page(start, self._page_limit(limit), predicate)
+        return json_normalize({
+            'transactions': items,
+            'next_cursor': self._next_cursor('lightning_history', version, query, next_start),
+        })
 
     @command('w')
     async def setlabel(self, key, label, wallet: Abstract_Wallet = None):
@@ -671,17 +774,17 @@ class Commands:
         transaction ID"""
         wallet.set_label(key, label)
 
-    @command('w')
+    @command('wr')
     async def listcontacts(self, wallet: Abstract_Wallet = None):
         """Show your list of contacts"""
         return wallet.contacts
 
-    @command('w')
+    @command('wr')
     async def getalias(self, key, wallet: Abstract_Wallet = None):
         """Retrieve alias. Lookup in your list of contacts, and for an OpenAlias DNS record."""
         return wallet.contacts.resolve(key)
 
-    @command('w')
+    @command('wr')
     async def searchcontacts(self, query, wallet: Abstract_Wallet = None):
         """Search through contacts, return matching entries. """
         results = {}
@@ -690,21 +793,30 @@ class Commands:
                 results[key] = value
         return results
 
-    @command('w')
-    async def listaddresses(self, receiving=False, change=False, labels=False, frozen=False, unused=False, funded=False, balance=False, wallet: Abstract_Wallet = None):
-        """List wallet addresses. Returns the list of all addresses in your wallet. Use optional arguments to filter the results."""
-        out = []
-        for addr in wallet.get_addresses():
+    @command('wrh')
+    async def listaddresses(self, receiving=False, change=False, labels=False, frozen=False, unused=False, funded=False, balance=False,
+                            min_amount=None, limit=None, cursor=None, wallet: Abstract_Wallet = None):
+        """List wallet addresses. Returns the list of all addresses in your wallet. Use optional arguments to filter the results.
+        With limit, cursor or min_amount, returns a page of at most limit addresses (default 100),
+        and a cursor for the next page."""
+        min_amount = satoshis(min_amount)
+
+        def predicate(addr):
             if frozen and not wallet.is_frozen_address(addr):
-                continue
+                return False
             if receiving and wallet.is_change(addr):
-                continue
+                return False
             if change and not wallet.is_change(addr):
-                continue
+                return False
             if unused and wallet.is_used(addr):
-                continue
+                return False
             if funded and wallet.is_empty(addr):
-                continue
+                return False
+            if min_amount is not None and sum(wallet.get_addr_balance(addr)) < min_amount:
+                return False
+            return True
+
+        def format_item(addr):
             item = addr
             if labels or balance:
                 item = (item,)
@@ -712,8 +824,19 @@ class Commands:
                 item += (format_satoshis(sum(wallet.get_addr_balance(addr))),)
             if labels:
                 item += (repr(wallet.labels.get(addr, '')),)
-            out.append(item)
-        return out
+            return item
+        if limit is None and cursor is None and min_amount is None:
+            return [format_item(addr) for addr in wallet.get_addresses() if predicate(addr)]
+        query = {'receiving': receiving, 'change': change, 'frozen': frozen, 'unused': unused,
+                 'funded': funded, 'min_amount': min_amount, 'labels': labels, 'balance': balance}
+        addresses = wallet.get_addresses()
+        version = [wallet.get_history_version(), len(addresses)]
+        start = util.read_page_cursor(cursor, 'listaddresses', version, query) if cursor else 0
+        page, next_start = util.paginate(addresses, start, self._page_limit(limit), predicate)
+        return {
+            'addresses': [format_item(addr) for addr in page],
+            'next_cursor': self._next_cursor('listaddresses', version, query, next_start),
+        }
 
     @command('n')
     async def gettransaction(self, txid, wallet: Abstract_Wallet = None):
@@ -744,7 +867,7 @@ class Commands:
         encrypted = public_key.encrypt_message(message)
         return encrypted.decode('utf-8')
 
-    @command('wp')
+    @command('wpr')
     async def decrypt(self, pubkey, encrypted, password=None, wallet: Abstract_Wallet = None) -> str:
         """Decrypt a message encrypted with a public key."""
         if not is_hex_str(pubkey):
@@ -760,7 +883,7 @@ class Commands:
         out['status_str'] = get_request_status(out)
         return out
 
-    @command('w')
+    @command('wr')
     async def getrequest(self, key, wallet: Abstract_Wallet = None):
         """Return a payment request"""
         r = wallet.get_request(key)
@@ -773,10 +896,13 @@ class Commands:
     #    """<Not implemented>"""
     #    pass
 
-    @command('w')
-    async def list_requests(self, pending=False, expired=False, paid=False, wallet: Abstract_Wallet = None):
-        """List the payment requests you made."""
-        out = wallet.get_sorted_requests()
+    @command('wrh')
+    async def list_requests(self, pending=False, expired=False, paid=False,
+                            from_timestamp=None, to_timestamp=None, min_amount=None,
+                            limit=None, cursor=None, wallet: Abstract_Wallet = None):
+        """List the payment requests you made.
+        With limit, cursor or filters, returns a page of at most limit requests
+        (default 100), and a cursor for the next page."""
         if pending:
             f = PR_UNPAID
         elif expired:
@@ -785,9 +911,22 @@ class Commands:
             f = PR_PAID
         else:
             f = None
-        if f is not None:
-            out = list(filter(lambda x: x.get('status')==f, out))
-        return list(map(self._format_request, out))
+        min_amount = satoshis(min_amount)
+        if limit is None and cursor is None and from_timestamp is None and to_timestamp is None and min_amount is None:
+            out = wallet.get_sorted_requests()
+            if f is not None:
+                out = list(filter(lambda x: x.get('status')==f, out))
+            return list(map(self._format_request, out))
+        query = {'status': f, 'from_timestamp': from_timestamp, 'to_timestamp': to_timestamp, 'min_amount': min_amount}
+        # positions are (timestamp, key): cursors stay valid when requests are added or removed
+        after = util.read_page_cursor(cursor, 'list_requests', None, query) if cursor else None
+        out, position = wallet.get_requests_page(after=after, limit=self._page_limit(limit), status=f,
+                                                 from_timestamp=from_timestamp, to_timestamp=to_timestamp,
+                                                 min_amount=min_amount)
+        return {
+            'requests': list(map(self._format_request, out)),
+            'next_cursor': self._next_cursor('list_requests', None, query, position),
+        }
 
     @command('w')
     async def createnewaddress(self, wallet: Abstract_Wallet = None):
@@ -860,14 +999,23 @@ class Commands:
         return True
 
     @command('n')
-    async def notify(self, address: str, URL: str):
-        """Watch an address. Every time the address changes, a http POST is sent to the URL."""
-        if not hasattr(self, "_notifier"):
-            self._notifier = Notifier(self.network)
-        await self._notifier.start_watching_queue.put((address, URL))
+    async def notify(self, address: str, URL: Optional[str]):
+        """Watch an address. Every time the address changes, a http POST is sent to the URL.
+        Call with an empty URL to stop watching an address.
+        """
+        if self.daemon:
+            notifier = self.daemon.get_notifier()
+        else:
+            if not hasattr(self, "_notifier"):
+                self._notifier = Notifier(self.network)
+            notifier = self._notifier
+        if URL:
+            await notifier.start_watching_addr(address, URL)
+        else:
+            await notifier.stop_watching_addr(address)
         return True
 
-    @command('wn')
+    @command('wnr')
     async def is_synchronized(self, wallet: Abstract_Wallet = None):
         """ return wallet synchronization status """
         return wallet.is_up_to_date()
@@ -908,7 +1056,7 @@ class Commands:
             wallet.remove_transaction(tx_hash)
         wallet.save_db()
 
-    @command('wn')
+    @command('wnr')
     async def get_tx_status(self, txid, wallet: Abstract_Wallet = None):
         """Returns some information regarding the tx. For now, only confirmations.
         The transaction must be related to the wallet.
@@ -945,16 +1093,22 @@ class Commands:
                                                                          password=password)
         return chan.funding_outpoint.to_str()
 
-    @command('wn')
+    @command('wns')
     async def lnpay(self, invoice, attempts=1, timeout=10, wallet: Abstract_Wallet = None):
         return await wallet.lnworker._pay(invoice, attempts=attempts)
 
-    @command('w')
+    @command('wns')
+    async def lnpay_batch(self, invoices, attempts=1, wallet: Abstract_Wallet = None):
+        """Pay a list of lightning invoices concurrently. Returns the
+        number of invoices paid, the throughput, and the failures."""
+        return await wallet.lnworker._pay_batch(invoices, attempts=attempts)
+
+    @command('wr')
     async def nodeid(self, wallet: Abstract_Wallet = None):
         listen_addr = self.config.get('lightning_listen')
         return bh2u(wallet.lnworker.node_keypair.pubkey) + (('@' + listen_addr) if listen_addr else '')
 
-    @command('w')
+    @command('wr')
     async def list_channels(self, wallet: Abstract_Wallet = None):
         return list(wallet.lnworker.list_channels())
 
@@ -971,15 +1125,12 @@ class Commands:
     @command('n')
     async def clear_ln_blacklist(self):
         self.network.path_finder.blacklist.clear()
+        self.network.path_finder.mission_control.clear()
 
-    @command('w')
+    @command('wr')
     async def list_invoices(self, wallet: Abstract_Wallet = None):
         return wallet.get_invoices()
 
-    @command('w')
-    async def lightning_history(self, wallet: Abstract_Wallet = None):
-        return wallet.lnworker.get_history()
-
     @command('wn')
     async def close_channel(self, channel_point, force=False, wallet: Abstract_Wallet = None):
         txid, index = channel_point.split(':')
@@ -1026,6 +1177,7 @@ param_descriptions = {
     'amount': 'Amount to be sent (in LBC). Type \'!\' to send the maximum available.',
     'requested_amount': 'Requested amount (in LBC).',
     'outputs': 'list of ["address", amount]',
+    'invoices': 'list of lightning invoices',
     'redeem_script': 'redeem script (hexadecimal)',
 }
 
@@ -1042,6 +1194,7 @@ command_options = {
     'labels':      ("-l", "Show the labels of listed addresses"),
     'nocheck':     (None, "Do not verify aliases"),
     'imax':        (None, "Maximum number of inputs"),
+    'batch':       (None, "Sweep all coins, into as many transactions as needed"),
     'fee':         ("-f", "Transaction fee (absolute, in LBC)"),
     'feerate':     (None, "Transaction fee rate (in sat/byte)"),
     'from_addr':   ("-F", "Source address (must be a wallet address; use sweep to spend from non-wallet address)."),
@@ -1073,6 +1226,13 @@ command_options = {
     'fee_level':   (None, "Float between 0.0 and 1.0, representing fee slider position"),
     'from_height': (None, "Only show transactions that confirmed after given block height"),
     'to_height':   (None, "Only show transactions that confirmed before given block height"),
+    'reset':       (None, "Reset the metrics after reading them"),
+    'from_timestamp': (None, "Only show items dated at or after this unix timestamp"),
+    'to_timestamp': (None, "Only show items dated before this unix timestamp"),
+    'address':     (None, "Only show transactions involving this address"),
+    'min_amount':  (None, "Only show items of at least this amount (in LBC)"),
+    'limit':       (None, "Maximum number of items to return. Use with cursor to get the next pages"),
+    'cursor':      (None, "Cursor returned by the previous page"),
 }
 
 
@@ -1086,11 +1246,15 @@ arg_types = {
     'year': int,
     'from_height': int,
     'to_height': int,
+    'from_timestamp': int,
+    'to_timestamp': int,
+    'limit': int,
     'tx': convert_raw_tx_to_hex,
     'pubkeys': json_loads,
     'jsontx': json_loads,
     'inputs': json_loads,
     'outputs': json_loads,
+    'invoices': json_loads,
     'fee': lambda x: str(Decimal(x)) if x is not None else None,
     'amount': lambda x: str(Decimal(x)) if x != '!' else '!',
     'locktime': int,
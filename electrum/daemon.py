@@ -24,12 +24,13 @@
 # SOFTWARE.
 import asyncio
 import ast
+import heapq
 import os
 import time
 import traceback
 import sys
 import threading
-from typing import Dict, Optional, Tuple, Iterable
+from typing import Dict, Optional, Tuple, Iterable, Set, List
 from base64 import b64decode, b64encode
 from collections import defaultdict
 
@@ -42,15 +43,19 @@ from jsonrpcclient.clients.aiohttp_client import AiohttpClient
 from aiorpcx import TaskGroup
 
 from .network import Network
+from .synchronizer import Notifier
 from .util import (json_decode, to_bytes, to_string, profiler, standardize_path, constant_time_compare)
-from .util import PR_PAID, PR_EXPIRED, get_request_status
+from .util import PR_PAID, PR_UNPAID, PR_EXPIRED, get_request_status
 from .util import log_exceptions, ignore_exceptions, randrange
 from .wallet import Wallet, Abstract_Wallet
 from .storage import WalletStorage
 from .wallet_db import WalletDB
 from .commands import known_commands, Commands
+from .command_executor import CommandExecutor
+from . import metrics, paymentrequest
 from .simple_config import SimpleConfig
 from .exchange_rate import FxThread
+from .websockets import WebSocketServer
 from .logging import get_logger, Logger
 
 
@@ -174,18 +179,126 @@ class WatchTowerServer(Logger):
         return await self.lnwatcher.sweepstore.add_sweep_tx(*args)
 
 
+class RequestStatusIndex(Logger):
+    """Status of the payment requests of a wallet, kept up to date from
+    wallet and lightning events, so that waiting for a request to be
+    paid or to expire does not require polling.
+
+    Requests are added to the index the first time their status is
+    asked for. Unpaid requests with an expiration date are put in a
+    heap, and a single timer is armed for the earliest one.
+    All methods must be called from the event loop.
+    """
+
+    def __init__(self, wallet: 'Abstract_Wallet', network: 'Network'):
+        Logger.__init__(self)
+        self.wallet = wallet
+        self.network = network
+        self.status = {}  # type: Dict[str, int]
+        self.waiters = defaultdict(set)  # type: Dict[str, Set[asyncio.Future]]
+        self.expiry_heap = []  # type: List[Tuple[float, str]]
+        self._timer = None  # type: Optional[asyncio.TimerHandle]
+        self._timer_when = None  # type: Optional[float]
+        self.network.register_callback(self.on_payment_received, ['payment_received'])
+        self.network.register_callback(self.on_request_status, ['request_status'])
+
+    def close(self):
+        self.network.unregister_callback(self.on_payment_received)
+        self.network.unregister_callback(self.on_request_status)
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        for waiters in self.waiters.values():
+            for fut in waiters:
+                fut.cancel()
+        self.waiters.clear()
+
+    def get_status(self, key: str) -> Optional[int]:
+        status = self.status.get(key)
+        if status is None:
+            req = self.wallet.get_request(key)
+            if not req:
+                return None
+            status, _ = get_request_status(req)
+            self.status[key] = status
+            exp = req.get('exp', 0) or 0
+            if status == PR_UNPAID and exp > 0:
+                self._add_expiry(req['time'] + exp, key)
+        return status
+
+    def set_status(self, key: str, status: int) -> None:
+        if key not in self.status:
+            return  # nobody asked about it yet
+        if self.status[key] == status:
+            return
+        self.status[key] = status
+        for fut in self.waiters.pop(key, ()):
+            if not fut.done():
+                fut.set_result(status)
+
+    def add_waiter(self, key: str) -> asyncio.Future:
+        """Returns a future that resolves to the next status of key."""
+        fut = asyncio.get_event_loop().create_future()
+        self.waiters[key].add(fut)
+        return fut
+
+    def remove_waiter(self, key: str, fut: asyncio.Future) -> None:
+        waiters = self.waiters.get(key)
+        if waiters is None:
+            return
+        waiters.discard(fut)
+        if not waiters:
+            self.waiters.pop(key)
+
+    def on_payment_received(self, evt, wallet, key, status):
+        if wallet == self.wallet:
+            self.set_status(key, status)
+
+    def on_request_status(self, evt, key, status):
+        self.set_status(key, status)
+
+    def _add_expiry(self, when: float, key: str) -> None:
+        heapq.heappush(self.expiry_heap, (when, key))
+        if self._timer_when is None or when < self._timer_when:
+            self._arm_timer()
+
+    def _arm_timer(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = self._timer_when = None
+        if not self.expiry_heap:
+            return
+        when = self.expiry_heap[0][0]
+        self._timer_when = when
+        self._timer = asyncio.get_event_loop().call_later(max(0, when - time.time()), self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = self._timer_when = None
+        now = time.time()
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            when, key = heapq.heappop(self.expiry_heap)
+            if self.status.get(key) == PR_UNPAID:
+                self.set_status(key, PR_EXPIRED)
+        self._arm_timer()
+
+
 class PayServer(Logger):
 
+    WS_HEARTBEAT = 30  # seconds between websocket pings
+
     def __init__(self, daemon: 'Daemon'):
         Logger.__init__(self)
         self.daemon = daemon
         self.config = daemon.config
-        self.pending = defaultdict(asyncio.Event)
-        self.daemon.network.register_callback(self.on_payment, ['payment_received'])
+        self._index = None  # type: Optional[RequestStatusIndex]
 
-    async def on_payment(self, evt, wallet, key, status):
-        if status == PR_PAID:
-            await self.pending[key].set()
+    def get_index(self) -> RequestStatusIndex:
+        wallet = self.daemon.wallet
+        if self._index is None or self._index.wallet != wallet:
+            if self._index:
+                self._index.close()
+            self._index = RequestStatusIndex(wallet, self.daemon.network)
+        return self._index
 
     @ignore_exceptions
     @log_exceptions
@@ -230,30 +343,29 @@ class PayServer(Logger):
         return web.Response(body=pr.SerializeToString(), content_type='application/bitcoin-paymentrequest')
 
     async def get_status(self, request):
-        ws = web.WebSocketResponse()
+        ws = web.WebSocketResponse(heartbeat=self.WS_HEARTBEAT)
         await ws.prepare(request)
         key = request.query_string
-        info = self.daemon.wallet.get_request(key)
-        if not info:
-            await ws.send_str('unknown invoice')
-            await ws.close()
-            return ws
-        if info.get('status') == PR_PAID:
-            await ws.send_str(f'paid')
-            await ws.close()
-            return ws
-        if info.get('status') == PR_EXPIRED:
-            await ws.send_str(f'expired')
-            await ws.close()
-            return ws
-        while True:
+        index = self.get_index()
+        status = index.get_status(key)
+        while status not in (PR_PAID, PR_EXPIRED):
+            if status is None:
+                await ws.send_str('unknown invoice')
+                await ws.close()
+                return ws
+            waiter = index.add_waiter(key)
+            # read from the websocket, so that we notice when the client leaves
+            reader = asyncio.ensure_future(ws.receive())
             try:
-                await asyncio.wait_for(self.pending[key].wait(), 1)
-                break
-            except asyncio.TimeoutError:
-                # send data on the websocket, to keep it alive
-                await ws.send_str('waiting')
-        await ws.send_str('paid')
+                await asyncio.wait([waiter, reader], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                reader.cancel()
+                index.remove_waiter(key, waiter)
+            if not waiter.done() or waiter.cancelled():
+                await ws.close()
+                return ws
+            status = waiter.result()
+        await ws.send_str('paid' if status == PR_PAID else 'expired')
         await ws.close()
         return ws
 
@@ -281,6 +393,9 @@ class Daemon(Logger):
             if fd is None:
                 raise Exception('failed to lock daemon; already running?')
         self.asyncio_loop = asyncio.get_event_loop()
+        metrics.set_enabled(config.get('metrics', False))
+        if config.path:
+            paymentrequest.ca_index_path = os.path.join(config.path, 'certs_index')
         self.network = None
         if not config.get('offline'):
             self.network = Network(config, daemon=self)
@@ -290,6 +405,7 @@ class Daemon(Logger):
         self._wallets = {}  # type: Dict[str, Abstract_Wallet]
         daemon_jobs = []
         # Setup JSONRPC server
+        self.cmd_executor = None
         if listen_jsonrpc:
             daemon_jobs.append(self.start_jsonrpc(config, fd))
         # request server
@@ -297,11 +413,20 @@ class Daemon(Logger):
         if not config.get('offline') and self.config.get('run_payserver'):
             self.pay_server = PayServer(self)
             daemon_jobs.append(self.pay_server.run())
+        # websocket server for payment request pages
+        self.websocket_server = None
+        if not config.get('offline') and self.config.get('websocket_server'):
+            self.websocket_server = WebSocketServer(config, self.network)
+            daemon_jobs.append(self.websocket_server.run())
         # server-side watchtower
         self.watchtower = None
         if not config.get('offline') and self.config.get('run_watchtower'):
             self.watchtower = WatchTowerServer(self.network)
             daemon_jobs.append(self.watchtower.run)
+        # address notifications: resume watching the addresses of a previous run
+        self.notifier = None
+        if self.network and os.path.exists(os.path.join(config.path, 'notifier_db')):
+            self.get_notifier()
         if self.network:
             self.network.start(jobs=[self.fx.run])
 
@@ -321,6 +446,11 @@ class Daemon(Logger):
         finally:
             self.logger.info("stopping daemon.taskgroup")
 
+    def get_notifier(self) -> Notifier:
+        if self.notifier is None:
+            self.notifier = Notifier(self.network)
+        return self.notifier
+
     async def authenticate(self, headers):
         if self.rpc_password == '':
             # RPC authentication is disabled
@@ -339,7 +469,8 @@ class Daemon(Logger):
             await asyncio.sleep(0.050)
             raise AuthenticationCredentialsInvalid('Invalid Credentials')
 
-    async def handle(self, request):
+    async def check_auth(self, request) -> Optional[web.Response]:
+        """Returns an error response if the request is not authenticated."""
         async with self.auth_lock:
             try:
                 await self.authenticate(request.headers)
@@ -348,6 +479,11 @@ class Daemon(Logger):
                                     text='Unauthorized', status=401)
             except AuthenticationCredentialsInvalid:
                 return web.Response(text='Forbidden', status=403)
+
+    async def handle(self, request):
+        error_response = await self.check_auth(request)
+        if error_response:
+            return error_response
         request = await request.text()
         response = await jsonrpcserver.async_dispatch(request, methods=self.methods)
         if isinstance(response, jsonrpcserver.response.ExceptionResponse):
@@ -359,14 +495,25 @@ class Daemon(Logger):
         else:
             return web.Response()
 
+    async def handle_metrics(self, request):
+        error_response = await self.check_auth(request)
+        if error_response:
+            return error_response
+        return web.Response(text=metrics.get_registry().to_text(),
+                            content_type='text/plain')
+
     async def start_jsonrpc(self, config: SimpleConfig, fd):
         self.app = web.Application()
         self.app.router.add_post("/", self.handle)
+        if config.get('rpc_metrics_endpoint', False):
+            self.app.router.add_get("/metrics", self.handle_metrics)
         self.rpc_user, self.rpc_password = get_rpc_credentials(config)
         self.methods = jsonrpcserver.methods.Methods()
         self.methods.add(self.ping)
         self.methods.add(self.gui)
-        self.cmd_runner = Commands(config=self.config, network=self.network, daemon=self)
+        self.cmd_executor = CommandExecutor(config)
+        self.cmd_runner = Commands(config=self.config, network=self.network, daemon=self,
+                                   executor=self.cmd_executor)
         for cmdname in known_commands:
             self.methods.add(getattr(self.cmd_runner, cmdname))
         self.methods.add(self.run_cmdline)
@@ -494,6 +641,12 @@ class Daemon(Logger):
         # stop network/wallets
         for k, wallet in self._wallets.items():
             wallet.stop_threads()
+        if self.notifier:
+            fut = asyncio.run_coroutine_threadsafe(self.notifier.stop(), self.asyncio_loop)
+            try:
+                fut.result(timeout=2)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
         if self.network:
             self.logger.info("shutting down network")
             self.network.stop()
@@ -503,6 +656,9 @@ class Daemon(Logger):
             fut.result(timeout=2)
         except (asyncio.TimeoutError, asyncio.CancelledError):
             pass
+        if self.cmd_executor:
+            self.cmd_executor.stop()
+        self.config.flush()
         self.logger.info("removing lockfile")
         remove_lockfile(get_lockfile(self.config))
         self.logger.info("stopped")
@@ -1,5 +1,5 @@
 import asyncio
-from datetime import datetime
+from datetime import datetime, date
 import inspect
 import sys
 import os
@@ -8,7 +8,7 @@ import time
 import csv
 import decimal
 from decimal import Decimal
-from typing import Sequence, Optional
+from typing import Sequence, Optional, List, Dict
 
 from aiorpcx.curio import timeout_after, TaskTimeout, TaskGroup
 
@@ -35,11 +35,40 @@ CCY_PRECISIONS = {'BHD': 3, 'BIF': 0, 'BYR': 0, 'CLF': 4, 'CLP': 0,
                   'VUV': 0, 'XAF': 0, 'XAU': 4, 'XOF': 0, 'XPF': 0}
 
 
+class HistoricalRates:
+    """Daily rates of one currency, kept in an array indexed by day number.
+    Day numbers are proleptic Gregorian ordinals, see date.toordinal().
+    """
+
+    def __init__(self, history: Optional[dict]):
+        self.source = history
+        rates = {}
+        for key, rate in (history or {}).items():
+            if key == 'timestamp':
+                continue
+            try:
+                day = datetime.strptime(key, '%Y-%m-%d').toordinal()
+            except (TypeError, ValueError):
+                continue
+            rates[day] = Decimal(rate) if rate is not None else None
+        self.first_day = min(rates) if rates else 0
+        self.rates = [None] * (max(rates) - self.first_day + 1 if rates else 0)  # type: List[Optional[Decimal]]
+        for day, rate in rates.items():
+            self.rates[day - self.first_day] = rate
+
+    def get(self, day: int) -> Optional[Decimal]:
+        index = day - self.first_day
+        if 0 <= index < len(self.rates):
+            return self.rates[index]
+        return None
+
+
 class ExchangeBase(Logger):
 
     def __init__(self, on_quotes, on_history):
         Logger.__init__(self)
         self.history = {}
+        self._rate_tables = {}  # type: Dict[str, HistoricalRates]
         self.quotes = {}
         self.on_quotes = on_quotes
         self.on_history = on_history
@@ -131,8 +160,17 @@ class ExchangeBase(Logger):
     def history_ccys(self):
         return []
 
+    def get_rate_table(self, ccy) -> HistoricalRates:
+        h = self.history.get(ccy)
+        table = self._rate_tables.get(ccy)
+        if table is None or table.source is not h:
+            table = HistoricalRates(h)
+            self._rate_tables[ccy] = table
+        return table
+
     def historical_rate(self, ccy, d_t):
-        return self.history.get(ccy, {}).get(d_t.strftime('%Y-%m-%d'), 'NaN')
+        rate = self.get_rate_table(ccy).get(d_t.toordinal())
+        return 'NaN' if rate is None else rate
 
     async def request_history(self, ccy):
         raise NotImplementedError()  # implemented by subclasses
@@ -629,5 +667,36 @@ class FxThread(ThreadJob):
         date = timestamp_to_datetime(timestamp)
         return self.history_rate(date)
 
+    def timestamp_rates(self, timestamps: Sequence[Optional[int]]) -> List[Decimal]:
+        """Batch version of timestamp_rate.
+        The rate table is looked up once per distinct day.
+        """
+        table = self.exchange.get_rate_table(self.ccy)
+        today = date.today().toordinal()
+        by_day = {}  # type: Dict[int, Decimal]
+        out = []
+        for timestamp in timestamps:
+            if timestamp is None:
+                out.append(Decimal('NaN'))
+                continue
+            day = date.fromtimestamp(timestamp).toordinal()
+            rate = by_day.get(day)
+            if rate is None:
+                rate = table.get(day)
+                # Frequently there is no rate for today, until tomorrow :)
+                # Use spot quotes in that case
+                if rate is None and today - day <= 2:
+                    rate = self.exchange.quotes.get(self.ccy)
+                    self.history_used_spot = True
+                rate = Decimal('NaN') if rate is None else Decimal(rate)
+                by_day[day] = rate
+            out.append(rate)
+        return out
+
+    def history_rates_key(self):
+        """Changes whenever the results of timestamp_rate may have changed."""
+        return (self.ccy, self.exchange.get_rate_table(self.ccy),
+                self.exchange.quotes.get(self.ccy), date.today())
+
 
 assert globals().get(DEFAULT_EXCHANGE), f"default exchange {DEFAULT_EXCHANGE} does not exist"
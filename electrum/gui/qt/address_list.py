@@ -24,9 +24,10 @@
 # SOFTWARE.
 
 from enum import IntEnum
+from typing import Dict, List, NamedTuple, Sequence, Tuple
 
 from PyQt5.QtCore import Qt, QPersistentModelIndex, QModelIndex
-from PyQt5.QtGui import QStandardItemModel, QStandardItem, QFont
+from PyQt5.QtGui import QStandardItemModel, QStandardItem, QFont, QBrush
 from PyQt5.QtWidgets import QAbstractItemView, QComboBox, QLabel, QMenu
 
 from electrum.i18n import _
@@ -35,7 +36,7 @@ from electrum.plugin import run_hook
 from electrum.bitcoin import is_address
 from electrum.wallet import InternalAddressCorruption
 
-from .util import MyTreeView, MONOSPACE_FONT, ColorScheme, webopen
+from .util import MyTreeView, MONOSPACE_FONT, ColorScheme, webopen, BackgroundUpdater
 
 
 class AddressUsageStateFilter(IntEnum):
@@ -66,6 +67,20 @@ class AddressTypeFilter(IntEnum):
         }[self]
 
 
+class AddressStats(NamedTuple):
+    num_txs: int
+    balance: int
+
+
+class AddressListUpdate(NamedTuple):
+    version: int
+    filters: Tuple[AddressTypeFilter, AddressUsageStateFilter]
+    addresses: Sequence[str]
+    stats: Dict[str, AddressStats]  # only for addresses whose history changed
+    flags: Dict[str, Tuple[bool, bool, bool]]  # is_change, is_frozen, is_beyond_limit
+    full: bool
+
+
 class AddressList(MyTreeView):
 
     class Columns(IntEnum):
@@ -94,6 +109,12 @@ class AddressList(MyTreeView):
         for addr_usage_state in AddressUsageStateFilter.__members__.values():  # type: AddressUsageStateFilter
             self.used_button.addItem(addr_usage_state.ui_text())
         self.setModel(QStandardItemModel(self))
+        self._address_items = {}  # type: Dict[str, List[QStandardItem]]
+        self._address_stats = {}  # type: Dict[str, AddressStats]
+        self._history_version = 0
+        self._shown_filters = None
+        self._updater = BackgroundUpdater(self.parent.list_update_thread,
+                                          self._compute_update, self._apply_update)
         self.update()
 
     def get_toolbar_buttons(self):
@@ -135,76 +156,136 @@ class AddressList(MyTreeView):
         self.show_used = AddressUsageStateFilter(state)
         self.update()
 
-    @profiler
     def update(self):
         if self.maybe_defer_update():
             return
-        current_address = self.current_item_user_role(col=self.Columns.LABEL)
-        if self.show_change == AddressTypeFilter.RECEIVING:
+        self._updater.request()
+
+    def _compute_update(self) -> AddressListUpdate:
+        # runs in list_update_thread: no Qt calls in here
+        show_change = self.show_change
+        if show_change == AddressTypeFilter.RECEIVING:
             addr_list = self.wallet.get_receiving_addresses()
-        elif self.show_change == AddressTypeFilter.CHANGE:
+        elif show_change == AddressTypeFilter.CHANGE:
             addr_list = self.wallet.get_change_addresses()
         else:
             addr_list = self.wallet.get_addresses()
-        self.model().clear()
+        version = self.wallet.get_history_version()
+        changes = self.wallet.get_history_changes_since(self._history_version)
+        stale = None if changes is None else changes.addresses
+        stats = {}
+        for address in addr_list:
+            if stale is not None and address not in stale and address in self._address_stats:
+                continue
+            stats[address] = AddressStats(
+                num_txs=self.wallet.get_address_history_len(address),
+                balance=sum(self.wallet.get_addr_balance(address)))
+        flags = {address: (self.wallet.is_change(address),
+                           self.wallet.is_frozen_address(address),
+                           self.wallet.is_beyond_limit(address))
+                 for address in addr_list}
+        return AddressListUpdate(
+            version=version,
+            filters=(show_change, self.show_used),
+            addresses=addr_list,
+            stats=stats,
+            flags=flags,
+            full=changes is None)
+
+    @profiler
+    def _apply_update(self, result: AddressListUpdate):
+        # stats of addresses we did not look at would go stale
+        shown = set(result.addresses)
+        self._address_stats = {addr: stats for addr, stats in self._address_stats.items()
+                               if addr in shown and not result.full}
+        self._address_stats.update(result.stats)
+        self._history_version = result.version
+        if result.filters != (self.show_change, self.show_used):
+            # filters changed while we were computing
+            self.update()
+            return
+        if result.filters != self._shown_filters:
+            self._shown_filters = result.filters
+            self._address_items.clear()
+            self.model().clear()
+        current_address = self.current_item_user_role(col=self.Columns.LABEL)
         self.refresh_headers()
         fx = self.parent.fx
-        set_address = None
-        for address in addr_list:
-            num = self.wallet.get_address_history_len(address)
-            label = self.wallet.labels.get(address, '')
-            c, u, x = self.wallet.get_addr_balance(address)
-            balance = c + u + x
-            is_used_and_empty = self.wallet.is_used(address) and balance == 0
+        show_fiat = bool(fx and fx.get_fiat_address_config())
+        rate = fx.exchange_rate() if show_fiat else None
+        rows = {}
+        for address in result.addresses:
+            stats = self._address_stats[address]
+            balance = stats.balance
+            is_used_and_empty = stats.num_txs != 0 and balance == 0
             if self.show_used == AddressUsageStateFilter.UNUSED and (balance or is_used_and_empty):
                 continue
             if self.show_used == AddressUsageStateFilter.FUNDED and balance == 0:
                 continue
             if self.show_used == AddressUsageStateFilter.USED_AND_EMPTY and not is_used_and_empty:
                 continue
-            balance_text = self.parent.format_amount(balance, whitespaces=True)
-            # create item
-            if fx and fx.get_fiat_address_config():
-                rate = fx.exchange_rate()
-                fiat_balance = fx.value_str(balance, rate)
-            else:
-                fiat_balance = ''
-            labels = ['', address, label, balance_text, fiat_balance, "%d"%num]
-            address_item = [QStandardItem(e) for e in labels]
-            # align text and set fonts
-            for i, item in enumerate(address_item):
-                item.setTextAlignment(Qt.AlignVCenter)
-                if i not in (self.Columns.TYPE, self.Columns.LABEL):
-                    item.setFont(QFont(MONOSPACE_FONT))
-            self.set_editability(address_item)
-            address_item[self.Columns.FIAT_BALANCE].setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-            # setup column 0
-            if self.wallet.is_change(address):
-                address_item[self.Columns.TYPE].setText(_('change'))
-                address_item[self.Columns.TYPE].setBackground(ColorScheme.YELLOW.as_color(True))
+            rows[address] = stats
+        # remove rows that are gone, bottom-up so that row numbers stay valid
+        removed = [addr for addr in self._address_items if addr not in rows]
+        for row in sorted((self._address_items[addr][0].row() for addr in removed), reverse=True):
+            self.model().removeRow(row)
+        for addr in removed:
+            del self._address_items[addr]
+        set_address = None
+        for address, stats in rows.items():
+            label = self.wallet.labels.get(address, '')
+            balance_text = self.parent.format_amount(stats.balance, whitespaces=True)
+            fiat_balance = fx.value_str(stats.balance, rate) if show_fiat else ''
+            labels = ['', address, label, balance_text, fiat_balance, "%d"%stats.num_txs]
+            address_item = self._address_items.get(address)
+            if address_item is None:
+                address_item = [QStandardItem(e) for e in labels]
+                # align text and set fonts
+                for i, item in enumerate(address_item):
+                    item.setTextAlignment(Qt.AlignVCenter)
+                    if i not in (self.Columns.TYPE, self.Columns.LABEL):
+                        item.setFont(QFont(MONOSPACE_FONT))
+                self.set_editability(address_item)
+                address_item[self.Columns.FIAT_BALANCE].setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                address_item[self.Columns.LABEL].setData(address, Qt.UserRole)
+                self.model().insertRow(self.model().rowCount(), address_item)
+                self._address_items[address] = address_item
             else:
-                address_item[self.Columns.TYPE].setText(_('receiving'))
-                address_item[self.Columns.TYPE].setBackground(ColorScheme.GREEN.as_color(True))
-            address_item[self.Columns.LABEL].setData(address, Qt.UserRole)
-            # setup column 1
-            if self.wallet.is_frozen_address(address):
-                address_item[self.Columns.ADDRESS].setBackground(ColorScheme.BLUE.as_color(True))
-            if self.wallet.is_beyond_limit(address):
-                address_item[self.Columns.ADDRESS].setBackground(ColorScheme.RED.as_color(True))
-            # add item
-            count = self.model().rowCount()
-            self.model().insertRow(count, address_item)
-            address_idx = self.model().index(count, self.Columns.LABEL)
+                for i, (item, text) in enumerate(zip(address_item, labels)):
+                    if i != self.Columns.TYPE and item.text() != text:
+                        item.setText(text)
+            is_change, is_frozen, is_beyond_limit = result.flags[address]
+            self._set_row_style(address_item, is_change, is_frozen, is_beyond_limit)
             if address == current_address:
+                address_idx = address_item[self.Columns.LABEL].index()
                 set_address = QPersistentModelIndex(address_idx)
         self.set_current_idx(set_address)
         # show/hide columns
-        if fx and fx.get_fiat_address_config():
+        if show_fiat:
             self.showColumn(self.Columns.FIAT_BALANCE)
         else:
             self.hideColumn(self.Columns.FIAT_BALANCE)
         self.filter()
 
+    def _set_row_style(self, address_item, is_change, is_frozen, is_beyond_limit):
+        # setup column 0
+        if is_change:
+            type_text, type_color = _('change'), ColorScheme.YELLOW
+        else:
+            type_text, type_color = _('receiving'), ColorScheme.GREEN
+        if address_item[self.Columns.TYPE].text() != type_text:
+            address_item[self.Columns.TYPE].setText(type_text)
+            address_item[self.Columns.TYPE].setBackground(type_color.as_color(True))
+        # setup column 1
+        if is_beyond_limit:
+            background = ColorScheme.RED.as_color(True)
+        elif is_frozen:
+            background = ColorScheme.BLUE.as_color(True)
+        else:
+            background = QBrush()
+        if address_item[self.Columns.ADDRESS].background() != background:
+            address_item[self.Columns.ADDRESS].setBackground(background)
+
     def create_menu(self, position):
         from electrum.wallet import Multisig_Wallet
         is_multisig = isinstance(self.wallet, Multisig_Wallet)
@@ -27,7 +27,7 @@ import os
 import sys
 import datetime
 from datetime import date
-from typing import TYPE_CHECKING, Tuple, Dict
+from typing import TYPE_CHECKING, Tuple, Dict, NamedTuple
 import threading
 from enum import IntEnum
 from decimal import Decimal
@@ -48,7 +48,7 @@ from electrum.logging import get_logger, Logger
 
 from .util import (read_QIcon, MONOSPACE_FONT, Buttons, CancelButton, OkButton,
                    filename_field, MyTreeView, AcceptFileDragDrop, WindowModalDialog,
-                   CloseButton, webopen)
+                   CloseButton, webopen, BackgroundUpdater)
 
 if TYPE_CHECKING:
     from electrum.wallet import Abstract_Wallet
@@ -103,6 +103,12 @@ class HistorySortModel(QSortFilterProxyModel):
         except:
             return False
 
+class HistoryRefresh(NamedTuple):
+    version: int
+    transactions: OrderedDictWithIndex
+    tx_status: Dict[str, Tuple[int, str]]
+
+
 def get_item_key(tx_item):
     return tx_item.get('txid') or tx_item['payment_hash']
 
@@ -115,6 +121,8 @@ class HistoryModel(QAbstractItemModel, Logger):
         self.view = None  # type: HistoryList
         self.transactions = OrderedDictWithIndex()
         self.tx_status_cache = {}  # type: Dict[str, Tuple[int, str]]
+        self._updater = BackgroundUpdater(parent.list_update_thread,
+                                          self._compute_refresh, self._apply_refresh)
 
     def set_view(self, history_list: 'HistoryList'):
         # FIXME HistoryModel and HistoryList mutually depend on each other.
@@ -259,37 +267,65 @@ class HistoryModel(QAbstractItemModel, Logger):
         """Overridden in address_dialog.py"""
         return True
 
-    @profiler
     def refresh(self, reason: str):
         self.logger.info(f"refreshing... reason: {reason}")
         assert self.parent.gui_thread == threading.current_thread(), 'must be called from GUI thread'
         assert self.view, 'view not set'
         if self.view.maybe_defer_update():
             return
-        selected = self.view.selectionModel().currentIndex()
-        selected_row = None
-        if selected:
-            selected_row = selected.row()
+        self.set_visibility_of_columns()
+        self._updater.request()
+
+    def _compute_refresh(self) -> HistoryRefresh:
+        # runs in list_update_thread: no Qt calls in here
         fx = self.parent.fx
         if fx: fx.history_used_spot = False
         wallet = self.parent.wallet
-        self.set_visibility_of_columns()
-        transactions = wallet.get_full_history(self.parent.fx,
+        version = wallet.get_history_version()
+        transactions = wallet.get_full_history(fx,
                                                onchain_domain=self.get_domain(),
                                                include_lightning=self.should_include_lightning_payments())
-        if transactions == list(self.transactions.values()):
-            return
-        old_length = len(self.transactions)
-        if old_length != 0:
-            self.beginRemoveRows(QModelIndex(), 0, old_length)
-            self.transactions.clear()
-            self.endRemoveRows()
-        self.beginInsertRows(QModelIndex(), 0, len(transactions)-1)
-        self.transactions = transactions
-        self.endInsertRows()
-        if selected_row:
-            self.view.selectionModel().select(self.createIndex(selected_row, 0), QItemSelectionModel.Rows | QItemSelectionModel.SelectCurrent)
-        self.view.filter()
+        tx_status = {}
+        for txid, tx_item in transactions.items():
+            if not tx_item.get('lightning', False):
+                tx_mined_info = self.tx_mined_info_from_tx_item(tx_item)
+                tx_status[txid] = wallet.get_tx_status(txid, tx_mined_info)
+        return HistoryRefresh(version, transactions, tx_status)
+
+    @profiler
+    def _apply_refresh(self, result: HistoryRefresh):
+        transactions = result.transactions
+        old_keys = list(self.transactions.keys())
+        new_keys = list(transactions.keys())
+        old_length, new_length = len(old_keys), len(new_keys)
+        self.tx_status_cache = result.tx_status
+        if new_keys[:old_length] == old_keys:
+            # rows kept their position: only signal what changed
+            changed_rows = [row for row, (old_item, new_item)
+                            in enumerate(zip(self.transactions.values(), transactions.values()))
+                            if old_item != new_item]
+            if new_length > old_length:
+                self.beginInsertRows(QModelIndex(), old_length, new_length - 1)
+                self.transactions = transactions
+                self.endInsertRows()
+            else:
+                self.transactions = transactions
+            last_col = len(HistoryColumns) - 1
+            for row in changed_rows:
+                self.dataChanged.emit(self.createIndex(row, 0), self.createIndex(row, last_col))
+            if new_length > old_length or changed_rows:
+                self.view.filter()
+        else:
+            selected = self.view.selectionModel().currentIndex()
+            selected_row = None
+            if selected:
+                selected_row = selected.row()
+            self.beginResetModel()
+            self.transactions = transactions
+            self.endResetModel()
+            if selected_row:
+                self.view.selectionModel().select(self.createIndex(selected_row, 0), QItemSelectionModel.Rows | QItemSelectionModel.SelectCurrent)
+            self.view.filter()
         # update time filter
         if not self.view.years and self.transactions:
             start_date = date.today()
@@ -299,12 +335,10 @@ class HistoryModel(QAbstractItemModel, Logger):
                 end_date = self.transactions.value_from_pos(len(self.transactions) - 1).get('date') or end_date
             self.view.years = [str(i) for i in range(start_date.year, end_date.year + 1)]
             self.view.period_combo.insertItems(1, self.view.years)
-        # update tx_status_cache
-        self.tx_status_cache.clear()
-        for txid, tx_item in self.transactions.items():
-            if not tx_item.get('lightning', False):
-                tx_mined_info = self.tx_mined_info_from_tx_item(tx_item)
-                self.tx_status_cache[txid] = self.parent.wallet.get_tx_status(txid, tx_mined_info)
+        if self.parent.wallet.get_history_version() != result.version:
+            # the wallet changed while we were computing,
+            # and may have overtaken update_tx_mined_status calls
+            self._updater.request()
 
     def set_visibility_of_columns(self):
         def set_visible(col: int, b: bool):
@@ -67,7 +67,8 @@ from electrum.transaction import (Transaction, PartialTxInput,
                                   PartialTransaction, PartialTxOutput)
 from electrum.address_synchronizer import AddTransactionException
 from electrum.wallet import (Multisig_Wallet, CannotBumpFee, Abstract_Wallet,
-                             sweep_preparations, InternalAddressCorruption)
+                             sweep_preparations, make_sweep_batch, SWEEP_MAX_TX_INPUTS,
+                             InternalAddressCorruption)
 from electrum.version import ELECTRUM_VERSION
 from electrum.network import Network, TxBroadcastError, BestEffortRequestFailed
 from electrum.exchange_rate import FxThread
@@ -197,6 +198,8 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, Logger):
         self.num_zeros = int(config.get('num_zeros', 0))
 
         self.completions = QStringListModel()
+        # list models compute their updates here, off the GUI thread
+        self.list_update_thread = TaskThread(self, self.on_error)
 
         coincontrol_sb = self.create_coincontrol_statusbar()
 
@@ -2710,15 +2713,61 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, Logger):
             self.show_error(str(e))
             raise
         try:
-            coins, keypairs = sweep_preparations(get_pk(), self.network)
+            coins, keypairs = sweep_preparations(get_pk(), self.network, imax=None)
         except Exception as e:  # FIXME too broad...
             self.show_message(repr(e))
             return
+        if len(coins) > SWEEP_MAX_TX_INPUTS:
+            self.sweep_batch_dialog(coins, keypairs, addr)
+            return
         scriptpubkey = bfh(bitcoin.address_to_script(addr))
         outputs = [PartialTxOutput(scriptpubkey=scriptpubkey, value='!')]
         self.warn_if_watching_only()
         self.pay_onchain_dialog(coins, outputs, external_keypairs=keypairs)
 
+    def sweep_batch_dialog(self, coins, keypairs, addr):
+        """Sweeps more coins than fit in one transaction, with several."""
+        def make_txs():
+            return make_sweep_batch(coins, keypairs, network=self.network, config=self.config,
+                                    to_address=addr)
+
+        def broadcast_txs(txs):
+            num_sent = 0
+            for tx in txs:
+                try:
+                    self.network.run_from_another_thread(self.network.broadcast_transaction(tx))
+                except TxBroadcastError as e:
+                    return num_sent, e.get_message_for_gui()
+                except BestEffortRequestFailed as e:
+                    return num_sent, repr(e)
+                num_sent += 1
+            return num_sent, None
+
+        def on_broadcast(txs, result):
+            num_sent, error = result
+            msg = _('{} of {} transactions sent.').format(num_sent, len(txs))
+            if error:
+                self.show_error(msg + '\n' + error)
+            else:
+                self.show_message(msg)
+
+        def on_signed(txs):
+            amount = sum(tx.output_value() for tx in txs)
+            fee = sum(tx.get_fee() for tx in txs)
+            msg = '\n'.join([
+                _('{} coins will be swept by {} transactions.').format(len(coins), len(txs)),
+                _('Amount') + ': ' + self.format_amount_and_units(amount),
+                _('Mining fee') + ': ' + self.format_amount_and_units(fee),
+                '',
+                _('Broadcast them now?'),
+            ])
+            if not self.question(msg):
+                return
+            WaitingDialog(self, _('Broadcasting transactions...'),
+                          partial(broadcast_txs, txs), partial(on_broadcast, txs), self.on_error)
+
+        WaitingDialog(self, _('Signing transactions...'), make_txs, on_signed, self.on_error)
+
     def _do_import(self, title, header_layout, func):
         text = text_dialog(self, title, header_layout, _('Import'), allow_multi=True)
         if not text:
@@ -2784,6 +2833,7 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, Logger):
 
     def clean_up(self):
         self.wallet.thread.stop()
+        self.list_update_thread.stop()
         if self.network:
             self.network.unregister_callback(self.on_network)
         self.config.set_key("is_maximized", self.isMaximized())
@@ -785,6 +785,38 @@ class TaskThread(QThread):
         self.tasks.put(None)
 
 
+class BackgroundUpdater:
+    """Runs the expensive part of a list update in a TaskThread.
+
+    compute() runs in the worker thread and must not touch Qt objects,
+    apply(result) then runs in the GUI thread. Updates requested while
+    one is in progress are coalesced into a single further update.
+    """
+
+    def __init__(self, thread: TaskThread, compute: Callable[[], Any], apply: Callable[[Any], None]):
+        self.thread = thread
+        self.compute = compute
+        self.apply = apply
+        self._running = False
+        self._pending = False
+
+    def request(self) -> None:
+        if self._running:
+            self._pending = True
+            return
+        self._running = True
+        self.thread.add(self.compute, on_success=self._on_success, on_done=self._on_done)
+
+    def _on_done(self):
+        self._running = False
+
+    def _on_success(self, result):
+        self.apply(result)
+        if self._pending:
+            self._pending = False
+            self.request()
+
+
 class ColorSchemeItem:
     def __init__(self, fg_color, bg_color):
         self.colors = (fg_color, bg_color)
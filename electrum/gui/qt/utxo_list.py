@@ -23,18 +23,18 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from typing import Optional, List, Dict, Sequence, Set
+from typing import Optional, List, Dict, Sequence, Set, Tuple
 from enum import IntEnum
 import copy
 
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QStandardItemModel, QStandardItem, QFont
+from PyQt5.QtGui import QStandardItemModel, QStandardItem, QFont, QBrush
 from PyQt5.QtWidgets import QAbstractItemView, QMenu, QLabel, QHBoxLayout
 
 from electrum.i18n import _
 from electrum.transaction import PartialTxInput
 
-from .util import MyTreeView, ColorScheme, MONOSPACE_FONT, EnterButton
+from .util import MyTreeView, ColorScheme, MONOSPACE_FONT, EnterButton, BackgroundUpdater
 
 
 class UTXOList(MyTreeView):
@@ -64,6 +64,10 @@ class UTXOList(MyTreeView):
         self._spend_set = None
         self._utxo_dict = {}
         self.wallet = self.parent.wallet
+        self._utxo_items = {}  # type: Dict[str, List[QStandardItem]]
+        self._utxo_styles = {}  # type: Dict[str, Tuple[bool, bool, bool]]
+        self._updater = BackgroundUpdater(self.parent.list_update_thread,
+                                          self._compute_update, self._apply_update)
 
         self.setModel(QStandardItemModel(self))
         self.setSelectionMode(QAbstractItemView.ExtendedSelection)
@@ -73,13 +77,25 @@ class UTXOList(MyTreeView):
     def update(self):
         if self.maybe_defer_update():
             return
-        utxos = self.wallet.get_utxos()
+        self._updater.request()
+
+    def _compute_update(self) -> List[PartialTxInput]:
+        # runs in list_update_thread: no Qt calls in here
+        return self.wallet.get_utxos()
+
+    def _apply_update(self, utxos: List[PartialTxInput]):
         self._maybe_reset_spend_list(utxos)
-        self._utxo_dict = {}
-        self.model().clear()
+        self._utxo_dict = {utxo.prevout.to_str(): utxo for utxo in utxos}
         self.update_headers(self.__class__.headers)
-        for idx, utxo in enumerate(utxos):
-            self.insert_utxo(idx, utxo)
+        # remove spent coins, bottom-up so that row numbers stay valid
+        spent = [name for name in self._utxo_items if name not in self._utxo_dict]
+        for row in sorted((self._utxo_items[name][0].row() for name in spent), reverse=True):
+            self.model().removeRow(row)
+        for name in spent:
+            del self._utxo_items[name]
+            del self._utxo_styles[name]
+        for utxo in utxos:
+            self.insert_utxo(self.model().rowCount(), utxo)
         self.filter()
         # update coincontrol status bar
         if self._spend_set is not None:
@@ -93,6 +109,7 @@ class UTXOList(MyTreeView):
             self.parent.set_coincontrol_msg(None)
 
     def insert_utxo(self, idx, utxo: PartialTxInput):
+        """Adds a row for utxo, or refreshes the row if it is already in the list."""
         address = utxo.address
         height = utxo.block_height
         name = utxo.prevout.to_str()
@@ -101,29 +118,42 @@ class UTXOList(MyTreeView):
         label = self.wallet.get_label(utxo.prevout.txid.hex())
         amount = self.parent.format_amount(utxo.value_sats(), whitespaces=True)
         labels = [name_short, address, label, amount, '%d'%height]
-        utxo_item = [QStandardItem(x) for x in labels]
-        self.set_editability(utxo_item)
-        utxo_item[self.Columns.OUTPOINT].setData(name, self.ROLE_CLIPBOARD_DATA)
-        utxo_item[self.Columns.ADDRESS].setFont(QFont(MONOSPACE_FONT))
-        utxo_item[self.Columns.AMOUNT].setFont(QFont(MONOSPACE_FONT))
-        utxo_item[self.Columns.OUTPOINT].setFont(QFont(MONOSPACE_FONT))
-        utxo_item[self.Columns.ADDRESS].setData(name, Qt.UserRole)
+        utxo_item = self._utxo_items.get(name)
+        if utxo_item is None:
+            utxo_item = [QStandardItem(x) for x in labels]
+            self.set_editability(utxo_item)
+            utxo_item[self.Columns.OUTPOINT].setData(name, self.ROLE_CLIPBOARD_DATA)
+            utxo_item[self.Columns.ADDRESS].setFont(QFont(MONOSPACE_FONT))
+            utxo_item[self.Columns.AMOUNT].setFont(QFont(MONOSPACE_FONT))
+            utxo_item[self.Columns.OUTPOINT].setFont(QFont(MONOSPACE_FONT))
+            utxo_item[self.Columns.ADDRESS].setData(name, Qt.UserRole)
+            self.model().insertRow(idx, utxo_item)
+            self._utxo_items[name] = utxo_item
+        else:
+            for item, text in zip(utxo_item, labels):
+                if item.text() != text:
+                    item.setText(text)
+        style = (name in (self._spend_set or set()),
+                 self.wallet.is_frozen_address(address),
+                 self.wallet.is_frozen_coin(utxo))
+        if self._utxo_styles.get(name) != style:
+            self._utxo_styles[name] = style
+            self._set_utxo_style(name, utxo_item, *style)
+
+    def _set_utxo_style(self, name, utxo_item, is_selected, is_frozen_address, is_frozen_coin):
         SELECTED_TO_SPEND_TOOLTIP = _('Coin selected to be spent')
-        if name in (self._spend_set or set()):
-            for col in utxo_item:
-                col.setBackground(ColorScheme.GREEN.as_color(True))
-                if col != self.Columns.OUTPOINT:
-                    col.setToolTip(SELECTED_TO_SPEND_TOOLTIP)
-        if self.wallet.is_frozen_address(address):
+        for col in utxo_item:
+            col.setBackground(ColorScheme.GREEN.as_color(True) if is_selected else QBrush())
+            col.setToolTip(SELECTED_TO_SPEND_TOOLTIP if is_selected else '')
+        if is_frozen_address:
             utxo_item[self.Columns.ADDRESS].setBackground(ColorScheme.BLUE.as_color(True))
             utxo_item[self.Columns.ADDRESS].setToolTip(_('Address is frozen'))
-        if self.wallet.is_frozen_coin(utxo):
+        if is_frozen_coin:
             utxo_item[self.Columns.OUTPOINT].setBackground(ColorScheme.BLUE.as_color(True))
             utxo_item[self.Columns.OUTPOINT].setToolTip(f"{name}\n{_('Coin is frozen')}")
         else:
-            tooltip = ("\n" + SELECTED_TO_SPEND_TOOLTIP) if name in (self._spend_set or set()) else ""
+            tooltip = ("\n" + SELECTED_TO_SPEND_TOOLTIP) if is_selected else ""
             utxo_item[self.Columns.OUTPOINT].setToolTip(name + tooltip)
-        self.model().insertRow(idx, utxo_item)
 
     def get_selected_outpoints(self) -> Optional[List[str]]:
         if not self.model():
@@ -33,6 +33,7 @@ from typing import Tuple, Union, List, TYPE_CHECKING, Optional, Set
 from collections import defaultdict
 from ipaddress import IPv4Network, IPv6Network, ip_address, IPv6Address
 import itertools
+import time
 import logging
 
 import aiorpcx
@@ -50,6 +51,7 @@ from . import version
 from . import blockchain
 from .blockchain import Blockchain
 from . import constants
+from . import metrics
 from .i18n import _
 from .logging import Logger
 
@@ -110,18 +112,26 @@ class NotificationSession(RPCSession):
         # aiorpcx. the timeout arg here in most cases should not be set
         msg_id = next(self._msg_counter)
         self.maybe_log(f"<-- {args} {kwargs} (id: {msg_id})")
+        method = args[0] if args else None
+        scoreboard = self.interface.network.scoreboard
+        t0 = time.monotonic()
         try:
             # note: RPCSession.send_request raises TaskTimeout in case of a timeout.
             # TaskTimeout is a subclass of CancelledError, which is *suppressed* in TaskGroups
-            response = await asyncio.wait_for(
-                super().send_request(*args, **kwargs),
-                timeout)
+            with metrics.timer('interface.request', method=method):
+                response = await asyncio.wait_for(
+                    super().send_request(*args, **kwargs),
+                    timeout)
         except (TaskTimeout, asyncio.TimeoutError) as e:
+            metrics.inc('interface.request_errors', method=method, error='timeout')
+            scoreboard.record_timeout(self.interface.server)
             raise RequestTimedOut(f'request timed out: {args} (id: {msg_id})') from e
         except CodeMessageError as e:
+            metrics.inc('interface.request_errors', method=method, error='server')
             self.maybe_log(f"--> {repr(e)} (id: {msg_id})")
             raise
         else:
+            scoreboard.record_rtt(self.interface.server, time.monotonic() - t0)
             self.maybe_log(f"--> {response} (id: {msg_id})")
             return response
 
@@ -149,6 +159,13 @@ class NotificationSession(RPCSession):
             if queue in v:
                 v.remove(queue)
 
+    def unsubscribe_from(self, method: str, params: List, queue: asyncio.Queue):
+        """Stop sending the notifications of a single subscription to queue."""
+        # note: the key is kept, as the server keeps sending notifications
+        key = self.get_hashable_key_for_rpc_call(method, params)
+        if queue in self.subscriptions.get(key, ()):
+            self.subscriptions[key].remove(queue)
+
     @classmethod
     def get_hashable_key_for_rpc_call(cls, method, params):
         """Hashable index for subscriptions and cache"""
@@ -530,6 +547,9 @@ class Interface(Logger):
             self.tip = height
             if self.tip < constants.net.max_checkpoint():
                 raise GracefulDisconnect('server tip below max checkpoint')
+            if self.ready.done():
+                # a new block, not the tip we got when subscribing
+                self.network.scoreboard.record_tip(self.server, height)
             self._mark_ready()
             await self._process_header_at_tip()
             self.network.trigger_callback('network_updated')
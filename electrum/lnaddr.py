@@ -3,9 +3,12 @@
 
 import re
 import time
+import copy
 from hashlib import sha256
 from binascii import hexlify
 from decimal import Decimal
+from functools import lru_cache
+from typing import List, Sequence
 
 import bitstring
 
@@ -75,6 +78,49 @@ def bitarray_to_u5(barr):
         ret.append(s.read(5).uint)
     return ret
 
+# Digits of base 32, so that int() can do the bit packing for us.
+_BASE32_DIGITS = '0123456789abcdefghijklmnopqrstuv'
+
+def u5_to_int(arr: Sequence[int]) -> int:
+    """ Interpret a sequence of 5-bit values as a big-endian unsigned integer.
+    """
+    if not arr:
+        return 0
+    return int(''.join(map(_BASE32_DIGITS.__getitem__, arr)), 32)
+
+def int_to_u5(value: int, length: int = None) -> List[int]:
+    """ Convert an integer to big-endian 5-bit values.
+    If length is not given, the shortest representation is used.
+    """
+    if length is None:
+        length = (value.bit_length() + 4) // 5
+    nbits = length * 5
+    if value < 0 or value >> nbits:
+        raise ValueError("{} does not fit in {} 5-bit values".format(value, length))
+    if not nbits:
+        return []
+    bits = format(value, '0{}b'.format(nbits))
+    return [int(bits[i:i+5], 2) for i in range(0, nbits, 5)]
+
+def u5_to_bytes(arr: Sequence[int], *, pad=False) -> bytes:
+    """ Pack 5-bit values into bytes.
+    Trailing bits that do not fill a byte are discarded, or
+    zero-padded if pad is set.
+    """
+    nbits = len(arr) * 5
+    nbytes, rem = divmod(nbits, 8)
+    value = u5_to_int(arr)
+    if pad and rem:
+        return (value << (8 - rem)).to_bytes(nbytes + 1, 'big')
+    return (value >> rem).to_bytes(nbytes, 'big')
+
+def bytes_to_u5(b: bytes) -> List[int]:
+    """ Unpack bytes into 5-bit values, zero-padding the last one.
+    """
+    nbits = len(b) * 8
+    rem = -nbits % 5
+    return int_to_u5(int.from_bytes(b, 'big') << rem, (nbits + rem) // 5)
+
 def encode_fallback(fallback, currency):
     """ Encode all supported fallback addresses.
     """
@@ -86,7 +132,7 @@ def encode_fallback(fallback, currency):
             wver = witness[0]
             if wver > 16:
                 raise ValueError("Invalid witness version {}".format(witness[0]))
-            wprog = u5_to_bitarray(witness[1:])
+            wprog = witness[1:]
         else:
             addrtype, addr = b58_address_to_hash160(fallback)
             if is_p2pkh(currency, addrtype):
@@ -95,24 +141,24 @@ def encode_fallback(fallback, currency):
                 wver = 18
             else:
                 raise ValueError("Unknown address type for {}".format(currency))
-            wprog = addr
-        return tagged('f', bitstring.pack("uint:5", wver) + wprog)
+            wprog = bytes_to_u5(addr)
+        return tagged('f', [wver] + wprog)
     else:
         raise NotImplementedError("Support for currency {} not implemented".format(currency))
 
-def parse_fallback(fallback, currency):
+def parse_fallback(fallback: Sequence[int], currency):
     if currency in [constants.BitcoinMainnet.SEGWIT_HRP, constants.BitcoinTestnet.SEGWIT_HRP]:
-        wver = fallback[0:5].uint
+        wver = fallback[0]
         if wver == 17:
-            addr=hash160_to_b58_address(fallback[5:].tobytes(), base58_prefix_map[currency][0])
+            addr=hash160_to_b58_address(u5_to_bytes(fallback[1:]), base58_prefix_map[currency][0])
         elif wver == 18:
-            addr=hash160_to_b58_address(fallback[5:].tobytes(), base58_prefix_map[currency][1])
+            addr=hash160_to_b58_address(u5_to_bytes(fallback[1:]), base58_prefix_map[currency][1])
         elif wver <= 16:
-            addr=bech32_encode(currency, bitarray_to_u5(fallback))
+            addr=bech32_encode(currency, fallback)
         else:
             return None
     else:
-        addr=fallback.tobytes()
+        addr=u5_to_bytes(fallback, pad=True)
     return addr
 
 
@@ -128,32 +174,29 @@ def is_p2pkh(currency, prefix):
 def is_p2sh(currency, prefix):
     return prefix == base58_prefix_map[currency][1]
 
-# Tagged field containing BitArray
-def tagged(char, l):
-    # Tagged fields need to be zero-padded to 5 bits.
-    while l.len % 5 != 0:
-        l.append('0b0')
-    return bitstring.pack("uint:5, uint:5, uint:5",
-                          CHARSET.find(char),
-                          (l.len / 5) / 32, (l.len / 5) % 32) + l
+# Tagged field containing 5-bit values
+def tagged(char, l: Sequence[int]) -> List[int]:
+    return [CHARSET.find(char), len(l) // 32, len(l) % 32] + list(l)
 
 # Tagged field containing bytes
-def tagged_bytes(char, l):
-    return tagged(char, bitstring.BitArray(l))
-
-# Discard trailing bits, convert to bytes.
-def trim_to_bytes(barr):
-    # Adds a byte if necessary.
-    b = barr.tobytes()
-    if barr.len % 8 != 0:
-        return b[:-1]
-    return b
-
-# Try to pull out tagged data: returns tag, tagged data and remainder.
-def pull_tagged(stream):
-    tag = stream.read(5).uint
-    length = stream.read(5).uint * 32 + stream.read(5).uint
-    return (CHARSET[tag], stream.read(length * 5), stream)
+def tagged_bytes(char, l: bytes) -> List[int]:
+    return tagged(char, bytes_to_u5(l))
+
+def iter_tagged_fields(data: Sequence[int], pos: int = 0):
+    """ Iterate over the tagged fields of a 5-bit data part, starting at pos.
+    Yields (tag, 5-bit values of the field).
+    """
+    end = len(data)
+    while pos < end:
+        if pos + 3 > end:
+            raise ValueError("Truncated tagged field")
+        tag = CHARSET[data[pos]]
+        length = data[pos+1] * 32 + data[pos+2]
+        pos += 3
+        if pos + length > end:
+            raise ValueError("Truncated tagged field '{}'".format(tag))
+        yield tag, data[pos:pos+length]
+        pos += length
 
 def lnencode(addr, privkey):
     if addr.amount:
@@ -170,7 +213,7 @@ def lnencode(addr, privkey):
     hrp = 'ln' + amount
 
     # Start with the timestamp
-    data = bitstring.pack('uint:35', addr.date)
+    data = int_to_u5(addr.date, 7)
 
     # Payment hash
     data += tagged_bytes('p', addr.paymenthash)
@@ -186,31 +229,25 @@ def lnencode(addr, privkey):
                 raise ValueError("Duplicate '{}' tag".format(k))
 
         if k == 'r':
-            route = bitstring.BitArray()
+            route = bytearray()
             for step in v:
                 pubkey, channel, feebase, feerate, cltv = step
-                route.append(bitstring.BitArray(pubkey) + bitstring.BitArray(channel) + bitstring.pack('intbe:32', feebase) + bitstring.pack('intbe:32', feerate) + bitstring.pack('intbe:16', cltv))
-            data += tagged('r', route)
+                route += pubkey + channel + feebase.to_bytes(4, 'big') + feerate.to_bytes(4, 'big') + cltv.to_bytes(2, 'big')
+            data += tagged_bytes('r', route)
         elif k == 'f':
             data += encode_fallback(v, addr.currency)
         elif k == 'd':
             data += tagged_bytes('d', v.encode())
         elif k == 'x':
-            # Get minimal length by trimming leading 5 bits at a time.
-            expirybits = bitstring.pack('intbe:64', v)[4:64]
-            while expirybits.startswith('0b00000'):
-                expirybits = expirybits[5:]
-            data += tagged('x', expirybits)
+            # Minimal length, i.e. without leading zero 5-bit values.
+            data += tagged('x', int_to_u5(v))
         elif k == 'h':
             data += tagged_bytes('h', sha256(v.encode('utf-8')).digest())
         elif k == 'n':
             data += tagged_bytes('n', v)
         elif k == 'c':
-            # Get minimal length by trimming leading 5 bits at a time.
-            finalcltvbits = bitstring.pack('intbe:64', v)[4:64]
-            while finalcltvbits.startswith('0b00000'):
-                finalcltvbits = finalcltvbits[5:]
-            data += tagged('c', finalcltvbits)
+            # Minimal length, i.e. without leading zero 5-bit values.
+            data += tagged('c', int_to_u5(v))
         else:
             # FIXME: Support unknown tags?
             raise ValueError("Unknown tag {}".format(k))
@@ -227,14 +264,15 @@ def lnencode(addr, privkey):
         raise ValueError("Must include either 'd' or 'h'")
 
     # We actually sign the hrp, then data (padded to 8 bits with zeroes).
-    msg = hrp.encode("ascii") + data.tobytes()
+    msg = hrp.encode("ascii") + u5_to_bytes(data, pad=True)
     privkey = ecc.ECPrivkey(privkey)
     sig = privkey.sign_message(msg, is_compressed=False, algo=lambda x:sha256(x).digest())
     recovery_flag = bytes([sig[0] - 27])
     sig = bytes(sig[1:]) + recovery_flag
-    data += sig
+    # 65 bytes are exactly 104 5-bit values
+    data += bytes_to_u5(sig)
 
-    return bech32_encode(hrp, bitarray_to_u5(data))
+    return bech32_encode(hrp, data)
 
 class LnAddr(object):
     def __init__(self, paymenthash: bytes = None, amount=None, currency=None, tags=None, date=None):
@@ -283,6 +321,22 @@ class LnDecodeException(Exception): pass
 def lndecode(invoice: str, *, verbose=False, expected_hrp=None) -> LnAddr:
     if expected_hrp is None:
         expected_hrp = constants.net.SEGWIT_HRP
+    if verbose:
+        return _lndecode(invoice, verbose=True, expected_hrp=expected_hrp)
+    addr = _lndecode_cached(invoice, expected_hrp)
+    # the cached instance is shared, hand out a copy that callers can modify
+    addr = copy.copy(addr)
+    addr.tags = list(addr.tags)
+    addr.unknown_tags = list(addr.unknown_tags)
+    return addr
+
+
+@lru_cache(maxsize=4096)
+def _lndecode_cached(invoice: str, expected_hrp: str) -> LnAddr:
+    return _lndecode(invoice, expected_hrp=expected_hrp)
+
+
+def _lndecode(invoice: str, *, verbose=False, expected_hrp: str) -> LnAddr:
     hrp, data = bech32_decode(invoice, ignore_long_length=True)
     if not hrp:
         raise ValueError("Bad bech32 checksum")
@@ -296,13 +350,11 @@ def lndecode(invoice: str, *, verbose=False, expected_hrp=None) -> LnAddr:
     if not hrp[2:].startswith(expected_hrp):
         raise ValueError("Wrong Lightning invoice HRP " + hrp[2:] + ", should be " + expected_hrp)
 
-    data = u5_to_bitarray(data)
-
-    # Final signature 65 bytes, split it off.
-    if len(data) < 65*8:
+    # Final signature 65 bytes (104 5-bit values), split it off.
+    if len(data) < 104 + 7:
         raise ValueError("Too short to contain signature")
-    sigdecoded = data[-65*8:].tobytes()
-    data = bitstring.ConstBitStream(data[:-65*8])
+    sigdecoded = u5_to_bytes(data[-104:])
+    data = data[:-104]
 
     addr = LnAddr()
     addr.pubkey = None
@@ -319,17 +371,16 @@ def lndecode(invoice: str, *, verbose=False, expected_hrp=None) -> LnAddr:
         if amountstr != '':
             addr.amount = unshorten_amount(amountstr)
 
-    addr.date = data.read(35).uint
+    addr.date = u5_to_int(data[:7])
 
-    while data.pos != data.len:
-        tag, tagdata, data = pull_tagged(data)
+    for tag, tagdata in iter_tagged_fields(data, 7):
 
         # BOLT #11:
         #
         # A reader MUST skip over unknown fields, an `f` field with unknown
         # `version`, or a `p`, `h`, or `n` field which does not have
         # `data_length` 52, 52, or 53 respectively.
-        data_length = len(tagdata) / 5
+        data_length = len(tagdata)
 
         if tag == 'r':
             # BOLT #11:
@@ -343,16 +394,16 @@ def lndecode(invoice: str, *, verbose=False, expected_hrp=None) -> LnAddr:
             #    * `feerate` (32 bits, big-endian)
             #    * `cltv_expiry_delta` (16 bits, big-endian)
             route=[]
-            s = bitstring.ConstBitStream(tagdata)
-            while s.pos + 264 + 64 + 32 + 32 + 16 < s.len:
-                route.append((s.read(264).tobytes(),
-                              s.read(64).tobytes(),
-                              s.read(32).intbe,
-                              s.read(32).intbe,
-                              s.read(16).intbe))
+            s = u5_to_bytes(tagdata)
+            for pos in range(0, len(s) - 50, 51):
+                route.append((s[pos:pos+33],
+                              s[pos+33:pos+41],
+                              int.from_bytes(s[pos+41:pos+45], 'big'),
+                              int.from_bytes(s[pos+45:pos+49], 'big'),
+                              int.from_bytes(s[pos+49:pos+51], 'big')))
             addr.tags.append(('r',route))
         elif tag == 'f':
-            fallback = parse_fallback(tagdata, addr.currency)
+            fallback = parse_fallback(tagdata, addr.currency) if tagdata else None
             if fallback:
                 addr.tags.append(('f', fallback))
             else:
@@ -361,48 +412,50 @@ def lndecode(invoice: str, *, verbose=False, expected_hrp=None) -> LnAddr:
                 continue
 
         elif tag == 'd':
-            addr.tags.append(('d', trim_to_bytes(tagdata).decode('utf-8')))
+            addr.tags.append(('d', u5_to_bytes(tagdata).decode('utf-8')))
 
         elif tag == 'h':
             if data_length != 52:
                 addr.unknown_tags.append((tag, tagdata))
                 continue
-            addr.tags.append(('h', trim_to_bytes(tagdata)))
+            addr.tags.append(('h', u5_to_bytes(tagdata)))
 
         elif tag == 'x':
-            addr.tags.append(('x', tagdata.uint))
+            addr.tags.append(('x', u5_to_int(tagdata)))
 
         elif tag == 'p':
             if data_length != 52:
                 addr.unknown_tags.append((tag, tagdata))
                 continue
-            addr.paymenthash = trim_to_bytes(tagdata)
+            addr.paymenthash = u5_to_bytes(tagdata)
 
         elif tag == 'n':
             if data_length != 53:
                 addr.unknown_tags.append((tag, tagdata))
                 continue
-            pubkeybytes = trim_to_bytes(tagdata)
+            pubkeybytes = u5_to_bytes(tagdata)
             addr.pubkey = pubkeybytes
         elif tag == 'c':
-            addr._min_final_cltv_expiry = tagdata.int
+            addr._min_final_cltv_expiry = u5_to_int(tagdata)
         else:
             addr.unknown_tags.append((tag, tagdata))
 
+    # the signed data is padded to 8 bits with zeroes
+    signed_data = hrp.encode("ascii") + u5_to_bytes(data, pad=True)
     if verbose:
         print('hex of signature data (32 byte r, 32 byte s): {}'
               .format(hexlify(sigdecoded[0:64])))
         print('recovery flag: {}'.format(sigdecoded[64]))
         print('hex of data for signing: {}'
-              .format(hexlify(hrp.encode("ascii") + data.tobytes())))
-        print('SHA256 of above: {}'.format(sha256(hrp.encode("ascii") + data.tobytes()).hexdigest()))
+              .format(hexlify(signed_data)))
+        print('SHA256 of above: {}'.format(sha256(signed_data).hexdigest()))
 
     # BOLT #11:
     #
     # A reader MUST check that the `signature` is valid (see the `n` tagged
     # field specified below).
     addr.signature = sigdecoded[:65]
-    hrp_hash = sha256(hrp.encode("ascii") + data.tobytes()).digest()
+    hrp_hash = sha256(signed_data).digest()
     if addr.pubkey: # Specified by `n`
         # BOLT #11:
         #
@@ -23,7 +23,8 @@
 # 42de4400bff5105352d0552155f73589166d162b
 
 import os
-from collections import namedtuple, defaultdict
+from collections import namedtuple, defaultdict, OrderedDict
+import copy
 import binascii
 import json
 from enum import IntEnum
@@ -104,6 +105,10 @@ RevokeAndAck = namedtuple("RevokeAndAck", ["per_commitment_secret", "next_per_co
 class RemoteCtnTooFarInFuture(Exception): pass
 
 
+# commitment transactions built per channel, see Channel.make_commitment
+COMMITMENT_CACHE_SIZE = 8
+
+
 def htlcsum(htlcs):
     return sum([x.amount_msat for x in htlcs])
 
@@ -145,6 +150,7 @@ class Channel(Logger):
         self.sweep_info = {}  # type: Dict[str, Dict[str, SweepInfo]]
         self._outgoing_channel_update = None  # type: Optional[bytes]
         self.revocation_store = RevocationStore(state["revocation_store"])
+        self._commitment_cache = OrderedDict()  # type: OrderedDict[tuple, PartialTransaction]
 
     def set_onion_key(self, key, value):
         self.onion_keys[key] = value
@@ -180,22 +186,32 @@ class Channel(Logger):
     def get_next_feerate(self, subject):
         return self.hm.get_feerate_in_next_ctx(subject)
 
+    def get_htlc_status(self, subject: HTLCOwner, htlc_id: int) -> str:
+        log = self.hm.log[subject]
+        if htlc_id in log.get('fails',{}):
+            return 'failed'
+        elif htlc_id in log.get('settles',{}):
+            return 'settled'
+        else:
+            return 'inflight'
+
     def get_payments(self):
         out = {}
         for subject in LOCAL, REMOTE:
             log = self.hm.log[subject]
             for htlc_id, htlc in log.get('adds', {}).items():
-                if htlc_id in log.get('fails',{}):
-                    status = 'failed'
-                elif htlc_id in log.get('settles',{}):
-                    status = 'settled'
-                else:
-                    status = 'inflight'
+                status = self.get_htlc_status(subject, htlc_id)
                 direction = SENT if subject is LOCAL else RECEIVED
                 rhash = bh2u(htlc.payment_hash)
                 out[rhash] = (self.channel_id, htlc, direction, status)
         return out
 
+    def _htlc_updated(self, subject: HTLCOwner, htlc_id: int) -> None:
+        if self.lnworker:
+            htlc = self.hm.log[subject]['adds'][htlc_id]
+            direction = SENT if subject is LOCAL else RECEIVED
+            self.lnworker.htlc_updated(self, htlc, direction, self.get_htlc_status(subject, htlc_id))
+
     def open_with_first_pcp(self, remote_pcp, remote_sig):
         with self.db_lock:
             self.config[REMOTE].current_per_commitment_point=remote_pcp
@@ -274,6 +290,7 @@ class Channel(Logger):
             htlc = htlc._replace(htlc_id=self.hm.get_next_htlc_id(LOCAL))
         with self.db_lock:
             self.hm.send_htlc(htlc)
+        self._htlc_updated(LOCAL, htlc.htlc_id)
         self.logger.info("add_htlc")
         return htlc
 
@@ -296,6 +313,7 @@ class Channel(Logger):
                     f' HTLC amount: {htlc.amount_msat}')
         with self.db_lock:
             self.hm.recv_htlc(htlc)
+        self._htlc_updated(REMOTE, htlc.htlc_id)
         self.logger.info("receive_htlc")
         return htlc
 
@@ -320,27 +338,14 @@ class Channel(Logger):
         their_remote_htlc_privkey_number = derive_privkey(
             int.from_bytes(self.config[LOCAL].htlc_basepoint.privkey, 'big'),
             self.config[REMOTE].next_per_commitment_point)
-        their_remote_htlc_privkey = their_remote_htlc_privkey_number.to_bytes(32, 'big')
-
-        htlcsigs = []
-        htlc_to_ctx_output_idx_map = map_htlcs_to_ctx_output_idxs(chan=self,
-                                                                  ctx=pending_remote_commitment,
-                                                                  pcp=self.config[REMOTE].next_per_commitment_point,
-                                                                  subject=REMOTE,
-                                                                  ctn=next_remote_ctn)
-        for (direction, htlc), (ctx_output_idx, htlc_relative_idx) in htlc_to_ctx_output_idx_map.items():
-            _script, htlc_tx = make_htlc_tx_with_open_channel(chan=self,
-                                                              pcp=self.config[REMOTE].next_per_commitment_point,
-                                                              subject=REMOTE,
-                                                              htlc_direction=direction,
-                                                              commit=pending_remote_commitment,
-                                                              ctx_output_idx=ctx_output_idx,
-                                                              htlc=htlc)
-            sig = bfh(htlc_tx.sign_txin(0, their_remote_htlc_privkey))
-            htlc_sig = ecc.sig_string_from_der_sig(sig[:-1])
-            htlcsigs.append((ctx_output_idx, htlc_sig))
-        htlcsigs.sort()
-        htlcsigs = [x[1] for x in htlcsigs]
+        their_remote_htlc_privkey = ecc.ECPrivkey(their_remote_htlc_privkey_number.to_bytes(32, 'big'))
+
+        htlc_txs = self._get_htlc_txs(subject=REMOTE,
+                                      ctx=pending_remote_commitment,
+                                      pcp=self.config[REMOTE].next_per_commitment_point,
+                                      ctn=next_remote_ctn)
+        htlcsigs = [their_remote_htlc_privkey.sign(pre_hash, sigencode=ecc.sig_string_from_r_and_s)
+                    for direction, htlc, pre_hash in htlc_txs]
         with self.db_lock:
             self.hm.send_ctx()
         return sig_64, htlcsigs
@@ -374,39 +379,40 @@ class Channel(Logger):
 
         _secret, pcp = self.get_secret_and_point(subject=LOCAL, ctn=next_local_ctn)
 
-        htlc_to_ctx_output_idx_map = map_htlcs_to_ctx_output_idxs(chan=self,
-                                                                  ctx=pending_local_commitment,
-                                                                  pcp=pcp,
-                                                                  subject=LOCAL,
-                                                                  ctn=next_local_ctn)
-        if len(htlc_to_ctx_output_idx_map) != len(htlc_sigs):
-            raise Exception(f'htlc sigs failure. recv {len(htlc_sigs)} sigs, expected {len(htlc_to_ctx_output_idx_map)}')
-        for (direction, htlc), (ctx_output_idx, htlc_relative_idx) in htlc_to_ctx_output_idx_map.items():
-            htlc_sig = htlc_sigs[htlc_relative_idx]
-            self.verify_htlc(htlc=htlc,
-                             htlc_sig=htlc_sig,
-                             htlc_direction=direction,
-                             pcp=pcp,
-                             ctx=pending_local_commitment,
-                             ctx_output_idx=ctx_output_idx)
+        htlc_txs = self._get_htlc_txs(subject=LOCAL,
+                                      ctx=pending_local_commitment,
+                                      pcp=pcp,
+                                      ctn=next_local_ctn)
+        if len(htlc_txs) != len(htlc_sigs):
+            raise Exception(f'htlc sigs failure. recv {len(htlc_sigs)} sigs, expected {len(htlc_txs)}')
+        remote_htlc_pubkey = derive_pubkey(self.config[REMOTE].htlc_basepoint.pubkey, pcp)
+        for htlc_sig, (direction, htlc, pre_hash) in zip(htlc_sigs, htlc_txs):
+            if not ecc.verify_signature(remote_htlc_pubkey, htlc_sig, pre_hash):
+                raise Exception(f'failed verifying HTLC signatures: {htlc} {direction}')
         with self.db_lock:
             self.hm.recv_ctx()
             self.config[LOCAL].current_commitment_signature=sig
             self.config[LOCAL].current_htlc_signatures=htlc_sigs_string
 
-    def verify_htlc(self, *, htlc: UpdateAddHtlc, htlc_sig: bytes, htlc_direction: Direction,
-                    pcp: bytes, ctx: Transaction, ctx_output_idx: int) -> None:
-        _script, htlc_tx = make_htlc_tx_with_open_channel(chan=self,
-                                                          pcp=pcp,
-                                                          subject=LOCAL,
-                                                          htlc_direction=htlc_direction,
-                                                          commit=ctx,
-                                                          ctx_output_idx=ctx_output_idx,
-                                                          htlc=htlc)
-        pre_hash = sha256d(bfh(htlc_tx.serialize_preimage(0)))
-        remote_htlc_pubkey = derive_pubkey(self.config[REMOTE].htlc_basepoint.pubkey, pcp)
-        if not ecc.verify_signature(remote_htlc_pubkey, htlc_sig, pre_hash):
-            raise Exception(f'failed verifying HTLC signatures: {htlc} {htlc_direction}')
+    def _get_htlc_txs(self, *, subject: HTLCOwner, ctx: Transaction, pcp: bytes,
+                      ctn: int) -> List[Tuple[Direction, UpdateAddHtlc, bytes]]:
+        """Returns (htlc_direction, htlc, sighash) of the second-stage HTLC
+        transactions of ctx, ordered by htlc_relative_idx, as their signatures are.
+        They are all built before any signature is made or checked."""
+        htlc_to_ctx_output_idx_map = map_htlcs_to_ctx_output_idxs(chan=self, ctx=ctx, pcp=pcp,
+                                                                  subject=subject, ctn=ctn)
+        htlc_txs = [None] * len(htlc_to_ctx_output_idx_map)
+        for (direction, htlc), (ctx_output_idx, htlc_relative_idx) in htlc_to_ctx_output_idx_map.items():
+            _script, htlc_tx = make_htlc_tx_with_open_channel(chan=self,
+                                                              pcp=pcp,
+                                                              subject=subject,
+                                                              htlc_direction=direction,
+                                                              commit=ctx,
+                                                              ctx_output_idx=ctx_output_idx,
+                                                              htlc=htlc)
+            pre_hash = sha256d(bfh(htlc_tx.serialize_preimage(0)))
+            htlc_txs[htlc_relative_idx] = (direction, htlc, pre_hash)
+        return htlc_txs
 
     def get_remote_htlc_sig_for_htlc(self, *, htlc_relative_idx: int) -> bytes:
         data = self.config[LOCAL].current_htlc_signatures
@@ -598,6 +604,7 @@ class Channel(Logger):
         assert htlc.payment_hash == sha256(preimage)
         assert htlc_id not in log['settles']
         self.hm.send_settle(htlc_id)
+        self._htlc_updated(REMOTE, htlc_id)
 
     def get_payment_hash(self, htlc_id):
         log = self.hm.log[LOCAL]
@@ -619,16 +626,19 @@ class Channel(Logger):
         assert htlc_id not in log['settles']
         with self.db_lock:
             self.hm.recv_settle(htlc_id)
+        self._htlc_updated(LOCAL, htlc_id)
 
     def fail_htlc(self, htlc_id):
         self.logger.info("fail_htlc")
         with self.db_lock:
             self.hm.send_fail(htlc_id)
+        self._htlc_updated(REMOTE, htlc_id)
 
     def receive_fail_htlc(self, htlc_id):
         self.logger.info("receive_fail_htlc")
         with self.db_lock:
             self.hm.recv_fail(htlc_id)
+        self._htlc_updated(LOCAL, htlc_id)
 
     def pending_local_fee(self):
         return self.constraints.capacity - sum(x.value for x in self.get_next_commitment(LOCAL).outputs())
@@ -644,6 +654,8 @@ class Channel(Logger):
                 self.hm.recv_update_fee(feerate)
 
     def make_commitment(self, subject, this_point, ctn) -> PartialTransaction:
+        """The returned transaction is cached, and shared between callers:
+        it must not be modified. Copy it first, e.g. to sign it."""
         assert type(subject) is HTLCOwner
         feerate = self.get_feerate(subject, ctn)
         other = REMOTE if LOCAL == subject else LOCAL
@@ -662,7 +674,23 @@ class Channel(Logger):
         # same htlcs as before, but now without dust.
         received_htlcs = self.included_htlcs(subject, SENT if subject == LOCAL else RECEIVED, ctn)
         sent_htlcs = self.included_htlcs(subject, RECEIVED if subject == LOCAL else SENT, ctn)
+        # the next ctx changes while updates are added, so the key has all of its inputs
+        key = (subject, ctn, this_point, feerate, local_msat, remote_msat,
+               tuple(htlc.htlc_id for htlc in received_htlcs),
+               tuple(htlc.htlc_id for htlc in sent_htlcs))
+        ctx = self._commitment_cache.get(key)
+        if ctx is not None:
+            self._commitment_cache.move_to_end(key)
+            return ctx
+        ctx = self._make_commitment(subject, this_point, ctn, feerate, local_msat, remote_msat,
+                                    received_htlcs, sent_htlcs)
+        self._commitment_cache[key] = ctx
+        if len(self._commitment_cache) > COMMITMENT_CACHE_SIZE:
+            self._commitment_cache.popitem(last=False)
+        return ctx
 
+    def _make_commitment(self, subject, this_point, ctn, feerate, local_msat, remote_msat,
+                         received_htlcs, sent_htlcs) -> PartialTransaction:
         this_config = self.config[subject]
         other_config = self.config[-subject]
         other_htlc_pubkey = derive_pubkey(other_config.htlc_basepoint.pubkey, this_point)
@@ -738,7 +766,7 @@ class Channel(Logger):
         return res
 
     def force_close_tx(self):
-        tx = self.get_latest_commitment(LOCAL)
+        tx = copy.deepcopy(self.get_latest_commitment(LOCAL))
         assert self.signature_fits(tx)
         tx.sign({bh2u(self.config[LOCAL].multisig_key.pubkey): (self.config[LOCAL].multisig_key.privkey, True)})
         remote_sig = self.config[LOCAL].current_commitment_signature
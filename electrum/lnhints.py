@@ -0,0 +1,77 @@
+# Copyright (C) 2020 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+import heapq
+import threading
+from typing import Dict, List, Optional, Set, TYPE_CHECKING
+
+from .lnutil import REMOTE
+from .lnchannel import Channel, channel_states, peer_states
+
+if TYPE_CHECKING:
+    from .lnworker import LNWallet
+
+
+NUM_ROUTING_HINTS = 3  # per invoice, so that it still fits in a QR code
+
+
+class InboundCapacityIndex:
+    """How much each of our open channels can receive, to choose the
+    routing hints of invoices.
+
+    The index is built from the channels the first time it is used.
+    After that, LNWallet marks a channel as changed when one of its
+    HTLCs is added, settled or failed, when it is saved after a
+    revocation, and when its state changes. Only the channels that
+    changed are looked at again when an invoice is created.
+    """
+
+    def __init__(self, lnworker: 'LNWallet'):
+        self.lnworker = lnworker
+        self.lock = threading.RLock()
+        self._loaded = False
+        self._inbound_msat = {}  # type: Dict[bytes, int]  # channel_id -> msat, for open channels
+        self._changed = set()  # type: Set[bytes]
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        with self.lnworker.lock:
+            self._changed = set(self.lnworker.channels)
+        self._loaded = True
+
+    def update_channel(self, chan: Channel) -> None:
+        with self.lock:
+            if self._loaded:
+                self._changed.add(chan.channel_id)
+
+    def remove_channel(self, chan_id: bytes) -> None:
+        with self.lock:
+            self._inbound_msat.pop(chan_id, None)
+            self._changed.discard(chan_id)
+
+    def _refresh(self) -> None:
+        for chan_id in self._changed:
+            chan = self.lnworker.channels.get(chan_id)
+            if chan is None or chan.get_state() != channel_states.OPEN or not chan.short_channel_id:
+                self._inbound_msat.pop(chan_id, None)
+                continue
+            # what the remote can send, like the check in Channel.receive_htlc:
+            # unlike balance(REMOTE), this takes reserve, fees and pending HTLCs into account
+            self._inbound_msat[chan_id] = chan.available_to_spend(REMOTE)
+        self._changed.clear()
+
+    def select(self, amount_msat: Optional[int], num: int = NUM_ROUTING_HINTS) -> List[Channel]:
+        """Returns up to num channels that can receive amount_msat, most
+        likely to succeed first: those with a connected peer, then those
+        with the most inbound capacity left."""
+        with self.lock:
+            self._load()
+            self._refresh()
+            channels = self.lnworker.channels
+            candidates = [(channels[chan_id], inbound_msat)
+                          for chan_id, inbound_msat in self._inbound_msat.items()
+                          if inbound_msat >= (amount_msat or 1) and chan_id in channels]
+        best = heapq.nlargest(num, candidates, key=lambda x: (x[0].peer_state == peer_states.GOOD, x[1]))
+        return [chan for chan, inbound_msat in best]
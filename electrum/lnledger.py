@@ -0,0 +1,271 @@
+# Copyright (C) 2020 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+import bisect
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple, Optional, Set, Callable, TYPE_CHECKING
+
+from .util import bh2u, bfh, timestamp_to_datetime, paginate
+from .lnutil import LOCAL, REMOTE, SENT, RECEIVED, Direction, UpdateAddHtlc, UnknownPaymentHash
+from .i18n import _
+
+if TYPE_CHECKING:
+    from .lnworker import LNWallet
+    from .lnchannel import Channel
+
+
+HistoryKey = Tuple[str, str]  # (type, payment_hash or channel_id)
+
+
+class PaymentLedger:
+    """Lightning history of a wallet, kept sorted by timestamp.
+
+    The ledger is built from the channels the first time it is used.
+    After that, it is updated one payment or one channel at a time, by
+    LNWallet, when an HTLC is added, settled or failed, and when a
+    channel is opened, closed or removed. Listing a page of history
+    costs O(page) for the usual case of new items being the most
+    recent ones.
+    """
+
+    def __init__(self, lnworker: 'LNWallet'):
+        self.lnworker = lnworker
+        self.lock = threading.RLock()
+        self._loaded = False
+        # payment_hash -> channel_id -> (channel_id, htlc, direction, status)
+        self._htlcs = defaultdict(dict)  # type: Dict[str, Dict[bytes, Tuple[bytes, UpdateAddHtlc, Direction, str]]]
+        self._htlc_keys = {}  # type: Dict[Tuple[str, bytes], Tuple[bool, int]]
+        self._chan_payments = defaultdict(set)  # type: Dict[bytes, Set[str]]
+        self._unsettled = set()  # type: Set[str]
+        self._items = {}  # type: Dict[HistoryKey, dict]
+        self._order = []  # type: List[Tuple[float, HistoryKey]]
+        self._balances = []  # type: List[int]  # running balance, for a prefix of _order
+        self.version = 0  # bumped whenever items are added, removed or reordered
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        with self.lnworker.lock:
+            channels = list(self.lnworker.channels.values())
+        for chan in channels:
+            for subject in LOCAL, REMOTE:
+                for htlc_id, htlc in chan.hm.log[subject].get('adds', {}).items():
+                    direction = SENT if subject is LOCAL else RECEIVED
+                    self._add_htlc(chan.channel_id, htlc, direction, chan.get_htlc_status(subject, htlc_id))
+        for payment_hash in list(self._htlcs):
+            self._update_payment(payment_hash)
+        for chan in channels:
+            self._update_channel(chan)
+        self._order = sorted((self._sort_key(item), key) for key, item in self._items.items())
+        self._balances = []
+        self._loaded = True
+
+    def _add_htlc(self, chan_id: bytes, htlc: UpdateAddHtlc, direction: Direction, status: str) -> bool:
+        # like Channel.get_payments: for a given payment_hash, the last
+        # HTLC added to a channel wins, remote ones after local ones
+        payment_hash = bh2u(htlc.payment_hash)
+        key = (direction != SENT, htlc.htlc_id)
+        old_key = self._htlc_keys.get((payment_hash, chan_id))
+        if old_key is not None and old_key > key:
+            return False
+        self._htlc_keys[(payment_hash, chan_id)] = key
+        self._htlcs[payment_hash][chan_id] = (chan_id, htlc, direction, status)
+        self._chan_payments[chan_id].add(payment_hash)
+        return True
+
+    def update_htlc(self, chan_id: bytes, htlc: UpdateAddHtlc, direction: Direction, status: str) -> None:
+        with self.lock:
+            if not self._loaded:
+                return
+            if self._add_htlc(chan_id, htlc, direction, status):
+                self._update_payment(bh2u(htlc.payment_hash))
+
+    def update_channel(self, chan: 'Channel') -> None:
+        with self.lock:
+            if self._loaded:
+                self._update_channel(chan)
+
+    def remove_channel(self, chan_id: bytes) -> None:
+        with self.lock:
+            if not self._loaded:
+                return
+            for key in (('channel_opening', chan_id.hex()), ('channel_closure', chan_id.hex())):
+                self._set_item(key, None)
+            for payment_hash in self._chan_payments.pop(chan_id, set()):
+                self._htlcs[payment_hash].pop(chan_id, None)
+                self._htlc_keys.pop((payment_hash, chan_id), None)
+                self._update_payment(payment_hash)
+
+    def _update_payment(self, payment_hash: str) -> None:
+        plist = list(self._htlcs.get(payment_hash, {}).values())
+        if not plist:
+            self._htlcs.pop(payment_hash, None)
+        # unsettled outgoing payments
+        if len(plist) == 1 and plist[0][2] == SENT and plist[0][3] != 'settled':
+            self._unsettled.add(payment_hash)
+        else:
+            self._unsettled.discard(payment_hash)
+        key = ('payment', payment_hash)
+        plist = [x for x in plist if x[3] == 'settled']
+        if len(plist) == 0:
+            self._set_item(key, None)
+            return
+        elif len(plist) == 1:
+            chan_id, htlc, _direction, status = plist[0]
+            direction = 'sent' if _direction == SENT else 'received'
+            amount_msat = int(_direction) * htlc.amount_msat
+            timestamp = htlc.timestamp
+            label = None  # looked up when listed
+            if _direction == SENT:
+                try:
+                    inv = self.lnworker.get_payment_info(bfh(payment_hash))
+                    fee_msat = - inv.amount*1000 - amount_msat if inv.amount else None
+                except UnknownPaymentHash:
+                    fee_msat = None
+            else:
+                fee_msat = None
+        else:
+            # assume forwarding
+            direction = 'forwarding'
+            amount_msat = sum([int(_direction) * htlc.amount_msat for chan_id, htlc, _direction, status in plist])
+            status = ''
+            label = _('Forwarding')
+            timestamp = min([htlc.timestamp for chan_id, htlc, _direction, status in plist])
+            fee_msat = None # fixme
+        self._set_item(key, {
+            'type': 'payment',
+            'label': label,
+            'timestamp': timestamp or 0,
+            'direction': direction,
+            'status': status,
+            'amount_msat': amount_msat,
+            'fee_msat': fee_msat,
+            'payment_hash': payment_hash,
+        })
+
+    def _update_channel(self, chan: 'Channel') -> None:
+        chan_id = chan.channel_id.hex()
+        item = self.lnworker.channel_timestamps.get(chan_id)
+        if item is None:
+            self._set_item(('channel_opening', chan_id), None)
+            self._set_item(('channel_closure', chan_id), None)
+            return
+        funding_txid, funding_height, funding_timestamp, closing_txid, closing_height, closing_timestamp = item
+        self._set_item(('channel_opening', chan_id), {
+            'channel_id': chan_id,
+            'type': 'channel_opening',
+            'label': _('Open channel'),
+            'txid': funding_txid,
+            'amount_msat': chan.balance(LOCAL, ctn=0),
+            'direction': 'received',
+            'timestamp': funding_timestamp,
+            'fee_msat': None,
+        })
+        if not chan.is_closed() or not closing_txid:
+            self._set_item(('channel_closure', chan_id), None)
+            return
+        self._set_item(('channel_closure', chan_id), {
+            'channel_id': chan_id,
+            'txid': closing_txid,
+            'label': _('Close channel'),
+            'type': 'channel_closure',
+            'amount_msat': -chan.balance_minus_outgoing_htlcs(LOCAL),
+            'direction': 'sent',
+            'timestamp': closing_timestamp,
+            'fee_msat': None,
+        })
+
+    @staticmethod
+    def _sort_key(item: dict) -> float:
+        return item.get('timestamp') or float("inf")
+
+    def _set_item(self, key: HistoryKey, item: Optional[dict]) -> None:
+        if not self._loaded:
+            # initial load: sorted at the end
+            if item is not None:
+                self._items[key] = item
+            return
+        old = self._items.get(key)
+        if old is None and item is None:
+            return
+        if old is not None and item is not None and self._sort_key(old) == self._sort_key(item):
+            # updated in place: the positions, hence cursors, are unchanged
+            self._items[key] = item
+            if item['amount_msat'] != old['amount_msat']:
+                idx = bisect.bisect_left(self._order, (self._sort_key(item), key))
+                del self._balances[idx:]
+            return
+        self.version += 1
+        old = self._items.pop(key, None)
+        if old is not None:
+            entry = (self._sort_key(old), key)
+            idx = bisect.bisect_left(self._order, entry)
+            assert self._order[idx] == entry
+            del self._order[idx]
+            del self._balances[idx:]
+        if item is not None:
+            self._items[key] = item
+            entry = (self._sort_key(item), key)
+            idx = bisect.bisect_left(self._order, entry)
+            self._order.insert(idx, entry)
+            del self._balances[idx:]
+
+    def _compute_balances(self, end: int) -> None:
+        balance_msat = self._balances[-1] if self._balances else 0
+        for idx in range(len(self._balances), end):
+            balance_msat += self._items[self._order[idx][1]]['amount_msat']
+            self._balances.append(balance_msat)
+
+    def __len__(self):
+        with self.lock:
+            self._load()
+            return len(self._order)
+
+    def get_history(self, offset: int = 0, limit: Optional[int] = None) -> List[dict]:
+        """Items sorted by timestamp, with their running balance."""
+        with self.lock:
+            self._load()
+            end = len(self._order) if limit is None else min(len(self._order), offset + limit)
+            return [self._get_history_item(idx) for idx in range(offset, end)]
+
+    def get_page(self, start: int, limit: int,
+                 predicate: Callable[[dict], bool] = None) -> Tuple[int, List[dict], Optional[int]]:
+        """Up to limit items matching predicate, from position start.
+        Returns the ledger version, the items, and the start of the
+        next page, if any. The predicate is given the stored items,
+        before they are copied and completed.
+        """
+        with self.lock:
+            self._load()
+            match = None if predicate is None else lambda idx: predicate(self._items[self._order[idx][1]])
+            page, next_start = paginate(range(len(self._order)), start, limit, match)
+            return self.version, [self._get_history_item(idx) for idx in page], next_start
+
+    def _get_history_item(self, idx: int) -> dict:
+        self._compute_balances(idx + 1)
+        key = self._order[idx][1]
+        item = dict(self._items[key])
+        if item['type'] == 'payment':
+            item['date'] = timestamp_to_datetime(item['timestamp'])
+            if item['label'] is None:
+                item['label'] = self.lnworker.wallet.get_label(item['payment_hash'])
+        item['balance_msat'] = self._balances[idx]
+        return item
+
+    def get_unsettled_payments(self) -> List[dict]:
+        with self.lock:
+            self._load()
+            out = []
+            for payment_hash in self._unsettled:
+                chan_id, htlc, _direction, status = next(iter(self._htlcs[payment_hash].values()))
+                out.append({
+                    'is_lightning': True,
+                    'status': status,
+                    'key': payment_hash,
+                    'amount': htlc.amount_msat//1000,
+                    'timestamp': htlc.timestamp,
+                    'label': self.lnworker.wallet.get_label(payment_hash)
+                })
+            return out
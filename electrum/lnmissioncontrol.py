@@ -0,0 +1,232 @@
+# Copyright (C) 2020 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+"""Outcomes of our payment attempts, per directed channel.
+
+For every edge a payment went through, we keep the largest amount it
+forwarded, and the smallest amount it failed to forward, with the time
+they were observed. From these, the path finder estimates the
+probability that the edge forwards a given amount: edges that failed
+recently are avoided for larger amounts, edges that succeeded are
+preferred for smaller ones. When the capacity of the channel is known,
+its balance is assumed to be uniformly distributed between the amounts
+that succeeded and failed, so that large payments prefer large channels.
+What was learnt fades out with a half-life, as channel balances change.
+The outcomes are saved in the electrum directory, so that they are used
+by the next payments too.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Optional, Dict, Sequence, TYPE_CHECKING
+
+from .logging import Logger
+
+if TYPE_CHECKING:
+    from .simple_config import SimpleConfig
+    from .lnrouter import RouteEdge
+
+
+APRIORI_PROBABILITY = 0.6    # of an edge we know nothing about
+SUCCESS_PROBABILITY = 0.95   # of an edge that just forwarded a larger amount
+HALF_LIFE = 3600             # seconds
+MIN_PROBABILITY = 0.01       # below that, edges are not used
+ATTEMPT_COST = 30            # in units of LNPathFinder._edge_cost
+MAX_AGE = 7 * 24 * 3600      # outcomes older than that are forgotten
+MAX_EDGES = 10000            # kept in the file
+SAVE_INTERVAL = 10           # seconds
+
+
+class EdgeHistory:
+    __slots__ = ('success_amount', 'success_time', 'fail_amount', 'fail_time')
+
+    def __init__(self):
+        self.success_amount = None  # type: Optional[int]  # msat
+        self.success_time = 0.0
+        self.fail_amount = None  # type: Optional[int]  # msat
+        self.fail_time = 0.0
+
+    def last_time(self) -> float:
+        return max(self.success_time, self.fail_time)
+
+    def probability(self, amount_msat: int, now: float, capacity_msat: int = None) -> float:
+        if capacity_msat:
+            return self._probability_within_capacity(amount_msat, now, capacity_msat)
+        failed = self.fail_amount is not None and amount_msat >= self.fail_amount
+        succeeded = self.success_amount is not None and amount_msat <= self.success_amount
+        if failed and succeeded:
+            # the balance moved between the two observations
+            failed = self.fail_time > self.success_time
+            succeeded = not failed
+        if failed:
+            weight = 0.5 ** ((now - self.fail_time) / HALF_LIFE)
+            return APRIORI_PROBABILITY * (1 - weight)
+        if succeeded:
+            weight = 0.5 ** ((now - self.success_time) / HALF_LIFE)
+            return APRIORI_PROBABILITY + (SUCCESS_PROBABILITY - APRIORI_PROBABILITY) * weight
+        return APRIORI_PROBABILITY
+
+    def _probability_within_capacity(self, amount_msat: int, now: float, capacity_msat: int) -> float:
+        # bounds of the balance, that relax back to the capacity over time
+        lower, upper = 0, capacity_msat
+        if self.success_amount is not None:
+            lower = self.success_amount * 0.5 ** ((now - self.success_time) / HALF_LIFE)
+        if self.fail_amount is not None and self.fail_amount < capacity_msat:
+            weight = 0.5 ** ((now - self.fail_time) / HALF_LIFE)
+            upper = capacity_msat - (capacity_msat - self.fail_amount) * weight
+        if amount_msat <= lower:
+            return SUCCESS_PROBABILITY
+        if amount_msat >= upper:
+            return 0.0
+        return SUCCESS_PROBABILITY * (upper - amount_msat) / (upper - lower)
+
+    def to_json(self) -> dict:
+        return {
+            'success_amount': self.success_amount,
+            'success_time': self.success_time,
+            'fail_amount': self.fail_amount,
+            'fail_time': self.fail_time,
+        }
+
+    @classmethod
+    def from_json(cls, d: dict) -> 'EdgeHistory':
+        h = cls()
+        h.success_amount = d.get('success_amount')
+        h.success_time = float(d.get('success_time', 0))
+        h.fail_amount = d.get('fail_amount')
+        h.fail_time = float(d.get('fail_time', 0))
+        return h
+
+
+def _edge_key(short_channel_id: bytes, start_node: bytes) -> str:
+    return bytes(short_channel_id).hex() + ':' + start_node.hex()
+
+
+def route_amounts_msat(route: Sequence['RouteEdge'], amount_msat: int) -> Sequence[int]:
+    """Amount forwarded over each edge of the route, for the given
+    amount to be received at the end."""
+    amounts = [amount_msat]
+    for route_edge in reversed(route[1:]):
+        amounts.append(amounts[-1] + route_edge.fee_for_edge(amounts[-1]))
+    amounts.reverse()
+    return amounts
+
+
+class MissionControl(Logger):
+
+    def __init__(self, config: Optional['SimpleConfig'] = None):
+        Logger.__init__(self)
+        self.config = config
+        self.lock = threading.Lock()
+        self._edges = {}  # type: Dict[str, EdgeHistory]
+        self._dirty = False
+        self._last_save = time.time()
+        self._load()
+
+    def _path(self) -> Optional[str]:
+        if not self.config or not self.config.path:
+            return None
+        return os.path.join(self.config.path, "ln_mission_control")
+
+    def _load(self) -> None:
+        path = self._path()
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding='utf-8') as f:
+                data = json.loads(f.read())
+            now = time.time()
+            edges = {key: EdgeHistory.from_json(d) for key, d in data.items()}
+            self._edges = {key: h for key, h in edges.items() if now - h.last_time() < MAX_AGE}
+        except Exception as e:
+            self.logger.info(f'could not read mission control data: {repr(e)}')
+            self._edges = {}
+
+    def save(self) -> None:
+        path = self._path()
+        if not path:
+            return
+        with self.lock:
+            edges = sorted(self._edges.items(), key=lambda x: x[1].last_time(), reverse=True)
+            data = {key: h.to_json() for key, h in edges[:MAX_EDGES]}
+            self._dirty = False
+            self._last_save = time.time()
+        temp_path = "%s.tmp.%s" % (path, os.getpid())
+        try:
+            with open(temp_path, "w", encoding='utf-8') as f:
+                f.write(json.dumps(data, sort_keys=True))
+            os.replace(temp_path, path)
+        except OSError as e:
+            self.logger.info(f'could not save mission control data: {repr(e)}')
+
+    def maybe_save(self) -> None:
+        if self._dirty and time.time() - self._last_save > SAVE_INTERVAL:
+            self.save()
+
+    def clear(self) -> None:
+        with self.lock:
+            self._edges.clear()
+            self._dirty = True
+        self.save()
+
+    def probability(self, short_channel_id: bytes, start_node: bytes, amount_msat: int,
+                    capacity_msat: int = None, now: float = None) -> float:
+        """Estimated probability that the edge forwards amount_msat."""
+        h = self._edges.get(_edge_key(short_channel_id, start_node)) or EdgeHistory()
+        return h.probability(amount_msat, time.time() if now is None else now, capacity_msat)
+
+    def penalty(self, short_channel_id: bytes, start_node: bytes, amount_msat: int,
+                capacity_msat: int = None) -> float:
+        """Cost added to the edge, for the attempts it is expected to take."""
+        p = self.probability(short_channel_id, start_node, amount_msat, capacity_msat)
+        if p < MIN_PROBABILITY:
+            return float('inf')
+        return ATTEMPT_COST * (1 / p - 1)
+
+    def _history(self, short_channel_id: bytes, start_node: bytes) -> EdgeHistory:
+        key = _edge_key(short_channel_id, start_node)
+        h = self._edges.get(key)
+        if h is None:
+            h = self._edges[key] = EdgeHistory()
+        self._dirty = True
+        return h
+
+    def report_success(self, short_channel_id: bytes, start_node: bytes, amount_msat: int,
+                       now: float = None) -> None:
+        now = time.time() if now is None else now
+        with self.lock:
+            h = self._history(short_channel_id, start_node)
+            if h.success_amount is None or amount_msat > h.success_amount \
+                    or h.probability(amount_msat, now) < SUCCESS_PROBABILITY:
+                h.success_amount = amount_msat
+            h.success_time = now
+            if h.fail_amount is not None and h.fail_amount <= amount_msat:
+                h.fail_amount = None  # contradicted
+                h.fail_time = 0.0
+
+    def report_failure(self, short_channel_id: bytes, start_node: bytes, amount_msat: int,
+                       now: float = None) -> None:
+        now = time.time() if now is None else now
+        with self.lock:
+            h = self._history(short_channel_id, start_node)
+            h.fail_amount = amount_msat if h.fail_amount is None else min(h.fail_amount, amount_msat)
+            h.fail_time = now
+            if h.success_amount is not None and h.success_amount >= amount_msat:
+                h.success_amount = None  # contradicted
+                h.success_time = 0.0
+
+    def report_attempt(self, our_node_id: bytes, route: Sequence['RouteEdge'], amount_msat: int,
+                       *, forwarded: int, failed: bool, now: float = None) -> None:
+        """Records that the first 'forwarded' edges of the route forwarded
+        the payment, and, if failed, that the next edge did not."""
+        amounts = route_amounts_msat(route, amount_msat)
+        start_nodes = [our_node_id] + [route_edge.node_id for route_edge in route[:-1]]
+        # our own channel is skipped: we know its balance
+        for i in range(1, min(forwarded, len(route))):
+            self.report_success(route[i].short_channel_id, start_nodes[i], amounts[i], now)
+        if failed and 0 < forwarded < len(route):
+            self.report_failure(route[forwarded].short_channel_id, start_nodes[forwarded], amounts[forwarded], now)
+        self.maybe_save()
@@ -28,9 +28,11 @@ from collections import defaultdict
 from typing import Sequence, List, Tuple, Optional, Dict, NamedTuple, TYPE_CHECKING, Set
 
 from .util import bh2u, profiler
+from . import metrics
 from .logging import Logger
 from .lnutil import NUM_MAX_EDGES_IN_PAYMENT_PATH, ShortChannelID
 from .channel_db import ChannelDB, Policy
+from .lnmissioncontrol import MissionControl
 
 if TYPE_CHECKING:
     from .lnchannel import Channel
@@ -119,9 +121,10 @@ def is_route_sane_to_use(route: LNPaymentRoute, invoice_amount_msat: int, min_fi
 
 class LNPathFinder(Logger):
 
-    def __init__(self, channel_db: ChannelDB):
+    def __init__(self, channel_db: ChannelDB, mission_control: MissionControl = None):
         Logger.__init__(self)
         self.channel_db = channel_db
+        self.mission_control = mission_control or MissionControl()
         self.blacklist = set()
 
     def add_to_blacklist(self, short_channel_id: ShortChannelID):
@@ -160,9 +163,14 @@ class LNPathFinder(Logger):
         # paying 10 more satoshis ~ waiting one more block
         fee_cost = fee_msat / 1000 / 10
         cltv_cost = route_edge.cltv_expiry_delta if not ignore_costs else 0
-        return cltv_cost + fee_cost + 1, fee_msat
+        # edges that are unlikely to forward the amount cost more attempts
+        capacity_msat = channel_info.capacity_sat * 1000 if channel_info.capacity_sat is not None else None
+        attempt_cost = self.mission_control.penalty(short_channel_id, start_node, payment_amt_msat, capacity_msat) \
+            if not ignore_costs else 0
+        return cltv_cost + fee_cost + attempt_cost + 1, fee_msat
 
     @profiler
+    @metrics.timed('lnrouter.find_path_for_payment')
     def find_path_for_payment(self, nodeA: bytes, nodeB: bytes,
                               invoice_amount_msat: int,
                               my_channels: List['Channel']=None) -> Sequence[Tuple[bytes, bytes]]:
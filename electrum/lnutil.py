@@ -5,6 +5,7 @@
 from enum import IntFlag, IntEnum
 import json
 from collections import namedtuple
+from functools import lru_cache
 from typing import NamedTuple, List, Tuple, Mapping, Optional, TYPE_CHECKING, Union, Dict, Set, Sequence
 import re
 import attr
@@ -253,6 +254,8 @@ def secret_to_pubkey(secret: int) -> bytes:
 def privkey_to_pubkey(priv: bytes) -> bytes:
     return ecc.ECPrivkey(priv[:32]).get_public_key_bytes()
 
+# the same keys are derived for every HTLC of a commitment
+@lru_cache(maxsize=1024)
 def derive_pubkey(basepoint: bytes, per_commitment_point: bytes) -> bytes:
     p = ecc.ECPubkey(basepoint) + ecc.GENERATOR * ecc.string_to_number(sha256(per_commitment_point + basepoint))
     return p.get_public_key_bytes()
@@ -264,6 +267,7 @@ def derive_privkey(secret: int, per_commitment_point: bytes) -> int:
     basepoint %= CURVE_ORDER
     return basepoint
 
+@lru_cache(maxsize=1024)
 def derive_blinded_pubkey(basepoint: bytes, per_commitment_point: bytes) -> bytes:
     k1 = ecc.ECPubkey(basepoint) * ecc.string_to_number(sha256(basepoint + per_commitment_point))
     k2 = ecc.ECPubkey(per_commitment_point) * ecc.string_to_number(sha256(per_commitment_point + basepoint))
@@ -291,13 +295,13 @@ def make_htlc_tx_output(amount_msat, local_feerate, revocationpubkey, local_dela
         + bfh(push_script(bh2u(local_delayedpubkey))) \
         + bytes([opcodes.OP_ENDIF, opcodes.OP_CHECKSIG])
 
-    p2wsh = bitcoin.redeem_script_to_address('p2wsh', bh2u(script))
+    p2wsh = bitcoin.p2wsh_nested_script(bh2u(script))
     weight = HTLC_SUCCESS_WEIGHT if success else HTLC_TIMEOUT_WEIGHT
     fee = local_feerate * weight
     fee = fee // 1000 * 1000
     final_amount_sat = (amount_msat - fee) // 1000
     assert final_amount_sat > 0, final_amount_sat
-    output = PartialTxOutput.from_address_and_value(p2wsh, final_amount_sat)
+    output = PartialTxOutput(scriptpubkey=bfh(p2wsh), value=final_amount_sat)
     return script, output
 
 def make_htlc_tx_witness(remotehtlcsig: bytes, localhtlcsig: bytes,
@@ -403,8 +407,8 @@ def possible_output_idxs_of_htlc_in_ctx(*, chan: 'Channel', pcp: bytes, subject:
                                                       local_htlc_pubkey=htlc_pubkey,
                                                       payment_hash=payment_hash,
                                                       cltv_expiry=cltv_expiry)
-    htlc_address = redeem_script_to_address('p2wsh', bh2u(preimage_script))
-    candidates = ctx.get_output_idxs_from_address(htlc_address)
+    htlc_script = bitcoin.p2wsh_nested_script(bh2u(preimage_script))
+    candidates = ctx.get_output_idxs_from_scriptpubkey(htlc_script)
     return {output_idx for output_idx in candidates
             if ctx.outputs()[output_idx].value == htlc.amount_msat // 1000}
 
@@ -513,8 +517,8 @@ def make_commitment_outputs(*, fees_per_participant: Mapping[HTLCOwner, int], lo
     non_htlc_outputs = [to_local, to_remote]
     htlc_outputs = []
     for script, htlc in htlcs:
-        addr = bitcoin.redeem_script_to_address('p2wsh', bh2u(script))
-        htlc_outputs.append(PartialTxOutput(scriptpubkey=bfh(address_to_script(addr)),
+        # the scriptpubkey of the p2wsh output, without going through its address
+        htlc_outputs.append(PartialTxOutput(scriptpubkey=bfh(bitcoin.p2wsh_nested_script(bh2u(script))),
                                             value=htlc.amount_msat // 1000))
 
     # trim outputs
@@ -585,8 +589,8 @@ def make_commitment_output_to_remote_address(remote_payment_pubkey: bytes) -> st
     return bitcoin.pubkey_to_address('p2wpkh', bh2u(remote_payment_pubkey))
 
 def sign_and_get_sig_string(tx: PartialTransaction, local_config, remote_config):
-    tx.sign({bh2u(local_config.multisig_key.pubkey): (local_config.multisig_key.privkey, True)})
-    sig = tx.inputs()[0].part_sigs[local_config.multisig_key.pubkey]
+    # does not add the signature to tx, which may be shared (see Channel.get_commitment)
+    sig = bfh(tx.sign_txin(0, local_config.multisig_key.privkey))
     sig_64 = sig_string_from_der_sig(sig[:-1])
     return sig_64
 
@@ -815,6 +819,13 @@ class ShortChannelID(bytes):
         return int.from_bytes(self[6:8], byteorder='big')
 
 
+class FundingOutput(NamedTuple):
+    """The funding output of a public channel, as found on-chain."""
+    txid: str
+    script: str  # hex
+    value_sat: int
+
+
 def format_short_channel_id(short_channel_id: Optional[bytes]):
     if not short_channel_id:
         return _('Not yet available')
@@ -25,7 +25,8 @@
 
 import asyncio
 import threading
-from typing import TYPE_CHECKING, Dict, Set
+from collections import deque, OrderedDict, defaultdict
+from typing import TYPE_CHECKING, Dict, Set, Sequence, Optional, Tuple, Deque
 
 import aiorpcx
 
@@ -33,18 +34,77 @@ from . import bitcoin
 from . import ecc
 from . import constants
 from .util import bh2u, bfh, NetworkJobOnDefaultServer
-from .lnutil import funding_output_script_from_keys, ShortChannelID
-from .verifier import verify_tx_is_in_block, MerkleVerificationFailure
+from .lnutil import funding_output_script_from_keys, ShortChannelID, FundingOutput
+from .verifier import SPV, MerkleVerificationFailure, MissingBlockHeader, MerkleRootMismatch
 from .transaction import Transaction
 from .interface import GracefulDisconnect
 from .crypto import sha256d
+from .bitcoin import hash_decode, hash_encode
 from .lnmsg import decode_msg, encode_msg
+from .synchronizer import SynchronizerBase, history_status
 
 if TYPE_CHECKING:
     from .network import Network
     from .lnrouter import ChannelDB
 
 
+MAX_CONCURRENT_REQUESTS = 20   # channels being verified at once
+BLOCK_CACHE_SIZE = 50          # blocks whose merkle nodes are kept
+
+
+class VerifiedMerkleNodes:
+    """Nodes of the merkle tree of a block that are known to lead to its
+    merkle root. The proofs of transactions in the same block share the
+    upper part of their branches: once a node is verified, the rest of a
+    branch does not need to be hashed again."""
+
+    def __init__(self, block_height: int, header: Optional[dict]):
+        self.block_height = block_height
+        self.merkle_root = header.get('merkle_root') if header else None
+        self.depth = None  # type: Optional[int]
+        self.nodes = {}  # type: Dict[Tuple[int, int], bytes]  # (level, index) -> hash
+
+    def verify(self, tx_hash: str, merkle_branch: Sequence[str], leaf_pos_in_tree: int) -> None:
+        """Raise MerkleVerificationFailure if verification fails."""
+        if self.merkle_root is None:
+            raise MissingBlockHeader("merkle verification failed for {} (missing header {})"
+                                     .format(tx_hash, self.block_height))
+        if len(merkle_branch) > 30:
+            raise MerkleVerificationFailure(f"merkle branch too long: {len(merkle_branch)}")
+        if self.depth is not None and len(merkle_branch) != self.depth:
+            raise MerkleVerificationFailure(f"unexpected merkle branch length: {len(merkle_branch)}")
+        try:
+            h = hash_decode(tx_hash)
+            merkle_branch_bytes = [hash_decode(item) for item in merkle_branch]
+            leaf_pos_in_tree = int(leaf_pos_in_tree)  # raise if invalid
+        except Exception as e:
+            raise MerkleVerificationFailure(e)
+        if leaf_pos_in_tree < 0:
+            raise MerkleVerificationFailure('leaf_pos_in_tree must be non-negative')
+        index = leaf_pos_in_tree
+        path = []
+        for level, item in enumerate(merkle_branch_bytes, 1):
+            if len(item) != 32:
+                raise MerkleVerificationFailure('all merkle branch items have to 32 bytes long')
+            h = sha256d(item + h) if (index & 1) else sha256d(h + item)
+            index >>= 1
+            known = self.nodes.get((level, index))
+            if known is not None:
+                if known != h:
+                    raise MerkleRootMismatch(f"merkle verification failed for {tx_hash}")
+                break
+            SPV._raise_if_valid_tx(bh2u(h))
+            path.append(((level, index), h))
+        else:
+            if index != 0:
+                raise MerkleVerificationFailure('leaf_pos_in_tree too large for branch')
+            if self.merkle_root != hash_encode(h):
+                raise MerkleRootMismatch("merkle verification failed for {} ({} != {})".format(
+                    tx_hash, self.merkle_root, hash_encode(h)))
+            self.depth = len(merkle_branch)
+        self.nodes.update(path)
+
+
 class LNChannelVerifier(NetworkJobOnDefaultServer):
     """ Verify channel announcements for the Channel DB """
 
@@ -59,10 +119,16 @@ class LNChannelVerifier(NetworkJobOnDefaultServer):
         # channel announcements that seem to be invalid:
         self.blacklist = set()  # type: Set[ShortChannelID]
         NetworkJobOnDefaultServer.__init__(self, network)
+        network.register_callback(self.wake_up, ['blockchain_updated'])
 
     def _reset(self):
         super()._reset()
         self.started_verifying_channel = set()  # type: Set[ShortChannelID]
+        # channels waiting for a worker, sorted by block
+        self._queue = deque()  # type: Deque[ShortChannelID]
+        self._num_workers = 0
+        self._blocks = OrderedDict()  # type: OrderedDict[int, VerifiedMerkleNodes]
+        self._blocks_tip = None  # type: Optional[str]
 
     # TODO make async; and rm self.lock completely
     def add_new_channel_info(self, short_channel_id: ShortChannelID, msg: dict) -> bool:
@@ -72,7 +138,8 @@ class LNChannelVerifier(NetworkJobOnDefaultServer):
             return False
         with self.lock:
             self.unverified_channel_info[short_channel_id] = msg
-            return True
+        self.wake_up()
+        return True
 
     async def _start_tasks(self):
         async with self.group as group:
@@ -80,31 +147,95 @@ class LNChannelVerifier(NetworkJobOnDefaultServer):
 
     async def main(self):
         while True:
+            await self._wakeup.wait()
             await self._verify_some_channels()
-            await asyncio.sleep(0.1)
+            await asyncio.sleep(0.1)  # batch bursts of announcements
 
     async def _verify_some_channels(self):
         blockchain = self.network.blockchain()
         local_height = blockchain.height()
+        # the cached merkle nodes are only valid for the chain they were read from
+        tip = blockchain.get_hash(local_height)
+        if tip != self._blocks_tip:
+            self._blocks.clear()
+            self._blocks_tip = tip
 
         with self.lock:
-            unverified_channel_info = list(self.unverified_channel_info)
+            unverified_channel_info = list(self.unverified_channel_info.items())
 
-        for short_channel_id in unverified_channel_info:
+        has_header = {}  # type: Dict[int, bool]
+        requested_chunks = set()
+        new_channels = []
+        for short_channel_id, msg in unverified_channel_info:
             if short_channel_id in self.started_verifying_channel:
                 continue
             block_height = short_channel_id.block_height
             # only resolve short_channel_id if headers are available.
             if block_height <= 0 or block_height > local_height:
                 continue
-            header = blockchain.read_header(block_height)
-            if header is None:
-                if block_height < constants.net.max_checkpoint():
-                    await self.group.spawn(self.network.request_chunk(block_height, None, can_return_early=True))
+            if self._verify_channel_from_cache(short_channel_id, msg):
+                continue
+            if block_height not in has_header:
+                has_header[block_height] = blockchain.read_header(block_height) is not None
+            if not has_header[block_height]:
+                chunk_index = block_height // 2016
+                if block_height < constants.net.max_checkpoint() and chunk_index not in requested_chunks:
+                    requested_chunks.add(chunk_index)
+                    await self.group.spawn(self._request_chunk(block_height))
                 continue
             self.started_verifying_channel.add(short_channel_id)
-            await self.group.spawn(self.verify_channel(block_height, short_channel_id))
-            #self.logger.info(f'requested short_channel_id {bh2u(short_channel_id)}')
+            new_channels.append(short_channel_id)
+        # channels of the same block are verified one after the other,
+        # while the merkle nodes of the block are in the cache
+        self._queue.extend(sorted(new_channels))
+        while self._num_workers < min(MAX_CONCURRENT_REQUESTS, len(self._queue)):
+            self._num_workers += 1
+            await self.group.spawn(self._worker(self._queue))
+
+    async def _worker(self, queue: deque):
+        try:
+            while queue:
+                short_channel_id = queue.popleft()
+                await self.verify_channel(short_channel_id.block_height, short_channel_id)
+        finally:
+            if queue is self._queue:  # not reset in the meantime
+                self._num_workers -= 1
+
+    def _verify_channel_from_cache(self, short_channel_id: ShortChannelID, msg: dict) -> bool:
+        """Verifies the channel against a funding output verified before,
+        e.g. in a previous session. Returns whether it was found."""
+        funding_output = self.channel_db.get_funding_output(short_channel_id)
+        if funding_output is None:
+            return False
+        self._add_channel_if_funded(short_channel_id, msg, funding_output.script, funding_output.value_sat)
+        return True
+
+    def _add_channel_if_funded(self, short_channel_id: ShortChannelID, msg: dict,
+                               script: str, value_sat: int) -> None:
+        redeem_script = funding_output_script_from_keys(msg['bitcoin_key_1'], msg['bitcoin_key_2'])
+        if bitcoin.p2wsh_nested_script(redeem_script) != script:
+            # FIXME what now? best would be to ban the originating ln peer.
+            self.logger.info(f"funding output script mismatch for {short_channel_id}")
+            self._remove_channel_from_unverified_db(short_channel_id)
+            return
+        # put channel into channel DB
+        self.channel_db.add_verified_channel_info(msg, capacity_sat=value_sat)
+        self._remove_channel_from_unverified_db(short_channel_id)
+
+    async def _get_verified_merkle_nodes(self, block_height: int) -> VerifiedMerkleNodes:
+        nodes = self._blocks.get(block_height)
+        if nodes is not None:
+            self._blocks.move_to_end(block_height)
+            return nodes
+        # we need to wait if header sync/reorg is still ongoing, hence lock:
+        async with self.network.bhi_lock:
+            header = self.network.blockchain().read_header(block_height)
+        nodes = VerifiedMerkleNodes(block_height, header)
+        if header is not None:
+            self._blocks[block_height] = nodes
+            while len(self._blocks) > BLOCK_CACHE_SIZE:
+                self._blocks.popitem(last=False)
+        return nodes
 
     async def verify_channel(self, block_height: int, short_channel_id: ShortChannelID):
         # we are verifying channel announcements as they are from untrusted ln peers.
@@ -119,11 +250,9 @@ class LNChannelVerifier(NetworkJobOnDefaultServer):
             return
         tx_hash = result['tx_hash']
         merkle_branch = result['merkle']
-        # we need to wait if header sync/reorg is still ongoing, hence lock:
-        async with self.network.bhi_lock:
-            header = self.network.blockchain().read_header(block_height)
+        merkle_nodes = await self._get_verified_merkle_nodes(block_height)
         try:
-            verify_tx_is_in_block(tx_hash, merkle_branch, short_channel_id.txpos, header, block_height)
+            merkle_nodes.verify(tx_hash, merkle_branch, short_channel_id.txpos)
         except MerkleVerificationFailure as e:
             # the electrum server sent an incorrect proof. blame is on server, not the ln peer
             raise GracefulDisconnect(e) from e
@@ -147,22 +276,19 @@ class LNChannelVerifier(NetworkJobOnDefaultServer):
             self.logger.info(f"received tx does not match expected txid ({tx_hash} != {tx.txid()})")
             return
         # check funding output
-        chan_ann_msg = self.unverified_channel_info[short_channel_id]
-        redeem_script = funding_output_script_from_keys(chan_ann_msg['bitcoin_key_1'], chan_ann_msg['bitcoin_key_2'])
-        expected_address = bitcoin.redeem_script_to_address('p2wsh', redeem_script)
         try:
             actual_output = tx.outputs()[short_channel_id.output_index]
         except IndexError:
             self._blacklist_short_channel_id(short_channel_id)
             return
-        if expected_address != actual_output.address:
-            # FIXME what now? best would be to ban the originating ln peer.
-            self.logger.info(f"funding output script mismatch for {short_channel_id}")
-            self._remove_channel_from_unverified_db(short_channel_id)
+        with self.lock:
+            chan_ann_msg = self.unverified_channel_info.get(short_channel_id)
+        if chan_ann_msg is None:
             return
-        # put channel into channel DB
-        self.channel_db.add_verified_channel_info(chan_ann_msg, capacity_sat=actual_output.value)
-        self._remove_channel_from_unverified_db(short_channel_id)
+        # remembered, so that the channel is not verified again after a restart
+        funding_output = FundingOutput(tx_hash, actual_output.scriptpubkey.hex(), actual_output.value)
+        self.channel_db.add_funding_output(short_channel_id, funding_output)
+        self._add_channel_if_funded(short_channel_id, chan_ann_msg, funding_output.script, funding_output.value_sat)
 
     def _remove_channel_from_unverified_db(self, short_channel_id: ShortChannelID):
         with self.lock:
@@ -175,6 +301,88 @@ class LNChannelVerifier(NetworkJobOnDefaultServer):
             self.unverified_channel_info.pop(short_channel_id, None)
 
 
+class FundingOutputWatcher(SynchronizerBase):
+    """Watch the funding outputs of verified channels, and remove the
+    channels from the channel DB as soon as their funding output is spent.
+
+    While a funding output is unspent, the history of its script is
+    the funding transaction alone, so the status announced by the server
+    is known in advance. Only when it differs is the history requested.
+    As the removal is permanent, a channel is only removed once a
+    confirmed transaction of that history, checked against its txid,
+    spends the funding output.
+    """
+
+    MAX_CONCURRENT_SUBSCRIPTIONS = 100
+
+    def __init__(self, network: 'Network', channel_db: 'ChannelDB'):
+        self.channel_db = channel_db
+        self.channels_for_address = defaultdict(set)  # type: Dict[str, Set[ShortChannelID]]
+        self._loaded = False
+        SynchronizerBase.__init__(self, network)
+
+    def watch(self, short_channel_id: ShortChannelID, funding_output: FundingOutput) -> None:
+        addr = bitcoin.script_to_address(funding_output.script)
+        if addr is None:
+            return
+        is_new = addr not in self.channels_for_address
+        self.channels_for_address[addr].add(short_channel_id)
+        if is_new and self._loaded:
+            self.add(addr)
+
+    async def main(self):
+        if not self._loaded:
+            await self.channel_db.data_loaded.wait()
+            for short_channel_id, funding_output in self.channel_db.get_funding_outputs().items():
+                self.watch(short_channel_id, funding_output)
+            self._loaded = True
+        # resend existing subscriptions if we were restarted
+        for addr in list(self.channels_for_address):
+            await self._add_address(addr)
+
+    def _is_unspent_status(self, short_channel_id: ShortChannelID, status: Optional[str]) -> bool:
+        funding_output = self.channel_db.get_funding_output(short_channel_id)
+        if funding_output is None:
+            return False
+        return status == history_status([(funding_output.txid, short_channel_id.block_height)])
+
+    async def _on_address_status(self, addr, status):
+        short_channel_ids = self.channels_for_address.get(addr)
+        if not short_channel_ids or status is None:
+            # status None: the server does not know the funding tx (yet)
+            return
+        if len(short_channel_ids) == 1 and self._is_unspent_status(next(iter(short_channel_ids)), status):
+            return
+        # other servers' answers are checked against the status of the main server
+        history = await self.network.get_history_for_scripthash(bitcoin.address_to_scripthash(addr), status=status)
+        funding_outputs = {short_channel_id: self.channel_db.get_funding_output(short_channel_id)
+                           for short_channel_id in short_channel_ids}
+        funding_txids = {funding_output.txid for funding_output in funding_outputs.values() if funding_output}
+        spent = await self._get_spent_outpoints(item['tx_hash'] for item in history
+                                                if item['height'] > 0 and item['tx_hash'] not in funding_txids)
+        for short_channel_id, funding_output in funding_outputs.items():
+            if funding_output is None:
+                # no longer in the channel DB
+                short_channel_ids.discard(short_channel_id)
+                continue
+            if (funding_output.txid, short_channel_id.output_index) not in spent:
+                continue
+            self.logger.info(f"funding output of channel {short_channel_id} was spent")
+            short_channel_ids.discard(short_channel_id)
+            self.channel_db.remove_spent_channel(short_channel_id)
+        if not short_channel_ids:
+            self.channels_for_address.pop(addr, None)
+
+    async def _get_spent_outpoints(self, txids) -> Set[Tuple[str, int]]:
+        spent = set()
+        for txid in txids:
+            # get_transaction checks the txid of the answer
+            tx = Transaction(await self.network.get_transaction(txid))
+            for txin in tx.inputs():
+                spent.add((txin.prevout.txid.hex(), txin.prevout.out_idx))
+        return spent
+
+
 def verify_sig_for_channel_update(chan_upd: dict, node_id: bytes) -> bool:
     msg_bytes = chan_upd['raw']
     pre_hash = msg_bytes[2+64:]
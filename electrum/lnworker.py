@@ -7,7 +7,7 @@ import os
 from decimal import Decimal
 import random
 import time
-from typing import Optional, Sequence, Tuple, List, Dict, TYPE_CHECKING
+from typing import Optional, Sequence, Tuple, List, Dict, Set, TYPE_CHECKING
 import threading
 import socket
 import json
@@ -32,7 +32,7 @@ from .transaction import Transaction
 from .crypto import sha256
 from .bip32 import BIP32Node
 from .util import bh2u, bfh, InvoiceError, resolve_dns_srv, is_ip_address, log_exceptions
-from .util import ignore_exceptions, make_aiohttp_session
+from .util import ignore_exceptions, make_aiohttp_session, WakeupEvent
 from .util import timestamp_to_datetime
 from .util import MyEncoder
 from .logging import Logger
@@ -42,6 +42,8 @@ from .lnaddr import lnencode, LnAddr, lndecode
 from .ecc import der_sig_from_sig_string
 from .lnchannel import Channel
 from .lnchannel import channel_states, peer_states
+from .lnledger import PaymentLedger
+from .lnhints import InboundCapacityIndex
 from . import lnutil
 from .lnutil import funding_output_script
 from .bitcoin import redeem_script_to_address
@@ -59,6 +61,7 @@ from .lnonion import OnionFailureCode
 from .lnmsg import decode_msg
 from .i18n import _
 from .lnrouter import RouteEdge, LNPaymentRoute, is_route_sane_to_use
+from .lnmissioncontrol import route_amounts_msat
 from .address_synchronizer import TX_HEIGHT_LOCAL
 from . import lnsweep
 from .lnwatcher import LNWatcher
@@ -73,6 +76,7 @@ NUM_PEERS_TARGET = 4
 PEER_RETRY_INTERVAL = 600  # seconds
 PEER_RETRY_INTERVAL_FOR_CHANNELS = 30  # seconds
 GRAPH_DOWNLOAD_SECONDS = 600
+MAX_HTLCS_PER_CHANNEL = 10  # in flight at once, when paying a batch of invoices
 
 FALLBACK_NODE_LIST_TESTNET = (
     LNPeerAddr(host='203.132.95.10', port=9735, pubkey=bfh('038863cf8ab91046230f561cd5b386cbff8309fa02e3f0c3ed161a3aeb64a643b9')),
@@ -121,6 +125,89 @@ class NoPathFound(PaymentFailure):
         return _('No path found')
 
 
+class PaymentBatch:
+    """State shared by the payments of a batch: the routes found so far,
+    and the HTLCs each of our channels has in flight. What is learnt
+    from failed attempts is shared through the mission control of the
+    path finder."""
+
+    def __init__(self, lnworker: 'LNWallet', max_htlcs_per_channel: int):
+        self.lnworker = lnworker
+        self.max_htlcs_per_channel = max_htlcs_per_channel
+        self.routes = {}  # type: Dict[tuple, LNPaymentRoute]
+        self.in_flight = defaultdict(int)  # type: Dict[Optional[bytes], int]  # channel_id -> htlcs
+        self.htlc_resolved = asyncio.Condition()
+        self.num_attempts = 0
+        self.num_routes_computed = 0
+
+    @staticmethod
+    def _route_key(lnaddr: LnAddr) -> tuple:
+        r_tags = tuple(tuple(x[1]) for x in lnaddr.tags if x[0] == 'r')
+        return lnaddr.pubkey.serialize(), int(lnaddr.amount * COIN * 1000), r_tags
+
+    def _has_free_slot(self, route: LNPaymentRoute) -> bool:
+        chan = self.lnworker.get_channel_by_short_id(route[0].short_channel_id)
+        if chan is None:
+            return True  # _pay_to_route will complain
+        # HTLCs that are not committed yet are not counted by can_pay
+        max_htlcs = min(self.max_htlcs_per_channel, chan.config[REMOTE].max_accepted_htlcs)
+        return self.in_flight[chan.channel_id] < max_htlcs
+
+    def _can_pay(self, route: LNPaymentRoute, amount_msat: int) -> bool:
+        chan = self.lnworker.get_channel_by_short_id(route[0].short_channel_id)
+        if chan is None:
+            return True
+        # nothing is awaited until the HTLC is added, so this still holds then
+        return chan.can_pay(route_amounts_msat(route, amount_msat)[0])
+
+    async def get_route(self, lnaddr: LnAddr) -> LNPaymentRoute:
+        """Returns a route whose first channel can take the HTLC now,
+        waiting for HTLCs of the batch to be resolved if needed."""
+        key = self._route_key(lnaddr)
+        amount_msat = key[1]
+        while True:
+            route = self.routes.get(key)
+            if route is None or not self._can_pay(route, amount_msat):
+                # the path finder skips our channels that cannot pay
+                try:
+                    route = await self.lnworker._create_route_from_invoice(decoded_invoice=lnaddr)
+                except NoPathFound:
+                    # our channels may only be busy with the rest of the batch
+                    if not any(self.in_flight.values()):
+                        raise
+                    route = None
+                else:
+                    self.num_routes_computed += 1
+                    self.routes[key] = route
+            if route is not None and self._can_pay(route, amount_msat) and self._has_free_slot(route):
+                return route
+            if not any(self.in_flight.values()):
+                # e.g. the first channel cannot pay the fee of a private hop:
+                # no HTLC of the batch will free it
+                raise NoPathFound()
+            async with self.htlc_resolved:
+                await self.htlc_resolved.wait()
+
+    async def pay_to_route(self, route: LNPaymentRoute, lnaddr: LnAddr) -> PaymentAttemptLog:
+        chan = self.lnworker.get_channel_by_short_id(route[0].short_channel_id)
+        channel_id = chan.channel_id if chan else None
+        self.in_flight[channel_id] += 1
+        self.num_attempts += 1
+        try:
+            payment_attempt_log = await self.lnworker._pay_to_route(route, lnaddr)
+        finally:
+            self.in_flight[channel_id] -= 1
+            async with self.htlc_resolved:
+                self.htlc_resolved.notify_all()
+        failure = payment_attempt_log.failure_details
+        if failure:
+            # other payments must not reuse the channel that failed
+            failed_scid = route[min(failure.sender_idx + 1, len(route) - 1)].short_channel_id
+            self.routes = {key: r for key, r in self.routes.items()
+                           if failed_scid not in [route_edge.short_channel_id for route_edge in r]}
+        return payment_attempt_log
+
+
 class LNWorker(Logger):
 
     def __init__(self, xprv):
@@ -151,6 +238,7 @@ class LNWorker(Logger):
                     return
                 peer = Peer(self, node_id, transport)
                 self.peers[node_id] = peer
+                self.peer_added(peer)
                 await self.network.main_taskgroup.spawn(peer.main_loop())
             await asyncio.start_server(cb, addr, int(port))
 
@@ -178,8 +266,12 @@ class LNWorker(Logger):
         peer = Peer(self, node_id, transport)
         await self.network.main_taskgroup.spawn(peer.main_loop())
         self.peers[node_id] = peer
+        self.peer_added(peer)
         return peer
 
+    def peer_added(self, peer):
+        pass
+
     def num_peers(self):
         return sum([p.initialized.is_set() for p in self.peers.values()])
 
@@ -319,6 +411,8 @@ class LNGossip(LNWorker):
     async def add_new_ids(self, ids):
         known = self.channel_db.get_channel_ids()
         new = set(ids) - set(known)
+        new = {short_channel_id for short_channel_id in new
+               if not self.channel_db.is_channel_spent(ShortChannelID.normalize(short_channel_id))}
         self.unknown_ids.update(new)
         self.network.trigger_callback('unknown_channels', len(self.unknown_ids))
         self.network.trigger_callback('gossip_peers', self.num_peers())
@@ -349,6 +443,7 @@ class LNWallet(LNWorker):
         self.sweep_address = wallet.get_receiving_address()
         self.lock = threading.RLock()
         self.logs = defaultdict(list)  # type: Dict[str, List[PaymentAttemptLog]]  # key is RHASH
+        self._paying = set()  # type: Set[bytes]  # payment hashes, while _pay runs
 
         # note: accessing channels (besides simple lookup) needs self.lock!
         self.channels = {}
@@ -358,6 +453,8 @@ class LNWallet(LNWorker):
 
         # timestamps of opening and closing transactions
         self.channel_timestamps = self.db.get_dict('lightning_channel_timestamps')
+        self.ledger = PaymentLedger(self)
+        self.inbound_capacity = InboundCapacityIndex(self)
         self.pending_payments = defaultdict(asyncio.Future)
 
     @ignore_exceptions
@@ -412,6 +509,10 @@ class LNWallet(LNWorker):
         self.lnwatcher.start_network(network)
         self.network = network
         daemon = network.daemon
+        # the channels are checked when the on-chain state, a channel,
+        # the fees or our peers change, not periodically
+        self._reestablish_wakeup = WakeupEvent(network.asyncio_loop)
+        self.network.register_callback(self._reestablish_wakeup.set, ['wallet_updated', 'channel', 'fee'])
         self.network.register_callback(self.on_update_open_channel, ['update_open_channel'])
         self.network.register_callback(self.on_update_closed_channel, ['update_closed_channel'])
         for chan_id, chan in self.channels.items():
@@ -434,6 +535,9 @@ class LNWallet(LNWorker):
             self.network.trigger_callback('channel', chan)
         self.peers.pop(peer.pubkey)
 
+    def peer_added(self, peer):
+        self._reestablish_wakeup.set()
+
     def get_channel_status(self, chan):
         # status displayed in the GUI
         cs = chan.get_state()
@@ -479,108 +583,17 @@ class LNWallet(LNWorker):
         }
 
     def get_unsettled_payments(self):
-        out = []
-        for payment_hash, plist in self.get_payments().items():
-            if len(plist) != 1:
-                continue
-            chan_id, htlc, _direction, status = plist[0]
-            if _direction != SENT:
-                continue
-            if status == 'settled':
-                continue
-            amount = htlc.amount_msat//1000
-            item = {
-                'is_lightning': True,
-                'status': status,
-                'key': payment_hash,
-                'amount': amount,
-                'timestamp': htlc.timestamp,
-                'label': self.wallet.get_label(payment_hash)
-            }
-            out.append(item)
-        return out
+        return self.ledger.get_unsettled_payments()
 
-    def get_history(self):
-        out = []
-        for key, plist in self.get_payments().items():
-            plist = list(filter(lambda x: x[3] == 'settled', plist))
-            if len(plist) == 0:
-                continue
-            elif len(plist) == 1:
-                chan_id, htlc, _direction, status = plist[0]
-                direction = 'sent' if _direction == SENT else 'received'
-                amount_msat = int(_direction) * htlc.amount_msat
-                timestamp = htlc.timestamp
-                label = self.wallet.get_label(key)
-                if _direction == SENT:
-                    try:
-                        inv = self.get_payment_info(bfh(key))
-                        fee_msat = - inv.amount*1000 - amount_msat if inv.amount else None
-                    except UnknownPaymentHash:
-                        fee_msat = None
-                else:
-                    fee_msat = None
-            else:
-                # assume forwarding
-                direction = 'forwarding'
-                amount_msat = sum([int(_direction) * htlc.amount_msat for chan_id, htlc, _direction, status in plist])
-                status = ''
-                label = _('Forwarding')
-                timestamp = min([htlc.timestamp for chan_id, htlc, _direction, status in plist])
-                fee_msat = None # fixme
-
-            item = {
-                'type': 'payment',
-                'label': label,
-                'timestamp': timestamp or 0,
-                'date': timestamp_to_datetime(timestamp),
-                'direction': direction,
-                'status': status,
-                'amount_msat': amount_msat,
-                'fee_msat': fee_msat,
-                'payment_hash': key,
-            }
-            out.append(item)
-        # add funding events
-        with self.lock:
-            channels = list(self.channels.values())
-        for chan in channels:
-            item = self.channel_timestamps.get(chan.channel_id.hex())
-            if item is None:
-                continue
-            funding_txid, funding_height, funding_timestamp, closing_txid, closing_height, closing_timestamp = item
-            item = {
-                'channel_id': bh2u(chan.channel_id),
-                'type': 'channel_opening',
-                'label': _('Open channel'),
-                'txid': funding_txid,
-                'amount_msat': chan.balance(LOCAL, ctn=0),
-                'direction': 'received',
-                'timestamp': funding_timestamp,
-                'fee_msat': None,
-            }
-            out.append(item)
-            if not chan.is_closed():
-                continue
-            assert closing_txid
-            item = {
-                'channel_id': bh2u(chan.channel_id),
-                'txid': closing_txid,
-                'label': _('Close channel'),
-                'type': 'channel_closure',
-                'amount_msat': -chan.balance_minus_outgoing_htlcs(LOCAL),
-                'direction': 'sent',
-                'timestamp': closing_timestamp,
-                'fee_msat': None,
-            }
-            out.append(item)
-        # sort by timestamp
-        out.sort(key=lambda x: (x.get('timestamp') or float("inf")))
-        balance_msat = 0
-        for item in out:
-            balance_msat += item['amount_msat']
-            item['balance_msat'] = balance_msat
-        return out
+    def get_history(self, offset: int = 0, limit: Optional[int] = None):
+        return self.ledger.get_history(offset, limit)
+
+    def get_history_page(self, start: int, limit: int, predicate=None):
+        return self.ledger.get_page(start, limit, predicate)
+
+    def htlc_updated(self, chan: Channel, htlc: UpdateAddHtlc, direction: Direction, status: str):
+        self.ledger.update_htlc(chan.channel_id, htlc, direction, status)
+        self.inbound_capacity.update_channel(chan)
 
     def get_and_inc_counter_for_channel_keys(self):
         with self.lock:
@@ -609,6 +622,7 @@ class LNWallet(LNWorker):
         assert type(chan) is Channel
         if chan.config[REMOTE].next_per_commitment_point == chan.config[REMOTE].current_per_commitment_point:
             raise Exception("Tried to save channel with next_point == current_point, this should not happen")
+        self.inbound_capacity.update_channel(chan)
         self.wallet.save_db()
         self.network.trigger_callback('channel', chan)
 
@@ -664,6 +678,7 @@ class LNWallet(LNWorker):
 
         # save timestamp regardless of state, so that funding tx is returned in get_history
         self.channel_timestamps[bh2u(chan.channel_id)] = chan.funding_outpoint.txid, funding_height.height, funding_height.timestamp, None, None, None
+        self.ledger.update_channel(chan)
 
         if chan.get_state() == channel_states.OPEN and self.should_channel_be_closed_due_to_expiring_htlcs(chan):
             self.logger.info(f"force-closing due to expiring htlcs")
@@ -719,6 +734,8 @@ class LNWallet(LNWorker):
         if chan.get_state() == channel_states.CLOSED and not keep_watching:
             chan.set_state(channel_states.REDEEMED)
 
+        self.ledger.update_channel(chan)
+
         # detect who closed and set sweep_info
         sweep_info_dict = chan.sweep_ctx(closing_tx)
         self.logger.info(f'sweep_info_dict length: {len(sweep_info_dict)}')
@@ -841,6 +858,7 @@ class LNWallet(LNWorker):
     def add_channel(self, chan):
         with self.lock:
             self.channels[chan.channel_id] = chan
+        self.inbound_capacity.update_channel(chan)
         self.lnwatcher.add_channel(chan.funding_outpoint.to_str(), chan.get_funding_address())
 
     @log_exceptions
@@ -896,22 +914,39 @@ class LNWallet(LNWorker):
         fut = asyncio.run_coroutine_threadsafe(coro, self.network.asyncio_loop)
         success = fut.result()
 
+    def pay_batch(self, invoices: Sequence[str], attempts=1) -> dict:
+        """
+        Can be called from other threads
+        """
+        coro = self._pay_batch(invoices, attempts)
+        fut = asyncio.run_coroutine_threadsafe(coro, self.network.asyncio_loop)
+        return fut.result()
+
     def get_channel_by_short_id(self, short_channel_id: ShortChannelID) -> Channel:
         with self.lock:
             for chan in self.channels.values():
                 if chan.short_channel_id == short_channel_id:
                     return chan
 
-    async def _pay(self, invoice, amount_sat=None, attempts=1) -> bool:
+    async def _pay(self, invoice, amount_sat=None, attempts=1, *, batch: PaymentBatch = None) -> bool:
         lnaddr = self._check_invoice(invoice, amount_sat)
         payment_hash = lnaddr.paymenthash
-        key = payment_hash.hex()
         amount = int(lnaddr.amount * COIN)
         status = self.get_payment_status(payment_hash)
         if status == PR_PAID:
             raise PaymentFailure(_("This invoice has been paid already"))
-        if status == PR_INFLIGHT:
+        # commands paying invoices may run concurrently, and the status
+        # only becomes PR_INFLIGHT once an HTLC is sent
+        if status == PR_INFLIGHT or payment_hash in self._paying:
             raise PaymentFailure(_("A payment was already initiated for this invoice"))
+        self._paying.add(payment_hash)
+        try:
+            return await self._pay_attempts(lnaddr, amount, attempts, batch)
+        finally:
+            self._paying.discard(payment_hash)
+
+    async def _pay_attempts(self, lnaddr: LnAddr, amount: int, attempts: int, batch: Optional[PaymentBatch]) -> bool:
+        key = lnaddr.paymenthash.hex()
         info = PaymentInfo(lnaddr.paymenthash, amount, SENT, PR_UNPAID)
         self.save_payment_info(info)
         self.wallet.set_label(key, lnaddr.get_description())
@@ -919,19 +954,76 @@ class LNWallet(LNWorker):
         success = False
         for i in range(attempts):
             try:
-                route = await self._create_route_from_invoice(decoded_invoice=lnaddr)
+                if batch:
+                    route = await batch.get_route(lnaddr)
+                else:
+                    route = await self._create_route_from_invoice(decoded_invoice=lnaddr)
             except NoPathFound as e:
                 log.append(PaymentAttemptLog(success=False, exception=e))
                 break
             self.network.trigger_callback('invoice_status', key, PR_INFLIGHT)
-            payment_attempt_log = await self._pay_to_route(route, lnaddr)
+            if batch:
+                payment_attempt_log = await batch.pay_to_route(route, lnaddr)
+            else:
+                payment_attempt_log = await self._pay_to_route(route, lnaddr)
             log.append(payment_attempt_log)
             success = payment_attempt_log.success
             if success:
                 break
+        if not batch:
+            self.network.path_finder.mission_control.save()
         self.network.trigger_callback('invoice_status', key, PR_PAID if success else PR_FAILED)
         return success
 
+    async def _pay_batch(self, invoices: Sequence[str], attempts=1,
+                         max_htlcs_per_channel=MAX_HTLCS_PER_CHANNEL) -> dict:
+        """Pays the invoices concurrently. Each of our channels has at
+        most max_htlcs_per_channel HTLCs of the batch in flight, within
+        its balance and the max_accepted_htlcs of the remote peer.
+        Failures are keyed by payment hash. Raises InvoiceError, before
+        paying anything, if an invoice cannot be decoded."""
+        lnaddrs = []
+        for invoice in invoices:
+            try:
+                lnaddrs.append(lndecode(invoice, expected_hrp=constants.net.SEGWIT_HRP))
+            except Exception as e:
+                raise InvoiceError(_('Invalid Lightning invoice') + f' {invoice}: {repr(e)}') from e
+        batch = PaymentBatch(self, max_htlcs_per_channel)
+        failures = {}  # payment_hash -> error
+        num_paid = 0
+        amount_paid = 0
+
+        async def pay(invoice, lnaddr):
+            nonlocal num_paid, amount_paid
+            key = lnaddr.paymenthash.hex()
+            try:
+                success = await self._pay(invoice, attempts=attempts, batch=batch)
+            except (InvoiceError, PaymentFailure) as e:
+                failures[key] = str(e)
+                return
+            if success:
+                num_paid += 1
+                amount_paid += int(lnaddr.amount * COIN)
+            else:
+                failures[key] = _('Payment failed')
+
+        t0 = time.monotonic()
+        await asyncio.gather(*[pay(invoice, lnaddr) for invoice, lnaddr in zip(invoices, lnaddrs)])
+        duration = time.monotonic() - t0
+        self.network.path_finder.mission_control.save()
+        self.logger.info(f"paid {num_paid}/{len(invoices)} invoices in {duration:.2f} s, "
+                         f"{batch.num_attempts} attempts, {batch.num_routes_computed} routes computed")
+        return {
+            'paid': num_paid,
+            'failed': len(invoices) - num_paid,
+            'amount_sat': amount_paid,
+            'duration': round(duration, 3),
+            'payments_per_second': round(num_paid / duration, 3) if duration else None,
+            'attempts': batch.num_attempts,
+            'routes_computed': batch.num_routes_computed,
+            'failures': failures,
+        }
+
     async def _pay_to_route(self, route: LNPaymentRoute, lnaddr: LnAddr) -> PaymentAttemptLog:
         short_channel_id = route[0].short_channel_id
         chan = self.get_channel_by_short_id(short_channel_id)
@@ -941,24 +1033,27 @@ class LNWallet(LNWorker):
                             f"{short_channel_id} that is not in channel list")
         self.set_payment_status(lnaddr.paymenthash, PR_INFLIGHT)
         peer = self.peers[route[0].node_id]
-        htlc = await peer.pay(route, chan, int(lnaddr.amount * COIN * 1000), lnaddr.paymenthash, lnaddr.get_min_final_cltv_expiry())
+        amount_msat = int(lnaddr.amount * COIN * 1000)
+        htlc = await peer.pay(route, chan, amount_msat, lnaddr.paymenthash, lnaddr.get_min_final_cltv_expiry())
         self.network.trigger_callback('htlc_added', htlc, lnaddr, SENT)
         success, preimage, reason = await self.await_payment(lnaddr.paymenthash)
+        mission_control = self.network.path_finder.mission_control
         if success:
             failure_log = None
+            mission_control.report_attempt(self.node_keypair.pubkey, route, amount_msat,
+                                           forwarded=len(route), failed=False)
         else:
             failure_msg, sender_idx = chan.decode_onion_error(reason, route, htlc.htlc_id)
             blacklist = self.handle_error_code_from_failed_htlc(failure_msg, sender_idx, route, peer)
-            if blacklist:
-                # blacklist channel after reporter node
-                # TODO this should depend on the error (even more granularity)
-                # also, we need finer blacklisting (directed edges; nodes)
-                try:
-                    short_chan_id = route[sender_idx + 1].short_channel_id
-                except IndexError:
-                    self.logger.info("payment destination reported error")
-                else:
-                    self.network.path_finder.add_to_blacklist(short_chan_id)
+            if sender_idx == len(route) - 1:
+                self.logger.info("payment destination reported error")
+            # the edges up to the reporter node forwarded the payment. the
+            # channel after it is penalized for this amount: a temporary
+            # channel failure usually means its balance was too low
+            # TODO this should depend on the error (even more granularity)
+            failed = blacklist or failure_msg.code == OnionFailureCode.TEMPORARY_CHANNEL_FAILURE
+            mission_control.report_attempt(self.node_keypair.pubkey, route, amount_msat,
+                                           forwarded=sender_idx + 1, failed=failed)
             failure_log = PaymentAttemptFailureDetails(sender_idx=sender_idx,
                                                        failure_msg=failure_msg,
                                                        is_blacklisted=blacklist)
@@ -1188,17 +1283,10 @@ class LNWallet(LNWorker):
     async def _calc_routing_hints_for_invoice(self, amount_sat):
         """calculate routing hints (BOLT-11 'r' field)"""
         routing_hints = []
-        with self.lock:
-            channels = list(self.channels.values())
-        # note: currently we add *all* our channels; but this might be a privacy leak?
+        # a few channels that can receive the amount, rather than all of them:
+        # this keeps the invoice short, and does not reveal all our channels
+        channels = self.inbound_capacity.select(amount_sat * 1000 if amount_sat else None)
         for chan in channels:
-            # check channel is open
-            if chan.get_state() != channel_states.OPEN:
-                continue
-            # check channel has sufficient balance
-            # FIXME because of on-chain fees of ctx, this check is insufficient
-            if amount_sat and chan.balance(REMOTE) // 1000 < amount_sat:
-                continue
             chan_id = chan.short_channel_id
             assert isinstance(chan_id, bytes), chan_id
             channel_info = self.channel_db.get_channel_info(chan_id)
@@ -1280,6 +1368,8 @@ class LNWallet(LNWorker):
             self.channels.pop(chan_id)
             self.channel_timestamps.pop(chan_id.hex())
             self.db.get('channels').pop(chan_id.hex())
+        self.ledger.remove_channel(chan_id)
+        self.inbound_capacity.remove_channel(chan_id)
 
         self.network.trigger_callback('channels_updated', self.wallet)
         self.network.trigger_callback('wallet_updated', self.wallet)
@@ -1307,12 +1397,13 @@ class LNWallet(LNWorker):
 
     async def reestablish_peers_and_channels(self):
         while True:
-            await asyncio.sleep(1)
+            await self._reestablish_wakeup.wait()
             # wait until on-chain state is synchronized
             if not (self.wallet.is_up_to_date() and self.lnwatcher.is_up_to_date()):
                 continue
             with self.lock:
                 channels = list(self.channels.values())
+            retry = False
             for chan in channels:
                 if chan.is_closed() or chan.is_closing():
                     continue
@@ -1331,6 +1422,10 @@ class LNWallet(LNWorker):
                 else:
                     await self.network.main_taskgroup.spawn(
                         self.reestablish_peer_for_given_channel(chan))
+                    retry = True
+            if retry:
+                # connection attempts are rate limited per peer address
+                self._reestablish_wakeup.set_after(PEER_RETRY_INTERVAL_FOR_CHANNELS)
 
     def current_feerate_per_kw(self):
         from .simple_config import FEE_LN_ETA_TARGET, FEERATE_FALLBACK_STATIC_FEE, FEERATE_REGTEST_HARDCODED
@@ -0,0 +1,293 @@
+# Copyright (C) 2020 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+"""In-process metrics: counters, gauges and latency histograms.
+
+Collection is disabled by default, in which case the module level
+helpers return immediately. It is enabled with the 'metrics' config
+option (see Daemon), and the values can then be read with the
+'getmetrics' command, or in text format from the JSON-RPC server.
+
+Metric names are dotted strings, e.g. 'interface.request'. Keyword
+arguments to the helpers are used as labels, e.g. method='server.ping'.
+Keep the set of label values small.
+"""
+
+import asyncio
+import bisect
+import functools
+import re
+import threading
+import time
+from typing import Dict, Tuple, Sequence, Optional, Callable, Union
+
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+# upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: Union[int, float] = 1) -> None:
+        self.value += amount
+
+    def to_json(self):
+        return self.value
+
+
+class Gauge:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: Union[int, float]) -> None:
+        self.value = value
+
+    def inc(self, amount: Union[int, float] = 1) -> None:
+        self.value += amount
+
+    def to_json(self):
+        return self.value
+
+
+class Histogram:
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate of the q-quantile: the upper bound of the bucket it falls in."""
+        with self.lock:
+            counts = list(self.counts)
+            count, max_value = self.count, self.max
+        if count == 0:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            if cumulative >= rank:
+                return min(bound, max_value)
+        return max_value
+
+    def cumulative_counts(self) -> Sequence[Tuple[float, int]]:
+        with self.lock:
+            counts = list(self.counts)
+        result = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            result.append((bound, cumulative))
+        return result
+
+    def to_json(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'max': round(self.max, 6),
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+
+class _NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('histogram', 't0')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.t0)
+        return False
+
+
+def _labels_key(labels: Dict[str, object]) -> LabelsKey:
+    if not labels:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def format_metric_name(name: str, labels: LabelsKey) -> str:
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.enabled = False
+        self._counters = {}  # type: Dict[Tuple[str, LabelsKey], Counter]
+        self._gauges = {}  # type: Dict[Tuple[str, LabelsKey], Gauge]
+        self._histograms = {}  # type: Dict[Tuple[str, LabelsKey], Histogram]
+        self._lock = threading.Lock()
+
+    def _get(self, table: dict, cls, name: str, labels: Dict[str, object]):
+        key = (name, _labels_key(labels))
+        metric = table.get(key)
+        if metric is None:
+            with self._lock:
+                metric = table.get(key)
+                if metric is None:
+                    metric = table[key] = cls()
+        return metric
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get(self._counters, Counter, name, labels)
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        return self._get(self._gauges, Gauge, name, labels)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self._get(self._histograms, Histogram, name, labels)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def to_json(self) -> dict:
+        def dump(table):
+            return {format_metric_name(name, labels): metric.to_json()
+                    for (name, labels), metric in sorted(table.items())}
+        with self._lock:
+            counters, gauges, histograms = dict(self._counters), dict(self._gauges), dict(self._histograms)
+        return {
+            'enabled': self.enabled,
+            'counters': dump(counters),
+            'gauges': dump(gauges),
+            'histograms': dump(histograms),
+        }
+
+    def to_text(self, prefix: str = 'electrum_') -> str:
+        """Prometheus text exposition format."""
+        def metric_name(name):
+            return prefix + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+        with self._lock:
+            counters, gauges, histograms = dict(self._counters), dict(self._gauges), dict(self._histograms)
+        lines = []
+        for table, kind in ((counters, 'counter'), (gauges, 'gauge')):
+            seen = set()
+            for (name, labels), metric in sorted(table.items()):
+                pname = metric_name(name)
+                if pname not in seen:
+                    seen.add(pname)
+                    lines.append(f'# TYPE {pname} {kind}')
+                lines.append(f'{format_metric_name(pname, labels)} {metric.value}')
+        seen = set()
+        for (name, labels), metric in sorted(histograms.items()):
+            pname = metric_name(name)
+            if pname not in seen:
+                seen.add(pname)
+                lines.append(f'# TYPE {pname} histogram')
+            for bound, cumulative in metric.cumulative_counts():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{format_metric_name(pname + "_bucket", labels + (("le", le),))} {cumulative}')
+            lines.append(f'{format_metric_name(pname + "_sum", labels)} {metric.sum}')
+            lines.append(f'{format_metric_name(pname + "_count", labels)} {metric.count}')
+        return '\n'.join(lines) + '\n'
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+
+def set_enabled(enabled: bool) -> None:
+    _registry.enabled = bool(enabled)
+
+
+def is_enabled() -> bool:
+    return _registry.enabled
+
+
+def inc(name: str, amount: Union[int, float] = 1, **labels) -> None:
+    if not _registry.enabled:
+        return
+    _registry.counter(name, **labels).inc(amount)
+
+
+def set_gauge(name: str, value: Union[int, float], **labels) -> None:
+    if not _registry.enabled:
+        return
+    _registry.gauge(name, **labels).set(value)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    if not _registry.enabled:
+        return
+    _registry.histogram(name, **labels).observe(value)
+
+
+def timer(name: str, **labels):
+    """Context manager recording the duration of its body in a histogram."""
+    if not _registry.enabled:
+        return _NULL_TIMER
+    return _Timer(_registry.histogram(name, **labels))
+
+
+def timed(name: Optional[str] = None, **labels) -> Callable:
+    """Decorator recording the duration of each call in a histogram.
+    Works for both regular and async functions.
+    """
+    def decorator(func):
+        metric_name = name or func.__qualname__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not _registry.enabled:
+                    return await func(*args, **kwargs)
+                with _Timer(_registry.histogram(metric_name, **labels)):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not _registry.enabled:
+                    return func(*args, **kwargs)
+                with _Timer(_registry.histogram(metric_name, **labels)):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
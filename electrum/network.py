@@ -42,7 +42,7 @@ from aiorpcx import TaskGroup
 from aiohttp import ClientResponse
 
 from . import util
-from .util import (log_exceptions, ignore_exceptions,
+from .util import (log_exceptions, ignore_exceptions, WakeupEvent,
                    bfh, SilentTaskGroup, make_aiohttp_session, send_exception_to_crash_reporter,
                    is_hash256_str, is_non_negative_integer)
 
@@ -56,6 +56,8 @@ from .blockchain import Blockchain, HEADER_SIZE
 from .interface import (Interface, serialize_server, deserialize_server,
                         RequestTimedOut, NetworkTimeout, BUCKET_NAME_OF_ONION_SERVERS,
                         NetworkException, RequestCorrupted)
+from .request_router import RequestRouter, StaleAnswer
+from .server_scoreboard import ServerScoreboard
 from .version import PROTOCOL_VERSION
 from .simple_config import SimpleConfig
 from .i18n import _
@@ -72,8 +74,8 @@ _logger = get_logger(__name__)
 
 
 
-NODES_RETRY_INTERVAL = 60
 SERVER_RETRY_INTERVAL = 10
+MIN_MAINTENANCE_DELAY = 0.1
 NUM_TARGET_CONNECTED_SERVERS = 10
 NUM_RECENT_SERVERS = 20
 
@@ -128,12 +130,15 @@ def filter_protocol(hostmap, protocol='t'):
     return eligible
 
 
-def pick_random_server(hostmap=None, protocol='t', exclude_set=None):
+def pick_random_server(hostmap=None, protocol='t', exclude_set=None,
+                       scoreboard: ServerScoreboard = None):
     if hostmap is None:
         hostmap = constants.net.DEFAULT_SERVERS
     if exclude_set is None:
         exclude_set = set()
     eligible = list(set(filter_protocol(hostmap, protocol)) - exclude_set)
+    if scoreboard is not None:
+        return scoreboard.choose(eligible)
     return random.choice(eligible) if eligible else None
 
 
@@ -256,6 +261,8 @@ class Network(Logger):
         self.logger.info(f"blockchains {list(map(lambda b: b.forkpoint, blockchain.blockchains.values()))}")
         self._blockchain_preferred_block = self.config.get('blockchain_preferred_block', None)  # type: Optional[Dict]
         self._blockchain = blockchain.get_best_chain()
+        # what we know about the servers, from previous sessions too
+        self.scoreboard = ServerScoreboard(self.config)
         # Server for addresses and transactions
         self.default_server = self.config.get('server', None)
         # Sanitize default server
@@ -266,7 +273,7 @@ class Network(Logger):
                 self.logger.warning('failed to parse server-string; falling back to random.')
                 self.default_server = None
         if not self.default_server:
-            self.default_server = pick_random_server()
+            self.default_server = pick_random_server(scoreboard=self.scoreboard)
 
         self.main_taskgroup = None  # type: TaskGroup
 
@@ -291,12 +298,15 @@ class Network(Logger):
 
         # retry times
         self.server_retry_time = time.time()
-        self.nodes_retry_time = time.time()
         # the main server we are currently communicating with
         self.interface = None  # type: Interface
         self.default_server_changed_event = asyncio.Event()
         # set of servers we have an ongoing connection with
         self.interfaces = {}  # type: Dict[str, Interface]
+        # spreads read-only requests across them
+        self.router = RequestRouter(self)
+        # wakes up _maintain_sessions
+        self._maintenance_wakeup = WakeupEvent(self.asyncio_loop)
         self.auto_connect = self.config.get('auto_connect', True)
         self.connecting = set()
         self.server_queue = None
@@ -322,8 +332,9 @@ class Network(Logger):
             from . import lnworker
             from . import lnrouter
             from . import channel_db
+            from . import lnmissioncontrol
             self.channel_db = channel_db.ChannelDB(self)
-            self.path_finder = lnrouter.LNPathFinder(self.channel_db)
+            self.path_finder = lnrouter.LNPathFinder(self.channel_db, lnmissioncontrol.MissionControl(self.config))
             self.lngossip = lnworker.LNGossip(self)
             self.lngossip.start_network(self)
 
@@ -404,6 +415,7 @@ class Network(Logger):
     def _set_status(self, status):
         self.connection_status = status
         self.notify('status')
+        self._maintenance_wakeup.set()
 
     def is_connected(self):
         interface = self.interface
@@ -542,11 +554,13 @@ class Network(Logger):
                 self._set_status('connecting')
             self.connecting.add(server)
             self.server_queue.put(server)
+            self._maintenance_wakeup.set()
 
     def _start_random_interface(self):
         with self.interfaces_lock:
             exclude_set = self.disconnected_servers | set(self.interfaces) | self.connecting
-        server = pick_random_server(self.get_servers(), self.protocol, exclude_set)
+        server = pick_random_server(self.get_servers(), self.protocol, exclude_set,
+                                    scoreboard=self.scoreboard)
         if server:
             self._start_interface(server)
         return server
@@ -598,12 +612,12 @@ class Network(Logger):
         self.oneserver = bool(oneserver)
 
     async def _switch_to_random_interface(self):
-        '''Switch to a random connected server other than the current one'''
+        '''Switch to the best connected server other than the current one'''
         servers = self.get_interfaces()    # Those in connected state
         if self.default_server in servers:
             servers.remove(self.default_server)
         if servers:
-            await self.switch_to_interface(random.choice(servers))
+            await self.switch_to_interface(self.scoreboard.best(servers))
 
     async def switch_lagging_interface(self):
         '''If auto_connect and lagging, switch interface'''
@@ -613,8 +627,9 @@ class Network(Logger):
             with self.interfaces_lock: interfaces = list(self.interfaces.values())
             filtered = list(filter(lambda iface: iface.tip_header == best_header, interfaces))
             if filtered:
-                chosen_iface = random.choice(filtered)
-                await self.switch_to_interface(chosen_iface.server)
+                self.scoreboard.record_stale_tip(self.default_server)
+                chosen_server = self.scoreboard.best(iface.server for iface in filtered)
+                await self.switch_to_interface(chosen_server)
 
     async def switch_unwanted_fork_interface(self):
         """If auto_connect and main interface is not on preferred fork,
@@ -695,6 +710,7 @@ class Network(Logger):
                     self.interfaces.pop(interface.server)
             if interface.server == self.default_server:
                 self.interface = None
+            self._maintenance_wakeup.set()
             await interface.close()
 
     @with_recent_servers_lock
@@ -711,6 +727,17 @@ class Network(Logger):
         We distinguish by whether it is in self.interfaces.'''
         if not interface: return
         server = interface.server
+        # closed by us, or by the server
+        with self.interfaces_lock:
+            dropped = self.interfaces.get(server) == interface
+            # if no other server is connected either, we are probably offline:
+            # that does not count against the server
+            others_connected = any(s != server for s in self.interfaces)
+        group = self.main_taskgroup
+        stopping = group is None or group.closed()
+        failed = (not stopping and others_connected
+                  and (dropped or not interface.ready.done() or interface.ready.cancelled()))
+        self.scoreboard.record_disconnect(server, failed=failed)
         self.disconnected_servers.add(server)
         if server == self.default_server:
             self._set_status('disconnected')
@@ -730,6 +757,7 @@ class Network(Logger):
         interface = Interface(self, server, self.proxy)
         # note: using longer timeouts here as DNS can sometimes be slow!
         timeout = self.get_network_timeout_seconds(NetworkTimeout.Generic)
+        t0 = time.monotonic()
         try:
             await asyncio.wait_for(interface.ready, timeout)
         except BaseException as e:
@@ -737,12 +765,16 @@ class Network(Logger):
             await interface.close()
             return
         else:
+            self.scoreboard.record_connect(server, time.monotonic() - t0)
+            if interface.tip < self.get_local_height() - 1:
+                self.scoreboard.record_stale_tip(server)
             with self.interfaces_lock:
                 assert server not in self.interfaces
                 self.interfaces[server] = interface
         finally:
             try: self.connecting.remove(server)
             except KeyError: pass
+            self._maintenance_wakeup.set()
 
         if server == self.default_server:
             await self.switch_to_interface(server)
@@ -832,7 +864,23 @@ class Network(Logger):
             raise Exception(f"{repr(tx_hash)} is not a txid")
         if not is_non_negative_integer(tx_height):
             raise Exception(f"{repr(tx_height)} is not a block height")
-        return await self.interface.session.send_request('blockchain.transaction.get_merkle', [tx_hash, tx_height])
+        from .verifier import verify_tx_is_in_block
+
+        def validate(iface, merkle):
+            # SPV check, for answers from servers other than the main one
+            if iface is self.interface or self.config.get("skipmerklecheck"):
+                return
+            try:
+                height = merkle['block_height']
+                header = self.blockchain().read_header(height)
+                if header is None:
+                    raise Exception(f"no header at height {height}")
+                verify_tx_is_in_block(tx_hash, merkle['merkle'], merkle['pos'], header, height)
+            except Exception as e:
+                self.logger.warning(f"invalid merkle proof for {tx_hash} from {str(iface)}: {e!r}")
+                raise RequestCorrupted() from e
+        return await self.router.send_request('blockchain.transaction.get_merkle', [tx_hash, tx_height],
+                                              validate=validate)
 
     @best_effort_reliable
     async def broadcast_transaction(self, tx: 'Transaction', *, timeout=None) -> None:
@@ -1005,32 +1053,44 @@ class Network(Logger):
     async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
         if not is_hash256_str(tx_hash):
             raise Exception(f"{repr(tx_hash)} is not a txid")
-        iface = self.interface
-        raw = await iface.session.send_request('blockchain.transaction.get', [tx_hash], timeout=timeout)
-        # validate response
-        tx = Transaction(raw)
-        try:
-            tx.deserialize()  # see if raises
-        except Exception as e:
-            self.logger.warning(f"cannot deserialize received transaction (txid {tx_hash}). from {str(iface)}")
-            raise RequestCorrupted() from e  # TODO ban server?
-        if tx.txid() != tx_hash:
-            self.logger.warning(f"received tx does not match expected txid {tx_hash} (got {tx.txid()}). from {str(iface)}")
-            raise RequestCorrupted()  # TODO ban server?
-        return raw
+
+        def validate(iface, raw):
+            tx = Transaction(raw)
+            try:
+                tx.deserialize()  # see if raises
+            except Exception as e:
+                self.logger.warning(f"cannot deserialize received transaction (txid {tx_hash}). from {str(iface)}")
+                raise RequestCorrupted() from e  # TODO ban server?
+            if tx.txid() != tx_hash:
+                self.logger.warning(f"received tx does not match expected txid {tx_hash} (got {tx.txid()}). from {str(iface)}")
+                raise RequestCorrupted()  # TODO ban server?
+        return await self.router.send_request('blockchain.transaction.get', [tx_hash], timeout=timeout,
+                                              validate=validate)
 
     @best_effort_reliable
     @catch_server_exceptions
-    async def get_history_for_scripthash(self, sh: str) -> List[dict]:
+    async def get_history_for_scripthash(self, sh: str, *, status: str = None) -> List[dict]:
+        """If the status announced by the main server is given, other
+        servers may answer, as their answer can be checked against it."""
         if not is_hash256_str(sh):
             raise Exception(f"{repr(sh)} is not a scripthash")
-        return await self.interface.session.send_request('blockchain.scripthash.get_history', [sh])
+        if status is None:
+            return await self.interface.session.send_request('blockchain.scripthash.get_history', [sh])
+        from .synchronizer import history_status
+
+        def validate(iface, result):
+            hist = [(item['tx_hash'], item['height']) for item in result]
+            if iface is not self.interface and history_status(hist) != status:
+                raise StaleAnswer('status mismatch')  # e.g. lagging server
+        return await self.router.send_request('blockchain.scripthash.get_history', [sh], validate=validate)
 
     @best_effort_reliable
     @catch_server_exceptions
     async def listunspent_for_scripthash(self, sh: str) -> List[dict]:
         if not is_hash256_str(sh):
             raise Exception(f"{repr(sh)} is not a scripthash")
+        # not routed: unlike histories, there is nothing to check the
+        # answers of other servers against
         return await self.interface.session.send_request('blockchain.scripthash.listunspent', [sh])
 
     @best_effort_reliable
@@ -1115,7 +1175,7 @@ class Network(Logger):
         assert not self.interface and not self.interfaces
         assert not self.connecting and not self.server_queue
         self.logger.info('starting network')
-        self.disconnected_servers = set([])
+        self.disconnected_servers = self.scoreboard.get_failing_servers()
         self.protocol = deserialize_server(self.default_server)[2]
         self.server_queue = queue.Queue()
         self._set_proxy(deserialize_proxy(self.config.get('proxy')))
@@ -1158,6 +1218,7 @@ class Network(Logger):
         self.interfaces = {}  # type: Dict[str, Interface]
         self.connecting.clear()
         self.server_queue = None
+        self.scoreboard.save()
         if not full_shutdown:
             self.trigger_callback('network_updated')
 
@@ -1181,6 +1242,7 @@ class Network(Logger):
                 if now - self.server_retry_time > SERVER_RETRY_INTERVAL:
                     self.disconnected_servers.remove(self.default_server)
                     self.server_retry_time = now
+                    self._maintenance_wakeup.set()
             else:
                 await self.switch_to_interface(self.default_server)
 
@@ -1194,10 +1256,14 @@ class Network(Logger):
             for i in range(self.num_server - len(self.interfaces) - len(self.connecting)):
                 # FIXME this should try to honour "healthy spread of connected servers"
                 self._start_random_interface()
-            if now - self.nodes_retry_time > NODES_RETRY_INTERVAL:
-                self.logger.info('network: retrying connections')
-                self.disconnected_servers = set([])
-                self.nodes_retry_time = now
+            # each server has its own backoff
+            retry = {server for server in self.disconnected_servers
+                     if server != self.default_server and not self.scoreboard.is_backing_off(server, now)}
+            if retry:
+                self.logger.info(f'network: retrying connections to {len(retry)} servers')
+                self.disconnected_servers -= retry
+                self._maintenance_wakeup.set()
+            self.scoreboard.maybe_save()
         async def maintain_healthy_spread_of_connected_servers():
             with self.interfaces_lock: interfaces = list(self.interfaces.values())
             random.shuffle(interfaces)
@@ -1211,6 +1277,19 @@ class Network(Logger):
             if self.is_connected():
                 if self.config.is_fee_estimates_update_required():
                     await self.interface.group.spawn(self._request_fee_estimates, self.interface)
+        def schedule_next_wakeup():
+            # other than the events that set _maintenance_wakeup,
+            # only these deadlines require work
+            now = time.time()
+            deadlines = [self.scoreboard.retry_time(server) for server in self.disconnected_servers
+                         if server != self.default_server]
+            if self.default_server in self.disconnected_servers:
+                deadlines.append(self.server_retry_time + SERVER_RETRY_INTERVAL)
+            if self.is_connected():
+                deadlines.append(now + self.config.time_until_fee_estimates_update())
+            self._maintenance_wakeup.cancel_deadlines()
+            if deadlines:
+                self._maintenance_wakeup.set_after(max(min(deadlines) - now, MIN_MAINTENANCE_DELAY))
 
         while True:
             try:
@@ -1218,12 +1297,13 @@ class Network(Logger):
                 await maybe_queue_new_interfaces_to_be_launched_later()
                 await maintain_healthy_spread_of_connected_servers()
                 await maintain_main_interface()
+                schedule_next_wakeup()
             except asyncio.CancelledError:
                 # suppress spurious cancellations
                 group = self.main_taskgroup
                 if not group or group.closed():
                     raise
-            await asyncio.sleep(0.1)
+            await self._maintenance_wakeup.wait()
 
     @classmethod
     async def _send_http_on_proxy(cls, method: str, url: str, params: str = None,
@@ -25,7 +25,9 @@
 import hashlib
 import sys
 import time
-from typing import Optional, List
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Tuple, Sequence
 import asyncio
 import urllib.parse
 
@@ -55,13 +57,25 @@ REQUEST_HEADERS = {'Accept': 'application/bitcoin-paymentrequest', 'User-Agent':
 ACK_HEADERS = {'Content-Type':'application/bitcoin-payment','Accept':'application/bitcoin-paymentack','User-Agent':'Electrum'}
 
 ca_path = certifi.where()
-ca_list = None
+ca_index_path = None  # type: Optional[str]  # set by the daemon, see x509.load_ca_store
+ca_list = None  # type: Optional[x509.CAStore]
 ca_keyID = None
 
+# parsed chain certificates, and verified chains
+PARSED_CERTS_CACHE_SIZE = 256
+VERIFIED_CHAINS_CACHE_SIZE = 128
+_parsed_certs = OrderedDict()  # type: OrderedDict[bytes, x509.X509]
+_verified_chains = OrderedDict()  # type: OrderedDict[Tuple[Optional[str], Tuple[bytes, ...]], Tuple[List[x509.X509], x509.X509]]
+_cache_lock = threading.Lock()
+
+
 def load_ca_list():
     global ca_list, ca_keyID
     if ca_list is None:
-        ca_list, ca_keyID = x509.load_certificates(ca_path)
+        store = x509.load_ca_store(ca_path, ca_index_path)
+        with _cache_lock:
+            _verified_chains.clear()
+        ca_list, ca_keyID = store, store.key_ids
 
 
 
@@ -350,14 +364,49 @@ def sign_request_with_alias(pr, alias, alias_privkey):
     pr.signature = ec_key.sign_message(message, compressed)
 
 
-def verify_cert_chain(chain):
+def _parse_cert(b: bytes) -> x509.X509:
+    with _cache_lock:
+        x = _parsed_certs.get(b)
+        if x is not None:
+            _parsed_certs.move_to_end(b)
+            return x
+    x = x509.X509(bytearray(b))
+    with _cache_lock:
+        _parsed_certs[b] = x
+        if len(_parsed_certs) > PARSED_CERTS_CACHE_SIZE:
+            _parsed_certs.popitem(last=False)
+    return x
+
+
+def verify_cert_chain(chain: Sequence[bytes]) -> Tuple[x509.X509, x509.X509]:
     """ Verify a chain of certificates. The last certificate is the CA"""
     load_ca_list()
+    chain = tuple(bytes(b) for b in chain)
+    # a chain is only trusted for the CA bundle it was verified against
+    key = (ca_list.bundle_hash, chain)
+    with _cache_lock:
+        result = _verified_chains.get(key)
+        if result is not None:
+            _verified_chains.move_to_end(key)
+    if result is None:
+        result = _verify_cert_chain(chain)
+        with _cache_lock:
+            _verified_chains[key] = result
+            if len(_verified_chains) > VERIFIED_CHAINS_CACHE_SIZE:
+                _verified_chains.popitem(last=False)
+    # the signatures were checked once, the validity windows on every call
+    x509_chain, ca = result
+    for x in x509_chain:
+        x.check_date()
+    return x509_chain[0], ca
+
+
+def _verify_cert_chain(chain: Sequence[bytes]) -> Tuple[List[x509.X509], x509.X509]:
     # parse the chain
     cert_num = len(chain)
     x509_chain = []
     for i in range(cert_num):
-        x = x509.X509(bytearray(chain[i]))
+        x = _parse_cert(chain[i])
         x509_chain.append(x)
         if i == 0:
             x.check_date()
@@ -400,7 +449,7 @@ def verify_cert_chain(chain):
         if not verify:
             raise Exception("Certificate not Signed by Provided CA Certificate Chain")
 
-    return x509_chain[0], ca
+    return x509_chain, ca
 
 
 def check_ssl_config(config):
@@ -0,0 +1,191 @@
+import asyncio
+import xmlrpc.client
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import aiohttp
+
+from electrum.logging import Logger
+from electrum.network import Network
+from electrum.util import log_exceptions, make_aiohttp_session
+
+
+SERVER_URL = 'https://cosigner.electrum.org/'
+
+
+class CosignerPoolClient(Logger):
+    """XML-RPC client of a cosigner pool server, on asyncio.
+
+    Besides get/put/delete, servers may offer get_many(keyhashes, timeout),
+    which returns the messages of all the given keyhashes at once, and holds
+    the request until one of them has a message or the timeout elapses.
+    Servers that do not know that method are polled with get instead.
+    """
+
+    LONG_POLL_TIMEOUT = 60  # seconds a get_many request is held by the server
+    MIN_BACKOFF = 1
+    MAX_BACKOFF = 300
+
+    def __init__(self, url: str = SERVER_URL):
+        self.url = url
+        Logger.__init__(self)
+        self.can_long_poll = True  # until the server says otherwise
+        self.backoff = 0  # seconds to wait before contacting the server again
+        self._session = None  # type: Optional[aiohttp.ClientSession]
+        self._session_proxy = None
+
+    def diagnostic_name(self):
+        return self.url
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        network = Network.get_instance()
+        proxy = network.proxy if network else None
+        session = self._session
+        if session is None or session.closed or proxy != self._session_proxy:
+            self._session = make_aiohttp_session(proxy)
+            self._session_proxy = proxy
+            if session is not None:
+                await session.close()
+        return self._session
+
+    async def close(self):
+        session, self._session = self._session, None
+        if session is not None:
+            await session.close()
+
+    async def call(self, method: str, *params, timeout: float = None):
+        data = xmlrpc.client.dumps(params, method, allow_none=True)
+        session = await self.get_session()
+        kwargs = {'timeout': aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+        async with session.post(self.url, data=data, headers={'Content-Type': 'text/xml'}, **kwargs) as response:
+            response.raise_for_status()
+            body = await response.read()
+        # raises xmlrpc.client.Fault if the server returned one
+        (result,), _ = xmlrpc.client.loads(body)
+        return result
+
+    async def get(self, keyhash: str) -> Optional[str]:
+        return await self.call('get', keyhash)
+
+    async def put(self, keyhash: str, message: str):
+        return await self.call('put', keyhash, message)
+
+    async def delete(self, keyhash: str):
+        return await self.call('delete', keyhash)
+
+    async def get_many(self, keyhashes: List[str]) -> Dict[str, str]:
+        """Returns the messages waiting for keyhashes, as soon as there is one.
+        Returns an empty dict if there was none within LONG_POLL_TIMEOUT."""
+        if self.can_long_poll:
+            try:
+                return await self.call('get_many', keyhashes, self.LONG_POLL_TIMEOUT,
+                                       timeout=self.LONG_POLL_TIMEOUT + 30)
+            except xmlrpc.client.Fault as e:
+                self.logger.info(f"server cannot long-poll, polling instead: {e.faultString}")
+                self.can_long_poll = False
+        messages = {}
+        for keyhash in keyhashes:
+            message = await self.get(keyhash)
+            if message:
+                messages[keyhash] = message
+        return messages
+
+    def on_success(self):
+        self.backoff = 0
+
+    def on_error(self):
+        self.backoff = min(max(2 * self.backoff, self.MIN_BACKOFF), self.MAX_BACKOFF)
+
+
+class Listener(Logger):
+    """Waits for messages to our keyhashes, and passes each of them to
+    on_message once, until it is cleared.
+
+    Runs on the asyncio loop of the network. set_keyhashes and clear may be
+    called from other threads.
+    """
+
+    POLL_INTERVAL = 30  # seconds between two rounds, when the server cannot long-poll
+
+    def __init__(self, client: CosignerPoolClient, on_message: Callable[[str, str], None]):
+        Logger.__init__(self)
+        self.client = client
+        self.on_message = on_message
+        self.received = set()  # type: Set[str]
+        self.keyhashes = []  # type: List[str]
+        self._changed = None  # type: Optional[asyncio.Event]  # created on the loop
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self._task = None  # type: Optional[asyncio.Future]
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._task = asyncio.run_coroutine_threadsafe(self.run(), loop)
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            asyncio.run_coroutine_threadsafe(self.client.close(), self._loop)
+            self._task = None
+
+    def _set_changed(self):
+        if self._changed:
+            self._changed.set()
+
+    def _wake_up(self):
+        self._loop.call_soon_threadsafe(self._set_changed)
+
+    def set_keyhashes(self, keyhashes: Iterable[str]):
+        self.keyhashes = list(keyhashes)
+        if self._loop:
+            self._wake_up()
+
+    def clear(self, keyhash: str):
+        asyncio.run_coroutine_threadsafe(self.clear_keyhash(keyhash), self._loop)
+
+    @log_exceptions
+    async def clear_keyhash(self, keyhash: str):
+        # delete first, so that the message is not fetched again
+        await self.client.delete(keyhash)
+        self.received.discard(keyhash)
+        self._set_changed()
+
+    async def _unless_changed(self, aw, timeout: float = None):
+        """Awaits aw, unless the keyhashes change or timeout elapses first.
+        Returns None in that case."""
+        task = asyncio.ensure_future(aw)
+        changed = asyncio.ensure_future(self._changed.wait())
+        try:
+            await asyncio.wait([task, changed], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            changed.cancel()
+            if not task.done():
+                task.cancel()
+        if task.done() and not task.cancelled():
+            return task.result()
+
+    @log_exceptions
+    async def run(self):
+        self._changed = asyncio.Event()
+        while True:
+            self._changed.clear()
+            keyhashes = [keyhash for keyhash in self.keyhashes if keyhash not in self.received]
+            if not keyhashes:
+                await self._changed.wait()
+                continue
+            try:
+                messages = await self._unless_changed(self.client.get_many(keyhashes))
+            except Exception as e:
+                self.client.on_error()
+                self.logger.info(f"cannot contact cosigner pool, retrying in {self.client.backoff} s: {repr(e)}")
+                await asyncio.sleep(self.client.backoff)
+                continue
+            if messages is None:
+                continue
+            self.client.on_success()
+            for keyhash, message in messages.items():
+                if keyhash in self.received or keyhash not in self.keyhashes:
+                    continue
+                self.received.add(keyhash)
+                self.logger.info(f"received message for {keyhash}")
+                self.on_message(keyhash, message)
+            if not self.client.can_long_poll:
+                await self._unless_changed(asyncio.sleep(self.POLL_INTERVAL), timeout=self.POLL_INTERVAL)
@@ -23,14 +23,13 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import time
-from xmlrpc.client import ServerProxy
-from typing import TYPE_CHECKING, Union, List, Tuple
+import asyncio
+from typing import TYPE_CHECKING, Union, List, Tuple, Optional
 
 from PyQt5.QtCore import QObject, pyqtSignal
 from PyQt5.QtWidgets import QPushButton
 
-from electrum import util, keystore, ecc, crypto
+from electrum import keystore, ecc, crypto
 from electrum import transaction
 from electrum.transaction import Transaction, PartialTransaction, tx_from_any
 from electrum.bip32 import BIP32Node
@@ -42,52 +41,12 @@ from electrum.util import bh2u, bfh
 from electrum.gui.qt.transaction_dialog import show_transaction, TxDialog
 from electrum.gui.qt.util import WaitingDialog
 
+from .cosigner_pool import CosignerPoolClient, Listener, SERVER_URL
+
 if TYPE_CHECKING:
     from electrum.gui.qt.main_window import ElectrumWindow
 
 
-server = ServerProxy('https://cosigner.electrum.org/', allow_none=True)
-
-
-class Listener(util.DaemonThread):
-
-    def __init__(self, parent):
-        util.DaemonThread.__init__(self)
-        self.daemon = True
-        self.parent = parent
-        self.received = set()
-        self.keyhashes = []
-
-    def set_keyhashes(self, keyhashes):
-        self.keyhashes = keyhashes
-
-    def clear(self, keyhash):
-        server.delete(keyhash)
-        self.received.remove(keyhash)
-
-    def run(self):
-        while self.running:
-            if not self.keyhashes:
-                time.sleep(2)
-                continue
-            for keyhash in self.keyhashes:
-                if keyhash in self.received:
-                    continue
-                try:
-                    message = server.get(keyhash)
-                except Exception as e:
-                    self.logger.info("cannot contact cosigner pool")
-                    time.sleep(30)
-                    continue
-                if message:
-                    self.received.add(keyhash)
-                    self.logger.info(f"received message for {keyhash}")
-                    self.parent.obj.cosigner_receive_signal.emit(
-                        keyhash, message)
-            # poll every 30 seconds
-            time.sleep(30)
-
-
 class QReceiveSignalObject(QObject):
     cosigner_receive_signal = pyqtSignal(object, object)
 
@@ -96,7 +55,8 @@ class Plugin(BasePlugin):
 
     def __init__(self, parent, config, name):
         BasePlugin.__init__(self, parent, config, name)
-        self.listener = None
+        self.listener = None  # type: Optional[Listener]
+        self.client = CosignerPoolClient(self.config.get('cosigner_pool_server', SERVER_URL))
         self.obj = QReceiveSignalObject()
         self.obj.cosigner_receive_signal.connect(self.on_receive)
         self.keys = []  # type: List[Tuple[str, str, ElectrumWindow]]
@@ -123,10 +83,10 @@ class Plugin(BasePlugin):
         if type(wallet) != Multisig_Wallet:
             return
         assert isinstance(wallet, Multisig_Wallet)  # only here for type-hints in IDE
-        if self.listener is None:
+        if self.listener is None and window.network:
             self.logger.info("starting listener")
-            self.listener = Listener(self)
-            self.listener.start()
+            self.listener = Listener(self.client, self.obj.cosigner_receive_signal.emit)
+            self.listener.start(window.network.asyncio_loop)
         elif self.listener:
             self.logger.info("shutting down listener")
             self.listener.stop()
@@ -187,10 +147,15 @@ class Plugin(BasePlugin):
             public_key = ecc.ECPubkey(K)
             message = public_key.encrypt_message(raw_tx_bytes).decode('ascii')
             # send message
-            task = lambda: server.put(_hash, message)
+            task = lambda: self.put_message(window, _hash, message)
             msg = _('Sending transaction to cosigning pool...')
             WaitingDialog(window, msg, task, on_success, on_failure)
 
+    def put_message(self, window: 'ElectrumWindow', keyhash: str, message: str):
+        if not window.network: raise Exception(_('You are offline.'))
+        coro = self.client.put(keyhash, message)
+        return asyncio.run_coroutine_threadsafe(coro, window.network.asyncio_loop).result()
+
     def on_receive(self, keyhash, message):
         self.logger.info(f"signal arrived for {keyhash}")
         for key, _hash, window in self.keys:
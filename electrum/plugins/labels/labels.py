@@ -1,18 +1,25 @@
 import asyncio
+import concurrent.futures
 import hashlib
 import json
 import sys
+import threading
 import traceback
-from typing import Union
+from typing import Union, Optional, Dict, TYPE_CHECKING
 
 import base64
 
+import aiohttp
+
 from electrum.plugin import BasePlugin, hook
 from electrum.crypto import aes_encrypt_with_iv, aes_decrypt_with_iv
 from electrum.i18n import _
 from electrum.util import log_exceptions, ignore_exceptions, make_aiohttp_session
 from electrum.network import Network
 
+if TYPE_CHECKING:
+    from electrum.wallet import Abstract_Wallet
+
 
 class ErrorConnectingServer(Exception):
     def __init__(self, reason: Union[str, Exception] = None):
@@ -28,10 +35,22 @@ class ErrorConnectingServer(Exception):
 
 class LabelsPlugin(BasePlugin):
 
+    PUSH_DELAY = 1.0  # seconds to wait for further label changes before pushing
+    RETRY_DELAY = 60.0  # seconds to wait before pushing again, after a failed push
+    MAX_LABELS_PER_POST = 500
+
     def __init__(self, parent, config, name):
         BasePlugin.__init__(self, parent, config, name)
-        self.target_host = 'labels.electrum.org'
+        self.target_url = 'https://labels.electrum.org'
         self.wallets = {}
+        self._session = None  # type: Optional[aiohttp.ClientSession]
+        self._session_proxy = None
+        self._session_loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        # labels changed locally and not pushed yet: wallet -> item -> label
+        self._pending = {}  # type: Dict[Abstract_Wallet, Dict[str, str]]
+        self._pending_lock = threading.Lock()
+        # digests of the labels the server has: wallet -> item -> digest
+        self._pushed = {}  # type: Dict[Abstract_Wallet, Dict[str, str]]
 
     def encode(self, wallet, msg):
         password, iv, wallet_id = self.wallets[wallet]
@@ -44,6 +63,10 @@ class LabelsPlugin(BasePlugin):
         decrypted = aes_decrypt_with_iv(password, iv, decoded)
         return decrypted.decode('utf8')
 
+    @staticmethod
+    def label_digest(label: str) -> str:
+        return hashlib.sha256(label.encode('utf8')).hexdigest()[:32]
+
     def get_nonce(self, wallet):
         # nonce is the nonce to be used with the next change
         nonce = wallet.db.get('wallet_nonce')
@@ -56,64 +79,137 @@ class LabelsPlugin(BasePlugin):
         self.logger.info(f"set {wallet.basename()} nonce to {nonce}")
         wallet.db.put("wallet_nonce", nonce)
 
+    def set_pushed(self, wallet, labels: Dict[str, str]):
+        pushed = self._pushed.setdefault(wallet, {})
+        for key, value in labels.items():
+            pushed[key] = self.label_digest(value)
+        wallet.db.put('labels_pushed', pushed)
+
+    def get_unpushed_labels(self, wallet) -> Dict[str, str]:
+        """Returns the labels that differ from what we last pushed to or
+        pulled from the server. Deleted labels are returned as ''.
+        """
+        pushed = self._pushed.get(wallet, {})
+        labels = {}
+        for key, value in list(wallet.labels.items()):
+            if pushed.get(key) != self.label_digest(value):
+                labels[key] = value
+        empty = self.label_digest('')
+        for key, digest in pushed.items():
+            if key not in wallet.labels and digest != empty:
+                labels[key] = ''
+        return labels
+
     @hook
     def set_label(self, wallet, item, label):
         if wallet not in self.wallets:
             return
         if not item:
             return
-        nonce = self.get_nonce(wallet)
-        wallet_id = self.wallets[wallet][2]
-        bundle = {"walletId": wallet_id,
-                  "walletNonce": nonce,
-                  "externalId": self.encode(wallet, item),
-                  "encryptedLabel": self.encode(wallet, label)}
-        asyncio.run_coroutine_threadsafe(self.do_post_safe("/label", bundle), wallet.network.asyncio_loop)
-        # Caller will write the wallet
-        self.set_nonce(wallet, nonce + 1)
+        with self._pending_lock:
+            pending = self._pending.setdefault(wallet, {})
+            schedule = not pending
+            pending[item] = label or ''
+        if schedule:
+            asyncio.run_coroutine_threadsafe(self.push_pending_later(wallet), wallet.network.asyncio_loop)
 
     @ignore_exceptions
     @log_exceptions
-    async def do_post_safe(self, *args):
-        await self.do_post(*args)
+    async def push_pending_later(self, wallet, delay=None):
+        # wait for more changes, so that bulk relabeling ends up in a few posts
+        await asyncio.sleep(self.PUSH_DELAY if delay is None else delay)
+        await self.push_pending(wallet)
 
-    async def do_get(self, url = "/labels"):
-        url = 'https://' + self.target_host + url
+    async def push_pending(self, wallet):
+        with self._pending_lock:
+            labels = self._pending.pop(wallet, {})
+        if not labels or wallet not in self.wallets:
+            return
+        try:
+            await self.post_labels(wallet, labels)
+        except Exception as e:
+            self.logger.info(f'could not push {len(labels)} labels, retrying in {self.RETRY_DELAY} s: {repr(e)}')
+            self.requeue_labels(wallet, labels)
+
+    def requeue_labels(self, wallet, labels: Dict[str, str]):
+        # labels changed again in the meantime are queued already, with their new value
+        pushed = self._pushed.get(wallet, {})
+        with self._pending_lock:
+            pending = self._pending.setdefault(wallet, {})
+            schedule = not pending
+            for key, value in labels.items():
+                if key not in pending and pushed.get(key) != self.label_digest(value):
+                    pending[key] = value
+            if not pending:
+                del self._pending[wallet]
+                schedule = False
+        if schedule and wallet in self.wallets:
+            asyncio.ensure_future(self.push_pending_later(wallet, self.RETRY_DELAY))
+
+    async def post_labels(self, wallet, labels: Dict[str, str]):
+        wallet_id = self.wallets[wallet][2]
+        items = list(labels.items())
+        for i in range(0, len(items), self.MAX_LABELS_PER_POST):
+            chunk = dict(items[i:i+self.MAX_LABELS_PER_POST])
+            nonce = self.get_nonce(wallet)
+            bundle = {"labels": [],
+                      "walletId": wallet_id,
+                      "walletNonce": nonce}
+            for key, value in chunk.items():
+                try:
+                    encoded_key = self.encode(wallet, key)
+                    encoded_value = self.encode(wallet, value)
+                except:
+                    self.logger.info(f'cannot encode {repr(key)} {repr(value)}')
+                    continue
+                bundle["labels"].append({'encryptedLabel': encoded_value,
+                                         'externalId': encoded_key})
+            await self.do_post("/labels", bundle)
+            self.set_nonce(wallet, nonce + 1)
+            self.set_pushed(wallet, chunk)
+
+    async def get_session(self) -> aiohttp.ClientSession:
         network = Network.get_instance()
         proxy = network.proxy if network else None
-        async with make_aiohttp_session(proxy) as session:
-            async with session.get(url) as result:
-                return await result.json()
+        session = self._session
+        if session is None or session.closed or proxy != self._session_proxy:
+            self._session = make_aiohttp_session(proxy)
+            self._session_proxy = proxy
+            self._session_loop = asyncio.get_event_loop()
+            if session is not None:
+                await session.close()
+        return self._session
+
+    def close_session(self) -> Optional[concurrent.futures.Future]:
+        session, self._session = self._session, None
+        if session is not None and not session.closed:
+            return asyncio.run_coroutine_threadsafe(session.close(), self._session_loop)
+
+    async def do_get(self, url = "/labels"):
+        url = self.target_url + url
+        session = await self.get_session()
+        async with session.get(url) as result:
+            return await result.json()
 
     async def do_post(self, url = "/labels", data=None):
-        url = 'https://' + self.target_host + url
-        network = Network.get_instance()
-        proxy = network.proxy if network else None
-        async with make_aiohttp_session(proxy) as session:
-            async with session.post(url, json=data) as result:
-                try:
-                    return await result.json()
-                except Exception as e:
-                    raise Exception('Could not decode: ' + await result.text()) from e
+        url = self.target_url + url
+        session = await self.get_session()
+        async with session.post(url, json=data) as result:
+            try:
+                return await result.json()
+            except Exception as e:
+                raise Exception('Could not decode: ' + await result.text()) from e
 
     async def push_thread(self, wallet):
         wallet_data = self.wallets.get(wallet, None)
         if not wallet_data:
             raise Exception('Wallet {} not loaded'.format(wallet))
-        wallet_id = wallet_data[2]
-        bundle = {"labels": [],
-                  "walletId": wallet_id,
-                  "walletNonce": self.get_nonce(wallet)}
-        for key, value in wallet.labels.items():
-            try:
-                encoded_key = self.encode(wallet, key)
-                encoded_value = self.encode(wallet, value)
-            except:
-                self.logger.info(f'cannot encode {repr(key)} {repr(value)}')
-                continue
-            bundle["labels"].append({'encryptedLabel': encoded_value,
-                                     'externalId': encoded_key})
-        await self.do_post("/labels", bundle)
+        # queued changes are in wallet.labels too
+        with self._pending_lock:
+            self._pending.pop(wallet, None)
+        labels = self.get_unpushed_labels(wallet)
+        self.logger.info(f"pushing {len(labels)} changed labels")
+        await self.post_labels(wallet, labels)
 
     async def pull_thread(self, wallet, force):
         wallet_data = self.wallets.get(wallet, None)
@@ -147,6 +243,8 @@ class LabelsPlugin(BasePlugin):
         for key, value in result.items():
             if force or not wallet.labels.get(key):
                 wallet.labels[key] = value
+        # the server has these now; local labels we kept instead will be pushed
+        self.set_pushed(wallet, result)
 
         self.logger.info(f"received {len(response)} labels")
         self.set_nonce(wallet, response["nonce"] + 1)
@@ -180,8 +278,32 @@ class LabelsPlugin(BasePlugin):
         iv = hashlib.sha256(password).digest()[:16]
         wallet_id = hashlib.sha256(mpk).hexdigest()
         self.wallets[wallet] = (password, iv, wallet_id)
+        self._pushed[wallet] = dict(wallet.db.get('labels_pushed', {}))
         # If there is an auth token we can try to actually start syncing
         asyncio.run_coroutine_threadsafe(self.pull_safe_thread(wallet, False), wallet.network.asyncio_loop)
 
     def stop_wallet(self, wallet):
+        if wallet in self.wallets and wallet.network:
+            asyncio.run_coroutine_threadsafe(self.stop_wallet_thread(wallet), wallet.network.asyncio_loop)
+        else:
+            self.forget_wallet(wallet)
+
+    @ignore_exceptions
+    @log_exceptions
+    async def stop_wallet_thread(self, wallet):
+        try:
+            # push what is still queued before forgetting about the wallet
+            await self.push_pending(wallet)
+        finally:
+            self.forget_wallet(wallet)
+
+    def forget_wallet(self, wallet):
         self.wallets.pop(wallet, None)
+        self._pushed.pop(wallet, None)
+        with self._pending_lock:
+            self._pending.pop(wallet, None)
+        if not self.wallets:
+            self.close_session()
+
+    def on_close(self):
+        self.close_session()
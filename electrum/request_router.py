@@ -0,0 +1,186 @@
+# Copyright (C) 2020 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+"""Routing of read-only requests across the connected servers.
+
+Requests go to the healthy interface with the lowest expected latency,
+given its recent latencies and the requests already in flight on it.
+If the answer takes longer than the 95th percentile of that server, a
+duplicate of the request is sent to the next best server, and the first
+valid answer wins. Answers are checked by a validate function before
+being accepted. Servers that time out or return invalid answers are
+avoided for a while.
+
+The main interface stays the last resort: when the other attempts
+fail, the error returned to the caller is the one of the main server,
+as it was before requests were spread.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Optional, List, Dict, Any, TYPE_CHECKING
+
+import aiorpcx
+
+from . import metrics
+from .interface import Interface, RequestTimedOut, RequestCorrupted
+from .logging import Logger
+
+if TYPE_CHECKING:
+    from .network import Network
+
+
+LATENCY_WINDOW = 64          # samples kept per server
+MIN_SAMPLES_FOR_P95 = 10
+DEFAULT_HEDGE_DELAY = 1.0    # seconds, before we know a server
+MIN_HEDGE_DELAY = 0.05       # seconds
+MIN_LATENCY = 0.001          # seconds, for scoring
+MAX_ATTEMPTS = 3
+FAILURE_PENALTY = 60         # seconds a server is avoided after a bad answer
+MAX_LAG = 1                  # blocks behind the main interface
+
+
+class StaleAnswer(Exception):
+    """The answer of a server does not match what the main server
+    announced, e.g. because the server is lagging."""
+
+
+class ServerStats:
+    __slots__ = ('latencies', 'ewma', 'in_flight', 'penalized_until', '_p95')
+
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.ewma = None  # type: Optional[float]
+        self.in_flight = 0
+        self.penalized_until = 0.0
+        self._p95 = None  # type: Optional[float]
+
+    def add_latency(self, value: float) -> None:
+        self.latencies.append(value)
+        self.ewma = value if self.ewma is None else 0.8 * self.ewma + 0.2 * value
+        self._p95 = None
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < MIN_SAMPLES_FOR_P95:
+            return None
+        if self._p95 is None:
+            values = sorted(self.latencies)
+            self._p95 = values[min(len(values) - 1, int(0.95 * len(values)))]
+        return self._p95
+
+    def request_done(self, fut: asyncio.Future) -> None:
+        self.in_flight -= 1
+
+    def score(self) -> float:
+        # unknown servers get probed first
+        return max(self.ewma or 0.0, MIN_LATENCY) * (1 + self.in_flight)
+
+
+class RequestRouter(Logger):
+
+    def __init__(self, network: 'Network'):
+        Logger.__init__(self)
+        self.network = network
+        self.enabled = network.config.get('spread_requests', True)
+        self._stats = {}  # type: Dict[str, ServerStats]
+
+    def get_stats(self, server: str) -> ServerStats:
+        stats = self._stats.get(server)
+        if stats is None:
+            stats = self._stats[server] = ServerStats()
+        return stats
+
+    def is_healthy(self, iface: Interface, main: Interface) -> bool:
+        if iface is main:
+            return True
+        if not iface.ready.done() or iface.ready.cancelled() or iface.got_disconnected.done():
+            return False
+        if iface.blockchain is not main.blockchain or iface.tip < main.tip - MAX_LAG:
+            return False
+        return self.get_stats(iface.server).penalized_until <= time.monotonic()
+
+    def get_candidates(self, main: Interface) -> List[Interface]:
+        """Interfaces to try, in order, the main one included."""
+        if not self.enabled:
+            return [main]
+        with self.network.interfaces_lock:
+            interfaces = list(self.network.interfaces.values())
+        candidates = [iface for iface in interfaces if iface is not main and self.is_healthy(iface, main)]
+        candidates.append(main)
+        candidates.sort(key=lambda iface: self.get_stats(iface.server).score())
+        candidates = candidates[:MAX_ATTEMPTS]
+        if main not in candidates:
+            candidates[-1] = main
+        return candidates
+
+    def hedge_delay(self, iface: Interface) -> float:
+        p95 = self.get_stats(iface.server).p95()
+        return DEFAULT_HEDGE_DELAY if p95 is None else max(MIN_HEDGE_DELAY, p95)
+
+    async def send_request(self, method: str, params: list, *, timeout=None,
+                           validate: Callable[[Interface, Any], None] = None) -> Any:
+        """Sends a request to the best candidate, and to the next ones
+        if it is too slow or fails. validate raises RequestCorrupted if
+        an answer is invalid, or StaleAnswer if it is only outdated.
+        """
+        main = self.network.interface
+        candidates = self.get_candidates(main)
+        pending = {}  # type: Dict[asyncio.Future, Interface]
+        errors = {}  # type: Dict[Interface, BaseException]
+
+        def launch():
+            iface = candidates.pop(0)
+            stats = self.get_stats(iface.server)
+            # counted from now, not from when the task starts
+            stats.in_flight += 1
+            fut = asyncio.ensure_future(self._request(iface, method, params, timeout, validate))
+            fut.add_done_callback(stats.request_done)
+            pending[fut] = iface
+            return iface
+
+        last = launch()
+        try:
+            while pending:
+                delay = self.hedge_delay(last) if candidates else None
+                done, _ = await asyncio.wait(list(pending), timeout=delay,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    metrics.inc('network.hedged_requests', method=method)
+                    last = launch()
+                    continue
+                for fut in done:
+                    iface = pending.pop(fut)
+                    if fut.exception() is None:
+                        return fut.result()
+                    errors[iface] = fut.exception()
+                if not pending and candidates:
+                    last = launch()
+        finally:
+            for fut in pending:
+                fut.cancel()
+        raise errors.get(main) or next(iter(errors.values()))
+
+    async def _request(self, iface: Interface, method: str, params: list, timeout,
+                       validate: Optional[Callable[[Interface, Any], None]]):
+        stats = self.get_stats(iface.server)
+        t0 = time.monotonic()
+        try:
+            result = await iface.session.send_request(method, params, timeout=timeout)
+            if validate is not None:
+                validate(iface, result)
+        except asyncio.CancelledError:
+            # hedged: the server was at least this slow
+            stats.add_latency(time.monotonic() - t0)
+            raise
+        except aiorpcx.jsonrpc.CodeMessageError:
+            stats.add_latency(time.monotonic() - t0)
+            raise
+        except (RequestTimedOut, RequestCorrupted) as e:
+            if iface is not self.network.interface:
+                self.logger.info(f'{method} failed on {iface.server}: {e!r}')
+                stats.penalized_until = time.monotonic() + FAILURE_PENALTY
+            raise
+        stats.add_latency(time.monotonic() - t0)
+        return result
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# Benchmark for BIP70 certificate chain verification.
+# Generates a local CA hierarchy with openssl (root -> intermediate ->
+# merchant), adds the root to the certifi bundle, and measures loading
+# the trusted CA store with and without the index, then verifying the
+# merchant chain for the first time and for repeated requests.
+# run using
+# python3 -m electrum.scripts.bench_bip70 [num_requests]
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import certifi
+
+from electrum import paymentrequest, pem, x509
+
+
+num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+EXTENSIONS = """\
+[ca]
+basicConstraints=critical,CA:TRUE
+subjectKeyIdentifier=hash
+authorityKeyIdentifier=keyid
+[leaf]
+basicConstraints=CA:FALSE
+subjectKeyIdentifier=hash
+authorityKeyIdentifier=keyid
+"""
+
+
+def openssl(*args, cwd):
+    subprocess.run(('openssl',) + args, cwd=cwd, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def make_ca_hierarchy(d):
+    with open(os.path.join(d, 'ext.cnf'), 'w') as f:
+        f.write(EXTENSIONS)
+    openssl('req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', 'root.key', '-out', 'root.pem',
+            '-days', '3650', '-subj', '/CN=Bench Root CA', '-sha256',
+            '-addext', 'basicConstraints=critical,CA:TRUE', '-addext', 'subjectKeyIdentifier=hash', cwd=d)
+    for name, issuer, ext in (('int', 'root', 'ca'), ('leaf', 'int', 'leaf')):
+        openssl('req', '-newkey', 'rsa:2048', '-nodes', '-keyout', f'{name}.key', '-out', f'{name}.csr',
+                '-subj', f'/CN=bench {name}', cwd=d)
+        openssl('x509', '-req', '-in', f'{name}.csr', '-CA', f'{issuer}.pem', '-CAkey', f'{issuer}.key',
+                '-CAcreateserial', '-out', f'{name}.pem', '-days', '3650', '-sha256',
+                '-extfile', 'ext.cnf', '-extensions', ext, cwd=d)
+
+    def read(name):
+        with open(os.path.join(d, f'{name}.pem')) as f:
+            return f.read()
+    return read('root'), read('int'), read('leaf')
+
+
+def main():
+    d = tempfile.mkdtemp()
+    try:
+        root, intermediate, leaf = make_ca_hierarchy(d)
+        ca_path = os.path.join(d, 'cacert.pem')
+        with open(certifi.where()) as f:
+            bundle = f.read()
+        with open(ca_path, 'w') as f:
+            f.write(bundle + root)
+        index_path = os.path.join(d, 'certs_index')
+        chain = [bytes(pem.dePem(leaf, 'CERTIFICATE')), bytes(pem.dePem(intermediate, 'CERTIFICATE'))]
+
+        t0 = time.perf_counter()
+        ca_list, ca_keyID = x509.load_certificates(ca_path)
+        t1 = time.perf_counter()
+        print(f"parse bundle ({len(ca_list)} certificates): {1000 * (t1 - t0):.1f} ms")
+        t0 = time.perf_counter()
+        x509.load_ca_store(ca_path, index_path)
+        t1 = time.perf_counter()
+        print(f"build and save index: {1000 * (t1 - t0):.1f} ms")
+        t0 = time.perf_counter()
+        x509.load_ca_store(ca_path, index_path)
+        t1 = time.perf_counter()
+        print(f"load from index: {1000 * (t1 - t0):.1f} ms")
+
+        paymentrequest.ca_path = ca_path
+        paymentrequest.ca_index_path = index_path
+        t0 = time.perf_counter()
+        x, ca = paymentrequest.verify_cert_chain(chain)
+        t1 = time.perf_counter()
+        print(f"first request, with index: {1000 * (t1 - t0):.1f} ms")
+        t0 = time.perf_counter()
+        for _ in range(num_requests):
+            paymentrequest._verify_cert_chain(chain)
+        t1 = time.perf_counter()
+        print(f"signature checks only: {1000 * (t1 - t0) / num_requests:.3f} ms/request")
+        t0 = time.perf_counter()
+        for _ in range(num_requests):
+            paymentrequest.verify_cert_chain(chain)
+        t1 = time.perf_counter()
+        print(f"repeated requests: {1000 * (t1 - t0) / num_requests:.3f} ms/request")
+    finally:
+        shutil.rmtree(d)
+
+
+main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# Benchmark for BOLT11 invoice decoding.
+# run using
+# python3 -m electrum.scripts.bench_bolt11 [num_invoices]
+import os
+import sys
+import time
+from decimal import Decimal
+
+from electrum.lnaddr import LnAddr, lnencode, lndecode, _lndecode_cached
+
+
+num_invoices = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+privkey = os.urandom(32)
+
+invoices = []
+for i in range(num_invoices):
+    lnaddr = LnAddr(os.urandom(32), amount=Decimal(i + 1) / 10**8,
+                    tags=[('d', 'invoice #{}'.format(i)), ('x', 3600), ('c', 144)])
+    invoices.append(lnencode(lnaddr, privkey))
+
+_lndecode_cached.cache_clear()
+t0 = time.monotonic()
+for invoice in invoices:
+    lndecode(invoice)
+t1 = time.monotonic()
+print(f"decoded {num_invoices} invoices in {t1 - t0:.3f} s")
+
+# decode the most recent ones again, as an invoice list would
+recent = invoices[-_lndecode_cached.cache_info().maxsize:]
+t0 = time.monotonic()
+for invoice in recent:
+    lndecode(invoice)
+t1 = time.monotonic()
+print(f"decoded {len(recent)} cached invoices in {t1 - t0:.3f} s")
+print(_lndecode_cached.cache_info())
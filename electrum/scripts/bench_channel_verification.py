@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# Benchmark for the verification of channel announcements.
+# A fake server answers the requests of the LNChannelVerifier for
+# announcements spread over blocks of fake transactions. The server
+# handles a limited number of requests at once, like a real one that
+# throttles its clients. Reports the total verification time and the
+# peak number of tasks, once with one task spawned per announcement,
+# once through the bounded pipeline, and once more after a restart,
+# with the funding outputs verified in the first session.
+# run using
+# python3 -m electrum.scripts.bench_channel_verification [num_channels] [channels_per_block]
+import asyncio
+import os
+import sys
+import time
+
+from electrum import bitcoin, ecc
+from electrum.bitcoin import hash_encode
+from electrum.crypto import sha256d
+from electrum.lnutil import ShortChannelID, funding_output_script_from_keys
+from electrum.lnverifier import LNChannelVerifier, VerifiedMerkleNodes
+from electrum.transaction import Transaction
+
+
+num_channels = int(sys.argv[1]) if len(sys.argv) > 1 else 80000
+channels_per_block = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+TXS_PER_BLOCK = 2000
+FIRST_BLOCK = 600000
+SERVER_CONCURRENCY = 20
+LATENCY = 0.001
+
+
+class FakeBlock:
+
+    def __init__(self, funding_txs):
+        self.funding_txs = funding_txs
+        self.tx_hashes = [Transaction(raw_tx).txid() for raw_tx in funding_txs]
+        self.tx_hashes += [hash_encode(os.urandom(32)) for i in range(TXS_PER_BLOCK - len(funding_txs))]
+        level = [bytes.fromhex(tx_hash)[::-1] for tx_hash in self.tx_hashes]
+        self.levels = []
+        while len(level) > 1:
+            if len(level) % 2:
+                level.append(level[-1])
+            self.levels.append(level)
+            level = [sha256d(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+        self.header = {'merkle_root': hash_encode(level[0])}
+
+    def merkle_branch(self, pos):
+        branch = []
+        for level in self.levels:
+            branch.append(hash_encode(level[pos ^ 1]))
+            pos >>= 1
+        return branch
+
+
+class FakeBlockchain:
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+    def height(self):
+        return FIRST_BLOCK + len(self.blocks)
+
+    def read_header(self, height):
+        block = self.blocks.get(height)
+        return block.header if block else {'merkle_root': None}
+
+    def get_hash(self, height):
+        return '00' * 32
+
+
+class FakeNetwork:
+
+    def __init__(self, blocks):
+        self.asyncio_loop = asyncio.get_event_loop()
+        self.interface = None
+        self.bhi_lock = asyncio.Lock()
+        self.blocks = blocks
+        self.txs = {tx_hash: raw_tx for block in blocks.values()
+                    for tx_hash, raw_tx in zip(block.tx_hashes, block.funding_txs)}
+        self._blockchain = FakeBlockchain(blocks)
+        self.server = asyncio.Semaphore(SERVER_CONCURRENCY)
+        self.num_requests = 0
+        self.peak_tasks = 0
+
+    def register_callback(self, callback, events):
+        pass
+
+    def unregister_callback(self, callback):
+        pass
+
+    def blockchain(self):
+        return self._blockchain
+
+    async def request(self):
+        self.num_requests += 1
+        async with self.server:
+            await asyncio.sleep(LATENCY)
+
+    async def get_txid_from_txpos(self, block_height, txpos, merkle):
+        await self.request()
+        block = self.blocks[block_height]
+        return {'tx_hash': block.tx_hashes[txpos], 'merkle': block.merkle_branch(txpos)}
+
+    async def get_transaction(self, tx_hash):
+        await self.request()
+        return self.txs[tx_hash]
+
+
+class FakeChannelDB:
+
+    def __init__(self):
+        self.num_channels = 0
+        self.funding_outputs = {}
+
+    def get_funding_output(self, short_channel_id):
+        return self.funding_outputs.get(short_channel_id)
+
+    def add_funding_output(self, short_channel_id, funding_output):
+        self.funding_outputs[short_channel_id] = funding_output
+
+    def add_verified_channel_info(self, msg, *, capacity_sat=None):
+        self.num_channels += 1
+
+
+class OneTaskPerChannel(LNChannelVerifier):
+    """How announcements used to be verified."""
+
+    async def _verify_some_channels(self):
+        with self.lock:
+            unverified_channel_info = list(self.unverified_channel_info)
+        for short_channel_id in unverified_channel_info:
+            if short_channel_id in self.started_verifying_channel:
+                continue
+            self.started_verifying_channel.add(short_channel_id)
+            await self.group.spawn(self.verify_channel(short_channel_id.block_height, short_channel_id))
+
+    async def _get_verified_merkle_nodes(self, block_height):
+        # every branch was hashed up to the root
+        async with self.network.bhi_lock:
+            header = self.network.blockchain().read_header(block_height)
+        return VerifiedMerkleNodes(block_height, header)
+
+
+def make_blocks():
+    keys = sorted(ecc.ECPrivkey.from_secret_scalar(k).get_public_key_bytes() for k in (1, 2))
+    redeem_script = funding_output_script_from_keys(keys[0], keys[1])
+    script = bitcoin.address_to_script(bitcoin.redeem_script_to_address('p2wsh', redeem_script))
+    blocks = {}
+    announcements = []
+    for i in range(num_channels):
+        height = FIRST_BLOCK + i // channels_per_block
+        txpos = i % channels_per_block
+        raw_tx = ('02000000' + '01' + '%064x' % (i + 1) + '00000000' + '00' + 'ffffffff'
+                  + '01' + (100000).to_bytes(8, 'little').hex() + '%02x' % (len(script) // 2) + script
+                  + '00000000')
+        blocks.setdefault(height, []).append(raw_tx)
+        announcements.append({'short_channel_id': ShortChannelID.from_components(height, txpos, 0),
+                              'bitcoin_key_1': keys[0], 'bitcoin_key_2': keys[1]})
+    return {height: FakeBlock(txs) for height, txs in blocks.items()}, announcements
+
+
+async def verify(name, verifier_class, blocks, announcements, channel_db):
+    network = FakeNetwork(blocks)
+    verifier = verifier_class(network, channel_db)
+    channel_db.num_channels = 0
+    t0 = time.perf_counter()
+    for msg in announcements:
+        verifier.add_new_channel_info(msg['short_channel_id'], msg)
+    task = asyncio.ensure_future(verifier.main())
+    while verifier.unverified_channel_info:
+        network.peak_tasks = max(network.peak_tasks, len(asyncio.all_tasks()))
+        await asyncio.sleep(0.01)
+    total = time.perf_counter() - t0
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await verifier.group.cancel_remaining()
+    assert channel_db.num_channels == len(announcements)
+    print(f"{name}: {total:.2f} s, {network.num_requests} requests, peak {network.peak_tasks} tasks")
+
+
+def main():
+    blocks, announcements = make_blocks()
+    print(f"{num_channels} announcements in {len(blocks)} blocks, "
+          f"server handles {SERVER_CONCURRENCY} requests at once")
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(verify("one task per channel", OneTaskPerChannel, blocks, announcements, FakeChannelDB()))
+    channel_db = FakeChannelDB()
+    loop.run_until_complete(verify("pipeline            ", LNChannelVerifier, blocks, announcements, channel_db))
+    loop.run_until_complete(verify("pipeline, restarted ", LNChannelVerifier, blocks, announcements, channel_db))
+
+
+main()
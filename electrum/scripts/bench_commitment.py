@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# Benchmark for the processing of commitment_signed in a channel with
+# many pending HTLCs. Opens a test channel with the given number of
+# HTLCs committed in each direction, save one. Then adds the last one,
+# and times one side signing the next commitment with all of its HTLC
+# signatures, the other side checking them and revoking its previous
+# commitment, and the commitment being looked up again. Compares building every commitment transaction from
+# scratch, with the commitment cache of the channel.
+# run using
+# python3 -m electrum.scripts.bench_commitment [num_htlcs]
+import os
+import sys
+import time
+
+from electrum import lnchannel
+from electrum.crypto import sha256
+from electrum.lnutil import LOCAL, REMOTE, UpdateAddHtlc
+from electrum.tests.test_lnchannel import create_test_channels, force_state_transition
+
+
+num_htlcs = int(sys.argv[1]) if len(sys.argv) > 1 else 483
+NUM_LOOKUPS = 10
+
+
+def add_htlcs(sender, receiver, num):
+    for i in range(num):
+        htlc = UpdateAddHtlc(amount_msat=20_000_000 + i, payment_hash=sha256(os.urandom(32)),
+                             cltv_expiry=500 + i, timestamp=0)
+        receiver.receive_htlc(sender.add_htlc(htlc))
+
+
+def run():
+    alice, bob = create_test_channels()
+    for chan in (alice, bob):
+        for subject in (LOCAL, REMOTE):
+            chan.config[subject].max_accepted_htlcs = 2 * num_htlcs
+    add_htlcs(alice, bob, num_htlcs - 1)
+    add_htlcs(bob, alice, num_htlcs)
+    force_state_transition(alice, bob)
+    add_htlcs(alice, bob, 1)
+    t0 = time.perf_counter()
+    sig, htlc_sigs = alice.sign_next_commitment()
+    t1 = time.perf_counter()
+    bob.receive_new_commitment(sig, htlc_sigs)
+    bob.revoke_current_commitment()
+    t2 = time.perf_counter()
+    for i in range(NUM_LOOKUPS):
+        bob.get_latest_commitment(LOCAL)
+        bob.get_oldest_unrevoked_commitment(LOCAL)
+    t3 = time.perf_counter()
+    print(f"  sign: {1000 * (t1 - t0):.0f} ms for {len(htlc_sigs)} htlc signatures, "
+          f"verify and revoke: {1000 * (t2 - t1):.0f} ms, "
+          f"lookup: {1000 * (t3 - t2) / (2 * NUM_LOOKUPS):.1f} ms per commitment")
+
+
+print(f"{num_htlcs} htlcs in each direction")
+cache_size = lnchannel.COMMITMENT_CACHE_SIZE
+lnchannel.COMMITMENT_CACHE_SIZE = 0
+print("without cache:")
+run()
+lnchannel.COMMITMENT_CACHE_SIZE = cache_size
+print("with cache:")
+run()
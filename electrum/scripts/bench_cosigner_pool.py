@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# Benchmark for the cosigner pool listener, against the local stand-in
+# server. A cosigner puts encrypted transactions for our keyhashes, one
+# at a time, as do_send does, at random moments. Each is cleared once
+# received, as on_receive does. Reports the median time from the put
+# to the message being passed on, and the requests made while idle.
+# Compares polling a server that only knows get, as was done before,
+# with long-polling one that knows get_many. The intervals are divided
+# by the given scale, so that the polling run does not take hours.
+# run using
+# python3 -m electrum.scripts.bench_cosigner_pool [num_messages] [scale]
+import asyncio
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+from electrum import ecc
+from electrum.plugins.cosigner_pool.cosigner_pool import CosignerPoolClient, Listener
+from electrum.util import create_and_start_event_loop
+from electrum.tests.cosigner_pool_server import CosignerPoolServer
+
+
+num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+scale = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+KEYHASHES = ['keyhash1', 'keyhash2']
+IDLE_TIME = 120 / scale
+
+loop, stop_loop, loop_thread = create_and_start_event_loop()
+
+
+def run_coro(coro):
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def run(long_poll: bool):
+    server = CosignerPoolServer(long_poll=long_poll)
+    url = run_coro(server.start())
+    received = {}  # keyhash -> threading.Event
+    def on_message(keyhash, message):
+        received[keyhash].set()
+    client = CosignerPoolClient(url)
+    client.LONG_POLL_TIMEOUT /= scale
+    listener = Listener(client, on_message)
+    listener.POLL_INTERVAL /= scale
+    listener.set_keyhashes(KEYHASHES)
+    listener.start(loop)
+    sender = CosignerPoolClient(url)
+    pubkey = ecc.ECPrivkey.generate_random_key()
+    # idle
+    time.sleep(1)
+    num_requests = server.num_requests
+    time.sleep(IDLE_TIME)
+    idle_rate = (server.num_requests - num_requests) / IDLE_TIME * 60 / scale
+    # messages
+    latencies = []
+    for i in range(num_messages):
+        time.sleep(random.random() * listener.POLL_INTERVAL)
+        keyhash = random.choice(KEYHASHES)
+        received[keyhash] = threading.Event()
+        message = pubkey.encrypt_message(os.urandom(500)).decode('ascii')
+        t0 = time.perf_counter()
+        run_coro(sender.put(keyhash, message))
+        received[keyhash].wait()
+        latencies.append(time.perf_counter() - t0)
+        run_coro(listener.clear_keyhash(keyhash))
+    listener.stop()
+    run_coro(sender.close())
+    run_coro(server.stop())
+    print(f"  median latency: {1000 * statistics.median(latencies):.0f} ms, "
+          f"max: {1000 * max(latencies):.0f} ms")
+    print(f"  idle: {idle_rate:.2f} requests per minute, at the unscaled intervals")
+
+
+def main():
+    random.seed(1)
+    print(f"{len(KEYHASHES)} keyhashes, {num_messages} messages, intervals divided by {scale:g}")
+    print(f"polling every {Listener.POLL_INTERVAL / scale:g} s:")
+    run(long_poll=False)
+    print(f"long-polling for {CosignerPoolClient.LONG_POLL_TIMEOUT / scale:g} s:")
+    run(long_poll=True)
+    loop.call_soon_threadsafe(stop_loop.set_result, 1)
+    loop_thread.join(timeout=1)
+
+
+main()
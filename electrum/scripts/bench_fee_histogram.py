@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# Benchmark for mempool fee histogram queries.
+# Compares the linear scans SimpleConfig used to do on every call with
+# the cumulative FeeHistogram, on a synthetic histogram, and checks that
+# both give the same results.
+# run using
+# python3 -m electrum.scripts.bench_fee_histogram [num_buckets]
+import random
+import sys
+import time
+
+from electrum.simple_config import FeeHistogram
+
+
+num_buckets = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+NUM_QUERIES = 2000
+
+
+def linear_fee_to_depth(histogram, target_fee):
+    depth = 0
+    for fee, s in histogram:
+        depth += s
+        if fee <= target_fee:
+            break
+    return depth
+
+
+def linear_depth_to_fee(histogram, target):
+    depth = 0
+    for fee, s in histogram:
+        depth += s
+        if depth > target:
+            return fee
+    return None
+
+
+def bench(name, f, queries):
+    t = time.perf_counter()
+    results = [f(q) for q in queries]
+    dt = time.perf_counter() - t
+    print(f"{name:40s} {1e6 * dt / len(queries):10.2f} us/query")
+    return results
+
+
+rng = random.Random(1)
+fees = sorted(rng.uniform(1, 5000) for i in range(num_buckets))[::-1]
+histogram = [[round(fee, 2), rng.randint(1000, 100000)] for fee in fees]
+total = sum(s for fee, s in histogram)
+fee_queries = [rng.uniform(0, 5500) for i in range(NUM_QUERIES)]
+depth_queries = [rng.randint(0, total + 100000) for i in range(NUM_QUERIES)]
+
+t = time.perf_counter()
+hist = FeeHistogram(histogram)
+print(f"{num_buckets} buckets, built in {1000 * (time.perf_counter() - t):.2f} ms")
+
+a = bench("fee_to_depth, linear", lambda q: linear_fee_to_depth(histogram, q), fee_queries)
+b = bench("fee_to_depth, cumulative", hist.fee_to_depth, fee_queries)
+assert a == b
+a = bench("depth_to_fee, linear", lambda q: linear_depth_to_fee(histogram, q), depth_queries)
+b = bench("depth_to_fee, cumulative", hist.depth_to_fee, depth_queries)
+assert a == b
+t = time.perf_counter()
+c = hist.depths_to_fees(depth_queries)
+print(f"{'depths_to_fees, batch':40s} {1e6 * (time.perf_counter() - t) / NUM_QUERIES:10.2f} us/query")
+assert c == b
+print("results are identical")
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# Benchmark for the removal of closed channels from the channel DB.
+# Builds a random graph of public channels, and a fake server on which
+# a share of their funding outputs is spent. Pays between random nodes,
+# blacklisting a closed channel every time a route goes through one,
+# once with the full graph, and once after the FundingOutputWatcher
+# has gone through the funding outputs. Reports the size of the graph,
+# the failed attempts and the time spent finding paths.
+# run using
+# python3 -m electrum.scripts.bench_graph_pruning [num_nodes] [num_channels] [closed_share]
+import asyncio
+import random
+import sys
+import tempfile
+import time
+
+from electrum import bitcoin, lnrouter
+from electrum.constants import BitcoinMainnet
+from electrum.lnutil import ShortChannelID, FundingOutput
+from electrum.simple_config import SimpleConfig
+from electrum.synchronizer import history_status
+from electrum.transaction import Transaction
+from electrum.util import SilentTaskGroup
+
+
+num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+num_channels = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+closed_share = float(sys.argv[3]) if len(sys.argv) > 3 else 0.3
+NUM_PAYMENTS = 200
+MAX_ATTEMPTS = 10
+
+
+class FakeSession:
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    async def subscribe(self, method, params, queue):
+        await queue.put([params[0], self.statuses[params[0]]])
+
+    def unsubscribe(self, queue):
+        pass
+
+
+class FakeInterface:
+
+    def __init__(self, session):
+        self.group = SilentTaskGroup()
+        self.session = session
+
+
+class FakeBlockchain:
+
+    def height(self):
+        return 0
+
+    def get_hash(self, height):
+        return '00' * 32
+
+
+class FakeNetwork:
+
+    def __init__(self, config):
+        self.asyncio_loop = asyncio.get_event_loop()
+        self.config = config
+        self.interface = None
+        self.histories = {}
+        self.txs = {}
+        self.statuses = {}
+        self.num_requests = 0
+
+    def register_callback(self, callback, events):
+        pass
+
+    def unregister_callback(self, callback):
+        pass
+
+    def trigger_callback(self, *args):
+        pass
+
+    def blockchain(self):
+        return FakeBlockchain()
+
+    async def get_history_for_scripthash(self, sh, *, status=None):
+        self.num_requests += 1
+        return self.histories[sh]
+
+    async def get_transaction(self, txid):
+        self.num_requests += 1
+        return self.txs[txid]
+
+
+def spending_tx(txid, output_index):
+    return ('02000000' + '01' + bytes.fromhex(txid)[::-1].hex() + output_index.to_bytes(4, 'little').hex()
+            + '00' + 'ffffffff' + '01' + (9_000_000).to_bytes(8, 'little').hex() + '0100' + '00000000')
+
+
+def node_id(i):
+    return b'\x02' + i.to_bytes(32, 'big')
+
+
+def build_graph(cdb, network):
+    o = lambda i: i.to_bytes(8, "big")
+    closed = set()
+    for i in range(num_channels):
+        n1, n2 = sorted(random.sample(range(num_nodes), 2))
+        scid = ShortChannelID.from_components(500000 + i, 1, 0)
+        cdb.add_channel_announcement({
+            'node_id_1': node_id(n1), 'node_id_2': node_id(n2),
+            'bitcoin_key_1': node_id(n1), 'bitcoin_key_2': node_id(n2),
+            'short_channel_id': scid, 'chain_hash': BitcoinMainnet.rev_genesis_bytes(),
+            'len': b'\x00\x00', 'features': b''})
+        for flags in (b'\x00', b'\x01'):
+            cdb.add_channel_update({
+                'short_channel_id': scid, 'message_flags': b'\x00', 'channel_flags': flags,
+                'cltv_expiry_delta': o(random.randint(10, 100)), 'htlc_minimum_msat': o(1),
+                'fee_base_msat': o(random.randint(0, 2000)), 'fee_proportional_millionths': o(random.randint(1, 1000)),
+                'chain_hash': BitcoinMainnet.rev_genesis_bytes(), 'timestamp': b'\x00\x00\x00\x00'})
+        funding_output = FundingOutput('%064x' % i, bitcoin.p2wsh_nested_script('%064x' % i), 10_000_000)
+        sh = bitcoin.script_to_scripthash(funding_output.script)
+        history = [(funding_output.txid, scid.block_height)]
+        if random.random() < closed_share:
+            closed.add(scid)
+            raw_tx = spending_tx(funding_output.txid, scid.output_index)
+            txid = Transaction(raw_tx).txid()
+            network.txs[txid] = raw_tx
+            history.append((txid, 600000))
+        network.histories[sh] = [{'tx_hash': txid, 'height': height} for txid, height in history]
+        network.statuses[sh] = history_status(history)
+        cdb.add_funding_output(scid, funding_output)
+    return closed
+
+
+def pay(cdb, closed, payments):
+    path_finder = lnrouter.LNPathFinder(cdb)
+    failed = 0
+    paid = 0
+    t0 = time.perf_counter()
+    for a, b in payments:
+        for attempt in range(MAX_ATTEMPTS):
+            path = path_finder.find_path_for_payment(node_id(a), node_id(b), 100_000)
+            if path is None:
+                break
+            dead = [scid for n, scid in path if scid in closed]
+            if not dead:
+                paid += 1
+                break
+            failed += 1
+            path_finder.add_to_blacklist(dead[0])
+    elapsed = time.perf_counter() - t0
+    print(f"  graph: {cdb.num_channels} channels, {cdb.num_policies} policies")
+    print(f"  {paid}/{len(payments)} paid, {failed} failed attempts, "
+          f"{1000 * elapsed / len(payments):.1f} ms finding paths per payment")
+
+
+async def main():
+    random.seed(1)
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp()})
+    network = FakeNetwork(config)
+    cdb = lnrouter.ChannelDB(network)
+    await cdb.load_data()
+    closed = build_graph(cdb, network)
+    payments = [random.sample(range(num_nodes), 2) for i in range(NUM_PAYMENTS)]
+    print(f"{num_nodes} nodes, {num_channels} channels, {len(closed)} closed on-chain")
+    print("without spend tracking:")
+    pay(cdb, closed, payments)
+    t0 = time.perf_counter()
+    network.interface = FakeInterface(FakeSession(network.statuses))
+    await cdb.funding_watcher._restart()
+    while cdb.num_channels > num_channels - len(closed):
+        await asyncio.sleep(0.05)
+    print(f"watcher: {len(closed)} closed channels removed in {time.perf_counter() - t0:.1f} s, "
+          f"{network.num_requests} requests for {num_channels} funding outputs")
+    print("with spend tracking:")
+    pay(cdb, closed, payments)
+    await cdb.funding_watcher.stop()
+    await cdb.ca_verifier.stop()
+
+
+asyncio.get_event_loop().run_until_complete(main())
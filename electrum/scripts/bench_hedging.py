@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# Benchmark for spreading and hedging read requests across servers.
+# Simulates the transaction requests of a wallet restore against fake
+# servers with random latencies and occasional stalls, once with all
+# requests sent to the main server, and once through the RequestRouter.
+# run using
+# python3 -m electrum.scripts.bench_hedging [num_txs] [num_servers]
+import asyncio
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from electrum.interface import RequestCorrupted
+from electrum.request_router import RequestRouter
+from electrum.simple_config import SimpleConfig
+
+
+num_txs = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+num_servers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+CONCURRENCY = 50           # like the synchronizer, many requests in flight
+STALL_PROBABILITY = 0.02
+STALL_SECONDS = 1.5
+
+
+class FakeSession:
+
+    def __init__(self, server):
+        self.server = server
+
+    async def send_request(self, method, params, timeout=None):
+        server = self.server
+        # latency grows with the load of the server
+        server.in_flight += 1
+        try:
+            delay = random.lognormvariate(0, 0.3) * server.base_latency * (1 + server.in_flight / 20)
+            if random.random() < STALL_PROBABILITY:
+                delay += STALL_SECONDS
+            await asyncio.sleep(delay)
+        finally:
+            server.in_flight -= 1
+        return params[0]
+
+
+class FakeInterface:
+
+    def __init__(self, name, base_latency):
+        self.server = name
+        self.base_latency = base_latency
+        self.in_flight = 0
+        self.blockchain = 'main'
+        self.tip = 100
+        loop = asyncio.get_event_loop()
+        self.ready = loop.create_future()
+        self.ready.set_result(1)
+        self.got_disconnected = loop.create_future()
+        self.session = FakeSession(self)
+
+
+class FakeNetwork:
+
+    def __init__(self, config, interfaces):
+        self.config = config
+        self.interfaces_lock = threading.Lock()
+        self.interfaces = {iface.server: iface for iface in interfaces}
+        self.interface = interfaces[0]
+
+
+def validate(iface, result):
+    pass  # the txid check, in the real thing
+
+
+async def restore(router):
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def get_transaction(i):
+        async with semaphore:
+            t0 = time.perf_counter()
+            txid = '%064x' % i
+            if await router.send_request('blockchain.transaction.get', [txid], validate=validate) != txid:
+                raise RequestCorrupted()
+            latencies.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    await asyncio.gather(*[get_transaction(i) for i in range(num_txs)])
+    total = time.perf_counter() - t0
+    latencies.sort()
+    print(f"  p50 {1000 * latencies[len(latencies) // 2]:.1f} ms, "
+          f"p99 {1000 * latencies[int(len(latencies) * 0.99)]:.1f} ms, "
+          f"max {1000 * latencies[-1]:.1f} ms, total {total:.2f} s")
+
+
+def main():
+    random.seed(1)
+    loop = asyncio.get_event_loop()
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp()})
+    # the main server is not the fastest one
+    interfaces = [FakeInterface(f'server{i}', 0.05 if i == 0 else random.uniform(0.01, 0.1))
+                  for i in range(num_servers)]
+    print(f"{num_txs} transactions, {num_servers} servers, {CONCURRENCY} requests in flight")
+    for enabled in (False, True):
+        config.set_key('spread_requests', enabled)
+        router = RequestRouter(FakeNetwork(config, interfaces))
+        print("spread and hedged:" if enabled else "main server only:")
+        loop.run_until_complete(restore(router))
+
+
+main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Benchmark for the lightning payment ledger.
+# Builds a synthetic node with many settled HTLCs spread over many
+# channels, then compares rebuilding the history from the channels,
+# which is what every call used to do, with listing a page of the
+# incrementally updated ledger after a new payment.
+# run using
+# python3 -m electrum.scripts.bench_lnledger [num_htlcs] [num_channels]
+import os
+import sys
+import threading
+import time
+
+from electrum.lnchannel import Channel
+from electrum.lnledger import PaymentLedger
+from electrum.lnutil import LOCAL, REMOTE, UpdateAddHtlc, UnknownPaymentHash
+from electrum.lnworker import LNWallet
+
+
+num_htlcs = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+num_channels = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+PAGE = 50
+
+
+class FakeHTLCManager:
+
+    def __init__(self):
+        self.log = {LOCAL: {'adds': {}, 'settles': {}, 'fails': {}},
+                    REMOTE: {'adds': {}, 'settles': {}, 'fails': {}}}
+
+
+class FakeChannel:
+
+    def __init__(self, lnworker, channel_id):
+        self.lnworker = lnworker
+        self.channel_id = channel_id
+        self.hm = FakeHTLCManager()
+
+    get_htlc_status = Channel.get_htlc_status
+    _htlc_updated = Channel._htlc_updated
+
+    def add_settled(self, subject, payment_hash, amount_msat, timestamp):
+        log = self.hm.log[subject]
+        htlc_id = len(log['adds'])
+        log['adds'][htlc_id] = UpdateAddHtlc(amount_msat, payment_hash, 500, htlc_id, timestamp)
+        self._htlc_updated(subject, htlc_id)
+        log['settles'][htlc_id] = {}
+        self._htlc_updated(subject, htlc_id)
+
+
+class FakeWallet:
+
+    def get_label(self, key):
+        return ''
+
+
+class FakeLNWallet:
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.channels = {}
+        self.channel_timestamps = {}
+        self.wallet = FakeWallet()
+        self.ledger = PaymentLedger(self)
+
+    def get_payment_info(self, payment_hash):
+        raise UnknownPaymentHash(payment_hash)
+
+    htlc_updated = LNWallet.htlc_updated
+
+
+lnworker = FakeLNWallet()
+channels = []
+for i in range(num_channels):
+    chan_id = i.to_bytes(32, 'big')
+    channels.append(lnworker.channels.setdefault(chan_id, FakeChannel(lnworker, chan_id)))
+t0 = int(time.time()) - num_htlcs
+for i in range(num_htlcs):
+    subject = LOCAL if i % 3 else REMOTE
+    channels[i % num_channels].add_settled(subject, os.urandom(32), 1000 + i, t0 + i)
+print(f"{num_htlcs} settled HTLCs in {num_channels} channels")
+
+t = time.perf_counter()
+history = PaymentLedger(lnworker).get_history()
+print(f"rebuild the full history: {time.perf_counter() - t:.3f} s ({len(history)} items)")
+
+t = time.perf_counter()
+lnworker.ledger.get_history()
+print(f"initial load of the ledger: {time.perf_counter() - t:.3f} s")
+
+n = 100
+t = time.perf_counter()
+for i in range(n):
+    channels[i % num_channels].add_settled(LOCAL, os.urandom(32), 1000, t0 + num_htlcs + i)
+    total = len(lnworker.ledger)
+    page = lnworker.ledger.get_history(offset=total - PAGE, limit=PAGE)
+dt = (time.perf_counter() - t) / n
+print(f"new payment + last page of {PAGE}: {1000 * dt:.3f} ms")
+assert page[-1]['balance_msat'] == history[-1]['balance_msat'] - 1000 * n
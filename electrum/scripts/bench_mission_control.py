@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# Benchmark for the scoring of edges with the outcomes of past payments.
+# Builds a random graph of public channels, each with a hidden balance
+# in both directions, and pays random amounts between random nodes.
+# An attempt fails at the first channel that cannot forward its amount.
+# Payments move the balances of the channels they go through. Compares
+# blacklisting the failing channel, as was done before, with reporting
+# the outcome of every attempt to MissionControl. Reports the attempts
+# per successful payment, the success rate and the time spent routing.
+# run using
+# python3 -m electrum.scripts.bench_mission_control [num_nodes] [num_channels] [num_payments]
+import asyncio
+import random
+import sys
+import tempfile
+import time
+
+from electrum import lnrouter
+from electrum.constants import BitcoinMainnet
+from electrum.lnmissioncontrol import MissionControl, route_amounts_msat
+from electrum.lnutil import ShortChannelID
+from electrum.simple_config import SimpleConfig
+
+
+num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+num_channels = int(sys.argv[2]) if len(sys.argv) > 2 else 2500
+num_payments = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+MAX_ATTEMPTS = 10
+
+
+class FakeNetwork:
+
+    def __init__(self, config):
+        self.asyncio_loop = asyncio.get_event_loop()
+        self.config = config
+        self.interface = None
+
+    def register_callback(self, callback, events):
+        pass
+
+    def unregister_callback(self, callback):
+        pass
+
+    def trigger_callback(self, *args):
+        pass
+
+
+class NoMissionControl(MissionControl):
+    """How edges used to be scored: outcomes are not taken into account."""
+
+    def penalty(self, short_channel_id, start_node, amount_msat, capacity_msat=None):
+        return 0
+
+
+def node_id(i):
+    return b'\x02' + i.to_bytes(32, 'big')
+
+
+def build_graph(cdb):
+    o = lambda i: i.to_bytes(8, "big")
+    balances = {}
+    for i in range(num_channels):
+        n1, n2 = sorted(random.sample(range(num_nodes), 2))
+        scid = ShortChannelID.from_components(500000 + i, 1, 0)
+        capacity_msat = random.choice((1, 2, 5, 10)) * 1_000_000_000
+        cdb.add_verified_channel_info({
+            'node_id_1': node_id(n1), 'node_id_2': node_id(n2),
+            'bitcoin_key_1': node_id(n1), 'bitcoin_key_2': node_id(n2),
+            'short_channel_id': scid, 'chain_hash': BitcoinMainnet.rev_genesis_bytes(),
+            'len': b'\x00\x00', 'features': b''}, capacity_sat=capacity_msat // 1000)
+        for flags in (b'\x00', b'\x01'):
+            cdb.add_channel_update({
+                'short_channel_id': scid, 'message_flags': b'\x00', 'channel_flags': flags,
+                'cltv_expiry_delta': o(random.randint(10, 100)), 'htlc_minimum_msat': o(1),
+                'fee_base_msat': o(random.randint(0, 2000)), 'fee_proportional_millionths': o(random.randint(1, 1000)),
+                'chain_hash': BitcoinMainnet.rev_genesis_bytes(), 'timestamp': b'\x00\x00\x00\x00'})
+        local_msat = int(capacity_msat * random.random())
+        balances[(scid, node_id(n1))] = local_msat
+        balances[(scid, node_id(n2))] = capacity_msat - local_msat
+    return balances
+
+
+def pay(cdb, balances, payments, mission_control):
+    balances = dict(balances)
+    path_finder = lnrouter.LNPathFinder(cdb, mission_control)
+    attempts = 0
+    paid = 0
+    routing_time = 0
+    for a, b, amount_msat in payments:
+        for attempt in range(MAX_ATTEMPTS):
+            t0 = time.perf_counter()
+            path = path_finder.find_path_for_payment(node_id(a), node_id(b), amount_msat)
+            routing_time += time.perf_counter() - t0
+            if path is None:
+                break
+            attempts += 1
+            route = path_finder.create_route_from_path(path, node_id(a))
+            amounts = route_amounts_msat(route, amount_msat)
+            start_nodes = [node_id(a)] + [route_edge.node_id for route_edge in route[:-1]]
+            # the payer knows the balance of its own channels
+            failed_at = next((i for i in range(1, len(route))
+                              if balances[(route[i].short_channel_id, start_nodes[i])] < amounts[i]), None)
+            if failed_at is None:
+                paid += 1
+                for route_edge, start_node, amount in zip(route, start_nodes, amounts):
+                    balances[(route_edge.short_channel_id, start_node)] -= amount
+                    balances[(route_edge.short_channel_id, route_edge.node_id)] += amount
+                mission_control.report_attempt(node_id(a), route, amount_msat, forwarded=len(route), failed=False)
+                break
+            if isinstance(mission_control, NoMissionControl):
+                path_finder.add_to_blacklist(route[failed_at].short_channel_id)
+            else:
+                mission_control.report_attempt(node_id(a), route, amount_msat, forwarded=failed_at, failed=True)
+    print(f"  {paid}/{len(payments)} paid, {attempts / max(paid, 1):.2f} attempts per successful payment, "
+          f"{1000 * routing_time / len(payments):.1f} ms routing per payment")
+
+
+async def main():
+    random.seed(1)
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp()})
+    cdb = lnrouter.ChannelDB(FakeNetwork(config))
+    await cdb.load_data()
+    balances = build_graph(cdb)
+    payments = [random.sample(range(num_nodes), 2) + [random.randint(10_000, 2_000_000) * 1000]
+                for i in range(num_payments)]
+    print(f"{num_nodes} nodes, {num_channels} channels, {num_payments} payments")
+    print("blacklist:")
+    pay(cdb, balances, payments, NoMissionControl())
+    print("mission control:")
+    pay(cdb, balances, payments, MissionControl())
+    await cdb.funding_watcher.stop()
+    await cdb.ca_verifier.stop()
+
+
+asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Load test for the address Notifier.
+# Watches many addresses against a fake ElectrumX session, with a local
+# aiohttp sink as webhook endpoint. Then changes the status of every
+# address, twice in a row, and measures the webhook throughput and the
+# number of running tasks.
+# run using
+# python3 -m electrum.scripts.bench_notifier [num_addresses]
+import asyncio
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+from electrum import bitcoin
+from electrum.simple_config import SimpleConfig
+from electrum.synchronizer import Notifier
+from electrum.util import SilentTaskGroup
+
+
+num_addresses = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.subscriptions = defaultdict(list)
+
+    async def subscribe(self, method, params, queue):
+        self.subscriptions[params[0]].append(queue)
+        await queue.put([params[0], None])
+
+    def unsubscribe(self, queue):
+        pass
+
+    async def notify(self, sh, status):
+        for queue in self.subscriptions[sh]:
+            await queue.put([sh, status])
+
+
+class FakeInterface:
+
+    def __init__(self):
+        self.group = SilentTaskGroup()
+        self.session = FakeSession()
+
+
+class FakeNetwork:
+
+    def __init__(self, loop, config):
+        self.asyncio_loop = loop
+        self.config = config
+        self.interface = FakeInterface()
+        self.proxy = None
+
+    def register_callback(self, callback, events):
+        pass
+
+    def unregister_callback(self, callback):
+        pass
+
+
+class Sink:
+
+    def __init__(self):
+        self.statuses = {}
+        self.count = 0
+
+    async def handle(self, request):
+        data = await request.json()
+        self.statuses[data['address']] = data['status']
+        self.count += 1
+        return web.Response(text='ok')
+
+
+async def wait_for(condition, max_tasks):
+    while not condition():
+        max_tasks[0] = max(max_tasks[0], len(asyncio.all_tasks()))
+        await asyncio.sleep(0.05)
+
+
+async def main():
+    loop = asyncio.get_event_loop()
+    sink = Sink()
+    app = web.Application()
+    app.router.add_post('/hook', sink.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = f'http://{host}:{port}/hook'
+
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp()})
+    network = FakeNetwork(loop, config)
+    notifier = Notifier(network)
+    addresses = [bitcoin.hash160_to_p2pkh(i.to_bytes(20, 'big')) for i in range(num_addresses)]
+    max_tasks = [0]
+
+    t0 = time.monotonic()
+    for addr in addresses:
+        await notifier.start_watching_addr(addr, url)
+    await wait_for(lambda: sink.count >= num_addresses, max_tasks)
+    t1 = time.monotonic()
+    print(f"watching {num_addresses} addresses: {t1 - t0:.1f} s, "
+          f"{num_addresses / (t1 - t0):.0f} initial webhooks/s")
+
+    count = sink.count
+    t0 = time.monotonic()
+    for status in ('mempool', 'confirmed'):
+        for addr in addresses:
+            await network.interface.session.notify(bitcoin.address_to_scripthash(addr), status)
+    await wait_for(lambda: all(sink.statuses[addr] == 'confirmed' for addr in addresses), max_tasks)
+    t1 = time.monotonic()
+    sent = sink.count - count
+    print(f"{2 * num_addresses} status changes: {sent} webhooks in {t1 - t0:.1f} s, "
+          f"{sent / (t1 - t0):.0f} webhooks/s")
+    print(f"max running tasks: {max_tasks[0]}")
+    await notifier.stop()
+    await runner.cleanup()
+
+
+asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# Benchmark for paginated history listings.
+# Fills a watching-only wallet with a synthetic history, then measures
+# the time and peak memory of the full onchain_history command, and of
+# walking through the same history one page at a time.
+# run using
+# python3 -m electrum.scripts.bench_pagination [num_txs] [page_size]
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+from electrum import bitcoin, constants
+from electrum.address_synchronizer import HistoryItem
+from electrum.commands import Commands
+from electrum.simple_config import SimpleConfig
+from electrum.util import TxMinedInfo, create_and_start_event_loop
+from electrum.wallet import Abstract_Wallet, restore_wallet_from_text
+
+
+num_txs = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+
+def synthetic_history(n):
+    history = []
+    balance = 0
+    for i in range(n):
+        delta = 100000 if i % 3 else -20000
+        balance += delta
+        history.append(HistoryItem(txid='%064x' % i,
+                                   tx_mined_status=TxMinedInfo(height=1000 + i, conf=n - i,
+                                                               timestamp=1500000000 + 60 * i, txpos=0),
+                                   delta=delta, fee=None, balance=balance))
+    return history
+
+
+def measure(f):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        result = f()
+        return result, time.perf_counter() - t0, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    constants.set_mainnet()
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    electrum_path = tempfile.mkdtemp()
+    config = SimpleConfig({'electrum_path': electrum_path})
+    address = bitcoin.pubkey_to_address('p2pkh', '02' + '11' * 32)
+    with mock.patch.object(Abstract_Wallet, 'save_db'):
+        wallet = restore_wallet_from_text(address, path=os.path.join(electrum_path, 'wallet'),
+                                          config=config)['wallet']
+    history = synthetic_history(num_txs)
+    wallet.get_history = lambda *args, **kwargs: history
+    cmds = Commands(config=config)
+    print(f"{num_txs} transactions, pages of {page_size}")
+
+    result, dt, peak = measure(lambda: cmds._run('onchain_history', (), wallet=wallet))
+    print(f"full history: {dt:.2f} s, peak {peak / 2**20:.1f} MiB")
+    del result
+
+    page = cmds._run('onchain_history', (), wallet=wallet, limit=page_size)
+    times, peaks = [], []
+    while page['next_cursor'] is not None:
+        page, dt, peak = measure(lambda: cmds._run('onchain_history', (), wallet=wallet,
+                                                   limit=page_size, cursor=page['next_cursor']))
+        times.append(dt)
+        peaks.append(peak)
+    times.sort()
+    print(f"{len(times) + 1} pages: median {1000 * times[len(times) // 2]:.2f} ms, "
+          f"max {1000 * times[-1]:.2f} ms, peak {max(peaks) / 2**10:.0f} KiB per page")
+    loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+    loop_thread.join(timeout=1)
+
+
+main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# Benchmark for PayServer websocket status notifications.
+# Opens many websocket clients waiting for unpaid requests, measures the
+# CPU used while nothing happens, then pays some requests and measures
+# the time until the clients are notified.
+# run using
+# python3 -m electrum.scripts.bench_payserver [num_requests] [num_clients]
+import asyncio
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import aiohttp
+from aiohttp import web
+
+from electrum.daemon import PayServer
+from electrum.simple_config import SimpleConfig
+from electrum.util import PR_PAID, PR_UNPAID, PR_TYPE_ONCHAIN
+
+
+num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+num_clients = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+IDLE_SECONDS = 5
+
+
+class StubNetwork:
+
+    def __init__(self, loop):
+        self.asyncio_loop = loop
+        self.callbacks = defaultdict(list)
+
+    def register_callback(self, callback, events):
+        for event in events:
+            self.callbacks[event].append(callback)
+
+    def unregister_callback(self, callback):
+        for callbacks in self.callbacks.values():
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def trigger_callback(self, event, *args):
+        for callback in self.callbacks[event]:
+            self.asyncio_loop.call_soon_threadsafe(callback, event, *args)
+
+
+class StubWallet:
+
+    def __init__(self, n):
+        now = int(time.time())
+        self.requests = {f'addr{i}': {'type': PR_TYPE_ONCHAIN, 'status': PR_UNPAID,
+                                       'time': now, 'exp': 3600 + i % 600}
+                         for i in range(n)}
+
+    def get_request(self, key):
+        return self.requests.get(key)
+
+
+class StubDaemon:
+
+    def __init__(self, loop):
+        self.config = SimpleConfig({'electrum_path': tempfile.mkdtemp()})
+        self.network = StubNetwork(loop)
+        self.wallet = StubWallet(num_requests)
+
+
+async def client(session, url, key, paid_at, latencies):
+    async with session.ws_connect(url + '?' + key) as ws:
+        async for msg in ws:
+            if msg.data == 'paid':
+                latencies.append(time.perf_counter() - paid_at[key])
+            break
+
+
+async def main():
+    loop = asyncio.get_event_loop()
+    daemon = StubDaemon(loop)
+    pay_server = PayServer(daemon)
+    app = web.Application()
+    app.add_routes([web.get('/api/get_status', pay_server.get_status)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = f'http://{host}:{port}/api/get_status'
+
+    paid_at = {}
+    latencies = []
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        keys = [f'addr{i}' for i in range(num_clients)]
+        tasks = [asyncio.ensure_future(client(session, url, key, paid_at, latencies)) for key in keys]
+        while len(pay_server.get_index().waiters) < num_clients:
+            await asyncio.sleep(0.1)
+        print(f"{num_clients} clients waiting on {num_requests} requests")
+
+        t0, c0 = time.monotonic(), time.process_time()
+        await asyncio.sleep(IDLE_SECONDS)
+        t1, c1 = time.monotonic(), time.process_time()
+        print(f"idle: {c1 - c0:.3f} s CPU in {t1 - t0:.1f} s")
+
+        for key in keys:
+            paid_at[key] = time.perf_counter()
+            daemon.network.trigger_callback('payment_received', daemon.wallet, key, PR_PAID)
+        await asyncio.gather(*tasks)
+    latencies.sort()
+    print(f"payment to notification: median {1000 * latencies[len(latencies) // 2]:.2f} ms, "
+          f"max {1000 * latencies[-1]:.2f} ms ({len(latencies)} notifications)")
+    await runner.cleanup()
+
+
+asyncio.get_event_loop().run_until_complete(main())
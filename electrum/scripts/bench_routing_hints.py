@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# Benchmark for the choice of the routing hints of invoices. Opens
+# test channels with random balances, and settles a few payments in
+# each, as a merchant node would. Then creates invoices for random
+# amounts, once with a hint for every channel that can receive the
+# amount, as was done before, and once with the few channels chosen
+# from the InboundCapacityIndex, also with a channel updated between
+# two invoices. Checks that the hints come back from
+# lndecode, and reports the time per invoice and its length.
+# run using
+# python3 -m electrum.scripts.bench_routing_hints [num_channels] [num_payments]
+import asyncio
+import random
+import sys
+import threading
+import time
+from decimal import Decimal
+
+from electrum import bitcoin
+from electrum.crypto import sha256
+from electrum.lnaddr import LnAddr, lnencode, lndecode
+from electrum.lnchannel import channel_states
+from electrum.lnhints import InboundCapacityIndex
+from electrum.lnutil import REMOTE, ShortChannelID, UpdateAddHtlc
+from electrum.lnworker import LNWallet
+from electrum.logging import Logger
+from electrum.tests.test_lnchannel import create_test_channels, force_state_transition
+
+
+num_channels = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+num_payments = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+NUM_INVOICES = 200
+PRIVKEY = sha256(b'merchant')
+
+
+class FakeChannelDB:
+
+    def get_channel_info(self, short_channel_id):
+        return None
+
+
+class FakeLNWallet(Logger):
+
+    def __init__(self, channels):
+        Logger.__init__(self)
+        self.lock = threading.RLock()
+        self.channels = {chan.channel_id: chan for chan in channels}
+        self.channel_db = FakeChannelDB()
+        self.inbound_capacity = InboundCapacityIndex(self)
+
+    _calc_routing_hints_for_invoice = LNWallet._calc_routing_hints_for_invoice
+
+
+class AllChannelsLNWallet(FakeLNWallet):
+    """How hints used to be chosen: every open channel with enough balance."""
+
+    async def _calc_routing_hints_for_invoice(self, amount_sat):
+        routing_hints = []
+        with self.lock:
+            channels = list(self.channels.values())
+        for chan in channels:
+            if chan.get_state() != channel_states.OPEN:
+                continue
+            if amount_sat and chan.balance(REMOTE) // 1000 < amount_sat:
+                continue
+            self.channel_db.get_channel_info(chan.short_channel_id)
+            routing_hints.append(('r', [(chan.node_id, chan.short_channel_id, 0, 0, 1)]))
+        return routing_hints
+
+
+def open_channels():
+    channels = []
+    for i in range(num_channels):
+        capacity_msat = random.choice((2, 5, 10)) * 100_000_000_000
+        local_msat = int(capacity_msat * random.random())
+        chan, remote_chan = create_test_channels(local=local_msat, remote=capacity_msat - local_msat)
+        for j in range(num_payments):
+            preimage = sha256(bytes([i % 256, j]))
+            htlc = UpdateAddHtlc(amount_msat=1_000_000, payment_hash=sha256(preimage), cltv_expiry=500, timestamp=0)
+            htlc = remote_chan.add_htlc(htlc)
+            chan.receive_htlc(htlc)
+            force_state_transition(remote_chan, chan)
+            chan.settle_htlc(preimage, htlc.htlc_id)
+            remote_chan.receive_htlc_settle(preimage, htlc.htlc_id)
+            force_state_transition(chan, remote_chan)
+        chan.channel_id = i.to_bytes(32, 'big')
+        chan.short_channel_id = ShortChannelID.from_components(600000, i, 0)
+        chan.node_id = b'\x02' + chan.channel_id
+        channels.append(chan)
+    return channels
+
+
+def create_invoices(lnworker, amounts, changed_channels=()):
+    loop = asyncio.get_event_loop()
+    lengths = []
+    num_hints = 0
+    hints_time = 0
+    t0 = time.perf_counter()
+    for i, amount_sat in enumerate(amounts):
+        t1 = time.perf_counter()
+        if changed_channels:
+            lnworker.inbound_capacity.update_channel(changed_channels[i % len(changed_channels)])
+        routing_hints = loop.run_until_complete(lnworker._calc_routing_hints_for_invoice(amount_sat))
+        hints_time += time.perf_counter() - t1
+        amount_btc = Decimal(amount_sat) / bitcoin.COIN if amount_sat else None
+        lnaddr = LnAddr(sha256(str(amount_sat).encode()), amount=amount_btc,
+                        tags=[('d', 'order'), ('x', 3600)] + routing_hints)
+        invoice = lnencode(lnaddr, PRIVKEY)
+        lengths.append(len(invoice))
+        num_hints += len(routing_hints)
+        decoded = lndecode(invoice)
+        assert [route for k, route in decoded.tags if k == 'r'] == [route for k, route in routing_hints]
+    elapsed = time.perf_counter() - t0
+    print(f"  {1000 * elapsed / len(amounts):.1f} ms per invoice, of which {1000 * hints_time / len(amounts):.2f} ms "
+          f"choosing {num_hints / len(amounts):.1f} hints")
+    print(f"  {sum(lengths) / len(lengths):.0f} characters on average, {max(lengths)} at most")
+
+
+def main():
+    random.seed(1)
+    channels = open_channels()
+    amounts = [random.choice((None, random.randint(1_000, 50_000_000))) for i in range(NUM_INVOICES)]
+    print(f"{num_channels} channels, {num_payments} settled payments each, {NUM_INVOICES} invoices")
+    print("all channels:")
+    create_invoices(AllChannelsLNWallet(channels), amounts)
+    print("inbound capacity index:")
+    lnworker = FakeLNWallet(channels)
+    create_invoices(lnworker, amounts)
+    print("inbound capacity index, one channel changed before each invoice:")
+    create_invoices(lnworker, amounts, channels)
+
+
+main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Load test for concurrent commands.
+# Many clients call getbalance and onchain_history on a wallet with a
+# synthetic history, first with the commands run directly on the event
+# loop, then through the daemon's CommandExecutor. Reports the latency
+# of the light getbalance calls while the heavy history calls run.
+# run using
+# python3 -m electrum.scripts.bench_rpc [num_clients] [num_txs]
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from electrum import bitcoin, constants
+from electrum.address_synchronizer import HistoryItem
+from electrum.command_executor import CommandExecutor
+from electrum.commands import Commands
+from electrum.simple_config import SimpleConfig
+from electrum.util import TxMinedInfo
+from electrum.wallet import Abstract_Wallet, restore_wallet_from_text
+
+
+num_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+num_txs = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+CALLS_PER_CLIENT = 10
+
+
+def synthetic_history(n):
+    history = []
+    balance = 0
+    for i in range(n):
+        delta = 100000 if i % 3 else -20000
+        balance += delta
+        history.append(HistoryItem(txid='%064x' % i,
+                                   tx_mined_status=TxMinedInfo(height=1000 + i, conf=n - i,
+                                                               timestamp=1500000000 + 60 * i, txpos=0),
+                                   delta=delta, fee=None, balance=balance))
+    return history
+
+
+async def client(cmds, wallet, idx, latencies):
+    # one client in ten lists the history, the others poll the balance.
+    # Latencies are measured from the time a call is due, so that they
+    # include the time spent waiting for a blocked event loop.
+    heavy = idx % 10 == 0
+    interval = 0.5 if heavy else 0.05
+    start = time.perf_counter() + interval * idx / num_clients
+    for i in range(CALLS_PER_CLIENT):
+        due = start + i * interval
+        await asyncio.sleep(max(0, due - time.perf_counter()))
+        if heavy:
+            await cmds.onchain_history(wallet=wallet)
+        else:
+            await cmds.getbalance(wallet=wallet)
+        latencies['onchain_history' if heavy else 'getbalance'].append(time.perf_counter() - due)
+
+
+async def run(cmds, wallet):
+    latencies = {'getbalance': [], 'onchain_history': []}
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client(cmds, wallet, i, latencies) for i in range(num_clients)])
+    total = time.perf_counter() - t0
+    for name, values in latencies.items():
+        values.sort()
+        print(f"  {name}: {len(values)} calls, median {1000 * values[len(values) // 2]:.1f} ms, "
+              f"p99 {1000 * values[int(len(values) * 0.99)]:.1f} ms")
+    print(f"  total {total:.2f} s")
+
+
+def main():
+    constants.set_mainnet()
+    electrum_path = tempfile.mkdtemp()
+    config = SimpleConfig({'electrum_path': electrum_path})
+    address = bitcoin.pubkey_to_address('p2pkh', '02' + '11' * 32)
+    with mock.patch.object(Abstract_Wallet, 'save_db'):
+        wallet = restore_wallet_from_text(address, path=os.path.join(electrum_path, 'wallet'),
+                                          config=config)['wallet']
+    history = synthetic_history(num_txs)
+    wallet.get_history = lambda *args, **kwargs: history
+    print(f"{num_clients} clients, {num_txs} transactions")
+    loop = asyncio.get_event_loop()
+    print("on the event loop:")
+    loop.run_until_complete(run(Commands(config=config), wallet))
+    print("with CommandExecutor:")
+    executor = CommandExecutor(config)
+    loop.run_until_complete(run(Commands(config=config, executor=executor), wallet))
+    executor.stop()
+
+
+main()
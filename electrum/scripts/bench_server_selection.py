@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# Benchmark for the server scoreboard.
+# Simulates repeated cold starts against a pool of servers with mixed
+# connection times, round-trip times and failure rates. Each start
+# picks a main server and NUM_TARGET_CONNECTED_SERVERS - 1 others the
+# way the network does, fails over to a connected server when the main
+# one fails, and syncs through the main server. Reports the time until
+# connected and synced, with uniform random selection and with the
+# scoreboard, which is saved and read again between starts.
+# run using
+# python3 -m electrum.scripts.bench_server_selection [num_starts] [num_servers]
+import random
+import sys
+import tempfile
+
+from electrum.network import pick_random_server, NUM_TARGET_CONNECTED_SERVERS
+from electrum.server_scoreboard import ServerScoreboard
+from electrum.simple_config import SimpleConfig
+
+
+num_starts = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+num_servers = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+CONNECT_TIMEOUT = 10       # seconds, NetworkTimeout.Generic.NORMAL
+SYNC_ROUND_TRIPS = 30
+REQUEST_TIMEOUT = 10
+
+
+class FakeServer:
+
+    def __init__(self, name):
+        self.name = name
+        kind = random.random()
+        if kind < 0.2:      # close by
+            self.connect_time, self.rtt = 0.1, 0.02
+        elif kind < 0.7:
+            self.connect_time, self.rtt = 0.5, 0.1
+        else:               # far away, or overloaded
+            self.connect_time, self.rtt = 2.0, 0.4
+        self.failure_probability = 0.6 if random.random() < 0.15 else 0.02
+        self.timeout_probability = 0.05 if random.random() < 0.1 else 0.0
+
+    def connect(self):
+        """Returns (seconds, success)."""
+        if random.random() < self.failure_probability:
+            return random.uniform(0.5, CONNECT_TIMEOUT), False
+        return self.connect_time * random.lognormvariate(0, 0.3), True
+
+    def request(self):
+        """Returns (seconds, success)."""
+        if random.random() < self.timeout_probability:
+            return REQUEST_TIMEOUT, False
+        return self.rtt * random.lognormvariate(0, 0.3), True
+
+
+def cold_start(servers, scoreboard):
+    hostmap = {s.name: {'t': '50001'} for s in servers.values()}
+    exclude_set = scoreboard.get_failing_servers() if scoreboard else set()
+    main = pick_random_server(hostmap, 't', exclude_set, scoreboard=scoreboard)
+    chosen = {main}
+    for i in range(NUM_TARGET_CONNECTED_SERVERS - 1):
+        chosen.add(pick_random_server(hostmap, 't', exclude_set | chosen, scoreboard=scoreboard))
+    chosen.discard(None)
+    # all connections are started at once
+    ready_at = {}
+    main_failed_at = None
+    for name in chosen:
+        seconds, success = servers[name].connect()
+        if scoreboard:
+            if success:
+                scoreboard.record_connect(name, seconds)
+            else:
+                scoreboard.record_disconnect(name, failed=True)
+        if success:
+            ready_at[name] = seconds
+        elif name == main:
+            main_failed_at = seconds
+    if not ready_at:
+        return None
+    now = ready_at.get(main)
+    if now is None:
+        # the main server failed: switch to a connected one
+        connected = list(ready_at)
+        main = scoreboard.best(connected) if scoreboard else random.choice(connected)
+        now = max(main_failed_at, ready_at[main])
+    for i in range(SYNC_ROUND_TRIPS):
+        seconds, success = servers[main].request()
+        now += seconds
+        if scoreboard:
+            if success:
+                scoreboard.record_rtt(main, seconds)
+            else:
+                scoreboard.record_timeout(main)
+    return now
+
+
+def report(name, times):
+    times = sorted(t for t in times if t is not None)
+    print(f"{name}: median {times[len(times) // 2]:.2f} s, "
+          f"p90 {times[int(len(times) * 0.9)]:.2f} s, max {times[-1]:.2f} s")
+
+
+def main():
+    random.seed(1)
+    servers = {f'server{i}:50001:t': FakeServer(f'server{i}') for i in range(num_servers)}
+    print(f"{num_starts} cold starts, {num_servers} servers")
+    report("uniform random  ", [cold_start(servers, None) for i in range(num_starts)])
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp()})
+    times = []
+    for i in range(num_starts):
+        scoreboard = ServerScoreboard(config)
+        times.append(cold_start(servers, scoreboard))
+        scoreboard.save()
+    print(f"first start with scoreboard: {times[0]:.2f} s")
+    report("with scoreboard ", times[1:])
+
+
+main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# Benchmark for sweeping many private keys.
+# A fake server holds one funded p2pkh output per key and answers each
+# listunspent request after a simulated round-trip. The keys are looked
+# up one at a time, like sweep_preparations used to do, and then with
+# sweep_batch, which also splits and signs the transactions.
+# run using
+# python3 -m electrum.scripts.bench_sweep [num_keys] [rtt_ms]
+import asyncio
+import sys
+import time
+
+from electrum import bitcoin, constants, ecc
+from electrum.util import bh2u
+from electrum.wallet import sweep_batch, _sweep_candidates
+
+
+num_keys = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+rtt = (float(sys.argv[2]) if len(sys.argv) > 2 else 1) / 1000
+
+
+class FakeServer:
+    relay_fee = 1000
+
+    def __init__(self):
+        self.utxos = {}
+        self.loop = asyncio.get_event_loop()
+
+    def run_from_another_thread(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    async def listunspent_for_scripthash(self, scripthash):
+        await asyncio.sleep(rtt)
+        return self.utxos.get(scripthash, [])
+
+
+def main():
+    constants.set_testnet()
+    network = FakeServer()
+    privkeys = []
+    for i in range(1, num_keys + 1):
+        secret = i.to_bytes(32, 'big')
+        privkeys.append(bitcoin.serialize_privkey(secret, True, 'p2pkh'))
+        pubkey = bh2u(ecc.ECPrivkey(secret).get_public_key_bytes(compressed=True))
+        scripthash = bitcoin.address_to_scripthash(bitcoin.pubkey_to_address('p2pkh', pubkey))
+        network.utxos[scripthash] = [{'tx_hash': bh2u(bitcoin.sha256(i.to_bytes(4, 'big'))),
+                                      'tx_pos': 0, 'height': 1000, 'value': 100000}]
+    dest_addr = bitcoin.pubkey_to_address('p2pkh', bh2u(ecc.ECPrivkey(b'\x01' * 32).get_public_key_bytes()))
+    print(f"{num_keys} funded keys, {1000 * rtt:.1f} ms round-trip")
+
+    candidates, keypairs = _sweep_candidates(privkeys)
+    t0 = time.monotonic()
+    for candidate in candidates:
+        network.run_from_another_thread(network.listunspent_for_scripthash(candidate.scripthash))
+    t1 = time.monotonic()
+    print(f"serial lookups: {len(candidates)} requests in {t1 - t0:.2f} s")
+
+    t0 = time.monotonic()
+    txs = sweep_batch(privkeys, network=network, config=None, to_address=dest_addr,
+                      fee_per_kb=1000, locktime=1000)
+    t1 = time.monotonic()
+    assert all(tx.is_complete() for tx in txs)
+    assert sum(len(tx.inputs()) for tx in txs) == num_keys
+    print(f"sweep_batch: {len(txs)} signed transactions in {t1 - t0:.2f} s, "
+          f"max size {max(tx.estimated_size() for tx in txs)} vbytes")
+
+
+main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Load test for the websocket balance monitor.
+# Connects many websocket clients watching requests spread over a set of
+# addresses, against a fake ElectrumX session. Then pays every address,
+# and measures the time until all clients are notified, and the number
+# of subscriptions and balance queries sent to the server.
+# run using
+# python3 -m electrum.scripts.bench_websockets [num_clients] [num_addresses]
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from electrum import bitcoin
+from electrum.simple_config import SimpleConfig
+from electrum.util import SilentTaskGroup
+from electrum.websockets import WebSocketServer
+
+
+num_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+num_addresses = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+AMOUNT = 1000
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.subscriptions = defaultdict(list)
+        self.num_subscribe = 0
+
+    async def subscribe(self, method, params, queue):
+        self.num_subscribe += 1
+        self.subscriptions[params[0]].append(queue)
+        await queue.put([params[0], None])
+
+    def unsubscribe(self, queue):
+        pass
+
+    async def notify(self, sh, status):
+        for queue in self.subscriptions[sh]:
+            await queue.put([sh, status])
+
+
+class FakeInterface:
+
+    def __init__(self):
+        self.group = SilentTaskGroup()
+        self.session = FakeSession()
+
+
+class FakeNetwork:
+
+    def __init__(self, loop):
+        self.asyncio_loop = loop
+        self.interface = FakeInterface()
+        self.num_get_balance = 0
+
+    def register_callback(self, callback, events):
+        pass
+
+    def unregister_callback(self, callback):
+        pass
+
+    async def get_balance_for_scripthash(self, sh):
+        self.num_get_balance += 1
+        await asyncio.sleep(0.001)  # server round-trip
+        return {'confirmed': 0, 'unconfirmed': AMOUNT}
+
+
+def write_requests(rdir, addresses):
+    for i in range(num_clients):
+        request_id = f'r{i:07d}'
+        d = os.path.join(rdir, 'req', request_id[0], request_id[1], request_id)
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, request_id + '.json'), 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'address': addresses[i % num_addresses], 'amount': AMOUNT}))
+
+
+async def client(session, url, request_id, failed, paid_at, latencies):
+    try:
+        async with session.ws_connect(url) as ws:
+            await ws.send_str('id:' + request_id)
+            async for msg in ws:
+                if msg.data == 'paid':
+                    latencies.append(time.perf_counter() - paid_at[0])
+                break
+    except aiohttp.ClientError as e:
+        failed.append(e)
+
+
+async def main():
+    loop = asyncio.get_event_loop()
+    rdir = tempfile.mkdtemp()
+    addresses = [bitcoin.hash160_to_p2pkh(i.to_bytes(20, 'big')) for i in range(num_addresses)]
+    write_requests(rdir, addresses)
+    config = SimpleConfig({'electrum_path': rdir, 'requests_dir': rdir,
+                           'websocket_server': '127.0.0.1', 'websocket_port': 0})
+    network = FakeNetwork(loop)
+    server = WebSocketServer(config, network)
+    await server.run()
+    host, port = server.runner.addresses[0][:2]
+    url = f'http://{host}:{port}/'
+    monitor = server.balance_monitor
+
+    failed = []
+    paid_at = [0.0]
+    latencies = []
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        t0 = time.monotonic()
+        tasks = [asyncio.ensure_future(client(session, url, f'r{i:07d}', failed, paid_at, latencies))
+                 for i in range(num_clients)]
+        while sum(len(w) for w in monitor.watchers.values()) + len(failed) < num_clients:
+            await asyncio.sleep(0.1)
+        print(f"{num_clients - len(failed)} clients watching {num_addresses} addresses, "
+              f"connected in {time.monotonic() - t0:.1f} s ({len(failed)} failed)")
+        print(f"subscriptions sent: {network.interface.session.num_subscribe}")
+
+        paid_at[0] = time.perf_counter()
+        for i, addr in enumerate(addresses):
+            await network.interface.session.notify(bitcoin.address_to_scripthash(addr), f'status{i}')
+        await asyncio.gather(*tasks)
+    latencies.sort()
+    print(f"balance queries: {network.num_get_balance}")
+    print(f"payment to notification: median {1000 * latencies[len(latencies) // 2]:.2f} ms, "
+          f"max {1000 * latencies[-1]:.2f} ms ({len(latencies)} notifications)")
+    await monitor.stop()
+    await server.runner.cleanup()
+
+
+# both ends of every connection live in this process
+soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+if hard != resource.RLIM_INFINITY and hard < 2 * num_clients + 100:
+    sys.exit(f"need {2 * num_clients + 100} file descriptors, the limit is {hard}")
+resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,259 @@
+# Copyright (C) 2020 The Electrum developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENCE or http://www.opensource.org/licenses/mit-license.php
+
+"""Persistent scoreboard of the servers we connected to.
+
+For every server we keep the time it took to connect, recent round-trip
+times of requests, the rate of failed connections and timed out
+requests, and how late it announces new blocks compared to the first
+server that announced them. The scoreboard is saved in the electrum
+directory, so that what was learnt in one session is used at the next
+start.
+
+Servers are picked at random, weighted by their score, so that fast and
+reliable servers are preferred, while unknown servers still get a chance
+to be measured. Servers that fail are retried with an exponential
+backoff, which starts over at the next start.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional, Iterable, Dict, Set, TYPE_CHECKING
+
+from .logging import Logger
+
+if TYPE_CHECKING:
+    from .simple_config import SimpleConfig
+
+
+RTT_WINDOW = 50              # samples kept per server
+EWMA_ALPHA = 0.2
+TIMEOUT_ALPHA = 0.02         # there are many more requests than connections
+UNKNOWN_CONNECT_TIME = 1.0   # seconds, assumed for servers we never connected to
+UNKNOWN_RTT = 0.2            # seconds
+RTT_WEIGHT = 10              # syncing takes many round trips
+TIP_WEIGHT = 0.1
+MAX_TIP_DELAY = 600          # seconds, recorded for servers with a stale tip
+FAILURE_COST = 10            # seconds lost on a failed connection
+TIMEOUT_COST = 10            # seconds lost on a timed out request
+MIN_RETRY_INTERVAL = 60      # seconds before reconnecting to a server
+MAX_RETRY_INTERVAL = 3600
+MAX_SERVERS = 200            # records kept in the file
+SAVE_INTERVAL = 60           # seconds
+TIPS_REMEMBERED = 10
+MIN_SCORE = 0.001            # seconds, for the weights of servers measured at 0
+
+
+def _ewma(old: Optional[float], value: float, alpha: float = EWMA_ALPHA) -> float:
+    return value if old is None else (1 - alpha) * old + alpha * value
+
+
+def _percentile(values: Iterable[float], q: float) -> Optional[float]:
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class ServerRecord:
+    __slots__ = ('connect_time', 'rtts', 'failure_rate', 'timeout_rate', 'tip_delay',
+                 'failures', 'last_disconnect', 'last_seen')
+
+    def __init__(self):
+        self.connect_time = None  # type: Optional[float]
+        self.rtts = deque(maxlen=RTT_WINDOW)
+        self.failure_rate = 0.0   # of connection attempts
+        self.timeout_rate = 0.0   # of requests
+        self.tip_delay = None  # type: Optional[float]
+        self.failures = 0         # consecutive
+        self.last_disconnect = 0.0
+        self.last_seen = 0.0
+
+    def rtt_percentile(self, q: float) -> Optional[float]:
+        return _percentile(self.rtts, q)
+
+    def retry_interval(self) -> float:
+        return min(MIN_RETRY_INTERVAL * 2 ** max(0, self.failures - 1), MAX_RETRY_INTERVAL)
+
+    def score(self) -> float:
+        """Expected seconds until the server is useful. Lower is better."""
+        connect_time = UNKNOWN_CONNECT_TIME if self.connect_time is None else self.connect_time
+        rtt = self.rtt_percentile(0.9)
+        rtt = UNKNOWN_RTT if rtt is None else rtt
+        tip_delay = self.tip_delay or 0.0
+        return (connect_time + self.failure_rate * FAILURE_COST
+                + RTT_WEIGHT * (rtt + self.timeout_rate * TIMEOUT_COST)
+                + TIP_WEIGHT * tip_delay)
+
+    def to_json(self) -> dict:
+        return {
+            'connect_time': self.connect_time,
+            'rtts': list(self.rtts),
+            'failure_rate': self.failure_rate,
+            'timeout_rate': self.timeout_rate,
+            'tip_delay': self.tip_delay,
+            'failures': self.failures,
+            'last_disconnect': self.last_disconnect,
+            'last_seen': self.last_seen,
+        }
+
+    @classmethod
+    def from_json(cls, d: dict) -> 'ServerRecord':
+        r = cls()
+        r.connect_time = d.get('connect_time')
+        r.rtts.extend(float(x) for x in d.get('rtts', []))
+        r.failure_rate = float(d.get('failure_rate', 0))
+        r.timeout_rate = float(d.get('timeout_rate', 0))
+        r.tip_delay = d.get('tip_delay')
+        r.failures = int(d.get('failures', 0))
+        r.last_disconnect = float(d.get('last_disconnect', 0))
+        r.last_seen = float(d.get('last_seen', 0))
+        return r
+
+
+class ServerScoreboard(Logger):
+
+    def __init__(self, config: 'SimpleConfig'):
+        Logger.__init__(self)
+        self.config = config
+        self.lock = threading.Lock()
+        self._records = {}  # type: Dict[str, ServerRecord]
+        self._tips_first_seen = {}  # type: Dict[int, float]
+        self._dirty = False
+        self._last_save = time.time()
+        self._load()
+
+    def _path(self) -> Optional[str]:
+        if not self.config.path:
+            return None
+        return os.path.join(self.config.path, "server_scoreboard")
+
+    def _load(self) -> None:
+        path = self._path()
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding='utf-8') as f:
+                data = json.loads(f.read())
+            self._records = {server: ServerRecord.from_json(d) for server, d in data.items()}
+            # the backoff is not restored: failures of the last session may
+            # be ours, e.g. if we were offline. They still weigh on the score.
+            for r in self._records.values():
+                r.failures = 0
+        except Exception as e:
+            self.logger.info(f'could not read scoreboard: {repr(e)}')
+            self._records = {}
+
+    def save(self) -> None:
+        path = self._path()
+        if not path:
+            return
+        with self.lock:
+            records = sorted(self._records.items(), key=lambda x: x[1].last_seen, reverse=True)
+            data = {server: r.to_json() for server, r in records[:MAX_SERVERS]}
+            self._dirty = False
+            self._last_save = time.time()
+        temp_path = "%s.tmp.%s" % (path, os.getpid())
+        try:
+            with open(temp_path, "w", encoding='utf-8') as f:
+                f.write(json.dumps(data, sort_keys=True))
+            os.replace(temp_path, path)
+        except OSError as e:
+            self.logger.info(f'could not save scoreboard: {repr(e)}')
+
+    def maybe_save(self) -> None:
+        if self._dirty and time.time() - self._last_save > SAVE_INTERVAL:
+            self.save()
+
+    def get(self, server: str) -> Optional[ServerRecord]:
+        return self._records.get(server)
+
+    def _record(self, server: str) -> ServerRecord:
+        r = self._records.get(server)
+        if r is None:
+            r = self._records[server] = ServerRecord()
+        r.last_seen = time.time()
+        self._dirty = True
+        return r
+
+    def record_connect(self, server: str, seconds: float) -> None:
+        with self.lock:
+            r = self._record(server)
+            r.connect_time = _ewma(r.connect_time, seconds)
+            r.failure_rate = _ewma(r.failure_rate, 0)
+            r.failures = 0
+
+    def record_disconnect(self, server: str, *, failed: bool) -> None:
+        """failed: the connection could not be established, or was
+        dropped by the server."""
+        with self.lock:
+            r = self._record(server)
+            r.last_disconnect = time.time()
+            if failed:
+                r.failure_rate = _ewma(r.failure_rate, 1)
+                r.failures += 1
+
+    def record_rtt(self, server: str, seconds: float) -> None:
+        with self.lock:
+            r = self._record(server)
+            r.rtts.append(seconds)
+            r.timeout_rate = _ewma(r.timeout_rate, 0, TIMEOUT_ALPHA)
+
+    def record_timeout(self, server: str) -> None:
+        with self.lock:
+            r = self._record(server)
+            r.timeout_rate = _ewma(r.timeout_rate, 1, TIMEOUT_ALPHA)
+
+    def record_tip(self, server: str, height: int) -> None:
+        """Called when a server announces a new block. The delay is
+        counted from the first server that announced it."""
+        now = time.monotonic()
+        with self.lock:
+            first_seen = self._tips_first_seen.setdefault(height, now)
+            if len(self._tips_first_seen) > TIPS_REMEMBERED:
+                del self._tips_first_seen[min(self._tips_first_seen)]
+            r = self._record(server)
+            r.tip_delay = _ewma(r.tip_delay, min(now - first_seen, MAX_TIP_DELAY))
+
+    def record_stale_tip(self, server: str) -> None:
+        with self.lock:
+            r = self._record(server)
+            r.tip_delay = _ewma(r.tip_delay, MAX_TIP_DELAY)
+
+    def score(self, server: str) -> float:
+        r = self._records.get(server)
+        return (r or ServerRecord()).score()
+
+    def retry_time(self, server: str) -> float:
+        """When the server can be tried again."""
+        r = self._records.get(server)
+        if r is None:
+            return 0.0
+        return r.last_disconnect + r.retry_interval()
+
+    def is_backing_off(self, server: str, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        return now < self.retry_time(server)
+
+    def get_failing_servers(self, now: float = None) -> Set[str]:
+        """Servers that failed recently and are still backing off."""
+        now = time.time() if now is None else now
+        with self.lock:
+            return {server for server, r in self._records.items()
+                    if r.failures > 0 and now - r.last_disconnect < r.retry_interval()}
+
+    def choose(self, servers: Iterable[str]) -> Optional[str]:
+        """Picks a server at random, weighted by score."""
+        servers = list(servers)
+        if not servers:
+            return None
+        weights = [1 / max(self.score(server), MIN_SCORE) ** 2 for server in servers]
+        return random.choices(servers, weights=weights)[0]
+
+    def best(self, servers: Iterable[str]) -> Optional[str]:
+        return min(servers, key=self.score, default=None)
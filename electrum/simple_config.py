@@ -1,3 +1,4 @@
+import atexit
 import json
 import threading
 import time
@@ -5,7 +6,9 @@ import os
 import stat
 import ssl
 from decimal import Decimal
-from typing import Union, Optional
+import bisect
+import weakref
+from typing import Union, Optional, Sequence, Tuple, List
 from numbers import Real
 
 from copy import deepcopy
@@ -21,6 +24,7 @@ from .logging import get_logger, Logger
 FEE_ETA_TARGETS = [25, 10, 5, 2]
 FEE_DEPTH_TARGETS = [10000000, 5000000, 2000000, 1000000, 500000, 200000, 100000]
 FEE_LN_ETA_TARGET = 2  # note: make sure the network is asking for estimates for this target
+FEE_ESTIMATES_UPDATE_INTERVAL = 60  # seconds
 
 # satoshi per kbyte
 FEERATE_MAX_DYNAMIC = 50000
@@ -38,6 +42,68 @@ _logger = get_logger(__name__)
 FINAL_CONFIG_VERSION = 3
 
 
+class FeeHistogram:
+    """Cumulative view of a mempool fee histogram.
+
+    The histogram is a list of (fee_rate, vsize) pairs, fee_rate in
+    sat/vbyte, sorted by decreasing fee_rate, as returned by
+    'mempool.get_fee_histogram'. The i-th bucket holds the transactions
+    paying at least fees[i], and less than fees[i-1].
+    """
+
+    def __init__(self, histogram: Sequence[Tuple[Real, int]] = ()):
+        self.fees = []  # type: List[Real]
+        self.depths = []  # type: List[int]  # cumulative vsize, at the end of each bucket
+        self._neg_min_fees = []  # type: List[Real]  # non-decreasing, for bisect
+        depth = 0
+        min_fee = None
+        for fee, size in histogram:
+            depth += size
+            min_fee = fee if min_fee is None else min(min_fee, fee)
+            self.fees.append(fee)
+            self.depths.append(depth)
+            self._neg_min_fees.append(-min_fee)
+
+    def __bool__(self):
+        return bool(self.fees)
+
+    def fee_to_depth(self, target_fee: Real, *, interpolate: bool = False) -> Real:
+        """Depth in vbytes of a transaction paying target_fee (sat/vbyte).
+        By default, the whole bucket the fee falls in is counted
+        (pessimistic); with interpolate, only the part of it paying more.
+        """
+        if not self.fees:
+            return 0
+        # first bucket with a fee <= target_fee
+        i = bisect.bisect_left(self._neg_min_fees, -target_fee)
+        if i == len(self.fees):
+            return self.depths[-1]
+        if not interpolate or i == 0:
+            return self.depths[i]
+        upper_fee, lower_fee = self.fees[i - 1], self.fees[i]
+        if upper_fee <= lower_fee or target_fee >= upper_fee:
+            return self.depths[i]
+        size = self.depths[i] - self.depths[i - 1]
+        return self.depths[i - 1] + size * (upper_fee - target_fee) / (upper_fee - lower_fee)
+
+    def depth_to_fee(self, target: int, *, interpolate: bool = False) -> Optional[Real]:
+        """Fee rate (sat/vbyte) of the bucket at depth target (vbytes),
+        or None if the mempool is not that deep. With interpolate, the
+        fee rate is interpolated within the bucket.
+        """
+        i = bisect.bisect_right(self.depths, target)
+        if i == len(self.depths):
+            return None
+        fee = self.fees[i]
+        if not interpolate or i == 0 or self.fees[i - 1] <= fee:
+            return fee
+        size = self.depths[i] - (self.depths[i - 1] if i else 0)
+        return fee + (self.fees[i - 1] - fee) * (self.depths[i] - target) / size
+
+    def depths_to_fees(self, targets: Sequence[int], *, interpolate: bool = False) -> List[Optional[Real]]:
+        return [self.depth_to_fee(target, interpolate=interpolate) for target in targets]
+
+
 class SimpleConfig(Logger):
     """
     The SimpleConfig class is responsible for handling operations involving
@@ -49,6 +115,8 @@ class SimpleConfig(Logger):
     They are taken in order (1. overrides config options set in 2.)
     """
 
+    SAVE_DELAY = 0.5  # seconds
+
     def __init__(self, options=None, read_user_config_function=None,
                  read_user_dir_function=None):
         if options is None:
@@ -59,8 +127,14 @@ class SimpleConfig(Logger):
         # This lock needs to be acquired for updating and reading the config in
         # a thread-safe way.
         self.lock = threading.RLock()
-
-        self.mempool_fees = {}
+        # Writes to disk are delayed by SAVE_DELAY seconds, so that a burst
+        # of set_key calls results in a single write.
+        self._save_lock = threading.Lock()
+        self._save_timer = None  # type: Optional[threading.Timer]
+        self._dirty = False
+
+        self._mempool_fees = []
+        self.fee_histogram = FeeHistogram()
         self.fee_estimates = {}
         self.fee_estimates_last_updated = {}
         self.last_time_fee_estimates_requested = 0  # zero ensures immediate fees
@@ -149,7 +223,18 @@ class SimpleConfig(Logger):
             else:
                 self.user_config.pop(key, None)
             if save:
-                self.save_user_config()
+                self._schedule_save()
+
+    def _schedule_save(self):
+        with self.lock:
+            self._dirty = True
+            if self._save_timer is not None or not self.path:
+                return
+            self._save_timer = threading.Timer(self.SAVE_DELAY, self._flush_from_timer)
+            self._save_timer.daemon = True
+            self._save_timer.name = 'SimpleConfig.save'
+            self._save_timer.start()
+            _unsaved_configs.add(self)
 
     def get(self, key, default=None):
         with self.lock:
@@ -223,15 +308,52 @@ class SimpleConfig(Logger):
     def is_modifiable(self, key):
         return key not in self.cmdline_options
 
+    def flush(self):
+        """Write pending changes to disk, if any."""
+        with self.lock:
+            timer, self._save_timer = self._save_timer, None
+            dirty = self._dirty
+        if timer is not None:
+            timer.cancel()
+        if dirty:
+            self.save_user_config()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception as e:
+            # the changes are still pending, and are written by the next save
+            self.logger.warning(f"cannot save config: {repr(e)}")
+
     def save_user_config(self):
         if not self.path:
             return
+        # the snapshot is taken under _save_lock, so that concurrent
+        # saves write their snapshots in the order they were taken.
+        # readers only need self.lock, which is not held while writing
+        with self._save_lock:
+            with self.lock:
+                # deep copy: callers may mutate the values they set, e.g. lists
+                user_config = deepcopy(self.user_config)
+                self._dirty = False
+            try:
+                s = json.dumps(user_config, indent=4, sort_keys=True)
+                self._write_user_config(s)
+            except BaseException:
+                with self.lock:
+                    self._dirty = True
+                raise
+
+    def _write_user_config(self, s: str):
         path = os.path.join(self.path, "config")
-        s = json.dumps(self.user_config, indent=4, sort_keys=True)
+        temp_path = "%s.tmp.%s" % (path, os.getpid())
         try:
-            with open(path, "w", encoding='utf-8') as f:
+            with open(temp_path, "w", encoding='utf-8') as f:
                 f.write(s)
-            os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(temp_path, stat.S_IREAD | stat.S_IWRITE)
+            os.replace(temp_path, path)
         except FileNotFoundError:
             # datadir probably deleted while running...
             if os.path.exists(self.path):  # or maybe not?
@@ -314,17 +436,21 @@ class SimpleConfig(Logger):
             fee = self.fee_estimates.get(num_blocks)
         return fee
 
+    @property
+    def mempool_fees(self):
+        return self._mempool_fees
+
+    @mempool_fees.setter
+    def mempool_fees(self, histogram):
+        self.fee_histogram = FeeHistogram(histogram)
+        self._mempool_fees = histogram
+
     def fee_to_depth(self, target_fee: Real) -> int:
         """For a given sat/vbyte fee, returns an estimate of how deep
         it would be in the current mempool in vbytes.
         Pessimistic == overestimates the depth.
         """
-        depth = 0
-        for fee, s in self.mempool_fees:
-            depth += s
-            if fee <= target_fee:
-                break
-        return depth
+        return self.fee_histogram.fee_to_depth(target_fee)
 
     def depth_to_fee(self, slider_pos) -> int:
         """Returns fee in sat/kbyte."""
@@ -336,12 +462,8 @@ class SimpleConfig(Logger):
         """Returns fee in sat/kbyte.
         target: desired mempool depth in vbytes
         """
-        depth = 0
-        for fee, s in self.mempool_fees:
-            depth += s
-            if depth > target:
-                break
-        else:
+        fee = self.fee_histogram.depth_to_fee(target)
+        if fee is None:
             return 0
         # add one sat/byte as currently that is
         # the max precision of the histogram
@@ -457,7 +579,7 @@ class SimpleConfig(Logger):
         return len(self.fee_estimates) == 4
 
     def has_fee_mempool(self):
-        return bool(self.mempool_fees)
+        return bool(self.fee_histogram)
 
     def has_dynamic_fees_ready(self):
         if self.use_mempool_fees():
@@ -547,8 +669,11 @@ class SimpleConfig(Logger):
         """Checks time since last requested and updated fee estimates.
         Returns True if an update should be requested.
         """
+        return self.time_until_fee_estimates_update() < 0
+
+    def time_until_fee_estimates_update(self) -> float:
         now = time.time()
-        return now - self.last_time_fee_estimates_requested > 60
+        return self.last_time_fee_estimates_requested + FEE_ESTIMATES_UPDATE_INTERVAL - now
 
     def requested_fee_estimates(self):
         self.last_time_fee_estimates_requested = time.time()
@@ -568,6 +693,15 @@ class SimpleConfig(Logger):
             return ssl_context
 
 
+_unsaved_configs = weakref.WeakSet()  # type: weakref.WeakSet[SimpleConfig]
+
+
+@atexit.register
+def _flush_unsaved_configs():
+    for config in list(_unsaved_configs):
+        config.flush()
+
+
 def read_user_config(path):
     """Parse and store the user config settings in electrum.conf into user_config[]."""
     if not path:
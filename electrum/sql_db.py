@@ -17,6 +17,16 @@ def sql(func):
         return f
     return wrapper
 
+def _set_result(future, result):
+    if not future.cancelled():
+        future.set_result(result)
+
+
+def _set_exception(future, e):
+    if not future.cancelled():
+        future.set_exception(e)
+
+
 class SqlDB(Logger):
     
     def __init__(self, network, path, commit_interval=None):
@@ -42,10 +52,9 @@ class SqlDB(Logger):
             try:
                 result = func(self, *args, **kwargs)
             except BaseException as e:
-                future.set_exception(e)
+                self.network.asyncio_loop.call_soon_threadsafe(_set_exception, future, e)
                 continue
-            if not future.cancelled():
-                future.set_result(result)
+            self.network.asyncio_loop.call_soon_threadsafe(_set_result, future, result)
             # note: in sweepstore session.commit() is called inside
             # the sql-decorated methods, so commiting to disk is awaited
             if self.commit_interval:
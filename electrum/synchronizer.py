@@ -24,17 +24,21 @@
 # SOFTWARE.
 import asyncio
 import hashlib
-from typing import Dict, List, TYPE_CHECKING, Tuple
-from collections import defaultdict
+import os
+from typing import Dict, List, TYPE_CHECKING, Tuple, Optional, Set
+from collections import defaultdict, OrderedDict
 import logging
 
+import aiohttp
 from aiorpcx import TaskGroup, run_in_thread, RPCError
 
 from .transaction import Transaction, PartialTransaction
 from .util import bh2u, make_aiohttp_session, NetworkJobOnDefaultServer
+from . import metrics
 from .bitcoin import address_to_scripthash, is_address
 from .network import UntrustedServerReturnedError
 from .logging import Logger
+from .sql_db import SqlDB, sql
 from .interface import GracefulDisconnect
 
 if TYPE_CHECKING:
@@ -58,6 +62,9 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
     """Subscribe over the network to a set of addresses, and monitor their statuses.
     Every time a status changes, run a coroutine provided by the subclass.
     """
+
+    MAX_CONCURRENT_SUBSCRIPTIONS = None  # type: Optional[int]  # unbounded
+
     def __init__(self, network: 'Network'):
         self.asyncio_loop = network.asyncio_loop
         self._reset_request_counters()
@@ -72,6 +79,8 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
         # Queues
         self.add_queue = asyncio.Queue()
         self.status_queue = asyncio.Queue()
+        self._subscription_slots = asyncio.Semaphore(self.MAX_CONCURRENT_SUBSCRIPTIONS) \
+            if self.MAX_CONCURRENT_SUBSCRIPTIONS else None
 
     async def _start_tasks(self):
         try:
@@ -95,6 +104,7 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
         if addr in self.requested_addrs: return
         self.requested_addrs.add(addr)
         await self.add_queue.put(addr)
+        self.wake_up()
 
     async def _on_address_status(self, addr, status):
         """Handle the change of the status of an address."""
@@ -111,19 +121,28 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
                 if e.message == 'history too large':  # no unique error code
                     raise GracefulDisconnect(e, log_level=logging.ERROR) from e
                 raise
+            finally:
+                if self._subscription_slots:
+                    self._subscription_slots.release()
             self._requests_answered += 1
             self.requested_addrs.remove(addr)
+            self.wake_up()
 
         while True:
             addr = await self.add_queue.get()
+            if self._subscription_slots:
+                await self._subscription_slots.acquire()
             await self.group.spawn(subscribe_to_address, addr)
 
     async def handle_status(self):
         while True:
             h, status = await self.status_queue.get()
-            addr = self.scripthash_to_address[h]
+            addr = self.scripthash_to_address.get(h)
+            if addr is None:
+                continue  # no longer interested in this address
             await self.group.spawn(self._on_address_status, addr, status)
             self._processed_some_notifications = True
+            self.wake_up()
 
     def num_requests_sent_and_answered(self) -> Tuple[int, int]:
         return self._requests_sent, self._requests_answered
@@ -167,7 +186,8 @@ class Synchronizer(SynchronizerBase):
         self.requested_histories.add((addr, status))
         h = address_to_scripthash(addr)
         self._requests_sent += 1
-        result = await self.network.get_history_for_scripthash(h)
+        metrics.inc('synchronizer.history_requests')
+        result = await self.network.get_history_for_scripthash(h, status=status)
         self._requests_answered += 1
         self.logger.info(f"receiving history {addr} {len(result)}")
         hashes = set(map(lambda item: item['tx_hash'], result))
@@ -183,12 +203,14 @@ class Synchronizer(SynchronizerBase):
             self.logger.info(f"error: status mismatch: {addr}")
         else:
             # Store received history
-            self.wallet.receive_history_callback(addr, hist, tx_fees)
+            with metrics.timer('synchronizer.receive_history'):
+                self.wallet.receive_history_callback(addr, hist, tx_fees)
             # Request transactions we don't have
             await self._request_missing_txs(hist)
 
         # Remove request; this allows up_to_date to be True
         self.requested_histories.discard((addr, status))
+        self.wake_up()
 
     async def _request_missing_txs(self, hist, *, allow_server_not_finding_tx=False):
         # "hist" is a list of [tx_hash, tx_height] lists
@@ -224,7 +246,9 @@ class Synchronizer(SynchronizerBase):
         if tx_hash != tx.txid():
             raise SynchronizerFailure(f"received tx does not match expected txid ({tx_hash} != {tx.txid()})")
         tx_height = self.requested_tx.pop(tx_hash)
-        self.wallet.receive_tx_callback(tx_hash, tx, tx_height)
+        metrics.inc('synchronizer.transactions_received')
+        with metrics.timer('synchronizer.receive_tx'):
+            self.wallet.receive_tx_callback(tx_hash, tx, tx_height)
         self.logger.info(f"received tx {tx_hash} height: {tx_height} bytes: {len(raw_tx)}")
         # callbacks
         self.wallet.network.trigger_callback('new_transaction', self.wallet, tx)
@@ -241,8 +265,10 @@ class Synchronizer(SynchronizerBase):
         # add addresses to bootstrap
         for addr in self.wallet.get_addresses():
             await self._add_address(addr)
-        # main loop
+        # main loop: runs when addresses, histories or transactions
+        # were received, at most every 0.1s
         while True:
+            await self._wakeup.wait()
             await asyncio.sleep(0.1)
             await run_in_thread(self.wallet.synchronize)
             up_to_date = self.is_up_to_date()
@@ -255,35 +281,216 @@ class Synchronizer(SynchronizerBase):
                 self.wallet.network.trigger_callback('wallet_updated', self.wallet)
 
 
+create_watched_addresses = """
+CREATE TABLE IF NOT EXISTS watched_addresses (
+address VARCHAR(64) NOT NULL,
+url TEXT NOT NULL,
+PRIMARY KEY(address, url)
+)"""
+
+
+class NotifierStore(SqlDB):
+    """The addresses watched by the Notifier, and their URLs."""
+
+    def __init__(self, path, network):
+        super().__init__(network, path)
+
+    def create_database(self):
+        c = self.conn.cursor()
+        c.execute(create_watched_addresses)
+        self.conn.commit()
+
+    @sql
+    def list_watched(self):
+        c = self.conn.cursor()
+        c.execute("SELECT address, url FROM watched_addresses")
+        return c.fetchall()
+
+    @sql
+    def add_watched(self, address, url):
+        c = self.conn.cursor()
+        c.execute("INSERT OR IGNORE INTO watched_addresses (address, url) VALUES (?,?)", (address, url))
+        self.conn.commit()
+
+    @sql
+    def remove_watched(self, address, url=None):
+        c = self.conn.cursor()
+        if url is None:
+            c.execute("DELETE FROM watched_addresses WHERE address=?", (address,))
+        else:
+            c.execute("DELETE FROM watched_addresses WHERE address=? AND url=?", (address, url))
+        self.conn.commit()
+
+
+class NotifierEndpoint:
+    """Pending deliveries to one URL.
+
+    Statuses are delivered in the order they were received. While a
+    status of an address is waiting, a newer status replaces it; while it
+    is being delivered, the newer one is deferred until the delivery ends.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.pending = OrderedDict()  # type: OrderedDict[str, Optional[str]]
+        self.deferred = {}  # type: Dict[str, Optional[str]]
+        self.in_flight = set()  # type: Set[str]
+        self.num_workers = 0
+
+    def put(self, addr: str, status: Optional[str]) -> None:
+        if addr in self.in_flight:
+            self.deferred[addr] = status
+        else:
+            self.pending[addr] = status
+
+    def discard(self, addr: str) -> None:
+        self.pending.pop(addr, None)
+        self.deferred.pop(addr, None)
+
+
 class Notifier(SynchronizerBase):
     """Watch addresses. Every time the status of an address changes,
-    an HTTP POST is sent to the corresponding URL.
+    an HTTP POST is sent to the corresponding URLs.
+
+    Deliveries go through a pooled HTTP session, and are retried with
+    exponential backoff. The watch list is stored in 'notifier_db', so
+    that it survives a restart.
     """
-    def __init__(self, network):
+
+    MAX_CONNECTIONS = 100  # for all URLs
+    WORKERS_PER_ENDPOINT = 8  # concurrent POSTs to the same URL
+    MAX_ATTEMPTS = 8
+    RETRY_DELAY = 1  # seconds, doubled after every failed attempt
+    MAX_RETRY_DELAY = 300
+    TIMEOUT = 30
+
+    def __init__(self, network: 'Network'):
+        self.watched_addresses = defaultdict(set)  # type: Dict[str, Set[str]]
+        self.statuses = {}  # type: Dict[str, Optional[str]]
+        self.endpoints = {}  # type: Dict[str, NotifierEndpoint]
+        self._session = None  # type: Optional[aiohttp.ClientSession]
+        self._session_proxy = None
+        self._loaded = False
+        self.db = NotifierStore(os.path.join(network.config.path, 'notifier_db'), network)
         SynchronizerBase.__init__(self, network)
-        self.watched_addresses = defaultdict(list)  # type: Dict[str, List[str]]
-        self.start_watching_queue = asyncio.Queue()
+
+    async def start_watching_addr(self, addr: str, url: str) -> None:
+        if not is_address(addr):
+            raise ValueError(f"invalid bitcoin address {addr}")
+        await self.db.add_watched(addr, url)
+        is_new = addr not in self.watched_addresses
+        self.watched_addresses[addr].add(url)
+        if is_new:
+            await self._add_address(addr)
+        elif addr in self.statuses:
+            await self._enqueue(url, addr, self.statuses[addr])
+
+    async def stop_watching_addr(self, addr: str, url: str = None) -> None:
+        await self.db.remove_watched(addr, url)
+        urls = self.watched_addresses.get(addr, set())
+        removed = set(urls) if url is None else urls & {url}
+        urls -= removed
+        for u in removed:
+            if u in self.endpoints:
+                self.endpoints[u].discard(addr)
+        if not urls:
+            self.watched_addresses.pop(addr, None)
+            self.statuses.pop(addr, None)
 
     async def main(self):
+        if not self._loaded:
+            for addr, url in await self.db.list_watched():
+                self.watched_addresses[addr].add(url)
+            self._loaded = True
         # resend existing subscriptions if we were restarted
-        for addr in self.watched_addresses:
-            await self._add_address(addr)
-        # main loop
-        while True:
-            addr, url = await self.start_watching_queue.get()
-            self.watched_addresses[addr].append(url)
+        for addr in list(self.watched_addresses):
             await self._add_address(addr)
+        # resume deliveries interrupted by the restart
+        for endpoint in list(self.endpoints.values()):
+            await self._start_workers(endpoint)
 
     async def _on_address_status(self, addr, status):
-        self.logger.info(f'new status for addr {addr}')
-        headers = {'content-type': 'application/json'}
-        data = {'address': addr, 'status': status}
-        for url in self.watched_addresses[addr]:
+        if addr in self.statuses and self.statuses[addr] == status:
+            return  # e.g. resubscribed after a server change
+        self.statuses[addr] = status
+        self.logger.debug(f'new status for addr {addr}')
+        for url in list(self.watched_addresses.get(addr, ())):
+            await self._enqueue(url, addr, status)
+
+    async def _enqueue(self, url: str, addr: str, status: Optional[str]) -> None:
+        endpoint = self.endpoints.get(url)
+        if endpoint is None:
+            endpoint = self.endpoints[url] = NotifierEndpoint(url)
+        endpoint.put(addr, status)
+        await self._start_workers(endpoint)
+
+    async def _start_workers(self, endpoint: NotifierEndpoint) -> None:
+        while endpoint.num_workers < min(self.WORKERS_PER_ENDPOINT, len(endpoint.pending)):
+            endpoint.num_workers += 1
+            await self.group.spawn(self._deliver_pending, endpoint)
+
+    async def _deliver_pending(self, endpoint: NotifierEndpoint) -> None:
+        try:
+            while endpoint.pending:
+                addr, status = endpoint.pending.popitem(last=False)
+                endpoint.in_flight.add(addr)
+                done = False
+                try:
+                    done = await self._deliver(endpoint, addr, status)
+                finally:
+                    endpoint.in_flight.discard(addr)
+                    if addr in endpoint.deferred:
+                        endpoint.pending[addr] = endpoint.deferred.pop(addr)
+                    elif not done and addr in self.watched_addresses:
+                        # interrupted: put it back at the front of the queue
+                        endpoint.pending[addr] = status
+                        endpoint.pending.move_to_end(addr, last=False)
+        finally:
+            endpoint.num_workers -= 1
+            if not endpoint.pending and not endpoint.num_workers:
+                self.endpoints.pop(endpoint.url, None)
+            metrics.set_gauge('notifier.pending', sum(len(e.pending) for e in self.endpoints.values()))
+
+    async def _deliver(self, endpoint: NotifierEndpoint, addr: str, status: Optional[str]) -> bool:
+        delay = self.RETRY_DELAY
+        for attempt in range(self.MAX_ATTEMPTS):
+            if addr in endpoint.deferred:
+                status = endpoint.deferred.pop(addr)
             try:
-                async with make_aiohttp_session(proxy=self.network.proxy, headers=headers) as session:
-                    async with session.post(url, json=data, headers=headers) as resp:
-                        await resp.text()
+                await self._post(endpoint.url, {'address': addr, 'status': status})
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                self.logger.info(repr(e))
+                self.logger.info(f'failed to notify {endpoint.url} for {addr}: {repr(e)}')
+                metrics.inc('notifier.delivery_errors')
             else:
-                self.logger.info(f'Got Response for {addr}')
+                metrics.inc('notifier.deliveries')
+                return True
+            if addr not in self.watched_addresses:
+                return True  # no longer watched: nothing to deliver
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, self.MAX_RETRY_DELAY)
+        self.logger.warning(f'giving up notifying {endpoint.url} for {addr}')
+        return True
+
+    async def _post(self, url: str, data: dict) -> None:
+        session = await self.get_session()
+        async with session.post(url, json=data) as resp:
+            resp.raise_for_status()
+            await resp.read()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        proxy = self.network.proxy
+        session = self._session
+        if session is None or session.closed or proxy != self._session_proxy:
+            self._session = make_aiohttp_session(proxy, timeout=self.TIMEOUT, limit=self.MAX_CONNECTIONS)
+            self._session_proxy = proxy
+            if session is not None:
+                await session.close()
+        return self._session
+
+    async def stop(self):
+        await super().stop()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
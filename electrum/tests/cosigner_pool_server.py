@@ -0,0 +1,83 @@
+import asyncio
+import xmlrpc.client
+from typing import Dict, Optional, Set
+
+from aiohttp import web
+
+
+class CosignerPoolServer:
+    """Local stand-in for the cosigner pool server, for tests.
+    Speaks the same XML-RPC, and can answer get_many as soon as a
+    message is put. With long_poll=False, it only knows get/put/delete,
+    like the public server does."""
+
+    def __init__(self, long_poll: bool = True):
+        self.long_poll = long_poll
+        self.messages = {}  # type: Dict[str, str]
+        self.num_requests = 0
+        self.stopping = False
+        self._waiters = set()  # type: Set[asyncio.Event]
+        self.runner = None  # type: Optional[web.AppRunner]
+
+    def get(self, keyhash):
+        return self.messages.get(keyhash)
+
+    def put(self, keyhash, message):
+        self.messages[keyhash] = message
+        for waiter in self._waiters:
+            waiter.set()
+
+    def delete(self, keyhash):
+        self.messages.pop(keyhash, None)
+
+    async def get_many(self, keyhashes, timeout):
+        waiter = asyncio.Event()
+        self._waiters.add(waiter)
+        try:
+            loop = asyncio.get_event_loop()
+            deadline = loop.time() + min(timeout, 300)
+            while True:
+                messages = {k: self.messages[k] for k in keyhashes if k in self.messages}
+                if messages or loop.time() >= deadline or self.stopping:
+                    return messages
+                waiter.clear()
+                try:
+                    await asyncio.wait_for(waiter.wait(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiters.discard(waiter)
+
+    async def handle(self, request):
+        self.num_requests += 1
+        params, method = xmlrpc.client.loads(await request.read())
+        methods = {'get': self.get, 'put': self.put, 'delete': self.delete}
+        if self.long_poll:
+            methods['get_many'] = self.get_many
+        try:
+            if method not in methods:
+                raise Exception(f'method "{method}" is not supported')
+            result = methods[method](*params)
+            if asyncio.iscoroutine(result):
+                result = await result
+            body = xmlrpc.client.dumps((result,), methodresponse=True, allow_none=True)
+        except Exception as e:
+            body = xmlrpc.client.dumps(xmlrpc.client.Fault(1, f'{type(e)}:{e}'), allow_none=True)
+        return web.Response(body=body, content_type='text/xml')
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post('/', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        return f'http://{host}:{port}/'
+
+    async def stop(self):
+        # release the requests being held
+        self.stopping = True
+        for waiter in self._waiters:
+            waiter.set()
+        await self.runner.cleanup()
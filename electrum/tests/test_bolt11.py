@@ -4,7 +4,8 @@ from binascii import unhexlify, hexlify
 import pprint
 import unittest
 
-from electrum.lnaddr import shorten_amount, unshorten_amount, LnAddr, lnencode, lndecode, u5_to_bitarray, bitarray_to_u5
+from electrum.lnaddr import (shorten_amount, unshorten_amount, LnAddr, lnencode, lndecode, u5_to_bitarray, bitarray_to_u5,
+                            u5_to_bytes, bytes_to_u5, u5_to_int, int_to_u5)
 from electrum.segwit_addr import bech32_encode, bech32_decode
 
 from . import ElectrumTestCase
@@ -104,3 +105,36 @@ class TestBolt11(ElectrumTestCase):
         lnaddr = LnAddr(RHASH, amount=Decimal('0.001'), tags=[('d', '1 cup coffee'), ('x', 60), ('c', 150)])
         invoice = lnencode(lnaddr, PRIVKEY)
         self.assertEqual(150, lndecode(invoice).get_min_final_cltv_expiry())
+
+    def test_u5_conversions(self):
+        for b in (b'', b'\x00', b'\xff', bytes(range(33)), RHASH, PUBKEY):
+            u5 = bytes_to_u5(b)
+            self.assertEqual(bitarray_to_u5(u5_to_bitarray(u5)), u5)
+            self.assertEqual(u5_to_bitarray(u5).tobytes()[:len(b)], b)
+            self.assertEqual(b, u5_to_bytes(u5))
+            self.assertEqual(u5_to_bitarray(u5).tobytes(), u5_to_bytes(u5, pad=True))
+        for i in (0, 1, 31, 32, 144, 3600, 2**35 - 1):
+            self.assertEqual(i, u5_to_int(int_to_u5(i)))
+            self.assertEqual(i, u5_to_int(int_to_u5(i, 7)))
+        self.assertEqual([], int_to_u5(0))
+        self.assertEqual([1, 0], int_to_u5(32))
+        with self.assertRaises(ValueError):
+            int_to_u5(32, 1)
+
+    def test_routing_hints_roundtrip(self):
+        # five hops fill the tagged field exactly, without padding bits
+        route = [(PUBKEY, bytes([i]) * 8, 1000 + i, 2**31 + i, 144 + i) for i in range(5)]
+        lnaddr = LnAddr(RHASH, amount=Decimal('0.001'), tags=[('d', 'route'), ('r', route)])
+        decoded = lndecode(lnencode(lnaddr, PRIVKEY))
+        self.assertEqual(route, decoded.get_tag('r'))
+
+    def test_lndecode_returns_copies(self):
+        invoice = lnencode(LnAddr(RHASH, amount=Decimal('0.001'), tags=[('d', 'coffee'), ('x', 60)]), PRIVKEY)
+        addr1 = lndecode(invoice)
+        addr1.tags.clear()
+        addr1.paymenthash = None
+        addr2 = lndecode(invoice)
+        self.assertEqual('coffee', addr2.get_description())
+        self.assertEqual(60, addr2.get_expiry())
+        self.assertEqual(RHASH, addr2.paymenthash)
+        self.assertEqual(PUBKEY, addr2.pubkey.serialize())
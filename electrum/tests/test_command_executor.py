@@ -0,0 +1,216 @@
+import asyncio
+import threading
+import time
+
+from electrum.command_executor import CommandExecutor, CommandTimeout, ReadWriteLock
+from electrum.commands import Command, known_commands
+from electrum.simple_config import SimpleConfig
+
+from . import ElectrumTestCase
+
+
+async def _read(self, wallet=None): pass
+async def _write(self, wallet=None): pass
+async def _heavy(self, wallet=None): pass
+
+READ = Command(_read, 'wr')
+WRITE = Command(_write, 'w')
+HEAVY_READ = Command(_heavy, 'wrh')
+HEAVY_WRITE = Command(_heavy, 'wh')
+
+
+class FakeWallet:
+    pass
+
+
+class TestReadWriteLock(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.get_event_loop()
+
+    def test_readers_share_writers_exclude(self):
+        lock = ReadWriteLock()
+        order = []
+
+        async def user(name, write, duration):
+            await lock.acquire(write=write)
+            order.append(('start', name))
+            await asyncio.sleep(duration)
+            order.append(('end', name))
+            lock.release(write=write)
+
+        async def main():
+            await asyncio.gather(user('r1', False, 0.05), user('r2', False, 0.05),
+                                 user('w', True, 0.01), user('r3', False, 0.01))
+        self.loop.run_until_complete(main())
+        self.assertEqual([('start', 'r1'), ('start', 'r2'), ('end', 'r1'), ('end', 'r2'),
+                          ('start', 'w'), ('end', 'w'), ('start', 'r3'), ('end', 'r3')], order)
+        self.assertFalse(lock.locked())
+
+    def test_cancelled_waiter(self):
+        lock = ReadWriteLock()
+
+        async def main():
+            await lock.acquire(write=True)
+            waiter = asyncio.ensure_future(lock.acquire(write=True))
+            reader = asyncio.ensure_future(lock.acquire(write=False))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            lock.release(write=True)
+            await reader
+        self.loop.run_until_complete(main())
+        self.assertTrue(lock.locked())
+        lock.release(write=False)
+        self.assertFalse(lock.locked())
+
+
+class TestCommandExecutor(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.get_event_loop()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.executor = CommandExecutor(self.config)
+
+    def tearDown(self):
+        self.executor.stop()
+        super().tearDown()
+
+    def test_heavy_command_runs_in_worker(self):
+        wallet = FakeWallet()
+        threads = []
+
+        async def heavy():
+            threads.append(threading.current_thread())
+            time.sleep(0.3)  # blocking
+            return 'heavy'
+
+        async def light():
+            return 'light'
+
+        async def main():
+            t0 = time.monotonic()
+            heavy_fut = asyncio.ensure_future(self.executor.run(HEAVY_READ, wallet, heavy))
+            await asyncio.sleep(0.05)
+            self.assertEqual('light', await self.executor.run(READ, wallet, light))
+            light_latency = time.monotonic() - t0
+            self.assertEqual('heavy', await heavy_fut)
+            return light_latency
+        light_latency = self.loop.run_until_complete(main())
+        self.assertLess(light_latency, 0.2)
+        self.assertNotEqual(threading.main_thread(), threads[0])
+
+    def test_writers_serialized_per_wallet(self):
+        wallet1, wallet2 = FakeWallet(), FakeWallet()
+        running = {wallet1: 0, wallet2: 0}
+        max_running = {wallet1: 0, wallet2: 0}
+
+        def make_command(wallet):
+            async def f():
+                running[wallet] += 1
+                max_running[wallet] = max(max_running[wallet], running[wallet])
+                await asyncio.sleep(0.02)
+                running[wallet] -= 1
+            return f
+
+        async def main():
+            t0 = time.monotonic()
+            await asyncio.gather(*[self.executor.run(WRITE, wallet, make_command(wallet))
+                                   for i in range(5) for wallet in (wallet1, wallet2)])
+            return time.monotonic() - t0
+        duration = self.loop.run_until_complete(main())
+        self.assertEqual({wallet1: 1, wallet2: 1}, max_running)
+        # both wallets progress in parallel
+        self.assertLess(duration, 0.18)
+
+    def test_readers_run_concurrently(self):
+        wallet = FakeWallet()
+
+        async def f():
+            await asyncio.sleep(0.1)
+
+        async def main():
+            t0 = time.monotonic()
+            await asyncio.gather(*[self.executor.run(READ, wallet, f) for i in range(10)])
+            return time.monotonic() - t0
+        self.assertLess(self.loop.run_until_complete(main()), 0.5)
+
+    def test_payments_do_not_block_readers(self):
+        wallet = FakeWallet()
+        for name in ('get_tx_status', 'is_synchronized', 'getbalance', 'list_channels'):
+            self.assertTrue(known_commands[name].is_read_only, name)
+        # payments write, but share the lock with readers
+        for name in ('lnpay', 'lnpay_batch'):
+            self.assertFalse(known_commands[name].is_read_only, name)
+            self.assertTrue(known_commands[name].shares_wallet_lock, name)
+        payment_done = asyncio.Event()
+
+        async def pay():
+            # waiting for the network
+            await payment_done.wait()
+
+        async def read():
+            return 'balance'
+
+        async def main():
+            payment = asyncio.ensure_future(self.executor.run(known_commands['lnpay'], wallet, pay))
+            await asyncio.sleep(0.01)
+            result = await asyncio.wait_for(self.executor.run(known_commands['getbalance'], wallet, read), 0.5)
+            payment_done.set()
+            await payment
+            return result
+        self.assertEqual('balance', self.loop.run_until_complete(main()))
+
+    def test_timeout(self):
+        self.executor.timeout = 0.1
+        wallet = FakeWallet()
+        done = threading.Event()
+
+        async def slow():
+            time.sleep(0.3)
+            done.set()
+
+        async def main():
+            with self.assertRaises(CommandTimeout):
+                await self.executor.run(HEAVY_WRITE, wallet, slow)
+            # the lock is held until the worker is done
+            self.assertTrue(self.executor.get_lock(wallet).locked())
+            self.executor.timeout = None
+            await self.executor.run(WRITE, wallet, self._noop)
+            self.assertTrue(done.is_set())
+        self.loop.run_until_complete(main())
+        self.assertFalse(self.executor.get_lock(wallet).locked())
+
+    def test_cancellation_releases_lock(self):
+        wallet = FakeWallet()
+        cancelled = asyncio.Event()
+
+        async def forever():
+            try:
+                await asyncio.sleep(100)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def main():
+            fut = asyncio.ensure_future(self.executor.run(WRITE, wallet, forever))
+            await asyncio.sleep(0.01)
+            fut.cancel()
+            await cancelled.wait()
+            await asyncio.wait_for(self.executor.run(WRITE, wallet, self._noop), 1)
+        self.loop.run_until_complete(main())
+
+    def test_nested_command(self):
+        wallet = FakeWallet()
+
+        async def inner():
+            return 'inner'
+
+        async def outer():
+            return await self.executor.run(WRITE, wallet, inner)
+        self.assertEqual('inner', self.loop.run_until_complete(self.executor.run(WRITE, wallet, outer)))
+
+    @staticmethod
+    async def _noop():
+        pass
@@ -1,12 +1,17 @@
+import asyncio
+import concurrent.futures
 import unittest
+import tracemalloc
 from unittest import mock
 from decimal import Decimal
 
-from electrum.util import create_and_start_event_loop
+from electrum.util import create_and_start_event_loop, TxMinedInfo, InvalidPageCursor
 from electrum.commands import Commands, eval_bool
-from electrum import storage, wallet
+from electrum import storage, wallet, bitcoin, ecc
+from electrum.address_synchronizer import HistoryItem
 from electrum.wallet import restore_wallet_from_text
 from electrum.simple_config import SimpleConfig
+from electrum.transaction import tx_from_any
 
 from . import TestCaseForTestnet, ElectrumTestCase
 
@@ -127,6 +132,148 @@ class TestCommands(ElectrumTestCase):
         self.assertEqual(['p2wpkh:L15oxP24NMNAXxq5r2aom24pHPtt3Fet8ZutgL155Bad93GSubM2', 'p2wpkh:L4rYY5QpfN6wJEF4SEKDpcGhTPnCe9zcGs6hiSnhpprZqVywFifN'],
                          cmds._run('getprivatekeys', (['bc1q3g5tmkmlvxryhh843v4dz026avatc0zzr6h3af', 'bc1q9pzjpjq4nqx5ycnywekcmycqz0wjp2nq604y2n'], ), wallet=wallet))
 
+    def _imported_p2pkh_wallet(self, num_keys):
+        privkeys = [bitcoin.serialize_privkey(i.to_bytes(32, 'big'), True, 'p2pkh') for i in range(1, num_keys + 1)]
+        return restore_wallet_from_text(' '.join(privkeys),
+                                        path='if_this_exists_mocking_failed_648151893',
+                                        config=self.config)['wallet']
+
+    @staticmethod
+    def _synthetic_history(n):
+        history = []
+        balance = 0
+        for i in range(n):
+            delta = 100_000 if i % 3 else -20_000
+            balance += delta
+            history.append(HistoryItem(txid='%064x' % i,
+                                       tx_mined_status=TxMinedInfo(height=1000 + i, conf=n - i, timestamp=1_500_000_000 + 600 * i, txpos=0),
+                                       delta=delta, fee=None, balance=balance))
+        return history
+
+    def _fetch_all(self, cmds, command, key, wallet, **kwargs):
+        items, pages, cursor = [], 0, None
+        while True:
+            page = cmds._run(command, (), wallet=wallet, cursor=cursor, **kwargs)
+            items += page[key]
+            pages += 1
+            cursor = page['next_cursor']
+            if cursor is None:
+                return items, pages
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_onchain_history_pages(self, mock_save_db):
+        w = self._imported_p2pkh_wallet(1)
+        history = self._synthetic_history(250)
+        w.get_history = lambda *args, **kwargs: history
+        cmds = Commands(config=self.config)
+        items, pages = self._fetch_all(cmds, 'onchain_history', 'transactions', w, limit=100)
+        self.assertEqual(3, pages)
+        self.assertEqual([h.txid for h in history], [item['txid'] for item in items])
+        # filters apply before the limit
+        items, pages = self._fetch_all(cmds, 'onchain_history', 'transactions', w, limit=40,
+                                       min_amount='0.0005', from_height=1100)
+        self.assertEqual(3, pages)
+        self.assertEqual([h.txid for h in history if h.delta > 0 and h.tx_mined_status.height >= 1100],
+                         [item['txid'] for item in items])
+        # a cursor only continues the query it was issued for
+        page = cmds._run('onchain_history', (), wallet=w, limit=100)
+        with self.assertRaises(InvalidPageCursor):
+            cmds._run('onchain_history', (), wallet=w, limit=100, min_amount='1', cursor=page['next_cursor'])
+        # and only as long as the history does not change
+        w._bump_history_version(txid=history[0].txid)
+        with self.assertRaises(InvalidPageCursor):
+            cmds._run('onchain_history', (), wallet=w, limit=100, cursor=page['next_cursor'])
+        # without limit, cursor or new filters, the full history is returned
+        self.assertEqual(250, len(cmds._run('onchain_history', (), wallet=w)['transactions']))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_onchain_history_pages_follow_new_blocks(self, mock_save_db):
+        w = self._imported_p2pkh_wallet(1)
+        local_height = 1249
+        history = self._synthetic_history(250)
+        w.get_local_height = lambda: local_height
+        w.get_history = lambda *args, **kwargs: [
+            h._replace(tx_mined_status=h.tx_mined_status._replace(conf=local_height - h.tx_mined_status.height + 1))
+            for h in history]
+        cmds = Commands(config=self.config)
+        page = cmds._run('onchain_history', (), wallet=w, limit=100)
+        self.assertEqual(250, page['transactions'][0]['confirmations'])
+        local_height += 1
+        # the history version is the same: the cursor is still valid, with fresh confirmations
+        page = cmds._run('onchain_history', (), wallet=w, limit=100, cursor=page['next_cursor'])
+        self.assertEqual(151, page['transactions'][0]['confirmations'])
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_onchain_history_page_memory(self, mock_save_db):
+        w = self._imported_p2pkh_wallet(1)
+        cmds = Commands(config=self.config)
+
+        def page_peak_memory(history):
+            w.get_history = lambda *args, **kwargs: history
+            w._bump_history_version(unknown_changes=True)
+            first = cmds._run('onchain_history', (), wallet=w, limit=100)
+            tracemalloc.start()
+            try:
+                page = cmds._run('onchain_history', (), wallet=w, limit=100, cursor=first['next_cursor'])
+                return tracemalloc.get_traced_memory()[1], page
+            finally:
+                tracemalloc.stop()
+        small_peak, page = page_peak_memory(self._synthetic_history(1_000))
+        self.assertEqual(100, len(page['transactions']))
+        large_peak, page = page_peak_memory(self._synthetic_history(50_000))
+        self.assertEqual(100, len(page['transactions']))
+        # the cost of a page does not depend on the size of the history
+        self.assertLess(large_peak, 2 * small_peak)
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_onchain_history_pages_keep_a_window(self, mock_save_db):
+        w = self._imported_p2pkh_wallet(1)
+        history = self._synthetic_history(2_500)
+        w.get_history = mock.Mock(return_value=history)
+        cmds = Commands(config=self.config)
+        items, pages = self._fetch_all(cmds, 'onchain_history', 'transactions', w, limit=100)
+        self.assertEqual(25, pages)
+        self.assertEqual([h.txid for h in history], [item['txid'] for item in items])
+        # the history is built once per window, and only the last window is kept
+        self.assertEqual(3, w.get_history.call_count)
+        self.assertEqual(500, len(w._history_window[3]))
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_listaddresses_pages(self, mock_save_db):
+        w = self._imported_p2pkh_wallet(5)
+        cmds = Commands(config=self.config)
+        addresses, pages = self._fetch_all(cmds, 'listaddresses', 'addresses', w, limit=2)
+        self.assertEqual(3, pages)
+        self.assertEqual(cmds._run('listaddresses', (), wallet=w), addresses)
+        page = cmds._run('listaddresses', (), wallet=w, limit=2)
+        w.delete_address(addresses[0])
+        with self.assertRaises(InvalidPageCursor):
+            cmds._run('listaddresses', (), wallet=w, limit=2, cursor=page['next_cursor'])
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    def test_list_requests_pages(self, mock_save_db):
+        w = self._imported_p2pkh_wallet(5)
+        cmds = Commands(config=self.config)
+        for i, addr in enumerate(w.get_addresses()):
+            req = w.make_payment_request(addr, 10_000 * (i + 1), 'request %d' % i, 3600)
+            req['time'] = 1_600_000_000 + 10 * (5 - i)
+            w.add_payment_request(req)
+        requests, pages = self._fetch_all(cmds, 'list_requests', 'requests', w, limit=2)
+        self.assertEqual(3, pages)
+        self.assertEqual(cmds._run('list_requests', (), wallet=w), requests)
+        # the cursor is a position in the list: it survives changes to the requests
+        page = cmds._run('list_requests', (), wallet=w, limit=2, min_amount='0.0002')
+        self.assertEqual([50_000, 40_000], [r['amount'] for r in page['requests']])
+        w.delete_request(w.get_addresses()[4])
+        page = cmds._run('list_requests', (), wallet=w, limit=2, min_amount='0.0002', cursor=page['next_cursor'])
+        self.assertEqual([30_000, 20_000], [r['amount'] for r in page['requests']])
+        self.assertIsNone(page['next_cursor'])
+        # a page has at least one item, or following the cursor would never end
+        for command in ('list_requests', 'listaddresses', 'onchain_history'):
+            with self.assertRaises(Exception):
+                cmds._run(command, (), wallet=w, limit=-1)
+        self.assertEqual(([], None), w.get_requests_page(limit=0))
+
 
 class TestCommandsTestnet(TestCaseForTestnet):
 
@@ -180,3 +327,49 @@ class TestCommandsTestnet(TestCaseForTestnet):
         }
         self.assertEqual("0200000000010139c5375fe9da7bd377c1783002b129f8c57d3e724d62f5eacb9739ca691a229d0100000000feffffff01301b0f0000000000160014ac0e2d229200bffb2167ed6fd196aef9d687d8bb0247304402206367fb2ddd723985f5f51e0f2435084c0a66f5c26f4403a75d3dd417b71a20450220545dc3637bcb49beedbbdf5063e05cad63be91af4f839886451c30ecd6edf1d20121021f110909ded653828a254515b58498a6bafc96799fb0851554463ed44ca7d9da00000000",
                          cmds._run('serialize', (jsontx,)))
+
+    def test_sweep_batch(self):
+
+        class FakeNetwork:
+            relay_fee = 1000
+            def __init__(self):
+                self.utxos = {}
+            def run_from_another_thread(self, coro):
+                # the command itself runs on the event loop of the test
+                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                    return executor.submit(asyncio.run, coro).result()
+            async def listunspent_for_scripthash(self, scripthash):
+                return self.utxos.get(scripthash, [])
+            def blockchain(self):
+                return mock.Mock(header_at_tip=lambda: None)
+
+        network = FakeNetwork()
+        privkeys = []
+        for i in range(1, 26):
+            secret = i.to_bytes(32, 'big')
+            privkeys.append(bitcoin.serialize_privkey(secret, True, 'p2wpkh'))
+            pubkey = ecc.ECPrivkey(secret).get_public_key_hex(compressed=True)
+            scripthash = bitcoin.address_to_scripthash(bitcoin.pubkey_to_address('p2wpkh', pubkey))
+            network.utxos[scripthash] = [{'tx_hash': bitcoin.sha256(bytes([i])).hex(),
+                                          'tx_pos': 0, 'height': 1000, 'value': 100000}]
+        privkey = ' '.join(privkeys)
+        dest_addr = bitcoin.pubkey_to_address('p2wpkh', ecc.ECPrivkey(b'\x01' * 32).get_public_key_hex())
+        cmds = Commands(config=self.config, network=network)
+        raw_txs = cmds._run('sweep', (privkey, dest_addr), imax=10, feerate='2', batch=True)
+        txs = [tx_from_any(raw_tx) for raw_tx in raw_txs]
+        self.assertEqual([10, 10, 5], [len(tx.inputs()) for tx in txs])
+        for tx in txs:
+            self.assertTrue(tx.is_complete())
+            self.assertEqual([dest_addr], [o.address for o in tx.outputs()])
+            fee = 100000 * len(tx.inputs()) - sum(o.value for o in tx.outputs())
+            self.assertAlmostEqual(2, fee / tx.estimated_size(), delta=0.1)
+        # all coins fit in one transaction by default
+        raw_txs = cmds._run('sweep', (privkey, dest_addr), feerate='2', batch=True)
+        self.assertEqual([25], [len(tx_from_any(raw_tx).inputs()) for raw_tx in raw_txs])
+        # without batch, one transaction of at most imax inputs
+        raw_tx = cmds._run('sweep', (privkey, dest_addr), imax=10, fee='0.0001')
+        self.assertEqual(10, len(tx_from_any(raw_tx).inputs()))
+        with self.assertRaises(Exception):
+            cmds._run('sweep', (privkey, dest_addr), fee='0.0001', batch=True)
+        with self.assertRaises(Exception):
+            cmds._run('sweep', (privkey, dest_addr), feerate='2')
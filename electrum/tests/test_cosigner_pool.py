@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+from electrum.plugins.cosigner_pool.cosigner_pool import CosignerPoolClient, Listener
+from electrum.util import create_and_start_event_loop
+
+from . import ElectrumTestCase
+from .cosigner_pool_server import CosignerPoolServer
+
+
+class TestCosignerPool(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.asyncio_loop, self._stop_loop, self._loop_thread = create_and_start_event_loop()
+        self.received = []
+        self.server = None
+        self.sender = None
+        self.listener = None
+
+    def tearDown(self):
+        if self.listener:
+            self.listener.stop()
+        if self.sender:
+            self.run_coro(self.sender.close())
+        if self.server:
+            self.run_coro(self.server.stop())
+        self.asyncio_loop.call_soon_threadsafe(self._stop_loop.set_result, 1)
+        self._loop_thread.join(timeout=1)
+        super().tearDown()
+
+    def run_coro(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.asyncio_loop).result(timeout=10)
+
+    def start(self, keyhashes, *, long_poll=True):
+        self.server = CosignerPoolServer(long_poll=long_poll)
+        url = self.run_coro(self.server.start())
+        self.sender = CosignerPoolClient(url)
+        self.listener = Listener(CosignerPoolClient(url), lambda *args: self.received.append(args))
+        self.listener.POLL_INTERVAL = 0.2
+        self.listener.set_keyhashes(keyhashes)
+        self.listener.start(self.asyncio_loop)
+
+    def put(self, keyhash, message):
+        self.run_coro(self.sender.put(keyhash, message))
+
+    def wait_received(self, num, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.received) < num and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.received
+
+    def test_messages_are_pushed(self):
+        self.start(['a', 'b'])
+        self.run_coro(asyncio.sleep(0.1))
+        t0 = time.monotonic()
+        self.put('b', 'tx for b')
+        self.assertEqual([('b', 'tx for b')], self.wait_received(1))
+        self.assertLess(time.monotonic() - t0, 1)
+        # one request held for both keyhashes, the put, and one for 'a' only
+        self.run_coro(asyncio.sleep(0.1))
+        self.assertEqual(3, self.server.num_requests)
+        self.assertTrue(self.listener.client.can_long_poll)
+        # nothing more while idle
+        self.run_coro(asyncio.sleep(0.5))
+        self.assertEqual(3, self.server.num_requests)
+        self.put('a', 'tx for a')
+        self.assertEqual([('b', 'tx for b'), ('a', 'tx for a')], self.wait_received(2))
+
+    def test_cleared_keyhash_is_listened_to_again(self):
+        self.start(['a'])
+        self.put('a', 'first')
+        self.wait_received(1)
+        self.listener.clear('a')
+        self.run_coro(asyncio.sleep(0.1))
+        self.assertEqual({}, self.server.messages)
+        self.put('a', 'second')
+        self.assertEqual([('a', 'first'), ('a', 'second')], self.wait_received(2))
+
+    def test_new_keyhashes_interrupt_the_request(self):
+        self.start(['a'])
+        self.run_coro(asyncio.sleep(0.1))
+        self.listener.set_keyhashes(['a', 'c'])
+        self.run_coro(asyncio.sleep(0.1))
+        self.put('c', 'tx for c')
+        self.assertEqual([('c', 'tx for c')], self.wait_received(1))
+
+    def test_polls_servers_without_long_poll(self):
+        self.start(['a', 'b'], long_poll=False)
+        self.put('a', 'tx for a')
+        self.assertEqual([('a', 'tx for a')], self.wait_received(1))
+        self.assertFalse(self.listener.client.can_long_poll)
+        self.put('b', 'tx for b')
+        self.assertEqual([('a', 'tx for a'), ('b', 'tx for b')], self.wait_received(2))
+
+    def test_backoff(self):
+        client = CosignerPoolClient()
+        for backoff in (1, 2, 4, 8):
+            client.on_error()
+            self.assertEqual(backoff, client.backoff)
+        for i in range(10):
+            client.on_error()
+        self.assertEqual(client.MAX_BACKOFF, client.backoff)
+        client.on_success()
+        self.assertEqual(0, client.backoff)
+
+    def test_backoff_then_reconnect(self):
+        self.server = CosignerPoolServer()
+        url = self.run_coro(self.server.start())
+        self.run_coro(self.server.stop())
+        client = CosignerPoolClient(url)
+        client.MIN_BACKOFF = 0.1
+        self.listener = Listener(client, lambda *args: self.received.append(args))
+        self.listener.set_keyhashes(['a'])
+        self.listener.start(self.asyncio_loop)
+        self.run_coro(asyncio.sleep(0.2))
+        self.assertGreater(client.backoff, 0)
+        port = int(url.rsplit(':', 1)[1].strip('/'))
+        self.server = CosignerPoolServer()
+        self.run_coro(self.server.start(port=port))
+        self.server.messages['a'] = 'tx for a'
+        self.assertEqual([('a', 'tx for a')], self.wait_received(1))
+        self.assertEqual(0, client.backoff)
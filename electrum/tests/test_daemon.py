@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import defaultdict
+
+from electrum.daemon import RequestStatusIndex
+from electrum.util import PR_PAID, PR_UNPAID, PR_EXPIRED, PR_TYPE_ONCHAIN
+
+from . import ElectrumTestCase
+
+
+class FakeNetwork:
+
+    def __init__(self, loop):
+        self.asyncio_loop = loop
+        self.callbacks = defaultdict(list)
+
+    def register_callback(self, callback, events):
+        for event in events:
+            self.callbacks[event].append(callback)
+
+    def unregister_callback(self, callback):
+        for callbacks in self.callbacks.values():
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def trigger_callback(self, event, *args):
+        for callback in self.callbacks[event]:
+            self.asyncio_loop.call_soon_threadsafe(callback, event, *args)
+
+
+class FakeWallet:
+
+    def __init__(self):
+        self.requests = {}
+        self.get_request_calls = 0
+
+    def add_request(self, key, exp):
+        self.requests[key] = {'type': PR_TYPE_ONCHAIN, 'status': PR_UNPAID,
+                              'time': int(time.time()), 'exp': exp}
+
+    def get_request(self, key):
+        self.get_request_calls += 1
+        return self.requests.get(key)
+
+
+class TestRequestStatusIndex(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.get_event_loop()
+        self.network = FakeNetwork(self.loop)
+        self.wallet = FakeWallet()
+        self.index = RequestStatusIndex(self.wallet, self.network)
+
+    def tearDown(self):
+        self.index.close()
+        super().tearDown()
+
+    def test_unknown_request(self):
+        self.assertIsNone(self.index.get_status('nope'))
+
+    def test_payment_fans_out_to_all_waiters(self):
+        self.wallet.add_request('addr1', exp=0)
+        self.wallet.add_request('addr2', exp=0)
+        self.assertEqual(PR_UNPAID, self.index.get_status('addr1'))
+        self.assertEqual(PR_UNPAID, self.index.get_status('addr2'))
+        waiters = [self.index.add_waiter('addr1') for i in range(3)]
+        other = self.index.add_waiter('addr2')
+        self.network.trigger_callback('payment_received', self.wallet, 'addr1', PR_PAID)
+        self.loop.run_until_complete(asyncio.wait(waiters))
+        self.assertEqual([PR_PAID] * 3, [w.result() for w in waiters])
+        self.assertFalse(other.done())
+        # status is served from the index from now on
+        calls = self.wallet.get_request_calls
+        self.assertEqual(PR_PAID, self.index.get_status('addr1'))
+        self.assertEqual(calls, self.wallet.get_request_calls)
+        # events for other wallets are ignored
+        self.network.trigger_callback('payment_received', FakeWallet(), 'addr2', PR_PAID)
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertFalse(other.done())
+
+    def test_lightning_request_status(self):
+        self.wallet.add_request('ab' * 32, exp=0)
+        self.assertEqual(PR_UNPAID, self.index.get_status('ab' * 32))
+        waiter = self.index.add_waiter('ab' * 32)
+        self.network.trigger_callback('request_status', 'ab' * 32, PR_PAID)
+        self.assertEqual(PR_PAID, self.loop.run_until_complete(waiter))
+
+    def test_expiry(self):
+        self.wallet.add_request('late', exp=3600)
+        self.wallet.add_request('soon', exp=1)
+        self.wallet.requests['soon']['time'] = time.time() - 0.8
+        self.assertEqual(PR_UNPAID, self.index.get_status('late'))
+        self.assertEqual(PR_UNPAID, self.index.get_status('soon'))
+        waiter = self.index.add_waiter('soon')
+        late_waiter = self.index.add_waiter('late')
+        self.assertEqual(PR_EXPIRED, self.loop.run_until_complete(asyncio.wait_for(waiter, 2)))
+        self.assertEqual(PR_EXPIRED, self.index.get_status('soon'))
+        self.assertFalse(late_waiter.done())
+        # a single timer stays armed, for the next expiry
+        self.assertEqual([(self.wallet.requests['late']['time'] + 3600, 'late')], self.index.expiry_heap)
+        self.assertIsNotNone(self.index._timer)
+
+    def test_paid_request_does_not_expire(self):
+        self.wallet.add_request('addr', exp=1)
+        self.wallet.requests['addr']['time'] = time.time() - 0.9
+        self.assertEqual(PR_UNPAID, self.index.get_status('addr'))
+        self.network.trigger_callback('payment_received', self.wallet, 'addr', PR_PAID)
+        self.loop.run_until_complete(asyncio.sleep(0.2))
+        self.assertEqual(PR_PAID, self.index.get_status('addr'))
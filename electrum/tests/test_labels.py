@@ -0,0 +1,188 @@
+import asyncio
+
+from aiohttp import web
+
+from electrum.plugins.labels.labels import LabelsPlugin
+from electrum.simple_config import SimpleConfig
+from electrum.util import create_and_start_event_loop
+from electrum.wallet_db import WalletDB
+
+from . import ElectrumTestCase
+
+
+class FakePlugins:
+
+    def close_plugin(self, plugin):
+        pass
+
+
+class Plugin(LabelsPlugin):
+
+    def on_pulled(self, wallet):
+        pass
+
+
+class FakeNetwork:
+
+    def __init__(self, loop):
+        self.asyncio_loop = loop
+
+
+class FakeWallet:
+
+    def __init__(self, plugin, loop):
+        self.plugin = plugin
+        self.db = WalletDB('', manual_upgrades=False)
+        self.labels = {}
+        self.network = FakeNetwork(loop)
+
+    def basename(self):
+        return 'fake_wallet'
+
+    def get_fingerprint(self):
+        return 'c0ffee'
+
+    def set_label(self, name, text):
+        if text:
+            self.labels[name] = text
+        else:
+            self.labels.pop(name, None)
+        self.plugin.set_label(self, name, text)
+
+
+class StubLabelServer:
+    """Accepts label posts over plain http and remembers them."""
+
+    def __init__(self):
+        self.posts = []
+        self.peers = set()
+        self.labels = {}  # externalId -> encryptedLabel
+        self.nonce = 0
+        self.num_failures = 0  # posts to refuse
+
+    async def post_labels(self, request):
+        self.peers.add(request.transport.get_extra_info('peername'))
+        if self.num_failures:
+            self.num_failures -= 1
+            raise web.HTTPServiceUnavailable()
+        data = await request.json()
+        self.posts.append(data)
+        for label in data['labels']:
+            self.labels[label['externalId']] = label['encryptedLabel']
+        self.nonce = data['walletNonce']
+        return web.json_response({})
+
+    async def get_labels(self, request):
+        self.peers.add(request.transport.get_extra_info('peername'))
+        labels = [{'externalId': k, 'encryptedLabel': v} for k, v in self.labels.items()]
+        return web.json_response({'labels': labels, 'nonce': self.nonce})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/labels', self.post_labels)
+        app.router.add_get('/labels/since/{nonce}/for/{wallet_id}', self.get_labels)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        return f'http://{host}:{port}'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class TestLabelsPlugin(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.asyncio_loop, self._stop_loop, self._loop_thread = create_and_start_event_loop()
+        config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.plugin = Plugin(FakePlugins(), config, 'labels')
+        self.plugin.PUSH_DELAY = 0.05
+        self.plugin.RETRY_DELAY = 0.2
+        self.server = StubLabelServer()
+        self.plugin.target_url = self.run_coro(self.server.start())
+        self.wallet = FakeWallet(self.plugin, self.asyncio_loop)
+
+    def tearDown(self):
+        fut = self.plugin.close_session()
+        if fut:
+            fut.result(timeout=10)
+        self.plugin.close()
+        self.run_coro(self.server.stop())
+        self.asyncio_loop.call_soon_threadsafe(self._stop_loop.set_result, 1)
+        self._loop_thread.join(timeout=1)
+        super().tearDown()
+
+    def run_coro(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.asyncio_loop).result(timeout=10)
+
+    def start_wallet(self):
+        self.plugin.start_wallet(self.wallet)
+        # wait for the initial pull
+        self.run_coro(asyncio.sleep(0.1))
+
+    def test_label_changes_are_batched(self):
+        self.start_wallet()
+        for i in range(50):
+            self.wallet.set_label(f'item{i}', f'label{i}')
+        self.wallet.set_label('item0', 'relabeled')
+        self.run_coro(asyncio.sleep(0.3))
+        self.assertEqual(1, len(self.server.posts))
+        self.assertEqual(50, len(self.server.posts[0]['labels']))
+        # the initial pull and the post share one connection
+        self.assertEqual(1, len(self.server.peers))
+        # nothing left to push
+        self.run_coro(self.plugin.push_thread(self.wallet))
+        self.assertEqual(1, len(self.server.posts))
+        self.assertEqual({}, self.plugin.get_unpushed_labels(self.wallet))
+
+    def test_push_sends_deltas(self):
+        self.wallet.labels.update({f'item{i}': f'label{i}' for i in range(10)})
+        self.start_wallet()
+        self.run_coro(self.plugin.push_thread(self.wallet))
+        self.assertEqual(10, len(self.server.posts[-1]['labels']))
+        nonce = self.server.posts[-1]['walletNonce']
+        # change one label, delete another, behind the plugin's back
+        self.wallet.labels['item3'] = 'changed'
+        del self.wallet.labels['item4']
+        self.run_coro(self.plugin.push_thread(self.wallet))
+        self.assertEqual(2, len(self.server.posts))
+        labels = {self.plugin.decode(self.wallet, label['externalId']):
+                  self.plugin.decode(self.wallet, label['encryptedLabel'])
+                  for label in self.server.posts[-1]['labels']}
+        self.assertEqual({'item3': 'changed', 'item4': ''}, labels)
+        self.assertEqual(nonce + 1, self.server.posts[-1]['walletNonce'])
+
+    def test_pushed_record_persists_and_pulled_labels_count_as_pushed(self):
+        self.wallet.labels['item'] = 'label'
+        self.start_wallet()
+        self.run_coro(self.plugin.push_thread(self.wallet))
+        self.plugin.stop_wallet(self.wallet)
+        self.run_coro(asyncio.sleep(0.1))
+        # a wallet restored elsewhere pulls the labels, and has nothing to push
+        other_wallet = FakeWallet(self.plugin, self.asyncio_loop)
+        self.plugin.start_wallet(other_wallet)
+        self.run_coro(self.plugin.pull_thread(other_wallet, force=True))
+        self.assertEqual({'item': 'label'}, other_wallet.labels)
+        self.assertEqual({}, self.plugin.get_unpushed_labels(other_wallet))
+        # the record is stored in the wallet file
+        self.plugin.start_wallet(self.wallet)
+        self.assertEqual({}, self.plugin.get_unpushed_labels(self.wallet))
+
+    def test_failed_push_is_retried(self):
+        self.start_wallet()
+        self.server.num_failures = 1
+        self.wallet.set_label('item1', 'label1')
+        self.wallet.set_label('item2', 'label2')
+        self.run_coro(asyncio.sleep(0.15))
+        self.assertEqual([], self.server.posts)
+        # changed again before the retry: the new value is pushed
+        self.wallet.set_label('item2', 'relabeled')
+        self.run_coro(asyncio.sleep(0.4))
+        labels = {self.plugin.decode(self.wallet, label['externalId']):
+                  self.plugin.decode(self.wallet, label['encryptedLabel'])
+                  for post in self.server.posts for label in post['labels']}
+        self.assertEqual({'item1': 'label1', 'item2': 'relabeled'}, labels)
+        self.assertEqual({}, self.plugin.get_unpushed_labels(self.wallet))
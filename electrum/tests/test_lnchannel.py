@@ -601,6 +601,32 @@ class TestChannel(ElectrumTestCase):
             self.alice_channel.add_htlc(new)
         self.assertIn('Not enough local balance', cm.exception.args[0])
 
+    def test_commitment_cache(self):
+        alice_channel, bob_channel = self.alice_channel, self.bob_channel
+        ctx = alice_channel.get_next_commitment(REMOTE)
+        self.assertIs(ctx, alice_channel.get_next_commitment(REMOTE))
+        # a new htlc changes the next ctx
+        self.htlc_dict['payment_hash'] = bitcoin.sha256(32 * b'\x02')
+        alice_channel.add_htlc(self.htlc_dict)
+        bob_channel.receive_htlc(self.htlc_dict)
+        new_ctx = alice_channel.get_next_commitment(REMOTE)
+        self.assertIsNot(ctx, new_ctx)
+        self.assertEqual(len(ctx.outputs()) + 1, len(new_ctx.outputs()))
+        # signing does not modify the shared ctx
+        sig, htlc_sigs = alice_channel.sign_next_commitment()
+        self.assertEqual(2, len(htlc_sigs))
+        self.assertEqual({}, new_ctx.inputs()[0].part_sigs)
+        # a bad htlc signature is rejected
+        bad_htlc_sigs = [htlc_sigs[0], bytes(64)]
+        with self.assertRaises(Exception) as cm:
+            bob_channel.receive_new_commitment(sig, bad_htlc_sigs)
+        self.assertIn('failed verifying HTLC signatures', cm.exception.args[0])
+        bob_channel.receive_new_commitment(sig, htlc_sigs)
+        bob_revocation, _ = bob_channel.revoke_current_commitment()
+        alice_channel.receive_revocation(bob_revocation)
+        self.assertTrue(bob_channel.force_close_tx().is_complete())
+        self.assertFalse(bob_channel.get_latest_commitment(LOCAL).is_complete())
+
 
 class TestAvailableToSpend(ElectrumTestCase):
     def test_DesyncHTLCs(self):
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+from decimal import Decimal
+
+from electrum.channel_db import ChannelInfo, Policy
+from electrum.lnaddr import LnAddr, lnencode, lndecode
+from electrum.lnchannel import channel_states, peer_states
+from electrum.lnhints import InboundCapacityIndex, NUM_ROUTING_HINTS
+from electrum.lnutil import REMOTE, ShortChannelID
+from electrum.lnworker import LNWallet
+from electrum.logging import Logger
+
+from . import ElectrumTestCase
+
+
+PRIVKEY = bytes.fromhex('e126f68f7eafcc8b74f54d269fe206be715000f94dac067d1c04a8ca3b2db734')
+
+
+class FakeChannel:
+
+    def __init__(self, i, inbound_msat):
+        self.channel_id = bytes([i]) * 32
+        self.short_channel_id = ShortChannelID.from_components(600000, i, 0)
+        self.node_id = b'\x02' + bytes([i]) * 32
+        self.inbound_msat = inbound_msat
+        self.state = channel_states.OPEN
+        self.peer_state = peer_states.GOOD
+        self.num_balance_calls = 0
+
+    def get_state(self):
+        return self.state
+
+    def available_to_spend(self, subject):
+        assert subject == REMOTE
+        self.num_balance_calls += 1
+        return self.inbound_msat
+
+
+class FakeChannelDB:
+
+    def __init__(self):
+        self.policies = {}
+
+    def get_channel_info(self, short_channel_id):
+        return ChannelInfo(short_channel_id, b'', b'', 0)
+
+    def get_policy_for_node(self, short_channel_id, node_id):
+        return self.policies.get((short_channel_id, node_id))
+
+
+class FakeLNWallet(Logger):
+
+    def __init__(self, channels):
+        Logger.__init__(self)
+        self.lock = threading.RLock()
+        self.channels = {chan.channel_id: chan for chan in channels}
+        self.channel_db = FakeChannelDB()
+        self.inbound_capacity = InboundCapacityIndex(self)
+
+    _calc_routing_hints_for_invoice = LNWallet._calc_routing_hints_for_invoice
+
+    def routing_hints(self, amount_sat):
+        coro = self._calc_routing_hints_for_invoice(amount_sat)
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class TestInboundCapacityIndex(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.channels = [FakeChannel(i, i * 100_000_000) for i in range(1, 11)]
+        self.lnworker = FakeLNWallet(self.channels)
+
+    def hint_channels(self, amount_sat):
+        return [hint[1][0][1] for hint in self.lnworker.routing_hints(amount_sat)]
+
+    def test_selects_largest_inbound(self):
+        self.assertEqual(NUM_ROUTING_HINTS, 3)
+        self.assertEqual([self.channels[i].short_channel_id for i in (9, 8, 7)], self.hint_channels(None))
+        # a single channel must be able to receive the whole amount
+        self.assertEqual([self.channels[9].short_channel_id], self.hint_channels(1_000_000))
+        self.assertEqual([], self.hint_channels(1_000_001))
+
+    def test_prefers_connected_peers_and_open_channels(self):
+        self.channels[9].peer_state = peer_states.DISCONNECTED
+        self.channels[8].state = channel_states.CLOSING
+        self.lnworker.inbound_capacity.update_channel(self.channels[8])
+        self.assertEqual([self.channels[i].short_channel_id for i in (7, 6, 5)], self.hint_channels(None))
+        # better than no hint at all
+        self.assertEqual([self.channels[9].short_channel_id], self.hint_channels(950_000))
+
+    def test_only_changed_channels_are_looked_at_again(self):
+        self.hint_channels(None)
+        self.assertEqual([1] * 10, [chan.num_balance_calls for chan in self.channels])
+        self.hint_channels(None)
+        self.assertEqual([1] * 10, [chan.num_balance_calls for chan in self.channels])
+        self.channels[0].inbound_msat = 2_000_000_000
+        self.lnworker.inbound_capacity.update_channel(self.channels[0])
+        self.assertEqual(self.channels[0].short_channel_id, self.hint_channels(None)[0])
+        self.assertEqual([2] + [1] * 9, [chan.num_balance_calls for chan in self.channels])
+        del self.lnworker.channels[self.channels[0].channel_id]
+        self.lnworker.inbound_capacity.remove_channel(self.channels[0].channel_id)
+        self.assertEqual([self.channels[i].short_channel_id for i in (9, 8, 7)], self.hint_channels(None))
+
+    def test_hints_roundtrip(self):
+        chan = self.channels[9]
+        policy = Policy(key=b'', cltv_expiry_delta=40, htlc_minimum_msat=1, htlc_maximum_msat=None,
+                        fee_base_msat=1000, fee_proportional_millionths=100,
+                        channel_flags=0, message_flags=0, timestamp=0)
+        self.lnworker.channel_db.policies[(chan.short_channel_id, chan.node_id)] = policy
+        hints = self.lnworker.routing_hints(850_000)
+        self.assertEqual(2, len(hints))
+        self.assertEqual(('r', [(chan.node_id, chan.short_channel_id, 1000, 100, 40)]), hints[0])
+        # without a channel update, the hint is filled with default values
+        self.assertEqual((self.channels[8].short_channel_id, 0, 0, 1), hints[1][1][0][1:])
+        lnaddr = LnAddr(b'\x01' * 32, amount=Decimal('0.005'), tags=[('d', 'coffee')] + hints)
+        decoded = lndecode(lnencode(lnaddr, PRIVKEY))
+        self.assertEqual([hint[1] for hint in hints], [route for k, route in decoded.tags if k == 'r'])
@@ -0,0 +1,184 @@
+import threading
+
+from electrum.lnchannel import Channel
+from electrum.lnhints import InboundCapacityIndex
+from electrum.lnledger import PaymentLedger
+from electrum.lnutil import LOCAL, REMOTE, SENT, UpdateAddHtlc, UnknownPaymentHash
+from electrum.lnworker import LNWallet, PaymentInfo
+
+from . import ElectrumTestCase
+
+
+class FakeHTLCManager:
+
+    def __init__(self):
+        self.log = {LOCAL: {'adds': {}, 'settles': {}, 'fails': {}},
+                    REMOTE: {'adds': {}, 'settles': {}, 'fails': {}}}
+
+
+class FakeChannel:
+
+    def __init__(self, lnworker, channel_id, initial_msat):
+        self.lnworker = lnworker
+        self.channel_id = channel_id
+        self.hm = FakeHTLCManager()
+        self.initial_msat = initial_msat
+        self.closed = False
+
+    get_htlc_status = Channel.get_htlc_status
+    get_payments = Channel.get_payments
+    _htlc_updated = Channel._htlc_updated
+
+    def add(self, subject, payment_hash, amount_msat, timestamp):
+        log = self.hm.log[subject]
+        htlc = UpdateAddHtlc(amount_msat, payment_hash, 500, len(log['adds']), timestamp)
+        log['adds'][htlc.htlc_id] = htlc
+        self._htlc_updated(subject, htlc.htlc_id)
+        return htlc.htlc_id
+
+    def settle(self, subject, htlc_id):
+        self.hm.log[subject]['settles'][htlc_id] = {}
+        self._htlc_updated(subject, htlc_id)
+
+    def fail(self, subject, htlc_id):
+        self.hm.log[subject]['fails'][htlc_id] = {}
+        self._htlc_updated(subject, htlc_id)
+
+    def balance(self, whose, *, ctn=None):
+        return self.initial_msat
+
+    def balance_minus_outgoing_htlcs(self, whose):
+        return self.initial_msat
+
+    def is_closed(self):
+        return self.closed
+
+
+class FakeWallet:
+
+    def __init__(self):
+        self.labels = {}
+
+    def get_label(self, key):
+        return self.labels.get(key, '')
+
+
+class FakeLNWallet:
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.channels = {}
+        self.channel_timestamps = {}
+        self.payment_info = {}
+        self.wallet = FakeWallet()
+        self.ledger = PaymentLedger(self)
+        self.inbound_capacity = InboundCapacityIndex(self)
+
+    def get_payment_info(self, payment_hash):
+        if payment_hash not in self.payment_info:
+            raise UnknownPaymentHash(payment_hash)
+        return self.payment_info[payment_hash]
+
+    def add_channel(self, channel_id, initial_msat=0):
+        chan = self.channels[channel_id] = FakeChannel(self, channel_id, initial_msat)
+        return chan
+
+    htlc_updated = LNWallet.htlc_updated
+    get_history = LNWallet.get_history
+    get_unsettled_payments = LNWallet.get_unsettled_payments
+
+
+def rhash(i):
+    return bytes([i]) * 32
+
+
+class TestPaymentLedger(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.lnworker = FakeLNWallet()
+        self.chan1 = self.lnworker.add_channel(b'\x01' * 32, initial_msat=1_000_000)
+        self.chan2 = self.lnworker.add_channel(b'\x02' * 32)
+
+    def summary(self, history):
+        return [(item['type'], item.get('payment_hash') or item['channel_id'], item['amount_msat'],
+                 item['balance_msat']) for item in history]
+
+    def test_history_and_unsettled_payments(self):
+        # received, settled
+        self.chan1.settle(REMOTE, self.chan1.add(REMOTE, rhash(1), 5000, 100))
+        # sent, settled, with a known invoice amount
+        self.lnworker.payment_info[rhash(2)] = PaymentInfo(rhash(2), 1, SENT, 0)
+        self.chan1.settle(LOCAL, self.chan1.add(LOCAL, rhash(2), 1200, 200))
+        # sent, in flight and failed
+        self.chan1.add(LOCAL, rhash(3), 700, 300)
+        self.chan1.fail(LOCAL, self.chan1.add(LOCAL, rhash(4), 800, 400))
+        # forwarded
+        self.chan1.settle(REMOTE, self.chan1.add(REMOTE, rhash(5), 3100, 50))
+        self.chan2.settle(LOCAL, self.chan2.add(LOCAL, rhash(5), 3000, 60))
+        self.lnworker.channel_timestamps[self.chan1.channel_id.hex()] = ('ab' * 32, 10, 10, None, None, None)
+        self.lnworker.wallet.labels[rhash(1).hex()] = 'coffee'
+        history = self.lnworker.get_history()
+        self.assertEqual([
+            ('channel_opening', self.chan1.channel_id.hex(), 1_000_000, 1_000_000),
+            ('payment', rhash(5).hex(), 100, 1_000_100),
+            ('payment', rhash(1).hex(), 5000, 1_005_100),
+            ('payment', rhash(2).hex(), -1200, 1_003_900),
+        ], self.summary(history))
+        self.assertEqual('coffee', history[2]['label'])
+        self.assertEqual('forwarding', history[1]['direction'])
+        self.assertEqual(200, history[3]['fee_msat'])
+        self.assertEqual([(rhash(3).hex(), 'inflight'), (rhash(4).hex(), 'failed')],
+                         sorted((x['key'], x['status']) for x in self.lnworker.get_unsettled_payments()))
+        # pages
+        self.assertEqual(history[1:3], self.lnworker.get_history(offset=1, limit=2))
+
+    def test_incremental_updates(self):
+        self.chan1.settle(REMOTE, self.chan1.add(REMOTE, rhash(1), 5000, 100))
+        self.assertEqual(1, len(self.lnworker.get_history()))
+        # settled after the ledger was loaded
+        htlc_id = self.chan1.add(LOCAL, rhash(2), 1000, 200)
+        self.assertEqual([rhash(2).hex()], [x['key'] for x in self.lnworker.get_unsettled_payments()])
+        self.chan1.settle(LOCAL, htlc_id)
+        self.assertEqual([], self.lnworker.get_unsettled_payments())
+        # an older payment settles later; the balances after it are updated
+        self.chan2.settle(REMOTE, self.chan2.add(REMOTE, rhash(3), 300, 150))
+        self.assertEqual([
+            ('payment', rhash(1).hex(), 5000, 5000),
+            ('payment', rhash(3).hex(), 300, 5300),
+            ('payment', rhash(2).hex(), -1000, 4300),
+        ], self.summary(self.lnworker.get_history()))
+        # channel events
+        chan_id = self.chan2.channel_id.hex()
+        self.lnworker.channel_timestamps[chan_id] = ('ab' * 32, 10, 10, 'cd' * 32, 20, 400)
+        self.chan2.closed = True
+        self.lnworker.ledger.update_channel(self.chan2)
+        self.assertEqual(['channel_opening', 'payment', 'payment', 'payment', 'channel_closure'],
+                         [x['type'] for x in self.lnworker.get_history()])
+        # removing a channel removes its payments
+        del self.lnworker.channels[self.chan2.channel_id]
+        self.lnworker.ledger.remove_channel(self.chan2.channel_id)
+        self.assertEqual([
+            ('payment', rhash(1).hex(), 5000, 5000),
+            ('payment', rhash(2).hex(), -1000, 4000),
+        ], self.summary(self.lnworker.get_history()))
+        # a fresh ledger agrees
+        self.assertEqual(self.lnworker.get_history(), PaymentLedger(self.lnworker).get_history())
+
+    def test_version_follows_the_list_of_items(self):
+        self.lnworker.channel_timestamps[self.chan1.channel_id.hex()] = ('ab' * 32, 10, 10, None, None, None)
+        self.chan1.settle(REMOTE, self.chan1.add(REMOTE, rhash(1), 5000, 100))
+        ledger = self.lnworker.ledger
+        version, page, next_start = ledger.get_page(0, 1)
+        self.assertEqual(1, next_start)
+        # a payment in flight, and updates of items that do not move them
+        htlc_id = self.chan1.add(LOCAL, rhash(2), 1000, 200)
+        ledger.update_channel(self.chan1)
+        self.chan1.initial_msat = 2_000_000
+        ledger.update_channel(self.chan1)
+        self.assertEqual(version, ledger.version)
+        self.assertEqual([('payment', rhash(1).hex(), 5000, 2_005_000)],
+                         self.summary(ledger.get_page(next_start, 1)[1]))
+        # the payment is added to the list once it settles
+        self.chan1.settle(LOCAL, htlc_id)
+        self.assertLess(version, ledger.version)
@@ -0,0 +1,121 @@
+import time
+
+from electrum.lnmissioncontrol import (MissionControl, APRIORI_PROBABILITY, SUCCESS_PROBABILITY,
+                                       HALF_LIFE, MAX_AGE, route_amounts_msat)
+from electrum.lnrouter import RouteEdge
+from electrum.lnutil import ShortChannelID
+from electrum.simple_config import SimpleConfig
+
+from . import ElectrumTestCase
+
+
+def node(c):
+    return b'\x02' + 32 * c
+
+
+def scid(i):
+    return ShortChannelID.from_components(600000, i, 0)
+
+
+class TestMissionControl(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.mc = MissionControl(self.config)
+
+    def test_unknown_edge(self):
+        self.assertEqual(APRIORI_PROBABILITY, self.mc.probability(scid(1), node(b'a'), 1000))
+
+    def test_failure_depends_on_amount_and_decays(self):
+        now = time.time()
+        self.mc.report_failure(scid(1), node(b'a'), 100_000, now)
+        self.assertEqual(0, self.mc.probability(scid(1), node(b'a'), 100_000, now=now))
+        self.assertEqual(0, self.mc.probability(scid(1), node(b'a'), 200_000, now=now))
+        self.assertEqual(float('inf'), self.mc.penalty(scid(1), node(b'a'), 200_000))
+        # smaller amounts may still go through
+        self.assertEqual(APRIORI_PROBABILITY, self.mc.probability(scid(1), node(b'a'), 50_000, now=now))
+        # the other direction is another edge
+        self.assertEqual(APRIORI_PROBABILITY, self.mc.probability(scid(1), node(b'b'), 100_000, now=now))
+        # the failure is forgotten over time
+        p = self.mc.probability(scid(1), node(b'a'), 100_000, now=now + HALF_LIFE)
+        self.assertAlmostEqual(APRIORI_PROBABILITY / 2, p)
+        p = self.mc.probability(scid(1), node(b'a'), 100_000, now=now + 20 * HALF_LIFE)
+        self.assertAlmostEqual(APRIORI_PROBABILITY, p, places=5)
+
+    def test_success(self):
+        now = time.time()
+        self.mc.report_success(scid(1), node(b'a'), 100_000, now)
+        self.assertEqual(SUCCESS_PROBABILITY, self.mc.probability(scid(1), node(b'a'), 100_000, now=now))
+        self.assertEqual(APRIORI_PROBABILITY, self.mc.probability(scid(1), node(b'a'), 200_000, now=now))
+        self.assertLess(self.mc.penalty(scid(1), node(b'a'), 100_000),
+                        self.mc.penalty(scid(2), node(b'a'), 100_000))
+        # a later failure of a smaller amount contradicts the success
+        self.mc.report_failure(scid(1), node(b'a'), 50_000, now + 1)
+        self.assertEqual(0, self.mc.probability(scid(1), node(b'a'), 100_000, now=now + 1))
+        self.assertEqual(APRIORI_PROBABILITY, self.mc.probability(scid(1), node(b'a'), 10_000, now=now + 1))
+
+    def test_known_capacity(self):
+        now = time.time()
+        capacity = 1_000_000
+        # the balance can be anywhere in the channel
+        p_small = self.mc.probability(scid(1), node(b'a'), 100_000, capacity, now=now)
+        p_large = self.mc.probability(scid(1), node(b'a'), 900_000, capacity, now=now)
+        self.assertAlmostEqual(SUCCESS_PROBABILITY * 0.9, p_small)
+        self.assertAlmostEqual(SUCCESS_PROBABILITY * 0.1, p_large)
+        # it is between 200000 and 600000
+        self.mc.report_success(scid(1), node(b'a'), 200_000, now)
+        self.mc.report_failure(scid(1), node(b'a'), 600_000, now)
+        self.assertEqual(SUCCESS_PROBABILITY, self.mc.probability(scid(1), node(b'a'), 200_000, capacity, now=now))
+        self.assertAlmostEqual(SUCCESS_PROBABILITY / 2, self.mc.probability(scid(1), node(b'a'), 400_000, capacity, now=now))
+        self.assertEqual(0, self.mc.probability(scid(1), node(b'a'), 600_000, capacity, now=now))
+        # and then anywhere again
+        p = self.mc.probability(scid(1), node(b'a'), 600_000, capacity, now=now + 20 * HALF_LIFE)
+        self.assertAlmostEqual(SUCCESS_PROBABILITY * 0.4, p, places=5)
+
+    def test_report_attempt(self):
+        now = time.time()
+        route = [RouteEdge(node(b'b'), scid(1), 0, 0, 10),
+                 RouteEdge(node(b'c'), scid(2), 1000, 0, 10),
+                 RouteEdge(node(b'd'), scid(3), 1000, 0, 10),
+                 RouteEdge(node(b'e'), scid(4), 1000, 0, 10)]
+        self.assertEqual([103_000, 102_000, 101_000, 100_000], route_amounts_msat(route, 100_000))
+        # c reported that it could not forward to d
+        self.mc.report_attempt(node(b'a'), route, 100_000, forwarded=2, failed=True, now=now)
+        # our own channel is not recorded
+        self.assertEqual(APRIORI_PROBABILITY, self.mc.probability(scid(1), node(b'a'), 103_000, now=now))
+        self.assertEqual(SUCCESS_PROBABILITY, self.mc.probability(scid(2), node(b'b'), 102_000, now=now))
+        self.assertEqual(0, self.mc.probability(scid(3), node(b'c'), 101_000, now=now))
+        self.assertEqual(APRIORI_PROBABILITY, self.mc.probability(scid(4), node(b'd'), 100_000, now=now))
+        # the payment went through
+        self.mc.report_attempt(node(b'a'), route, 10_000, forwarded=len(route), failed=False, now=now)
+        self.assertEqual(SUCCESS_PROBABILITY, self.mc.probability(scid(3), node(b'c'), 10_000, now=now))
+        self.assertEqual(SUCCESS_PROBABILITY, self.mc.probability(scid(4), node(b'd'), 10_000, now=now))
+
+    def test_persistence(self):
+        now = time.time()
+        self.mc.report_failure(scid(1), node(b'a'), 100_000, now)
+        self.mc.report_success(scid(2), node(b'a'), 100_000, now)
+        self.mc.report_failure(scid(3), node(b'a'), 100_000, now - MAX_AGE - 1)
+        self.mc.save()
+        mc = MissionControl(self.config)
+        self.assertEqual(0, mc.probability(scid(1), node(b'a'), 100_000, now=now))
+        self.assertEqual(SUCCESS_PROBABILITY, mc.probability(scid(2), node(b'a'), 100_000, now=now))
+        # old outcomes are dropped
+        self.assertEqual(2, len(mc._edges))
+        mc.clear()
+        self.assertEqual(0, len(MissionControl(self.config)._edges))
+
+    def test_corrupt_file_is_ignored(self):
+        with open(self.mc._path(), 'w') as f:
+            f.write('{not json')
+        mc = MissionControl(self.config)
+        self.assertEqual(APRIORI_PROBABILITY, mc.probability(scid(1), node(b'a'), 1000))
+
+    def test_without_config(self):
+        mc = MissionControl()
+        mc.report_failure(scid(1), node(b'a'), 100_000)
+        mc.save()
+        self.assertIsNone(mc._path())
+        self.assertLess(mc.probability(scid(1), node(b'a'), 100_000), 0.01)
+        self.assertEqual(APRIORI_PROBABILITY, MissionControl(self.config).probability(scid(1), node(b'a'), 100_000))
@@ -13,18 +13,18 @@ from electrum.ecc import ECPrivkey
 from electrum import simple_config, lnutil
 from electrum.lnaddr import lnencode, LnAddr, lndecode
 from electrum.bitcoin import COIN, sha256
-from electrum.util import bh2u, create_and_start_event_loop
+from electrum.util import bh2u, create_and_start_event_loop, InvoiceError
 from electrum.lnpeer import Peer
 from electrum.lnutil import LNPeerAddr, Keypair, privkey_to_pubkey
 from electrum.lnutil import LightningPeerConnectionClosed, RemoteMisbehaving
-from electrum.lnutil import PaymentFailure, LnLocalFeatures
+from electrum.lnutil import PaymentFailure, LnLocalFeatures, REMOTE, RECEIVED
 from electrum.lnchannel import channel_states, peer_states
 from electrum.lnrouter import LNPathFinder
 from electrum.channel_db import ChannelDB
-from electrum.lnworker import LNWallet, NoPathFound
+from electrum.lnworker import LNWallet, NoPathFound, PaymentBatch
 from electrum.lnmsg import encode_msg, decode_msg
-from electrum.logging import console_stderr_handler
-from electrum.lnworker import PaymentInfo, RECEIVED, PR_UNPAID
+from electrum.logging import console_stderr_handler, Logger
+from electrum.lnworker import PaymentInfo, PR_UNPAID
 
 from .test_lnchannel import create_test_channels
 from . import ElectrumTestCase
@@ -74,14 +74,16 @@ class MockWallet:
     def save_db(self):
         pass
 
-class MockLNWallet:
+class MockLNWallet(Logger):
     def __init__(self, remote_keypair, local_keypair, chan, tx_queue):
+        Logger.__init__(self)
         self.remote_keypair = remote_keypair
         self.node_keypair = local_keypair
         self.network = MockNetwork(tx_queue)
         self.channels = {chan.channel_id: chan}
         self.payments = {}
         self.logs = defaultdict(list)
+        self._paying = set()
         self.wallet = MockWallet()
         self.localfeatures = LnLocalFeatures(0)
         self.localfeatures |= LnLocalFeatures.OPTION_DATA_LOSS_PROTECT_OPT
@@ -123,6 +125,8 @@ class MockLNWallet:
     _create_route_from_invoice = LNWallet._create_route_from_invoice
     _check_invoice = staticmethod(LNWallet._check_invoice)
     _pay_to_route = LNWallet._pay_to_route
+    _pay = LNWallet._pay
+    _pay_attempts = LNWallet._pay_attempts
     force_close_channel = LNWallet.force_close_channel
     get_first_timestamp = lambda self: 0
 
@@ -200,9 +204,8 @@ class TestPeer(ElectrumTestCase):
         return p1, p2, w1, w2, q1, q2
 
     @staticmethod
-    def prepare_invoice(w2 # receiver
-            ):
-        amount_sat = 100000
+    def prepare_invoice(w2, # receiver
+            amount_sat=100000):
         amount_btc = amount_sat/Decimal(COIN)
         payment_preimage = os.urandom(32)
         RHASH = sha256(payment_preimage)
@@ -270,6 +273,57 @@ class TestPeer(ElectrumTestCase):
         with self.assertRaises(concurrent.futures.CancelledError):
             run(f())
 
+    def test_payment_batch(self):
+        alice_channel, bob_channel = create_test_channels()
+        p1, p2, w1, w2, _q1, _q2 = self.prepare_peers(alice_channel, bob_channel)
+        pay_reqs = [self.prepare_invoice(w2, amount_sat=100000 if i % 2 else 200000) for i in range(12)]
+        max_htlcs = []
+        def on_htlc_added(event, htlc, lnaddr, direction):
+            max_htlcs.append(len(alice_channel.hm.htlcs_by_direction(REMOTE, RECEIVED, alice_channel.get_latest_ctn(REMOTE))))
+        w1.network.register_callback(on_htlc_added, ['htlc_added'])
+        async def pay():
+            result = await LNWallet._pay_batch(w1, pay_reqs + [pay_reqs[0]], max_htlcs_per_channel=10)
+            self.assertEqual(12, result['paid'])
+            self.assertEqual(1, result['failed'])  # paid already
+            self.assertEqual([w1._check_invoice(pay_reqs[0]).paymenthash.hex()], list(result['failures']))
+            self.assertEqual(6 * 100000 + 6 * 200000, result['amount_sat'])
+            self.assertEqual(12, result['attempts'])
+            # the route is shared by the payments of the same amount
+            self.assertEqual(2, result['routes_computed'])
+            gath.cancel()
+        gath = asyncio.gather(pay(), p1._message_loop(), p2._message_loop())
+        async def f():
+            await gath
+        with self.assertRaises(concurrent.futures.CancelledError):
+            run(f())
+        # HTLCs were sent concurrently, within max_accepted_htlcs of bob
+        self.assertGreater(max(max_htlcs), 1)
+        self.assertLessEqual(max(max_htlcs), alice_channel.config[REMOTE].max_accepted_htlcs)
+
+    def test_payment_batch_invalid_invoice(self):
+        alice_channel, bob_channel = create_test_channels()
+        p1, p2, w1, w2, _q1, _q2 = self.prepare_peers(alice_channel, bob_channel)
+        pay_req = self.prepare_invoice(w2)
+        with self.assertRaises(InvoiceError):
+            run(LNWallet._pay_batch(w1, [pay_req, 'lnnotaninvoice']))
+        # nothing was paid
+        self.assertEqual(PR_UNPAID, w2.get_payment_status(w1._check_invoice(pay_req).paymenthash))
+
+    def test_payment_batch_route_that_cannot_pay(self):
+        alice_channel, bob_channel = create_test_channels()
+        p1, p2, w1, w2, _q1, _q2 = self.prepare_peers(alice_channel, bob_channel)
+        lnaddr = w1._check_invoice(self.prepare_invoice(w2))
+        route = run(w1._create_route_from_invoice(decoded_invoice=lnaddr))
+        # e.g. a route through a private hop, whose fee the channel cannot pay
+        async def create_route(decoded_invoice):
+            return route
+        w1._create_route_from_invoice = create_route
+        alice_channel.can_pay = lambda amount_msat: False
+        batch = PaymentBatch(w1, max_htlcs_per_channel=10)
+        # nothing of the batch is in flight, so there is nothing to wait for
+        with self.assertRaises(NoPathFound):
+            run(asyncio.wait_for(batch.get_route(lnaddr), 5))
+
     def test_channel_usage_after_closing(self):
         alice_channel, bob_channel = create_test_channels()
         p1, p2, w1, w2, q1, q2 = self.prepare_peers(alice_channel, bob_channel)
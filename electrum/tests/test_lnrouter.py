@@ -8,6 +8,7 @@ from electrum.lnonion import (OnionHopsDataSingle, new_onion_packet, OnionPerHop
                               process_onion_packet, _decode_onion_error, decode_onion_error,
                               OnionFailureCode)
 from electrum import bitcoin, lnrouter
+from electrum.lnutil import ShortChannelID
 from electrum.constants import BitcoinTestnet
 from electrum.simple_config import SimpleConfig
 
@@ -110,6 +111,87 @@ class Test_LNRouter(TestCaseForTestnet):
         self._loop_thread.join(timeout=1)
         cdb.sql_thread.join(timeout=1)
 
+    def test_remove_spent_channel(self):
+        class fake_network:
+            config = self.config
+            asyncio_loop = asyncio.get_event_loop()
+            trigger_callback = lambda *args: None
+            register_callback = lambda *args: None
+            interface = None
+        fake_network.channel_db = lnrouter.ChannelDB(fake_network())
+        cdb = fake_network.channel_db
+        path_finder = lnrouter.LNPathFinder(cdb)
+        o = lambda i: i.to_bytes(8, "big")
+        node = lambda c: b'\x02' + 32 * c
+        def announcement(scid, n1, n2):
+            return {'node_id_1': node(n1), 'node_id_2': node(n2),
+                    'bitcoin_key_1': node(n1), 'bitcoin_key_2': node(n2),
+                    'short_channel_id': bfh(scid),
+                    'chain_hash': BitcoinTestnet.rev_genesis_bytes(),
+                    'len': b'\x00\x00', 'features': b''}
+        channels = {'0000000000000001': (b'a', b'b', 100), '0000000000000002': (b'b', b'e', 100),
+                    '0000000000000003': (b'a', b'c', 100), '0000000000000004': (b'c', b'e', 999)}
+        for scid, (n1, n2, fee) in channels.items():
+            cdb.add_channel_announcement(announcement(scid, n1, n2), trusted=True)
+            for flags in (b'\x00', b'\x01'):
+                cdb.add_channel_update({'short_channel_id': bfh(scid), 'message_flags': b'\x00', 'channel_flags': flags, 'cltv_expiry_delta': o(10), 'htlc_minimum_msat': o(250), 'fee_base_msat': o(fee), 'fee_proportional_millionths': o(150), 'chain_hash': BitcoinTestnet.rev_genesis_bytes(), 'timestamp': b'\x00\x00\x00\x00'})
+        self.assertEqual(4, cdb.num_channels)
+        self.assertEqual(8, cdb.num_policies)
+        path = path_finder.find_path_for_payment(node(b'a'), node(b'e'), 100000)
+        self.assertEqual([node(b'b'), node(b'e')], [node_id for node_id, scid in path])
+        # the funding output of b-e is spent
+        spent = ShortChannelID(bfh('0000000000000002'))
+        cdb.remove_spent_channel(spent)
+        self.assertTrue(cdb.is_channel_spent(spent))
+        self.assertEqual(3, cdb.num_channels)
+        self.assertEqual(6, cdb.num_policies)
+        self.assertEqual(set(), cdb.get_channels_for_node(node(b'b')) - {ShortChannelID(bfh('0000000000000001'))})
+        path = path_finder.find_path_for_payment(node(b'a'), node(b'e'), 100000)
+        self.assertEqual([node(b'c'), node(b'e')], [node_id for node_id, scid in path])
+        # its announcement is not accepted again
+        cdb.add_channel_announcement(announcement('0000000000000002', b'b', b'e'), trusted=True)
+        self.assertEqual(3, cdb.num_channels)
+
+        self.asyncio_loop.call_soon_threadsafe(self._stop_loop.set_result, 1)
+        self._loop_thread.join(timeout=1)
+        cdb.sql_thread.join(timeout=1)
+
+    def test_mission_control_penalty(self):
+        class fake_network:
+            config = self.config
+            asyncio_loop = asyncio.get_event_loop()
+            trigger_callback = lambda *args: None
+            register_callback = lambda *args: None
+            interface = None
+        fake_network.channel_db = lnrouter.ChannelDB(fake_network())
+        cdb = fake_network.channel_db
+        path_finder = lnrouter.LNPathFinder(cdb)
+        o = lambda i: i.to_bytes(8, "big")
+        node = lambda c: b'\x02' + 32 * c
+        channels = {'0000000000000001': (b'a', b'b', 100), '0000000000000002': (b'b', b'e', 100),
+                    '0000000000000003': (b'a', b'c', 100), '0000000000000004': (b'c', b'e', 999)}
+        for scid, (n1, n2, fee) in channels.items():
+            cdb.add_channel_announcement({'node_id_1': node(n1), 'node_id_2': node(n2),
+                                          'bitcoin_key_1': node(n1), 'bitcoin_key_2': node(n2),
+                                          'short_channel_id': bfh(scid),
+                                          'chain_hash': BitcoinTestnet.rev_genesis_bytes(),
+                                          'len': b'\x00\x00', 'features': b''}, trusted=True)
+            for flags in (b'\x00', b'\x01'):
+                cdb.add_channel_update({'short_channel_id': bfh(scid), 'message_flags': b'\x00', 'channel_flags': flags, 'cltv_expiry_delta': o(10), 'htlc_minimum_msat': o(250), 'fee_base_msat': o(fee), 'fee_proportional_millionths': o(150), 'chain_hash': BitcoinTestnet.rev_genesis_bytes(), 'timestamp': b'\x00\x00\x00\x00'})
+        path = path_finder.find_path_for_payment(node(b'a'), node(b'e'), 100000)
+        self.assertEqual([node(b'b'), node(b'e')], [node_id for node_id, scid in path])
+        # b could not forward 100000 msat to e
+        path_finder.mission_control.report_failure(ShortChannelID(bfh('0000000000000002')), node(b'b'), 100000)
+        path = path_finder.find_path_for_payment(node(b'a'), node(b'e'), 100000)
+        self.assertEqual([node(b'c'), node(b'e')], [node_id for node_id, scid in path])
+        # smaller amounts still go through b
+        path = path_finder.find_path_for_payment(node(b'a'), node(b'e'), 50000)
+        self.assertEqual([node(b'b'), node(b'e')], [node_id for node_id, scid in path])
+
+        self.asyncio_loop.call_soon_threadsafe(self._stop_loop.set_result, 1)
+        self._loop_thread.join(timeout=1)
+        cdb.sql_thread.join(timeout=1)
+
     def test_new_onion_packet(self):
         # test vector from bolt-04
         payment_path_pubkeys = [
@@ -0,0 +1,91 @@
+import asyncio
+
+from electrum import metrics
+from electrum.metrics import Histogram
+
+from . import ElectrumTestCase
+
+
+class TestMetrics(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry = metrics.get_registry()
+        self.was_enabled = metrics.is_enabled()
+        self.registry.reset()
+
+    def tearDown(self):
+        metrics.set_enabled(self.was_enabled)
+        self.registry.reset()
+        super().tearDown()
+
+    def test_disabled_is_noop(self):
+        metrics.set_enabled(False)
+        metrics.inc('test.counter')
+        metrics.set_gauge('test.gauge', 3)
+        metrics.observe('test.latency', 0.1)
+        with metrics.timer('test.timer'):
+            pass
+        data = self.registry.to_json()
+        self.assertFalse(data['enabled'])
+        self.assertEqual({}, data['counters'])
+        self.assertEqual({}, data['gauges'])
+        self.assertEqual({}, data['histograms'])
+
+    def test_counters_gauges_and_labels(self):
+        metrics.set_enabled(True)
+        metrics.inc('test.requests', method='a')
+        metrics.inc('test.requests', 2, method='a')
+        metrics.inc('test.requests', method='b')
+        metrics.set_gauge('test.gauge', 5)
+        metrics.set_gauge('test.gauge', 7)
+        data = self.registry.to_json()
+        self.assertEqual({'test.requests{method="a"}': 3, 'test.requests{method="b"}': 1},
+                         data['counters'])
+        self.assertEqual({'test.gauge': 7}, data['gauges'])
+
+    def test_histogram_quantiles(self):
+        h = Histogram(buckets=(0.01, 0.1, 1))
+        for _ in range(90):
+            h.observe(0.005)
+        for _ in range(10):
+            h.observe(0.5)
+        self.assertEqual(100, h.count)
+        self.assertEqual(0.01, h.quantile(0.5))
+        self.assertEqual(0.5, h.quantile(0.95))  # capped at the max seen
+        self.assertEqual([(0.01, 90), (0.1, 90), (1, 100), (float('inf'), 100)],
+                         h.cumulative_counts())
+
+    def test_timed_sync_and_async(self):
+        metrics.set_enabled(True)
+
+        @metrics.timed('test.sync')
+        def f(x):
+            return x + 1
+
+        @metrics.timed('test.async')
+        async def g(x):
+            return x * 2
+
+        self.assertEqual(2, f(1))
+        self.assertEqual(4, asyncio.get_event_loop().run_until_complete(g(2)))
+        histograms = self.registry.to_json()['histograms']
+        self.assertEqual(1, histograms['test.sync']['count'])
+        self.assertEqual(1, histograms['test.async']['count'])
+        # exceptions are timed too
+        with self.assertRaises(ZeroDivisionError):
+            with metrics.timer('test.sync'):
+                1 / 0
+        self.assertEqual(2, self.registry.histogram('test.sync').count)
+
+    def test_text_format(self):
+        metrics.set_enabled(True)
+        metrics.inc('interface.request_errors', method='server.ping', error='timeout')
+        metrics.observe('wallet_db.write', 0.002)
+        text = self.registry.to_text()
+        self.assertIn('# TYPE electrum_interface_request_errors counter\n', text)
+        self.assertIn('electrum_interface_request_errors{error="timeout",method="server.ping"} 1\n', text)
+        self.assertIn('# TYPE electrum_wallet_db_write histogram\n', text)
+        self.assertIn('electrum_wallet_db_write_bucket{le="0.0025"} 1\n', text)
+        self.assertIn('electrum_wallet_db_write_bucket{le="+Inf"} 1\n', text)
+        self.assertIn('electrum_wallet_db_write_count 1\n', text)
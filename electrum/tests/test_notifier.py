@@ -0,0 +1,180 @@
+import asyncio
+from collections import defaultdict
+
+from aiohttp import web
+
+from electrum import bitcoin
+from electrum.simple_config import SimpleConfig
+from electrum.synchronizer import Notifier
+from electrum.util import SilentTaskGroup, create_and_start_event_loop
+
+from . import ElectrumTestCase
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.subscriptions = defaultdict(list)
+        self.statuses = {}
+
+    async def subscribe(self, method, params, queue):
+        sh = params[0]
+        self.subscriptions[sh].append(queue)
+        await queue.put([sh, self.statuses.get(sh)])
+
+    def unsubscribe(self, queue):
+        for queues in self.subscriptions.values():
+            if queue in queues:
+                queues.remove(queue)
+
+    async def notify(self, sh, status):
+        self.statuses[sh] = status
+        for queue in self.subscriptions[sh]:
+            await queue.put([sh, status])
+
+
+class FakeInterface:
+
+    def __init__(self):
+        self.group = SilentTaskGroup()
+        self.session = FakeSession()
+
+
+class FakeNetwork:
+
+    def __init__(self, loop, config):
+        self.asyncio_loop = loop
+        self.config = config
+        self.interface = FakeInterface()
+        self.proxy = None
+
+    def register_callback(self, callback, events):
+        pass
+
+    def unregister_callback(self, callback):
+        pass
+
+
+class StubSink:
+    """Records the webhooks it receives. Fails the first 'failures' of them."""
+
+    def __init__(self):
+        self.received = []
+        self.failures = 0
+        self.release = None  # type: asyncio.Event
+
+    async def handle(self, request):
+        data = await request.json()
+        if self.release is not None:
+            await self.release.wait()
+        if self.failures > 0:
+            self.failures -= 1
+            return web.Response(status=500)
+        self.received.append((data['address'], data['status']))
+        return web.Response(text='ok')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/hook', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        return f'http://{host}:{port}/hook'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class TestNotifier(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.asyncio_loop, self._stop_loop, self._loop_thread = create_and_start_event_loop()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.network = FakeNetwork(self.asyncio_loop, self.config)
+        self.session = self.network.interface.session
+        self.sink = StubSink()
+        self.url = self.run_coro(self.sink.start())
+        self.notifier = self.new_notifier()
+        self.addrs = [bitcoin.hash160_to_p2pkh(bytes([i]) * 20) for i in range(3)]
+
+    def tearDown(self):
+        self.run_coro(self.notifier.stop())
+        self.run_coro(self.sink.stop())
+        self.asyncio_loop.call_soon_threadsafe(self._stop_loop.set_result, 1)
+        self._loop_thread.join(timeout=1)
+        super().tearDown()
+
+    def run_coro(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.asyncio_loop).result(timeout=10)
+
+    def new_notifier(self):
+        notifier = Notifier(self.network)
+        notifier.RETRY_DELAY = 0.01
+        return notifier
+
+    def notify(self, addr, status):
+        self.run_coro(self.session.notify(bitcoin.address_to_scripthash(addr), status))
+
+    def wait_received(self, n):
+        for i in range(100):
+            if len(self.sink.received) >= n:
+                return
+            self.run_coro(asyncio.sleep(0.02))
+        self.fail(f'received {self.sink.received}')
+
+    def test_statuses_are_delivered_in_order(self):
+        for addr in self.addrs:
+            self.run_coro(self.notifier.start_watching_addr(addr, self.url))
+        self.wait_received(3)
+        for addr in self.addrs:
+            self.notify(addr, 'status1')
+        self.wait_received(6)
+        self.assertEqual({(addr, None) for addr in self.addrs}, set(self.sink.received[:3]))
+        self.assertEqual({(addr, 'status1') for addr in self.addrs}, set(self.sink.received[3:]))
+        # an unchanged status, e.g. after resubscribing, is not sent again
+        self.notify(self.addrs[0], 'status1')
+        self.run_coro(asyncio.sleep(0.1))
+        self.assertEqual(6, len(self.sink.received))
+
+    def test_burst_is_coalesced(self):
+        addr = self.addrs[0]
+        self.run_coro(self.notifier.start_watching_addr(addr, self.url))
+        self.wait_received(1)
+        self.sink.release = self.run_coro(self.make_event())
+        self.notify(addr, 'status1')
+        self.run_coro(asyncio.sleep(0.1))
+        # status1 is in flight, the next ones are coalesced
+        for i in range(2, 10):
+            self.notify(addr, f'status{i}')
+        self.asyncio_loop.call_soon_threadsafe(self.sink.release.set)
+        self.wait_received(3)
+        self.run_coro(asyncio.sleep(0.1))
+        self.assertEqual([(addr, None), (addr, 'status1'), (addr, 'status9')], self.sink.received)
+
+    async def make_event(self):
+        return asyncio.Event()
+
+    def test_failed_delivery_is_retried(self):
+        self.sink.failures = 3
+        addr = self.addrs[0]
+        self.run_coro(self.notifier.start_watching_addr(addr, self.url))
+        self.wait_received(1)
+        self.assertEqual([(addr, None)], self.sink.received)
+        self.assertEqual(0, self.sink.failures)
+
+    def test_watch_list_is_persisted(self):
+        self.run_coro(self.notifier.start_watching_addr(self.addrs[0], self.url))
+        self.run_coro(self.notifier.start_watching_addr(self.addrs[1], self.url))
+        self.run_coro(self.notifier.stop_watching_addr(self.addrs[1]))
+        self.wait_received(1)
+        self.run_coro(self.notifier.stop())
+        # restart
+        self.network.interface = FakeInterface()
+        self.session = self.network.interface.session
+        self.notifier = self.new_notifier()
+        self.run_coro(asyncio.sleep(0.2))
+        self.assertEqual({self.addrs[0]: {self.url}}, dict(self.notifier.watched_addresses))
+        self.assertEqual(1, len(self.session.subscriptions))
@@ -0,0 +1,218 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from electrum import paymentrequest, pem, x509
+from electrum.paymentrequest import verify_cert_chain
+
+from . import ElectrumTestCase
+
+
+# generated with openssl: root CA -> intermediate CA -> leaf, valid until 2126
+ROOT_CA = """\
+-----BEGIN CERTIFICATE-----
+MIIDIzCCAgugAwIBAgIUa90HRjKueAM1Tsg99aTp7Cxo7TAwDQYJKoZIhvcNAQEL
+BQAwIDEeMBwGA1UEAwwVRWxlY3RydW0gVGVzdCBSb290IENBMCAXDTI2MTAxODIz
+MDA0NVoYDzIxMjYwOTI0MjMwMDQ1WjAgMR4wHAYDVQQDDBVFbGVjdHJ1bSBUZXN0
+IFJvb3QgQ0EwggEiMA0GCSqGSIb3DQEBAQUAA4IBDwAwggEKAoIBAQDJvyT7H84O
+RnWqL6SU6IdG+0qhNEIUeEm8pewK3NwdUdMViK1JE9Wu1uEVuUs7vTKEoh2tZzfi
+5GCilfcra96g9l4XFg0cnfRCSwDz5pS+P40SLpNKUlkdowuHpDpNiJQO0biQXUd7
+OSjJNWrqpdPIk7Mv5Q5q/Oi2HR7CTD3R00xovic8jcSog7BmgCIdOxV3SEUok5bA
+D5tvRUndoBRvdbu+muiDIz5nFU23+ZoNyqIYIPLZyFaLnaS1q9ndX7FNRmm4dsnc
+doC/L7mQ09pIbdEkQGH0r3pB57MNI+p3/dhIJan9fHW9eg/LylhJJLbDGuHwJRep
+s8R7EjSKbVMFAgMBAAGjUzBRMB8GA1UdIwQYMBaAFDKQh65m2G7qEMvdwpWXqxt2
+QR1pMA8GA1UdEwEB/wQFMAMBAf8wHQYDVR0OBBYEFDKQh65m2G7qEMvdwpWXqxt2
+QR1pMA0GCSqGSIb3DQEBCwUAA4IBAQAPfHSS6kBOARl/A3SjnrXF/UNu5vKzzDbg
+t4bmz5yfRj3FVaHsxS/sdiMLG9V3TEhts3LUpMTVGkCF7kHJtNhJkULp8OiImZv8
+hzG+NhvvnVEKJm+qzxYFBEuJ/JRAYpi/EnGj/K++SLJdyuRsrcqfglo/sb7cwvMt
+pcTaLcy/svFOHvjb+TD+SlB5S3szil/juoTXsVVnyzSg0pwfzmX/7zJ2EQVcbzbS
+78/9U4Ddppdjvv6gCglmemBJJrua/Me5n01eJQMRIp4DnynH6QcAdnyiHdd3Wfa+
+AUk0bAPJE8A66AeuGzvrvomRC2OZF/UukGLnc4Rr3Dd85TgywYUf
+-----END CERTIFICATE-----
+"""
+
+INTERMEDIATE_CA = """\
+-----BEGIN CERTIFICATE-----
+MIIDOzCCAiOgAwIBAgIUaGMMnSs84mmqW4kEyCufxnL6N8wwDQYJKoZIhvcNAQEL
+BQAwIDEeMBwGA1UEAwwVRWxlY3RydW0gVGVzdCBSb290IENBMCAXDTI2MTAxODIz
+MDA0NloYDzIxMjYwOTI0MjMwMDQ2WjAoMSYwJAYDVQQDDB1FbGVjdHJ1bSBUZXN0
+IEludGVybWVkaWF0ZSBDQTCCASIwDQYJKoZIhvcNAQEBBQADggEPADCCAQoCggEB
+AKoIl0HJxuX3fihWBZOKihOkNmw4ppVQVTc+Oq8G2cQkRwLp+ecxTkq5zEY/8LPR
+tOpsrEjFR8F60dIAYZAa1Ys8//dUoaUJlFmLiVj5NXNi9KhtowfUaVUVuVsQIExR
+9yPdHGWUyAIwbrxFAufv0ROTjQaztzdL9VdokSi1R07aILjctIwE2WQqn48BKF24
+B1DxK5gehgcJiK/RixJhIbPKdH+A24SD4JJBfxvPYPkmvdSl1Es87112UjvHUQ2E
+0NLU3t9ovElKqD3hObjSDBTpUnVwuN4DzXPL7c9gW1VHlP24a0KBdl+OBUC3NavP
++/vphNjckmd6gTD/IL7YzLUCAwEAAaNjMGEwDwYDVR0TAQH/BAUwAwEB/zAdBgNV
+HQ4EFgQUmQqfswYYAOFhpzoKSKi0TtRolvswHwYDVR0jBBgwFoAUMpCHrmbYbuoQ
+y93ClZerG3ZBHWkwDgYDVR0PAQH/BAQDAgEGMA0GCSqGSIb3DQEBCwUAA4IBAQCX
+feIl0/715nyBk6wHDI9gEdayzFVEba7EAsCSB2CG5Yp+UTgYAt7TISLJEHMlijeY
+cAZQBKN2uGvNbyDJ/LrYdmxqiTH/ZiIC7027AlQ5rOlT7OavbcWwa79ZLa0ImTB2
+FR8cq8BCwDp+8VwULSicGr0fTJVIiAuEz4CxG32TwKhxd4b9KQpkbYhZoAEUMECN
+bxdoxYEZRxOtCb76qFJ9CkZQ6mrxSTNhgD4Vy9iwT1DGhIhLXWSw+PCjm4PX/9zF
+xI8vawYG1OOacR1tjO4ujFx8xsSdj3fj3lWegYgZ+7Nmk/NXlDQWluwtlS/zeXvl
+UG15HsXhZhRLKMfn86RR
+-----END CERTIFICATE-----
+"""
+
+LEAF = """\
+-----BEGIN CERTIFICATE-----
+MIIDIDCCAgigAwIBAgIUAbRETW7QucKtiNfQZBjZj8BEyIswDQYJKoZIhvcNAQEL
+BQAwKDEmMCQGA1UEAwwdRWxlY3RydW0gVGVzdCBJbnRlcm1lZGlhdGUgQ0EwIBcN
+MjYxMDE4MjMwMDQ2WhgPMjEyNjA5MjQyMzAwNDZaMBsxGTAXBgNVBAMMEG1lcmNo
+YW50LmV4YW1wbGUwggEiMA0GCSqGSIb3DQEBAQUAA4IBDwAwggEKAoIBAQCwDkEU
+OLxQsN7DQaSIjV79IdG1+iHQ5wYccEuTY9JwOJ1f6rnpJ7mDUr8c2chsP0OU0/Qk
+7Wo/zJ6sNdoGXoCzmoDOEEn38lapHsRBg3MG/ILbopKY8keIDzPdDvqboCa+W2Sn
+3mnoCDJE0Y3tdMa/j2TPM8o03aGNkjMDI3wUM2TH6/7vKSDVRy8eFHo4gDbsqgez
+Jwmrv5hrMeUog0X6CvRfIWEPQTq+Pm9Cv4FvW0tApYPUyKUh+x6y7G5vk78HL5Yw
+2leZvw7+j0e2o1pFp3eUnBT1UKGu09RusUZlG7I7t+sOQmKbPNV/kFHjDC0Pt1XD
+tuSDKp/oItd3GtHnAgMBAAGjTTBLMAkGA1UdEwQCMAAwHQYDVR0OBBYEFN+K3DG8
+LlaYYlotjK77x5gOR75gMB8GA1UdIwQYMBaAFJkKn7MGGADhYac6CkiotE7UaJb7
+MA0GCSqGSIb3DQEBCwUAA4IBAQBOsag1wsjSfkqZQJkagz76m71tgkXPyslD2xTs
+A6f5pFGru8/zJjgLoy8PBI7Zv1a4Sv5bwvNDsVDAUlWU/nB+GTPCindr7zA9wOSU
+k3Dp2IwTOxV47cGaifwep7By7kL+h4+OIINF3uyQktzSlHpPmsojpp6i+WlG5A4h
+JZIeQQLqVh2YmyTBYENuKPyUa7VetfBuSheTDRyEsFR87iPmagqbk2QlZXBNuFyR
+7exVshNLhD1UPaBKFX5aIhCLCSy0ibjSr3ZQ/k7zmNt1gJ5C3l8BJmySpfdOFNeZ
+82pw1Ef8y5HF7ttgP6jTX63tc5tQTVpBcVE43BiAcHycH8sE
+-----END CERTIFICATE-----
+"""
+
+
+class TestCAStore(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.ca_path = os.path.join(self.tmpdir, 'cacert.pem')
+        self.index_path = os.path.join(self.tmpdir, 'certs_index')
+        with open(self.ca_path, 'w') as f:
+            f.write(ROOT_CA + INTERMEDIATE_CA)
+        self._saved = paymentrequest.ca_path, paymentrequest.ca_index_path, paymentrequest.ca_list, paymentrequest.ca_keyID
+        paymentrequest.ca_path = self.ca_path
+        paymentrequest.ca_index_path = self.index_path
+        paymentrequest.ca_list = None
+        paymentrequest._parsed_certs.clear()
+        paymentrequest._verified_chains.clear()
+
+    def tearDown(self):
+        paymentrequest.ca_path, paymentrequest.ca_index_path, paymentrequest.ca_list, paymentrequest.ca_keyID = self._saved
+        paymentrequest._parsed_certs.clear()
+        paymentrequest._verified_chains.clear()
+        shutil.rmtree(self.tmpdir)
+        super().tearDown()
+
+    def test_index_is_reused_until_bundle_changes(self):
+        store = x509.load_ca_store(self.ca_path, self.index_path)
+        self.assertEqual(2, len(store))
+        self.assertTrue(os.path.exists(self.index_path))
+        root = x509.X509(pem.dePem(ROOT_CA, 'CERTIFICATE'))
+        self.assertIn(root.getFingerprint(), store)
+        self.assertEqual(root.getFingerprint(), store.key_ids[root.get_keyID()])
+        # no certificate is parsed when loading from the index, nor before one is used
+        with mock.patch.object(x509, 'X509', wraps=x509.X509) as parse:
+            store = x509.load_ca_store(self.ca_path, self.index_path)
+            self.assertEqual(2, len(store))
+            self.assertEqual(0, parse.call_count)
+            self.assertEqual('Electrum Test Root CA', store[root.getFingerprint()].get_common_name())
+            self.assertEqual(1, parse.call_count)
+        # a new bundle invalidates the index
+        with open(self.ca_path, 'w') as f:
+            f.write(ROOT_CA)
+        store = x509.load_ca_store(self.ca_path, self.index_path)
+        self.assertEqual(1, len(store))
+        self.assertEqual(1, len(x509.load_ca_store(self.ca_path, self.index_path)))
+
+    def test_corrupt_index_is_rebuilt(self):
+        with open(self.index_path, 'w') as f:
+            f.write('{"version": 1, "bundle_ha')
+        store = x509.load_ca_store(self.ca_path, self.index_path)
+        self.assertEqual(2, len(store))
+        self.assertEqual(2, len(x509.load_ca_store(self.ca_path, self.index_path)))
+
+    def test_expired_entries_are_skipped(self):
+        store = x509.load_ca_store(self.ca_path, self.index_path)
+        entries = [dict(e) for e in store.entries]
+        entries[0]['not_after'] = 1
+        self.assertEqual(1, len(x509.CAStore(entries)))
+
+    def test_index_not_matching_bundle_is_rebuilt(self):
+        leaf = bytes(pem.dePem(LEAF, 'CERTIFICATE'))
+        leaf_fp = x509.X509(leaf).getFingerprint()
+        store = x509.load_ca_store(self.ca_path, self.index_path)
+        # a certificate that is not in the bundle
+        entries = [dict(e) for e in store.entries]
+        entries[0]['der'] = leaf.hex()
+        entries[0]['fingerprint'] = leaf_fp.hex()
+        self.write_index(store, entries)
+        store = x509.load_ca_store(self.ca_path, self.index_path)
+        self.assertEqual(2, len(store))
+        self.assertNotIn(leaf_fp, store)
+        # a certificate of the bundle, under another fingerprint
+        entries = [dict(e) for e in store.entries]
+        entries[0]['fingerprint'] = leaf_fp.hex()
+        self.write_index(store, entries)
+        store = x509.load_ca_store(self.ca_path, self.index_path)
+        self.assertEqual(2, len(store))
+        self.assertNotIn(leaf_fp, store)
+
+    def write_index(self, store, entries):
+        with open(self.index_path, 'w') as f:
+            f.write(json.dumps({'version': x509.CA_INDEX_VERSION,
+                                'bundle_hash': store.bundle_hash,
+                                'certificates': entries}))
+
+    def test_verify_cert_chain(self):
+        chain = [pem.dePem(LEAF, 'CERTIFICATE'), pem.dePem(INTERMEDIATE_CA, 'CERTIFICATE')]
+        x, ca = verify_cert_chain(chain)
+        self.assertEqual('merchant.example', x.get_common_name())
+        self.assertEqual('Electrum Test Intermediate CA', ca.get_common_name())
+        # the same chain is not verified again
+        with mock.patch('electrum.rsakey.RSAKey.verify') as rsa_verify:
+            x2, ca2 = verify_cert_chain(chain)
+            self.assertEqual(0, rsa_verify.call_count)
+        self.assertIs(x, x2)
+        # nor are its certificates parsed again, in another chain
+        with mock.patch.object(x509, 'X509', wraps=x509.X509) as parse:
+            x3, ca3 = verify_cert_chain(chain + [pem.dePem(ROOT_CA, 'CERTIFICATE')])
+            self.assertEqual(1, parse.call_count)
+        self.assertEqual('Electrum Test Root CA', ca3.get_common_name())
+
+    def test_untrusted_chain(self):
+        with open(self.ca_path, 'w') as f:
+            f.write(LEAF)
+        chain = [pem.dePem(LEAF, 'CERTIFICATE'), pem.dePem(INTERMEDIATE_CA, 'CERTIFICATE')]
+        with self.assertRaises(Exception) as ctx:
+            verify_cert_chain(chain)
+        self.assertIn('Not Found in Trusted CA Store', str(ctx.exception))
+        # failures are not cached
+        with open(self.ca_path, 'w') as f:
+            f.write(ROOT_CA)
+        paymentrequest.ca_list = None
+        x, ca = verify_cert_chain(chain)
+        self.assertEqual('merchant.example', x.get_common_name())
+
+    def test_cached_chain_dates_are_checked(self):
+        # the root CA is taken from the store
+        with open(self.ca_path, 'w') as f:
+            f.write(ROOT_CA)
+        chain = [pem.dePem(LEAF, 'CERTIFICATE'), pem.dePem(INTERMEDIATE_CA, 'CERTIFICATE')]
+        x, ca = verify_cert_chain(chain)
+        root = paymentrequest.ca_list[paymentrequest.ca_keyID[ca.get_issuer_keyID()]]
+        for expired in (ca, root):
+            with mock.patch.object(expired, 'notAfter', time.gmtime(0)):
+                with self.assertRaises(x509.CertificateError):
+                    verify_cert_chain(chain)
+        self.assertIs(x, verify_cert_chain(chain)[0])
+
+    def test_cached_chain_is_not_trusted_by_another_bundle(self):
+        chain = [pem.dePem(LEAF, 'CERTIFICATE'), pem.dePem(INTERMEDIATE_CA, 'CERTIFICATE')]
+        verify_cert_chain(chain)
+        with open(self.ca_path, 'w') as f:
+            f.write(LEAF)
+        store = x509.load_ca_store(self.ca_path)
+        paymentrequest.ca_list, paymentrequest.ca_keyID = store, store.key_ids
+        with self.assertRaises(Exception) as ctx:
+            verify_cert_chain(chain)
+        self.assertIn('Not Found in Trusted CA Store', str(ctx.exception))
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+
+from aiorpcx import RPCError
+
+from electrum.interface import RequestCorrupted
+from electrum.request_router import RequestRouter, StaleAnswer, MIN_SAMPLES_FOR_P95
+from electrum.simple_config import SimpleConfig
+
+from . import ElectrumTestCase
+
+
+class FakeSession:
+
+    def __init__(self, iface):
+        self.iface = iface
+
+    async def send_request(self, method, params, timeout=None):
+        self.iface.requests += 1
+        await asyncio.sleep(self.iface.latency)
+        if isinstance(self.iface.answer, Exception):
+            raise self.iface.answer
+        return self.iface.answer
+
+
+class FakeInterface:
+
+    def __init__(self, server, *, latency=0.001, answer='ok', blockchain='main', tip=100):
+        self.server = server
+        self.latency = latency
+        self.answer = answer
+        self.blockchain = blockchain
+        self.tip = tip
+        self.requests = 0
+        loop = asyncio.get_event_loop()
+        self.ready = loop.create_future()
+        self.ready.set_result(1)
+        self.got_disconnected = loop.create_future()
+        self.session = FakeSession(self)
+
+
+class FakeNetwork:
+
+    def __init__(self, config, interfaces):
+        self.config = config
+        self.interfaces_lock = threading.Lock()
+        self.interfaces = {iface.server: iface for iface in interfaces}
+        self.interface = interfaces[0]
+
+
+class TestRequestRouter(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.get_event_loop()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+
+    def make_router(self, *interfaces):
+        self.network = FakeNetwork(self.config, list(interfaces))
+        return RequestRouter(self.network)
+
+    def send(self, router, n=1, validate=None):
+        async def main():
+            return await asyncio.gather(*[router.send_request('method', [], validate=validate) for i in range(n)])
+        return self.loop.run_until_complete(main())
+
+    def test_requests_are_spread(self):
+        ifaces = [FakeInterface(f's{i}', latency=0.01) for i in range(3)]
+        router = self.make_router(*ifaces)
+        self.assertEqual(['ok'] * 30, self.send(router, 30))
+        for iface in ifaces:
+            self.assertGreater(iface.requests, 5)
+
+    def test_faster_server_is_preferred(self):
+        main = FakeInterface('main', latency=0.02)
+        fast = FakeInterface('fast', latency=0.001)
+        router = self.make_router(main, fast)
+        for i in range(20):
+            self.send(router)
+        self.assertGreater(fast.requests, 15)
+
+    def test_unhealthy_servers_are_not_used(self):
+        main = FakeInterface('main')
+        fork = FakeInterface('fork', blockchain='other')
+        lagging = FakeInterface('lagging', tip=90)
+        disconnected = FakeInterface('disconnected')
+        disconnected.got_disconnected.set_result(1)
+        router = self.make_router(main, fork, lagging, disconnected)
+        self.send(router, 10)
+        self.assertEqual(10, main.requests)
+        self.assertEqual(0, fork.requests + lagging.requests + disconnected.requests)
+
+    def test_slow_request_is_hedged(self):
+        main = FakeInterface('main', latency=0.005)
+        other = FakeInterface('other', latency=0.005)
+        router = self.make_router(main, other)
+        router.get_candidates = lambda main: [self.network.interface, other]
+        for i in range(MIN_SAMPLES_FOR_P95):
+            self.send(router)
+        main.latency = 5
+        t0 = self.loop.time()
+        self.assertEqual(['ok'], self.send(router))
+        self.assertLess(self.loop.time() - t0, 1)
+        self.assertEqual(1, other.requests)
+
+    def test_invalid_answer_is_rejected(self):
+        main = FakeInterface('main', latency=0.01, answer='good')
+        liar = FakeInterface('liar', latency=0.001, answer='bad')
+        router = self.make_router(main, liar)
+
+        def validate(iface, result):
+            if result != 'good':
+                raise RequestCorrupted()
+        self.assertEqual(['good'], self.send(router, validate=validate))
+        self.assertEqual(1, liar.requests)
+        # the liar is avoided from now on
+        self.assertEqual(['good'] * 5, self.send(router, 5, validate=validate))
+        self.assertEqual(1, liar.requests)
+
+    def test_stale_answer(self):
+        main = FakeInterface('main', latency=0.01, answer='new')
+        lagging = FakeInterface('lagging', latency=0.001, answer='old')
+        router = self.make_router(main, lagging)
+
+        def validate(iface, result):
+            if result != 'new':
+                raise StaleAnswer()
+        self.assertEqual(['new'], self.send(router, validate=validate))
+        self.assertEqual(['new'], self.send(router, validate=validate))
+        # not penalized
+        self.assertEqual(2, lagging.requests)
+
+    def test_error_of_main_server_is_raised(self):
+        main = FakeInterface('main', latency=0.01, answer=RPCError(1, 'not found on main'))
+        other = FakeInterface('other', latency=0.001, answer=RPCError(1, 'not found on other'))
+        router = self.make_router(main, other)
+        with self.assertRaises(RPCError) as ctx:
+            self.send(router)
+        self.assertEqual('not found on main', ctx.exception.message)
+        self.assertEqual(1, main.requests)
+        self.assertEqual(1, other.requests)
+
+    def test_disabled(self):
+        self.config.set_key('spread_requests', False)
+        main = FakeInterface('main', latency=0.01)
+        other = FakeInterface('other', latency=0.001)
+        router = self.make_router(main, other)
+        self.send(router, 10)
+        self.assertEqual(10, main.requests)
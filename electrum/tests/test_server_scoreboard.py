@@ -0,0 +1,162 @@
+import asyncio
+import random
+import threading
+import time
+
+from electrum import server_scoreboard
+from electrum.network import Network, pick_random_server
+from electrum.server_scoreboard import ServerScoreboard, MIN_RETRY_INTERVAL, MAX_RETRY_INTERVAL
+from electrum.simple_config import SimpleConfig
+
+from . import ElectrumTestCase
+
+
+class FakeInterface:
+
+    def __init__(self, server):
+        self.server = server
+        self.ready = asyncio.Future()
+        self.ready.cancel()  # could not connect
+
+
+class FakeTaskGroup:
+
+    def closed(self):
+        return False
+
+
+class FakeNetwork:
+
+    def __init__(self, scoreboard, connected_servers):
+        self.scoreboard = scoreboard
+        self.interfaces_lock = threading.Lock()
+        self.interfaces = {server: FakeInterface(server) for server in connected_servers}
+        self.main_taskgroup = FakeTaskGroup()
+        self.disconnected_servers = set()
+        self.default_server = 'main:50001:t'
+
+    async def _close_interface(self, interface):
+        pass
+
+    def trigger_callback(self, event, *args):
+        pass
+
+    connection_down = Network.connection_down
+
+
+class TestServerScoreboard(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.scoreboard = ServerScoreboard(self.config)
+
+    def measure(self, server, connect_time, rtt, n=20):
+        self.scoreboard.record_connect(server, connect_time)
+        for i in range(n):
+            self.scoreboard.record_rtt(server, rtt)
+
+    def test_fast_and_reliable_servers_score_better(self):
+        self.measure('fast:50001:t', 0.1, 0.02)
+        self.measure('slow:50001:t', 1.5, 0.3)
+        self.measure('flaky:50001:t', 0.1, 0.02)
+        for i in range(10):
+            self.scoreboard.record_timeout('flaky:50001:t')
+        scores = {server: self.scoreboard.score(server)
+                  for server in ('fast:50001:t', 'slow:50001:t', 'flaky:50001:t', 'unknown:50001:t')}
+        self.assertEqual(['fast:50001:t', 'unknown:50001:t', 'slow:50001:t', 'flaky:50001:t'],
+                         sorted(scores, key=scores.get))
+        self.assertEqual('fast:50001:t', self.scoreboard.best(scores))
+
+    def test_choose_prefers_better_servers(self):
+        random.seed(0)
+        servers = [f's{i}:50001:t' for i in range(20)]
+        for i, server in enumerate(servers):
+            self.measure(server, 0.1 if i < 2 else 1.0, 0.02 if i < 2 else 0.2)
+        picks = [self.scoreboard.choose(servers) for i in range(200)]
+        self.assertGreater(sum(1 for s in picks if s in servers[:2]), 150)
+        # the others still get picked sometimes
+        self.assertGreater(len(set(picks)), 2)
+        self.assertIsNone(self.scoreboard.choose([]))
+        # e.g. a local server, with a coarse clock
+        self.measure('local:50001:t', 0.0, 0.0)
+        self.assertEqual(0, self.scoreboard.score('local:50001:t'))
+        self.assertIn(self.scoreboard.choose(servers + ['local:50001:t']), servers + ['local:50001:t'])
+
+    def test_tip_delay(self):
+        self.measure('first:50001:t', 0.1, 0.02)
+        self.measure('late:50001:t', 0.1, 0.02)
+        self.assertIsNone(self.scoreboard.get('first:50001:t').tip_delay)
+        self.scoreboard.record_tip('first:50001:t', 1000)
+        time.sleep(0.05)
+        self.scoreboard.record_tip('late:50001:t', 1000)
+        self.assertEqual(0, self.scoreboard.get('first:50001:t').tip_delay)
+        self.assertGreater(self.scoreboard.get('late:50001:t').tip_delay, 0.04)
+        self.assertLess(self.scoreboard.score('first:50001:t'), self.scoreboard.score('late:50001:t'))
+
+    def test_backoff(self):
+        server = 's:50001:t'
+        now = time.time()
+        self.assertFalse(self.scoreboard.is_backing_off(server, now))
+        # closed by us: retried after the minimum interval
+        self.scoreboard.record_disconnect(server, failed=False)
+        self.assertTrue(self.scoreboard.is_backing_off(server, now))
+        self.assertFalse(self.scoreboard.is_backing_off(server, now + MIN_RETRY_INTERVAL + 1))
+        self.assertEqual(set(), self.scoreboard.get_failing_servers(now))
+        # failures double the interval
+        for i in range(3):
+            self.scoreboard.record_disconnect(server, failed=True)
+        self.assertTrue(self.scoreboard.is_backing_off(server, now + 3 * MIN_RETRY_INTERVAL))
+        self.assertFalse(self.scoreboard.is_backing_off(server, now + 4 * MIN_RETRY_INTERVAL + 1))
+        self.assertEqual({server}, self.scoreboard.get_failing_servers(now))
+        for i in range(20):
+            self.scoreboard.record_disconnect(server, failed=True)
+        self.assertFalse(self.scoreboard.is_backing_off(server, now + MAX_RETRY_INTERVAL + 1))
+        # a successful connection resets the backoff
+        self.scoreboard.record_connect(server, 0.1)
+        self.assertEqual(set(), self.scoreboard.get_failing_servers(now))
+
+    def test_persistence(self):
+        self.measure('fast:50001:t', 0.1, 0.02)
+        self.scoreboard.record_disconnect('bad:50001:t', failed=True)
+        self.scoreboard.save()
+        scoreboard = ServerScoreboard(self.config)
+        self.assertEqual(self.scoreboard.score('fast:50001:t'), scoreboard.score('fast:50001:t'))
+        self.assertEqual(self.scoreboard.score('bad:50001:t'), scoreboard.score('bad:50001:t'))
+        # but the backoff starts over
+        self.assertEqual({'bad:50001:t'}, self.scoreboard.get_failing_servers())
+        self.assertEqual(set(), scoreboard.get_failing_servers())
+
+    def test_corrupt_file_is_ignored(self):
+        with open(self.scoreboard._path(), 'w') as f:
+            f.write('{not json')
+        scoreboard = ServerScoreboard(self.config)
+        self.assertIsNone(scoreboard.get('fast:50001:t'))
+
+    def test_file_keeps_most_recent_servers(self):
+        for i in range(server_scoreboard.MAX_SERVERS + 10):
+            self.scoreboard.record_connect(f's{i}:50001:t', 1)
+        self.scoreboard.save()
+        scoreboard = ServerScoreboard(self.config)
+        self.assertEqual(server_scoreboard.MAX_SERVERS, len(scoreboard._records))
+
+    def test_pick_random_server(self):
+        hostmap = {f's{i}': {'t': '50001'} for i in range(10)}
+        for i in range(10):
+            self.measure(f's{i}:50001:t', 0.1 if i == 0 else 2.0, 0.02 if i == 0 else 0.5)
+        exclude_set = {'s0:50001:t'}
+        for i in range(20):
+            server = pick_random_server(hostmap, 't', exclude_set, scoreboard=self.scoreboard)
+            self.assertIn(server, {f's{i}:50001:t' for i in range(1, 10)})
+        self.assertIsNone(pick_random_server(hostmap, 's', scoreboard=self.scoreboard))
+
+    def test_failures_are_not_counted_while_offline(self):
+        loop = asyncio.get_event_loop()
+        offline = FakeNetwork(self.scoreboard, [])
+        for i in range(5):
+            loop.run_until_complete(offline.connection_down(FakeInterface('s1:50001:t')))
+        self.assertEqual(0, self.scoreboard.get('s1:50001:t').failures)
+        self.assertEqual(set(), self.scoreboard.get_failing_servers())
+        online = FakeNetwork(self.scoreboard, ['main:50001:t'])
+        loop.run_until_complete(online.connection_down(FakeInterface('s1:50001:t')))
+        self.assertEqual({'s1:50001:t'}, self.scoreboard.get_failing_servers())
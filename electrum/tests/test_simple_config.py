@@ -1,11 +1,16 @@
 import ast
+import random
 import sys
 import os
 import tempfile
 import shutil
+import json
+import threading
+import time
+from unittest import mock
 
 from io import StringIO
-from electrum.simple_config import (SimpleConfig, read_user_config)
+from electrum.simple_config import (SimpleConfig, FeeHistogram, read_user_config)
 
 from . import ElectrumTestCase
 
@@ -109,6 +114,105 @@ class Test_SimpleConfig(ElectrumTestCase):
         result.pop('config_version', None)
         self.assertEqual({"something": "a"}, result)
 
+    def _read_config_file(self):
+        with open(os.path.join(self.electrum_dir, "config"), "r") as f:
+            return json.loads(f.read())
+
+    def test_set_key_writes_are_coalesced(self):
+        config = SimpleConfig(self.options)
+        config.flush()
+        with mock.patch.object(config, '_write_user_config', wraps=config._write_user_config) as write:
+            for i in range(10000):
+                config.set_key(f'key{i}', i)
+            # readers see the new values before they are written
+            self.assertEqual(9999, config.get('key9999'))
+            config.flush()
+            self.assertLessEqual(write.call_count, 1 + int(10 * config.SAVE_DELAY))
+            self.assertGreaterEqual(write.call_count, 1)
+            calls = write.call_count
+            config.flush()  # nothing pending
+            self.assertEqual(calls, write.call_count)
+        contents = self._read_config_file()
+        self.assertEqual(9999, contents['key9999'])
+        self.assertEqual(10000, len([k for k in contents if k.startswith('key')]))
+
+    def test_set_key_is_saved_after_delay(self):
+        config = SimpleConfig(self.options)
+        config.SAVE_DELAY = 0.05
+        config.set_key('something', 'a')
+        timer = config._save_timer
+        self.assertIsNotNone(timer)
+        timer.join(5)
+        self.assertFalse(timer.is_alive())
+        self.assertEqual('a', self._read_config_file()['something'])
+
+    def test_concurrent_saves_keep_the_newest_config(self):
+        config = SimpleConfig(self.options)
+        config.set_key('something', 'a')
+        dumps = json.dumps
+        first_write_started = threading.Event()
+        release_first_write = threading.Event()
+        def slow_dumps(*args, **kwargs):
+            if not first_write_started.is_set():
+                first_write_started.set()
+                release_first_write.wait(5)
+            return dumps(*args, **kwargs)
+        with mock.patch('json.dumps', side_effect=slow_dumps):
+            # e.g. the save timer, writing 'a'
+            t1 = threading.Thread(target=config.save_user_config)
+            t1.start()
+            first_write_started.wait(5)
+            # and flush() on shutdown, after the value changed
+            config.set_key('something', 'b', save=False)
+            t2 = threading.Thread(target=config.save_user_config)
+            t2.start()
+            time.sleep(0.05)
+            release_first_write.set()
+            t1.join()
+            t2.join()
+        self.assertEqual('b', self._read_config_file()['something'])
+
+    def test_values_mutated_while_saving_are_not_written(self):
+        config = SimpleConfig(self.options)
+        recently_open = ['wallet1']
+        config.set_key('recently_open', recently_open, save=False)
+        dumps = json.dumps
+        def mutating_dumps(*args, **kwargs):
+            # e.g. the GUI updating the list in place, while the timer writes
+            recently_open.insert(0, 'wallet2')
+            return dumps(*args, **kwargs)
+        with mock.patch('json.dumps', side_effect=mutating_dumps):
+            config.save_user_config()
+        self.assertEqual(['wallet1'], self._read_config_file()['recently_open'])
+
+    def test_failed_save_is_retried(self):
+        config = SimpleConfig(self.options)
+        config.SAVE_DELAY = 0.05
+        config.set_key('something', 'a')
+        timer = config._save_timer
+        with mock.patch.object(config, '_write_user_config', side_effect=PermissionError):
+            timer.join(5)
+        # the change is still pending
+        self.assertTrue(config._dirty)
+        config.flush()
+        self.assertEqual('a', self._read_config_file()['something'])
+
+    def test_crash_during_write_leaves_config_intact(self):
+        config = SimpleConfig(self.options)
+        config.set_key('something', 'a')
+        config.flush()
+        config.set_key('something', 'b')
+        # the process dies after writing the temp file, before replacing the config
+        with mock.patch('os.replace', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                config.flush()
+        self.assertEqual('a', self._read_config_file()['something'])
+        self.assertEqual('a', SimpleConfig(self.options).get('something'))
+        # the next write replaces the stale temp file
+        config.set_key('something', 'c')
+        config.flush()
+        self.assertEqual('c', self._read_config_file()['something'])
+
     def test_depth_target_to_fee(self):
         config = SimpleConfig(self.options)
         config.mempool_fees = [[49, 100110], [10, 121301], [6, 153731], [5, 125872], [1, 36488810]]
@@ -146,6 +250,45 @@ class Test_SimpleConfig(ElectrumTestCase):
         self.assertEqual(495000, config.fee_to_depth(5.5))
         self.assertEqual(36495000, config.fee_to_depth(0.5))
 
+    def test_fee_histogram_interpolation(self):
+        hist = FeeHistogram([[49, 100000], [10, 120000], [6, 150000], [5, 125000], [1, 36000000]])
+        self.assertEqual(100000, hist.fee_to_depth(49, interpolate=True))
+        self.assertEqual(220000, hist.fee_to_depth(10, interpolate=True))
+        self.assertEqual(295000, hist.fee_to_depth(8, interpolate=True))
+        self.assertEqual(49, hist.depth_to_fee(50000, interpolate=True))
+        self.assertEqual(8, hist.depth_to_fee(295000, interpolate=True))
+        self.assertEqual(6, hist.depth_to_fee(295000))
+        self.assertIsNone(hist.depth_to_fee(36495000))
+
+    def test_fee_histogram_matches_linear_scan(self):
+        def fee_to_depth(histogram, target_fee):
+            depth = 0
+            for fee, s in histogram:
+                depth += s
+                if fee <= target_fee:
+                    break
+            return depth
+
+        def depth_to_fee(histogram, target):
+            depth = 0
+            for fee, s in histogram:
+                depth += s
+                if depth > target:
+                    return fee
+            return None
+
+        rng = random.Random(0)
+        for sort in (True, False):
+            histogram = [[rng.randint(1, 1000), rng.randint(0, 10000)] for i in range(200)]
+            if sort:
+                histogram.sort(reverse=True)
+            hist = FeeHistogram(histogram)
+            for i in range(500):
+                fee = rng.uniform(0, 1100)
+                self.assertEqual(fee_to_depth(histogram, fee), hist.fee_to_depth(fee))
+            targets = [rng.randint(0, 1100000) for i in range(500)]
+            self.assertEqual([depth_to_fee(histogram, t) for t in targets], hist.depths_to_fees(targets))
+
 
 class TestUserConfig(ElectrumTestCase):
 
@@ -1,7 +1,11 @@
+import asyncio
+import threading
 from decimal import Decimal
 
 from electrum.util import (format_satoshis, format_fee_satoshis, parse_URI,
-                           is_hash256_str, chunks, is_ip_address, list_enabled_bits)
+                           is_hash256_str, chunks, is_ip_address, list_enabled_bits,
+                           make_page_cursor, read_page_cursor, paginate, InvalidPageCursor,
+                           WakeupEvent)
 
 from . import ElectrumTestCase
 
@@ -129,3 +133,69 @@ class TestUtil(ElectrumTestCase):
         self.assertFalse(is_ip_address("2001:db8:0:0:g:ff00:42:8329"))
         self.assertFalse(is_ip_address("lol"))
         self.assertFalse(is_ip_address(":@ASD:@AS\x77\x22\xff¬!"))
+
+    def test_page_cursor(self):
+        cursor = make_page_cursor('history', 7, {'min_amount': 100}, 250)
+        self.assertEqual(250, read_page_cursor(cursor, 'history', 7, {'min_amount': 100}))
+        position = read_page_cursor(make_page_cursor('requests', None, {}, [1600000000, 'addr']), 'requests', None, {})
+        self.assertEqual([1600000000, 'addr'], position)
+        with self.assertRaises(InvalidPageCursor):
+            read_page_cursor(cursor, 'history', 8, {'min_amount': 100})  # stale
+        with self.assertRaises(InvalidPageCursor):
+            read_page_cursor(cursor, 'history', 7, {'min_amount': 200})  # other filters
+        with self.assertRaises(InvalidPageCursor):
+            read_page_cursor(cursor, 'addresses', 7, {'min_amount': 100})
+        with self.assertRaises(InvalidPageCursor):
+            read_page_cursor('not a cursor', 'history', 7, {'min_amount': 100})
+
+    def test_paginate(self):
+        items = list(range(10))
+        self.assertEqual(([0, 1, 2], 3), paginate(items, 0, 3))
+        self.assertEqual(([9], None), paginate(items, 9, 3))
+        self.assertEqual(([7, 8, 9], None), paginate(items, 7, 3))
+        self.assertEqual(([], None), paginate(items, 10, 3))
+        is_even = lambda x: x % 2 == 0
+        self.assertEqual(([0, 2], 3), paginate(items, 0, 2, is_even))
+        self.assertEqual(([4, 6], 7), paginate(items, 3, 2, is_even))
+        self.assertEqual(([8], None), paginate(items, 7, 2, is_even))
+
+
+class TestWakeupEvent(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.get_event_loop()
+
+    def test_events_are_coalesced(self):
+        wakeup = WakeupEvent(self.loop)
+
+        async def main():
+            for i in range(5):
+                wakeup.set()
+            threading.Thread(target=wakeup.set).start()
+            await asyncio.wait_for(wakeup.wait(), 1)
+            # nothing happened since
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(wakeup.wait(), 0.1)
+        self.loop.run_until_complete(main())
+        self.assertEqual(1, wakeup.wakeups)
+
+    def test_deadlines(self):
+        wakeup = WakeupEvent(self.loop)
+
+        async def main():
+            t0 = self.loop.time()
+            wakeup.set_after(0.2)
+            wakeup.set_after(0.05)
+            await wakeup.wait()
+            self.assertLess(self.loop.time() - t0, 0.15)
+            await wakeup.wait()
+            self.assertGreaterEqual(self.loop.time() - t0, 0.2)
+            # cancelled deadlines do not fire
+            wakeup.set_after(0.05)
+            await asyncio.sleep(0)
+            wakeup.cancel_deadlines()
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(wakeup.wait(), 0.2)
+        self.loop.run_until_complete(main())
+        self.assertEqual(2, wakeup.wakeups)
@@ -0,0 +1,457 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from unittest import mock
+
+from electrum import bitcoin, ecc, lnverifier
+from electrum.channel_db import ChannelDB, DB_VERSION
+from electrum.bitcoin import hash_encode, hash_decode
+from electrum.crypto import sha256d
+from electrum.lnutil import ShortChannelID, FundingOutput, funding_output_script_from_keys
+from electrum.lnverifier import LNChannelVerifier, VerifiedMerkleNodes, FundingOutputWatcher
+from electrum.synchronizer import history_status
+from electrum.util import SilentTaskGroup
+from electrum.transaction import Transaction
+from electrum.verifier import SPV, MerkleVerificationFailure
+
+from . import ElectrumTestCase
+
+
+class FakeBlockchain:
+
+    def height(self):
+        return 1000
+
+    def read_header(self, height):
+        return {'merkle_root': '00' * 32}
+
+    def get_hash(self, height):
+        return '00' * 32
+
+
+class FakeNetwork:
+
+    def __init__(self, loop):
+        self.asyncio_loop = loop
+        self.interface = None
+        self.callbacks = []
+        self._blockchain = FakeBlockchain()
+        self.requests = []
+
+    def register_callback(self, callback, events):
+        self.callbacks.append((callback, events))
+
+    def unregister_callback(self, callback):
+        self.callbacks = [(cb, events) for cb, events in self.callbacks if cb != callback]
+
+    def trigger_callback(self, event):
+        for callback, events in self.callbacks:
+            if event in events:
+                self.asyncio_loop.call_soon_threadsafe(callback, event)
+
+    def blockchain(self):
+        return self._blockchain
+
+    async def get_merkle_for_transaction(self, tx_hash, tx_height):
+        self.requests.append(tx_hash)
+        await asyncio.Future()  # never answered
+
+    async def get_txid_from_txpos(self, block_height, txpos, merkle):
+        self.requests.append((block_height, txpos))
+        await asyncio.Future()
+
+
+class FakeWallet:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.unverified_tx = {}
+        self.scans = 0
+
+    def diagnostic_name(self):
+        return 'wallet'
+
+    def get_unverified_txs(self):
+        self.scans += 1
+        with self.lock:
+            return dict(self.unverified_tx)
+
+
+class FakeChannelDB:
+
+    def __init__(self):
+        self.channels = {}
+        self.funding_outputs = {}
+
+    def get_funding_output(self, short_channel_id):
+        return self.funding_outputs.get(short_channel_id)
+
+    def add_funding_output(self, short_channel_id, funding_output):
+        self.funding_outputs[short_channel_id] = funding_output
+
+    def add_verified_channel_info(self, msg, *, capacity_sat=None):
+        self.channels[ShortChannelID(msg['short_channel_id'])] = capacity_sat
+
+
+class TestIdleVerifiers(ElectrumTestCase):
+    """The verifiers sleep until there is something to verify."""
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.get_event_loop()
+        self.network = FakeNetwork(self.loop)
+
+    def run_for(self, seconds):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def simulate_idle_hour(self):
+        """Runs the loop, with its clock advanced by an hour."""
+        real_time = self.loop.time
+        with mock.patch.object(self.loop, 'time', lambda: real_time() + 3600):
+            self.run_for(0.2)
+
+    def start(self, job):
+        self.job = job
+        self.task = asyncio.ensure_future(job.main())
+        job.wake_up()
+
+    def tearDown(self):
+        self.task.cancel()
+        self.loop.run_until_complete(asyncio.gather(self.task, return_exceptions=True))
+        self.loop.run_until_complete(self.job.group.cancel_remaining())
+        super().tearDown()
+
+    def test_spv(self):
+        wallet = FakeWallet()
+        spv = SPV(self.network, wallet)
+        self.start(spv)
+        self.run_for(0.3)
+        self.assertEqual(1, spv._wakeup.wakeups)
+        cpu = time.process_time()
+        self.simulate_idle_hour()
+        self.assertLess(time.process_time() - cpu, 0.1)
+        self.assertEqual(1, spv._wakeup.wakeups)
+        self.assertEqual(1, wallet.scans)
+        # a new transaction to verify
+        wallet.unverified_tx['aa' * 32] = 900
+        spv.wake_up()
+        self.run_for(0.2)
+        self.assertEqual(['aa' * 32], self.network.requests)
+        # new headers
+        self.network.trigger_callback('blockchain_updated')
+        self.run_for(0.2)
+        self.assertEqual(3, spv._wakeup.wakeups)
+        self.assertEqual(['aa' * 32], self.network.requests)
+
+    def test_channel_verifier(self):
+        verifier = LNChannelVerifier(self.network, channel_db=FakeChannelDB())
+        self.start(verifier)
+        self.run_for(0.3)
+        self.simulate_idle_hour()
+        self.assertEqual(1, verifier._wakeup.wakeups)
+        # a burst of announcements is handled in one pass
+        for i in range(10):
+            verifier.add_new_channel_info(ShortChannelID.from_components(900, i, 0), {})
+        self.run_for(0.3)
+        self.assertEqual(2, verifier._wakeup.wakeups)
+        self.assertEqual(10, len(self.network.requests))
+
+
+def merkle_branch(tx_hashes, pos):
+    level = [hash_decode(tx_hash) for tx_hash in tx_hashes]
+    branch = []
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        branch.append(hash_encode(level[pos ^ 1]))
+        level = [sha256d(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+        pos >>= 1
+    return branch, hash_encode(level[0])
+
+
+def funding_tx(i, msg, value_sat):
+    redeem_script = funding_output_script_from_keys(msg['bitcoin_key_1'], msg['bitcoin_key_2'])
+    script = bitcoin.address_to_script(bitcoin.redeem_script_to_address('p2wsh', redeem_script))
+    return ('02000000' + '01' + '%064x' % (i + 1) + '00000000' + '00' + 'ffffffff'
+            + '01' + value_sat.to_bytes(8, 'little').hex() + '%02x' % (len(script) // 2) + script
+            + '00000000')
+
+
+class FakeGossipServer(FakeNetwork):
+    """Answers the requests of the channel verifier for the given blocks,
+    each a list of (raw_tx, channel_announcement)."""
+
+    def __init__(self, loop, blocks):
+        super().__init__(loop)
+        self.bhi_lock = asyncio.Lock()
+        self.blocks = blocks
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.txs = {}
+        self.merkle_roots = {}
+        for height, txs in blocks.items():
+            tx_hashes = [Transaction(raw_tx).txid() for raw_tx, msg in txs]
+            self.txs.update(zip(tx_hashes, (raw_tx for raw_tx, msg in txs)))
+            self.merkle_roots[height] = merkle_branch(tx_hashes, 0)[1]
+        self._blockchain.read_header = lambda height: {'merkle_root': self.merkle_roots[height]}
+
+    async def request(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+
+    async def get_txid_from_txpos(self, block_height, txpos, merkle):
+        await self.request()
+        tx_hashes = [Transaction(raw_tx).txid() for raw_tx, msg in self.blocks[block_height]]
+        self.requests.append((block_height, txpos))
+        return {'tx_hash': tx_hashes[txpos], 'merkle': merkle_branch(tx_hashes, txpos)[0]}
+
+    async def get_transaction(self, tx_hash):
+        await self.request()
+        return self.txs[tx_hash]
+
+
+class TestChannelVerification(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.get_event_loop()
+        self.blocks = {}
+        i = 0
+        for height in range(900, 905):
+            self.blocks[height] = []
+            for txpos in range(30):
+                keys = sorted(ecc.ECPrivkey.from_secret_scalar(2 * i + k + 1).get_public_key_bytes()
+                              for k in range(2))
+                msg = {'short_channel_id': ShortChannelID.from_components(height, txpos, 0),
+                       'bitcoin_key_1': keys[0], 'bitcoin_key_2': keys[1]}
+                self.blocks[height].append((funding_tx(i, msg, 100_000 + i), msg))
+                i += 1
+        self.channel_db = FakeChannelDB()
+
+    def verify_all(self, network):
+        verifier = LNChannelVerifier(network, self.channel_db)
+        for txs in self.blocks.values():
+            for raw_tx, msg in txs:
+                verifier.add_new_channel_info(msg['short_channel_id'], msg)
+        task = asyncio.ensure_future(verifier.main())
+        try:
+            for i in range(100):
+                if not verifier.unverified_channel_info:
+                    break
+                self.loop.run_until_complete(asyncio.sleep(0.05))
+        finally:
+            task.cancel()
+            self.loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+            self.loop.run_until_complete(verifier.group.cancel_remaining())
+        self.assertEqual({}, verifier.unverified_channel_info)
+
+    def test_verified_merkle_nodes(self):
+        tx_hashes = ['%064x' % (i + 1) for i in range(13)]
+        branch, merkle_root = merkle_branch(tx_hashes, 0)
+        nodes = VerifiedMerkleNodes(900, {'merkle_root': merkle_root})
+        nodes.verify(tx_hashes[0], branch, 0)
+        self.assertEqual(4, len(nodes.nodes))
+        # the neighbour shares all of its branch
+        nodes.verify(tx_hashes[1], merkle_branch(tx_hashes, 1)[0], 1)
+        self.assertEqual(4, len(nodes.nodes))
+        for pos in range(2, 13):
+            nodes.verify(tx_hashes[pos], merkle_branch(tx_hashes, pos)[0], pos)
+        with self.assertRaises(MerkleVerificationFailure):
+            nodes.verify('%064x' % 100, merkle_branch(tx_hashes, 5)[0], 5)
+        with self.assertRaises(MerkleVerificationFailure):
+            nodes.verify(tx_hashes[5], merkle_branch(tx_hashes, 5)[0], 4)
+        with self.assertRaises(MerkleVerificationFailure):
+            nodes.verify(tx_hashes[5], merkle_branch(tx_hashes, 5)[0][:-1], 5)
+        with self.assertRaises(MerkleVerificationFailure):
+            VerifiedMerkleNodes(901, None).verify(tx_hashes[0], branch, 0)
+
+    def test_bounded_concurrency(self):
+        network = FakeGossipServer(self.loop, self.blocks)
+        self.verify_all(network)
+        self.assertEqual(150, len(self.channel_db.channels))
+        self.assertEqual(150, len(self.channel_db.funding_outputs))
+        self.assertEqual(100_000, self.channel_db.channels[ShortChannelID.from_components(900, 0, 0)])
+        self.assertEqual(150, len(network.requests))
+        self.assertLessEqual(network.max_in_flight, lnverifier.MAX_CONCURRENT_REQUESTS)
+
+    def test_verified_funding_outputs_are_remembered(self):
+        self.verify_all(FakeGossipServer(self.loop, self.blocks))
+        # after a restart, the announcements are verified without the server
+        self.channel_db.channels.clear()
+        network = FakeGossipServer(self.loop, self.blocks)
+        self.verify_all(network)
+        self.assertEqual(150, len(self.channel_db.channels))
+        self.assertEqual([], network.requests)
+
+    def test_funding_output_mismatch(self):
+        txs = self.blocks[900]
+        raw_tx, msg = txs[0]
+        # announcement with the keys of another channel
+        txs[0] = (raw_tx, dict(txs[1][1], short_channel_id=msg['short_channel_id']))
+        self.blocks = {900: txs}
+        self.verify_all(FakeGossipServer(self.loop, self.blocks))
+        self.assertEqual(29, len(self.channel_db.channels))
+        self.assertNotIn(msg['short_channel_id'], self.channel_db.channels)
+
+
+class FakeSession:
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.queues = []
+
+    async def subscribe(self, method, params, queue):
+        self.queues.append(queue)
+        await queue.put([params[0], self.statuses.get(params[0])])
+
+    def unsubscribe(self, queue):
+        pass
+
+    async def notify(self, sh, status):
+        self.statuses[sh] = status
+        for queue in self.queues:
+            await queue.put([sh, status])
+
+
+class FakeInterface:
+
+    def __init__(self, session):
+        self.group = SilentTaskGroup()
+        self.session = session
+
+
+def spending_tx(txid, output_index):
+    return ('02000000' + '01' + bytes.fromhex(txid)[::-1].hex() + output_index.to_bytes(4, 'little').hex()
+            + '00' + 'ffffffff' + '01' + (90_000).to_bytes(8, 'little').hex() + '0100' + '00000000')
+
+
+class FakeChainServer(FakeNetwork):
+    """Knows the funding outputs of the channels, and the transactions spending them."""
+
+    def __init__(self, loop, funding_outputs):
+        super().__init__(loop)
+        self.histories = {}
+        self.txs = {}
+        statuses = {}
+        for short_channel_id, funding_output in funding_outputs.items():
+            self.add_funding_output(short_channel_id, funding_output, statuses)
+        self.interface = FakeInterface(FakeSession(statuses))
+
+    def add_funding_output(self, short_channel_id, funding_output, statuses):
+        sh = bitcoin.script_to_scripthash(funding_output.script)
+        self.histories[sh] = [{'tx_hash': funding_output.txid, 'height': short_channel_id.block_height}]
+        statuses[sh] = history_status([(funding_output.txid, short_channel_id.block_height)])
+
+    async def spend(self, short_channel_id, funding_output, *, height=1000, spent_outpoint=None):
+        """spent_outpoint: what the transaction really spends"""
+        raw_tx = spending_tx(*(spent_outpoint or (funding_output.txid, short_channel_id.output_index)))
+        txid = Transaction(raw_tx).txid()
+        self.txs[txid] = raw_tx
+        sh = bitcoin.script_to_scripthash(funding_output.script)
+        self.histories[sh].append({'tx_hash': txid, 'height': height})
+        await self.interface.session.notify(sh, history_status([(item['tx_hash'], item['height'])
+                                                                for item in self.histories[sh]]))
+
+    async def get_history_for_scripthash(self, sh, *, status=None):
+        self.requests.append(sh)
+        return self.histories[sh]
+
+    async def get_transaction(self, txid):
+        return self.txs[txid]
+
+
+class TestFundingOutputWatcher(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.get_event_loop()
+        self.channel_db = FakeChannelDB()
+        self.channel_db.data_loaded = asyncio.Event()
+        self.channel_db.spent = []
+        self.channel_db.get_funding_outputs = lambda: dict(self.channel_db.funding_outputs)
+        self.channel_db.remove_spent_channel = self.channel_db.spent.append
+        for i in range(10):
+            short_channel_id = ShortChannelID.from_components(900 + i, 1, i % 2)
+            script = bitcoin.p2wsh_nested_script('%064x' % i)
+            self.channel_db.funding_outputs[short_channel_id] = FundingOutput('%064x' % i, script, 100_000)
+
+    def run_for(self, seconds):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def test_spent_funding_outputs(self):
+        network = FakeChainServer(self.loop, self.channel_db.funding_outputs)
+        watcher = FundingOutputWatcher(network, self.channel_db)
+        self.channel_db.data_loaded.set()
+        self.run_for(0.1)
+        self.assertEqual(10, len(watcher.channels_for_address))
+        # unspent funding outputs do not need any request
+        self.assertEqual([], network.requests)
+        closed = list(self.channel_db.funding_outputs)[:3]
+        for short_channel_id in closed:
+            self.loop.run_until_complete(network.spend(short_channel_id, self.channel_db.funding_outputs[short_channel_id]))
+        self.run_for(0.1)
+        self.assertEqual(closed, self.channel_db.spent)
+        self.assertEqual(3, len(network.requests))
+        self.assertEqual(7, len(watcher.channels_for_address))
+        # a new verified channel is watched too
+        short_channel_id = ShortChannelID.from_components(950, 1, 0)
+        funding_output = FundingOutput('%064x' % 50, bitcoin.p2wsh_nested_script('%064x' % 50), 100_000)
+        self.channel_db.funding_outputs[short_channel_id] = funding_output
+        network.add_funding_output(short_channel_id, funding_output, network.interface.session.statuses)
+        network.interface.session.statuses[bitcoin.script_to_scripthash(funding_output.script)] = 'bb' * 32
+        watcher.watch(short_channel_id, funding_output)
+        self.run_for(0.1)
+        self.assertEqual(8, len(watcher.channels_for_address))
+        self.assertEqual(4, len(network.requests))
+        self.assertEqual(closed, self.channel_db.spent)
+        self.loop.run_until_complete(watcher.stop())
+
+    def test_channels_are_only_removed_once_the_spend_is_confirmed(self):
+        network = FakeChainServer(self.loop, self.channel_db.funding_outputs)
+        watcher = FundingOutputWatcher(network, self.channel_db)
+        self.channel_db.data_loaded.set()
+        self.run_for(0.1)
+        (scid1, fo1), (scid2, fo2), (scid3, fo3) = list(self.channel_db.funding_outputs.items())[:3]
+        # a transaction that does not spend the funding output
+        self.loop.run_until_complete(network.spend(scid1, fo1, spent_outpoint=('%064x' % 99, 0)))
+        # a spend in the mempool may still be replaced
+        self.loop.run_until_complete(network.spend(scid2, fo2, height=0))
+        # a status that matches nothing the server knows
+        self.loop.run_until_complete(network.interface.session.notify(bitcoin.script_to_scripthash(fo3.script), 'cc' * 32))
+        self.run_for(0.1)
+        self.assertEqual([], self.channel_db.spent)
+        self.assertEqual(10, len(watcher.channels_for_address))
+        # once confirmed
+        network.histories[bitcoin.script_to_scripthash(fo2.script)][-1]['height'] = 1000
+        self.loop.run_until_complete(network.interface.session.notify(bitcoin.script_to_scripthash(fo2.script), 'dd' * 32))
+        self.run_for(0.1)
+        self.assertEqual([scid2], self.channel_db.spent)
+        self.loop.run_until_complete(watcher.stop())
+
+
+class TestChannelDBUpgrade(ElectrumTestCase):
+
+    def test_funding_outputs_without_txid_are_verified_again(self):
+        conn = sqlite3.connect(':memory:')
+        c = conn.cursor()
+        # as created before funding outputs had a txid
+        c.execute("CREATE TABLE channel_info (short_channel_id VARCHAR(64), node1_id VARCHAR(66), "
+                  "node2_id VARCHAR(66), capacity_sat INTEGER, PRIMARY KEY(short_channel_id))")
+        c.execute("CREATE TABLE funding_output (short_channel_id VARCHAR(64), script VARCHAR(128), "
+                  "value_sat INTEGER NOT NULL, PRIMARY KEY(short_channel_id))")
+        c.execute("INSERT INTO channel_info VALUES (?,?,?,?)", ('verified', 'node1', 'node2', 1000))
+        c.execute("INSERT INTO channel_info VALUES (?,?,?,?)", ('trusted', 'node1', 'node2', 1000))
+        c.execute("INSERT INTO funding_output VALUES (?,?,?)", ('verified', 'script', 1000))
+        db = mock.Mock(conn=conn)
+        db.upgrade_database = lambda c: ChannelDB.upgrade_database(db, c)
+        ChannelDB.create_database(db)
+        self.assertEqual([('trusted',)], c.execute("SELECT short_channel_id FROM channel_info").fetchall())
+        self.assertEqual(DB_VERSION, c.execute("PRAGMA user_version").fetchone()[0])
+        # funding outputs of the new schema are kept
+        c.execute("INSERT INTO funding_output VALUES (?,?,?,?)", ('trusted', 'ab' * 32, 'script', 1000))
+        ChannelDB.create_database(db)
+        self.assertEqual([('trusted', 'ab' * 32, 'script', 1000)],
+                         c.execute("SELECT short_channel_id, txid, script, value_sat FROM funding_output").fetchall())
@@ -5,15 +5,20 @@ import os
 import json
 from decimal import Decimal
 import time
+from datetime import datetime
 
 from io import StringIO
 from electrum.storage import WalletStorage
 from electrum.wallet_db import FINAL_SEED_VERSION
 from electrum.wallet import (Abstract_Wallet, Standard_Wallet, create_new_wallet,
-                             restore_wallet_from_text, Imported_Wallet)
-from electrum.exchange_rate import ExchangeBase, FxThread
+                             restore_wallet_from_text, Imported_Wallet, FiatValuation)
+from electrum.exchange_rate import ExchangeBase, FxThread, HistoricalRates
+from electrum.address_synchronizer import HistoryItem
 from electrum.util import TxMinedInfo
 from electrum.bitcoin import COIN
+from electrum import bitcoin
+from electrum.transaction import (PartialTransaction, PartialTxInput, PartialTxOutput,
+                                  TxOutpoint)
 from electrum.wallet_db import WalletDB
 from electrum.simple_config import SimpleConfig
 
@@ -95,6 +100,7 @@ class FakeFxThread:
 
     remove_thousands_separator = staticmethod(FxThread.remove_thousands_separator)
     timestamp_rate = FxThread.timestamp_rate
+    timestamp_rates = FxThread.timestamp_rates
     ccy_amount_str = FxThread.ccy_amount_str
     history_rate = FxThread.history_rate
 
@@ -150,6 +156,86 @@ class TestFiat(ElectrumTestCase):
         self.assertNotIn(ccy, self.fiat_value)
 
 
+class FakeHistoryWallet:
+    """Wallet receiving coins in tx 'a', and spending them in 'b' then 'c'."""
+    DAY = 24 * 3600
+
+    def __init__(self):
+        self.fiat_value = {}
+        self.timestamps = {'a': 20 * self.DAY, 'b': 30 * self.DAY, 'c': 40 * self.DAY}
+        self.txi = {
+            'b': {'addr1': [('a:0', COIN)]},
+            'c': {'addr2': [('b:1', COIN // 2)]},
+        }
+        self.db = self
+
+    def get_txi_addresses(self, txid):
+        return list(self.txi.get(txid, {}))
+
+    def get_txi_addr(self, txid, addr):
+        return self.txi[txid][addr]
+
+    def get_tx_height(self, txid):
+        return TxMinedInfo(height=10, conf=10, timestamp=self.timestamps[txid], header_hash='def')
+
+    def get_history(self):
+        return [HistoryItem(txid=txid, tx_mined_status=self.get_tx_height(txid), delta=None, fee=None, balance=None)
+                for txid in ('a', 'b', 'c')]
+
+    get_fiat_value = Abstract_Wallet.get_fiat_value
+
+
+class TestFiatValuation(ElectrumTestCase):
+    DAY = FakeHistoryWallet.DAY
+
+    def setUp(self):
+        super().setUp()
+        exchange = FakeExchange(Decimal('1000'))
+        history = {}
+        for day in range(50):
+            d_t = datetime.fromtimestamp(day * self.DAY)
+            history[d_t.strftime('%Y-%m-%d')] = 100.5 + day
+        history['timestamp'] = 0
+        exchange.history[ccy] = history
+        self.fx = FakeFxThread(exchange)
+
+    def test_rate_table(self):
+        table = HistoricalRates({'2020-01-01': 1.5, '2020-01-03': 3, 'timestamp': 123})
+        day = datetime(2020, 1, 1).toordinal()
+        self.assertEqual(Decimal(1.5), table.get(day))
+        self.assertEqual(None, table.get(day + 1))
+        self.assertEqual(Decimal(3), table.get(day + 2))
+        self.assertEqual(None, table.get(day - 1))
+        self.assertEqual(None, table.get(day + 3))
+        self.assertEqual(None, HistoricalRates(None).get(day))
+
+    def test_timestamp_rates_match_timestamp_rate(self):
+        timestamps = [None, 0, 3 * self.DAY + 5, 3 * self.DAY + 7, 49 * self.DAY, 60 * self.DAY, int(time.time())]
+        expected = [self.fx.timestamp_rate(ts) for ts in timestamps]
+        self.assertEqual([str(r) for r in expected],
+                         [str(r) for r in self.fx.timestamp_rates(timestamps)])
+        self.assertEqual(Decimal(1000), self.fx.timestamp_rates([int(time.time())])[0])
+
+    def test_acquisition_price(self):
+        wallet = FakeHistoryWallet()
+        valuation = FiatValuation(wallet, self.fx)
+        rate_a = self.fx.timestamp_rate(wallet.timestamps['a'])
+        self.assertEqual(rate_a, valuation.rate('a'))
+        # coins of 'c' were acquired in 'a'
+        self.assertEqual(rate_a, valuation.average_price('b'))
+        self.assertEqual(rate_a, valuation.average_price('c'))
+        rate_c = self.fx.timestamp_rate(wallet.timestamps['c'])
+        item = valuation.get_tx_item_fiat('c', -COIN // 2, 1000)
+        self.assertEqual(rate_c, item['fiat_rate'].value)
+        self.assertEqual(-rate_c / 2, item['fiat_value'].value)
+        self.assertEqual(rate_a / 2, item['acquisition_price'].value)
+        self.assertEqual((rate_c - rate_a) / 2, item['capital_gain'].value)
+        # a saved fiat value is used as the acquisition price of the received coins
+        wallet.fiat_value[ccy] = {'a': '50'}
+        valuation = FiatValuation(wallet, self.fx)
+        self.assertEqual(Decimal(50), valuation.average_price('c'))
+
+
 class TestCreateRestoreWallet(WalletTestCase):
 
     def test_create_new_wallet(self):
@@ -229,3 +315,51 @@ class TestCreateRestoreWallet(WalletTestCase):
         # also test addr deletion
         wallet.delete_address('bc1qnp78h78vp92pwdwq5xvh8eprlga5q8gu66960c')
         self.assertEqual(1, len(wallet.get_receiving_addresses()))
+
+
+class TestHistoryChanges(WalletTestCase):
+
+    def setUp(self):
+        super().setUp()
+        db = WalletDB('', manual_upgrades=False)
+        self.wallet = Imported_Wallet(db, None, config=self.config)
+        self.addr1 = bitcoin.public_key_to_p2pkh(bytes.fromhex('02' + '11' * 32))
+        self.addr2 = bitcoin.public_key_to_p2pkh(bytes.fromhex('02' + '22' * 32))
+        self.wallet.import_address(self.addr1)
+        self.wallet.import_address(self.addr2)
+
+    def _make_tx(self, addr, value):
+        txin = PartialTxInput(prevout=TxOutpoint(bytes([value % 256]) * 32, 0))
+        txin.script_sig = b''
+        txout = PartialTxOutput.from_address_and_value(addr, value)
+        return PartialTransaction.from_io([txin], [txout])
+
+    def test_changes_since_version(self):
+        wallet = self.wallet
+        version0 = wallet.get_history_version()
+        tx1 = self._make_tx(self.addr1, 1000)
+        self.assertTrue(wallet.add_transaction(tx1))
+        version1 = wallet.get_history_version()
+        self.assertGreater(version1, version0)
+        changes = wallet.get_history_changes_since(version0)
+        self.assertEqual({tx1.txid()}, changes.txids)
+        self.assertEqual({self.addr1}, changes.addresses)
+        self.assertEqual(set(), wallet.get_history_changes_since(version1).addresses)
+        tx2 = self._make_tx(self.addr2, 2000)
+        self.assertTrue(wallet.add_transaction(tx2))
+        self.assertEqual({self.addr2}, wallet.get_history_changes_since(version1).addresses)
+        self.assertEqual({self.addr1, self.addr2}, wallet.get_history_changes_since(version0).addresses)
+        # removed transactions still report their addresses
+        version2 = wallet.get_history_version()
+        wallet.remove_transaction(tx1.txid())
+        changes = wallet.get_history_changes_since(version2)
+        self.assertEqual({tx1.txid()}, changes.txids)
+        self.assertEqual({self.addr1}, changes.addresses)
+
+    def test_changes_unknown_after_clear_history(self):
+        wallet = self.wallet
+        version0 = wallet.get_history_version()
+        self.assertTrue(wallet.add_transaction(self._make_tx(self.addr1, 1000)))
+        wallet.clear_history()
+        self.assertIsNone(wallet.get_history_changes_since(version0))
+        self.assertIsNotNone(wallet.get_history_changes_since(wallet.get_history_version()))
@@ -5,11 +5,11 @@ import tempfile
 from typing import Sequence
 import asyncio
 
-from electrum import storage, bitcoin, keystore, bip32, wallet
+from electrum import storage, bitcoin, keystore, bip32, wallet, ecc
 from electrum import Transaction
 from electrum import SimpleConfig
 from electrum.address_synchronizer import TX_HEIGHT_UNCONFIRMED, TX_HEIGHT_UNCONF_PARENT
-from electrum.wallet import sweep, Multisig_Wallet, Standard_Wallet, Imported_Wallet, restore_wallet_from_text, Abstract_Wallet
+from electrum.wallet import sweep, sweep_batch, Multisig_Wallet, Standard_Wallet, Imported_Wallet, restore_wallet_from_text, Abstract_Wallet
 from electrum.util import bfh, bh2u
 from electrum.transaction import TxOutput, Transaction, PartialTransaction, PartialTxOutput, PartialTxInput, tx_from_any
 from electrum.mnemonic import seed_type
@@ -1394,6 +1394,58 @@ class TestWalletSending(TestCaseForTestnet):
         self.assertEqual('7f827fc5256c274fd1094eb7e020c8ded0baf820356f61aa4f14a9093b0ea0ee', tx_copy.txid())
         self.assertEqual('7f827fc5256c274fd1094eb7e020c8ded0baf820356f61aa4f14a9093b0ea0ee', tx_copy.wtxid())
 
+    def test_sweep_batch(self):
+
+        class FakeServer:
+            relay_fee = 1000
+            def __init__(self):
+                self.utxos = {}
+                self.in_flight = 0
+                self.max_in_flight = 0
+                self.num_requests = 0
+            def run_from_another_thread(self, coro):
+                loop = asyncio.get_event_loop()
+                return loop.run_until_complete(coro)
+            async def listunspent_for_scripthash(self, scripthash):
+                self.num_requests += 1
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                await asyncio.sleep(0)
+                self.in_flight -= 1
+                return self.utxos.get(scripthash, [])
+
+        network = FakeServer()
+        privkeys = []
+        for i in range(1, 301):
+            secret = i.to_bytes(32, 'big')
+            privkeys.append(bitcoin.serialize_privkey(secret, True, 'p2pkh'))
+            pubkey = bh2u(ecc.ECPrivkey(secret).get_public_key_bytes(compressed=True))
+            scripthash = bitcoin.address_to_scripthash(bitcoin.pubkey_to_address('p2pkh', pubkey))
+            network.utxos[scripthash] = [{'tx_hash': bh2u(bitcoin.sha256(bytes([i % 256, i // 256]))),
+                                          'tx_pos': 0, 'height': 1000, 'value': 100000}]
+        dest_addr = bitcoin.pubkey_to_address('p2pkh', bh2u(ecc.ECPrivkey(b'\x01' * 32).get_public_key_bytes()))
+        txs = sweep_batch(privkeys, network=network, config=None, to_address=dest_addr,
+                          fee_per_kb=1000, max_inputs=120, locktime=1000)
+        # p2pkh and p2pk lookups for each key, at most SWEEP_CONCURRENCY at a time
+        self.assertEqual(600, network.num_requests)
+        self.assertEqual(wallet.SWEEP_CONCURRENCY, network.max_in_flight)
+        self.assertEqual([120, 120, 60], [len(tx.inputs()) for tx in txs])
+        for tx in txs:
+            self.assertTrue(tx.is_complete())
+            tx_copy = tx_from_any(tx.serialize())
+            self.assertEqual(1, len(tx_copy.outputs()))
+            fee = tx.input_value() - tx.output_value()
+            # 1 sat/byte, estimated before signing
+            self.assertLess(abs(tx.estimated_size() - fee), 0.01 * fee)
+        swept = {txin.prevout.to_str() for tx in txs for txin in tx.inputs()}
+        self.assertEqual(300, len(swept))
+        # size cap
+        txs = sweep_batch(privkeys, network=network, config=None, to_address=dest_addr,
+                          fee_per_kb=1000, max_vsize=10000, locktime=1000)
+        self.assertEqual(300, sum(len(tx.inputs()) for tx in txs))
+        for tx in txs:
+            self.assertLessEqual(tx.estimated_size(), 10000)
+
     @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
     def test_coinjoin_between_two_p2wpkh_electrum_seeds(self, mock_save_db):
         wallet1 = WalletIntegrityHelper.create_standard_wallet(
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+from collections import defaultdict
+
+from electrum import bitcoin
+from electrum.simple_config import SimpleConfig
+from electrum.util import SilentTaskGroup
+from electrum.websockets import BalanceMonitor
+
+from . import ElectrumTestCase
+
+
+class FakeSession:
+
+    def __init__(self):
+        self.subscriptions = defaultdict(list)
+        self.statuses = {}
+
+    async def subscribe(self, method, params, queue):
+        sh = params[0]
+        self.subscriptions[sh].append(queue)
+        await queue.put([sh, self.statuses.get(sh)])
+
+    def unsubscribe(self, queue):
+        for queues in self.subscriptions.values():
+            if queue in queues:
+                queues.remove(queue)
+
+    def unsubscribe_from(self, method, params, queue):
+        queues = self.subscriptions[params[0]]
+        if queue in queues:
+            queues.remove(queue)
+
+    async def notify(self, sh, status):
+        self.statuses[sh] = status
+        for queue in self.subscriptions[sh]:
+            await queue.put([sh, status])
+
+
+class FakeInterface:
+
+    def __init__(self):
+        self.group = SilentTaskGroup()
+        self.session = FakeSession()
+
+
+class FakeNetwork:
+
+    def __init__(self, loop):
+        self.asyncio_loop = loop
+        self.interface = FakeInterface()
+        self.balances = {}
+        self.balance_queries = 0
+
+    def register_callback(self, callback, events):
+        pass
+
+    def unregister_callback(self, callback):
+        pass
+
+    async def get_balance_for_scripthash(self, sh):
+        self.balance_queries += 1
+        await asyncio.sleep(0.01)
+        return self.balances.get(sh, {'confirmed': 0, 'unconfirmed': 0})
+
+
+class FakeWebSocket:
+
+    def __init__(self):
+        self.closed = False
+        self.messages = []
+
+    async def send_str(self, data):
+        self.messages.append(data)
+
+
+class TestBalanceMonitor(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.get_event_loop()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path,
+                                    'requests_dir': self.electrum_path})
+        self.network = FakeNetwork(self.loop)
+        self.monitor = BalanceMonitor(self.config, self.network)
+        self.addr = bitcoin.hash160_to_p2pkh(bytes(20))
+        self.sh = bitcoin.address_to_scripthash(self.addr)
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.monitor.stop())
+        super().tearDown()
+
+    def add_request(self, request_id, addr, amount):
+        d = os.path.join(self.electrum_path, 'req', request_id[0], request_id[1], request_id)
+        os.makedirs(d)
+        with open(os.path.join(d, request_id + '.json'), 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'address': addr, 'amount': amount}))
+
+    def run_coro(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_clients_share_subscription_and_balance_query(self):
+        self.add_request('req1', self.addr, 1000)
+        self.add_request('req2', self.addr, 5000)
+        clients = [FakeWebSocket() for i in range(5)]
+        for ws in clients[:4]:
+            self.run_coro(self.monitor.watch(ws, 'req1'))
+        self.run_coro(self.monitor.watch(clients[4], 'req2'))
+        self.run_coro(asyncio.sleep(0.05))
+        self.assertEqual(1, len(self.network.interface.session.subscriptions[self.sh]))
+        # no history: no balance query
+        self.assertEqual(0, self.network.balance_queries)
+        self.network.balances[self.sh] = {'confirmed': 0, 'unconfirmed': 1000}
+        self.run_coro(self.network.interface.session.notify(self.sh, 'status1'))
+        self.run_coro(asyncio.sleep(0.05))
+        self.assertEqual(1, self.network.balance_queries)
+        self.assertEqual([['paid']] * 4 + [[]], [ws.messages for ws in clients])
+        # a late client is answered from the cached balance
+        late = FakeWebSocket()
+        self.run_coro(self.monitor.watch(late, 'req1'))
+        self.assertEqual(['paid'], late.messages)
+        self.assertEqual(1, self.network.balance_queries)
+        self.assertEqual(1, len(self.network.interface.session.subscriptions[self.sh]))
+
+    def test_request_metadata_is_cached(self):
+        self.add_request('req1', self.addr, 1000)
+        ws = FakeWebSocket()
+        self.run_coro(self.monitor.watch(ws, 'req1'))
+        os.remove(os.path.join(self.electrum_path, 'req', 'r', 'e', 'req1', 'req1.json'))
+        self.assertEqual((self.addr, 1000), self.monitor.get_request('req1'))
+
+    def test_closed_clients_are_dropped(self):
+        self.add_request('req1', self.addr, 1000)
+        ws = FakeWebSocket()
+        self.run_coro(self.monitor.watch(ws, 'req1'))
+        self.monitor.unwatch(ws)
+        self.assertEqual({}, dict(self.monitor.watchers))
+        self.network.balances[self.sh] = {'confirmed': 1000, 'unconfirmed': 0}
+        self.run_coro(self.network.interface.session.notify(self.sh, 'status1'))
+        self.run_coro(asyncio.sleep(0.05))
+        # nobody is watching, so the balance is not queried
+        self.assertEqual(0, self.network.balance_queries)
+        self.assertEqual([], ws.messages)
+
+    def test_unwatched_addresses_are_forgotten(self):
+        self.add_request('req1', self.addr, 1000)
+        ws = FakeWebSocket()
+        self.run_coro(self.monitor.watch(ws, 'req1'))
+        self.run_coro(asyncio.sleep(0.05))
+        self.assertEqual({self.addr: None}, self.monitor.statuses)
+        self.monitor.unwatch(ws)
+        self.assertEqual({}, self.monitor.statuses)
+        self.assertEqual(set(), self.monitor.subscribed)
+        self.assertEqual({}, self.monitor.scripthash_to_address)
+        self.assertEqual([], self.network.interface.session.subscriptions[self.sh])
+        # watching again subscribes again
+        ws = FakeWebSocket()
+        self.run_coro(self.monitor.watch(ws, 'req1'))
+        self.run_coro(asyncio.sleep(0.05))
+        self.assertEqual(1, len(self.network.interface.session.subscriptions[self.sh]))
+        # once paid, the address is forgotten
+        self.network.balances[self.sh] = {'confirmed': 1000, 'unconfirmed': 0}
+        self.run_coro(self.network.interface.session.notify(self.sh, 'status1'))
+        self.run_coro(asyncio.sleep(0.05))
+        self.assertEqual(['paid'], ws.messages)
+        self.assertEqual({}, self.monitor.statuses)
+        self.assertEqual({}, self.monitor.balances)
+        self.assertEqual(set(), self.monitor.subscribed)
+        self.assertEqual([], self.network.interface.session.subscriptions[self.sh])
@@ -733,6 +733,10 @@ class Transaction:
                                           hashSequence=hashSequence,
                                           hashOutputs=hashOutputs)
 
+    def _calc_legacy_preimage_inputs(self) -> List[str]:
+        # inputs as serialized in legacy sighash preimages, other than the one being signed
+        return [self.serialize_input(txin, '') for txin in self.inputs()]
+
     def is_segwit(self, *, guess_for_address=False):
         return any(self.is_segwit_input(txin, guess_for_address=guess_for_address)
                    for txin in self.inputs())
@@ -1699,7 +1703,8 @@ class PartialTransaction(Transaction):
             return None
 
     def serialize_preimage(self, txin_index: int, *,
-                           bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None) -> str:
+                           bip143_shared_txdigest_fields: BIP143SharedTxDigestFields = None,
+                           legacy_preimage_inputs: Sequence[str] = None) -> str:
         nVersion = int_to_hex(self.version, 4)
         nLocktime = int_to_hex(self.locktime, 4)
         inputs = self.inputs()
@@ -1722,8 +1727,12 @@ class PartialTransaction(Transaction):
             nSequence = int_to_hex(txin.nsequence, 4)
             preimage = nVersion + hashPrevouts + hashSequence + outpoint + scriptCode + amount + nSequence + hashOutputs + nLocktime + nHashType
         else:
-            txins = var_int(len(inputs)) + ''.join(self.serialize_input(txin, preimage_script if txin_index==k else '')
-                                                   for k, txin in enumerate(inputs))
+            if legacy_preimage_inputs is None:
+                legacy_preimage_inputs = self._calc_legacy_preimage_inputs()
+            txins = (var_int(len(inputs))
+                     + ''.join(legacy_preimage_inputs[:txin_index])
+                     + self.serialize_input(txin, preimage_script)
+                     + ''.join(legacy_preimage_inputs[txin_index+1:]))
             txouts = var_int(len(outputs)) + ''.join(o.serialize_to_network().hex() for o in outputs)
             preimage = nVersion + txins + txouts + nLocktime + nHashType
         return preimage
@@ -1731,6 +1740,7 @@ class PartialTransaction(Transaction):
     def sign(self, keypairs) -> None:
         # keypairs:  pubkey_hex -> (secret_bytes, is_compressed)
         bip143_shared_txdigest_fields = self._calc_bip143_shared_txdigest_fields()
+        legacy_preimage_inputs = None
         for i, txin in enumerate(self.inputs()):
             pubkeys = [pk.hex() for pk in txin.pubkeys]
             for pubkey in pubkeys:
@@ -1740,17 +1750,22 @@ class PartialTransaction(Transaction):
                     continue
                 _logger.info(f"adding signature for {pubkey}")
                 sec, compressed = keypairs[pubkey]
-                sig = self.sign_txin(i, sec, bip143_shared_txdigest_fields=bip143_shared_txdigest_fields)
+                if legacy_preimage_inputs is None and not self.is_segwit_input(txin):
+                    legacy_preimage_inputs = self._calc_legacy_preimage_inputs()
+                sig = self.sign_txin(i, sec, bip143_shared_txdigest_fields=bip143_shared_txdigest_fields,
+                                     legacy_preimage_inputs=legacy_preimage_inputs)
                 self.add_signature_to_txin(txin_idx=i, signing_pubkey=pubkey, sig=sig)
 
         _logger.debug(f"is_complete {self.is_complete()}")
         self.invalidate_ser_cache()
 
-    def sign_txin(self, txin_index, privkey_bytes, *, bip143_shared_txdigest_fields=None) -> str:
+    def sign_txin(self, txin_index, privkey_bytes, *, bip143_shared_txdigest_fields=None,
+                  legacy_preimage_inputs=None) -> str:
         txin = self.inputs()[txin_index]
         txin.validate_data(for_signing=True)
         pre_hash = sha256d(bfh(self.serialize_preimage(txin_index,
-                                                       bip143_shared_txdigest_fields=bip143_shared_txdigest_fields)))
+                                                       bip143_shared_txdigest_fields=bip143_shared_txdigest_fields,
+                                                       legacy_preimage_inputs=legacy_preimage_inputs)))
         privkey = ecc.ECPrivkey(privkey_bytes)
         sig = privkey.sign_transaction(pre_hash)
         sig = bh2u(sig) + '01'  # SIGHASH_ALL
@@ -20,10 +20,12 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import base64
 import binascii
+import hashlib
 import os, sys, re, json
 from collections import defaultdict, OrderedDict
-from typing import NamedTuple, Union, TYPE_CHECKING, Tuple, Optional, Callable, Any, Sequence
+from typing import NamedTuple, Union, TYPE_CHECKING, Tuple, Optional, Callable, Any, Sequence, List
 from datetime import datetime
 import decimal
 from decimal import Decimal
@@ -49,6 +51,7 @@ import certifi
 import dns.resolver
 import ecdsa
 
+from . import metrics
 from .i18n import _
 from .logging import get_logger, Logger
 
@@ -195,6 +198,9 @@ class UserFacingException(Exception):
 class InvoiceError(UserFacingException): pass
 
 
+class InvalidPageCursor(UserFacingException): pass
+
+
 # Throw this exception to unwind the stack like when an error occurs.
 # However unlike other exceptions the user won't be informed.
 class UserCancelled(Exception):
@@ -421,6 +427,7 @@ def profiler(func):
         o = func(*args, **kw_args)
         t = time.time() - t0
         _profiler_logger.debug(f"{name} {t:,.4f}")
+        metrics.observe('profiler', t, func=name)
         return o
     return lambda *args, **kw_args: do_profile(args, kw_args)
 
@@ -1018,7 +1025,8 @@ class TxMinedInfo(NamedTuple):
     header_hash: Optional[str] = None  # hash of block that mined tx
 
 
-def make_aiohttp_session(proxy: Optional[dict], headers=None, timeout=None):
+def make_aiohttp_session(proxy: Optional[dict], headers=None, timeout=None, *,
+                         limit: int = 100, limit_per_host: int = 0):
     if headers is None:
         headers = {'User-Agent': 'Electrum'}
     if timeout is None:
@@ -1038,9 +1046,11 @@ def make_aiohttp_session(proxy: Optional[dict], headers=None, timeout=None):
             password=proxy.get('password', None),
             rdns=True,
             ssl=ssl_context,
+            limit=limit,
+            limit_per_host=limit_per_host,
         )
     else:
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
+        connector = aiohttp.TCPConnector(ssl=ssl_context, limit=limit, limit_per_host=limit_per_host)
 
     return aiohttp.ClientSession(headers=headers, timeout=timeout, connector=connector)
 
@@ -1054,6 +1064,44 @@ class SilentTaskGroup(TaskGroup):
         return super().spawn(*args, **kwargs)
 
 
+class WakeupEvent:
+    """What a maintenance loop waits on, instead of polling.
+
+    It is set by events, or when a deadline scheduled with set_after()
+    is reached; the deadlines are timers of the event loop. set() and
+    set_after() can be called from any thread.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop = None):
+        self.loop = loop or asyncio.get_event_loop()
+        self._event = asyncio.Event()
+        self._timers = []  # type: List[asyncio.TimerHandle]
+        self.wakeups = 0
+
+    def set(self, *args) -> None:
+        # args: so that it can be registered as a network callback
+        self.loop.call_soon_threadsafe(self._event.set)
+
+    def set_after(self, delay: float) -> None:
+        self.loop.call_soon_threadsafe(self._add_deadline, delay)
+
+    def _add_deadline(self, delay: float) -> None:
+        now = self.loop.time()
+        self._timers = [t for t in self._timers if t.when() > now and not t.cancelled()]
+        self._timers.append(self.loop.call_later(max(0, delay), self._event.set))
+
+    def cancel_deadlines(self) -> None:
+        """Must be called from the event loop."""
+        for t in self._timers:
+            t.cancel()
+        self._timers = []
+
+    async def wait(self) -> None:
+        await self._event.wait()
+        self._event.clear()
+        self.wakeups += 1
+
+
 class NetworkJobOnDefaultServer(Logger):
     """An abstract base class for a job that runs on the main network
     interface. Every time the main interface changes, the job is
@@ -1065,6 +1113,7 @@ class NetworkJobOnDefaultServer(Logger):
         self.network = network
         self.interface = None  # type: Interface
         self._restart_lock = asyncio.Lock()
+        self._wakeup = WakeupEvent(network.asyncio_loop)
         self._reset()
         asyncio.run_coroutine_threadsafe(self._restart(), network.asyncio_loop)
         network.register_callback(self._restart, ['default_server_changed'])
@@ -1077,6 +1126,7 @@ class NetworkJobOnDefaultServer(Logger):
 
     async def _start(self, interface: 'Interface'):
         self.interface = interface
+        self.wake_up()
         await interface.group.spawn(self._start_tasks)
 
     async def _start_tasks(self):
@@ -1085,13 +1135,25 @@ class NetworkJobOnDefaultServer(Logger):
         """
         raise NotImplementedError()  # implemented by subclasses
 
+    def wake_up(self, *args) -> None:
+        """Wakes up the main loop of the job, if it waits for work.
+        Can be called from any thread, or as a network callback.
+        """
+        self._wakeup.set()
+
     async def stop(self):
         self.network.unregister_callback(self._restart)
+        self.network.unregister_callback(self.wake_up)
         await self._stop()
 
     async def _stop(self):
         await self.group.cancel_remaining()
 
+    async def _request_chunk(self, height: int):
+        """Fetches the headers around height, then wakes up the job."""
+        await self.network.request_chunk(height, None, can_return_early=True)
+        self.wake_up()
+
     @log_exceptions
     async def _restart(self, *args):
         interface = self.network.interface
@@ -1133,6 +1195,53 @@ def create_and_start_event_loop() -> Tuple[asyncio.AbstractEventLoop,
     return loop, stopping_fut, loop_thread
 
 
+def _page_filters_digest(filters: dict) -> str:
+    data = json.dumps(filters, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def make_page_cursor(kind: str, version, filters: dict, position) -> str:
+    """Opaque continuation token for a paginated list.
+
+    version identifies the state of the list the page was taken from,
+    and position (any JSON value) is where the next page starts.
+    """
+    data = json.dumps([kind, version, _page_filters_digest(filters), position])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def read_page_cursor(cursor: str, kind: str, version, filters: dict):
+    """Returns the position stored in a cursor made by make_page_cursor,
+    checking that it was issued for the same query and list version.
+    """
+    try:
+        _kind, _version, digest, position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise InvalidPageCursor(_('Invalid cursor'))
+    if _kind != kind or digest != _page_filters_digest(filters):
+        raise InvalidPageCursor(_('This cursor was issued for another query'))
+    if _version != version:
+        raise InvalidPageCursor(_('The list has changed since this cursor was issued. Start again without a cursor.'))
+    return position
+
+
+def paginate(items: Sequence, start: int, limit: int,
+             predicate: Callable[[Any], bool] = None) -> Tuple[list, Optional[int]]:
+    """Returns up to limit items matching predicate, scanning items from
+    index start, and the index to resume from, or None if the end was reached.
+    """
+    if limit < 1:
+        raise ValueError(f'limit must be at least 1, not {limit}')
+    page = []
+    for idx in range(start, len(items)):
+        if len(page) >= limit:
+            return page, idx
+        item = items[idx]
+        if predicate is None or predicate(item):
+            page.append(item)
+    return page, None
+
+
 class OrderedDictWithIndex(OrderedDict):
     """An OrderedDict that keeps track of the positions of keys.
 
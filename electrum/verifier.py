@@ -52,6 +52,8 @@ class SPV(NetworkJobOnDefaultServer):
     def __init__(self, network: 'Network', wallet: 'AddressSynchronizer'):
         self.wallet = wallet
         NetworkJobOnDefaultServer.__init__(self, network)
+        # new headers, or a new chain
+        network.register_callback(self.wake_up, ['blockchain_updated'])
 
     def _reset(self):
         super()._reset()
@@ -68,9 +70,10 @@ class SPV(NetworkJobOnDefaultServer):
     async def main(self):
         self.blockchain = self.network.blockchain()
         while True:
+            await self._wakeup.wait()
             await self._maybe_undo_verifications()
             await self._request_proofs()
-            await asyncio.sleep(0.1)
+            await asyncio.sleep(0.1)  # batch bursts of events
 
     async def _request_proofs(self):
         local_height = self.blockchain.height()
@@ -87,7 +90,7 @@ class SPV(NetworkJobOnDefaultServer):
             header = self.blockchain.read_header(tx_height)
             if header is None:
                 if tx_height < constants.net.max_checkpoint():
-                    await self.group.spawn(self.network.request_chunk(tx_height, None, can_return_early=True))
+                    await self.group.spawn(self._request_chunk(tx_height))
                 continue
             # request now
             self.logger.info(f'requested merkle {tx_hash}')
@@ -185,6 +188,7 @@ class SPV(NetworkJobOnDefaultServer):
     def remove_spv_proof_for_tx(self, tx_hash):
         self.merkle_roots.pop(tx_hash, None)
         self.requested_merkle.discard(tx_hash)
+        self.wake_up()
 
     def is_up_to_date(self):
         return not self.requested_merkle
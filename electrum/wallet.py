@@ -26,6 +26,8 @@
 #   - Standard_Wallet: one HD keystore, P2PKH-like scripts
 #   - Multisig_Wallet: several HD keystores, M-of-N OP_CHECKMULTISIG scripts
 
+import asyncio
+import concurrent.futures
 import os
 import sys
 import random
@@ -39,7 +41,7 @@ from functools import partial
 from collections import defaultdict
 from numbers import Number
 from decimal import Decimal
-from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Callable
 from abc import ABC, abstractmethod
 import itertools
 
@@ -50,7 +52,8 @@ from .util import (NotEnoughFunds, UserCancelled, profiler,
                    format_satoshis, format_fee_satoshis, NoDynamicFeeEstimates,
                    WalletFileException, BitcoinException, MultipleSpendMaxTxOutputs,
                    InvalidPassword, format_time, timestamp_to_datetime, Satoshis,
-                   Fiat, bfh, bh2u, TxMinedInfo, quantize_feerate, create_bip21_uri, OrderedDictWithIndex)
+                   Fiat, bfh, bh2u, TxMinedInfo, quantize_feerate, create_bip21_uri, OrderedDictWithIndex,
+                   paginate)
 from .util import PR_TYPE_ONCHAIN, PR_TYPE_LN
 from .simple_config import SimpleConfig
 from .bitcoin import (COIN, is_address, address_to_script,
@@ -66,7 +69,8 @@ from .transaction import (Transaction, TxInput, UnknownTxinType, TxOutput,
                           PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint)
 from .plugin import run_hook
 from .address_synchronizer import (AddressSynchronizer, TX_HEIGHT_LOCAL,
-                                   TX_HEIGHT_UNCONF_PARENT, TX_HEIGHT_UNCONFIRMED, TX_HEIGHT_FUTURE)
+                                   TX_HEIGHT_UNCONF_PARENT, TX_HEIGHT_UNCONFIRMED, TX_HEIGHT_FUTURE,
+                                   HistoryItem)
 from .util import PR_PAID, PR_UNPAID, PR_UNKNOWN, PR_EXPIRED, PR_INFLIGHT
 from .contacts import Contacts
 from .interface import NetworkException
@@ -77,6 +81,7 @@ from .paymentrequest import PaymentRequest
 
 if TYPE_CHECKING:
     from .network import Network
+    from .exchange_rate import FxThread
 
 
 _logger = get_logger(__name__)
@@ -89,7 +94,23 @@ TX_STATUS = [
 ]
 
 
-def _append_utxos_to_inputs(inputs: List[PartialTxInput], network: 'Network', pubkey, txin_type, imax):
+# max number of listunspent requests in flight while sweeping
+SWEEP_CONCURRENCY = 50
+# caps for each transaction created by sweep_batch
+SWEEP_MAX_TX_INPUTS = 500
+SWEEP_MAX_TX_VSIZE = 90_000  # below the 100 kvB standardness limit
+# number of history items kept for the next pages, when paginating
+HISTORY_WINDOW = 1000
+
+
+class SweepCandidate(NamedTuple):
+    scripthash: str
+    address: Optional[str]
+    txin_type: str
+    pubkey: str
+
+
+def _sweep_candidate(pubkey: str, txin_type: str) -> SweepCandidate:
     if txin_type in ('p2pkh', 'p2wpkh', 'p2wpkh-p2sh'):
         address = bitcoin.pubkey_to_address(txin_type, pubkey)
         scripthash = bitcoin.address_to_scripthash(address)
@@ -99,76 +120,186 @@ def _append_utxos_to_inputs(inputs: List[PartialTxInput], network: 'Network', pu
         address = None
     else:
         raise Exception(f'unexpected txin_type to sweep: {txin_type}')
+    return SweepCandidate(scripthash, address, txin_type, pubkey)
 
-    u = network.run_from_another_thread(network.listunspent_for_scripthash(scripthash))
-    for item in u:
-        if len(inputs) >= imax:
-            break
-        prevout_str = item['tx_hash'] + ':%d' % item['tx_pos']
-        prevout = TxOutpoint.from_str(prevout_str)
-        utxo = PartialTxInput(prevout=prevout)
-        utxo._trusted_value_sats = int(item['value'])
-        utxo._trusted_address = address
-        utxo.block_height = int(item['height'])
-        utxo.script_type = txin_type
-        utxo.pubkeys = [bfh(pubkey)]
-        utxo.num_sig = 1
-        if txin_type == 'p2wpkh-p2sh':
-            utxo.redeem_script = bfh(bitcoin.p2wpkh_nested_script(pubkey))
-        inputs.append(utxo)
 
-def sweep_preparations(privkeys, network: 'Network', imax=100):
+def _sweep_candidates(privkeys) -> Tuple[List[SweepCandidate], dict]:
+    """Scripthashes to look up for each private key, and the keypairs to sign with."""
+    candidates = []  # type: List[SweepCandidate]
+    keypairs = {}
 
-    def find_utxos_for_privkey(txin_type, privkey, compressed):
+    def add(txin_type, privkey, compressed):
         pubkey = ecc.ECPrivkey(privkey).get_public_key_hex(compressed=compressed)
-        _append_utxos_to_inputs(inputs, network, pubkey, txin_type, imax)
+        candidates.append(_sweep_candidate(pubkey, txin_type))
         keypairs[pubkey] = privkey, compressed
-    inputs = []  # type: List[PartialTxInput]
-    keypairs = {}
     for sec in privkeys:
         txin_type, privkey, compressed = bitcoin.deserialize_privkey(sec)
-        find_utxos_for_privkey(txin_type, privkey, compressed)
+        add(txin_type, privkey, compressed)
         # do other lookups to increase support coverage
         if is_minikey(sec):
             # minikeys don't have a compressed byte
             # we lookup both compressed and uncompressed pubkeys
-            find_utxos_for_privkey(txin_type, privkey, not compressed)
+            add(txin_type, privkey, not compressed)
         elif txin_type == 'p2pkh':
             # WIF serialization does not distinguish p2pkh and p2pk
             # we also search for pay-to-pubkey outputs
-            find_utxos_for_privkey('p2pk', privkey, compressed)
+            add('p2pk', privkey, compressed)
+    return candidates, keypairs
+
+
+def _utxo_to_txin(item: dict, candidate: SweepCandidate) -> PartialTxInput:
+    prevout_str = item['tx_hash'] + ':%d' % item['tx_pos']
+    prevout = TxOutpoint.from_str(prevout_str)
+    utxo = PartialTxInput(prevout=prevout)
+    utxo._trusted_value_sats = int(item['value'])
+    utxo._trusted_address = candidate.address
+    utxo.block_height = int(item['height'])
+    utxo.script_type = candidate.txin_type
+    utxo.pubkeys = [bfh(candidate.pubkey)]
+    utxo.num_sig = 1
+    if candidate.txin_type == 'p2wpkh-p2sh':
+        utxo.redeem_script = bfh(bitcoin.p2wpkh_nested_script(candidate.pubkey))
+    return utxo
+
+
+async def _find_sweep_utxos(candidates: Sequence[SweepCandidate], network: 'Network', *,
+                            imax: Optional[int] = None,
+                            concurrency: int = SWEEP_CONCURRENCY) -> List[PartialTxInput]:
+    """Queries all candidates, at most 'concurrency' at a time.
+    Inputs are returned in the order of the candidates.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def listunspent(candidate):
+        async with semaphore:
+            return await network.listunspent_for_scripthash(candidate.scripthash)
+    results = await asyncio.gather(*[listunspent(c) for c in candidates])
+    inputs = []  # type: List[PartialTxInput]
+    for candidate, u in zip(candidates, results):
+        for item in u:
+            if imax is not None and len(inputs) >= imax:
+                return inputs
+            inputs.append(_utxo_to_txin(item, candidate))
+    return inputs
+
+
+def sweep_preparations(privkeys, network: 'Network', imax=100):
+    candidates, keypairs = _sweep_candidates(privkeys)
+    inputs = network.run_from_another_thread(_find_sweep_utxos(candidates, network, imax=imax))
     if not inputs:
         raise Exception(_('No inputs found. (Note that inputs need to be confirmed)'))
         # FIXME actually inputs need not be confirmed now, see https://github.com/kyuupichan/electrumx/issues/365
     return inputs, keypairs
 
 
+def _make_sweep_tx(inputs: List[PartialTxInput], *, network: 'Network', to_address: str,
+                   fee: int, locktime: int, tx_version=None) -> PartialTransaction:
+    total = sum(txin.value_sats() for txin in inputs)
+    if total - fee < 0:
+        raise Exception(_('Not enough funds on address.') + '\nTotal: %d satoshis\nFee: %d'%(total, fee))
+    if total - fee < dust_threshold(network):
+        raise Exception(_('Not enough funds on address.') + '\nTotal: %d satoshis\nFee: %d\nDust Threshold: %d'%(total, fee, dust_threshold(network)))
+
+    outputs = [PartialTxOutput(scriptpubkey=bfh(bitcoin.address_to_script(to_address)),
+                               value=total - fee)]
+    tx = PartialTransaction.from_io(inputs, outputs, locktime=locktime, version=tx_version)
+    tx.set_rbf(True)
+    return tx
+
+
 def sweep(privkeys, *, network: 'Network', config: 'SimpleConfig',
           to_address: str, fee: int = None, imax=100,
           locktime=None, tx_version=None) -> PartialTransaction:
     inputs, keypairs = sweep_preparations(privkeys, network, imax)
-    total = sum(txin.value_sats() for txin in inputs)
     if fee is None:
+        total = sum(txin.value_sats() for txin in inputs)
         outputs = [PartialTxOutput(scriptpubkey=bfh(bitcoin.address_to_script(to_address)),
                                    value=total)]
         tx = PartialTransaction.from_io(inputs, outputs)
         fee = config.estimate_fee(tx.estimated_size())
-    if total - fee < 0:
-        raise Exception(_('Not enough funds on address.') + '\nTotal: %d satoshis\nFee: %d'%(total, fee))
-    if total - fee < dust_threshold(network):
-        raise Exception(_('Not enough funds on address.') + '\nTotal: %d satoshis\nFee: %d\nDust Threshold: %d'%(total, fee, dust_threshold(network)))
-
-    outputs = [PartialTxOutput(scriptpubkey=bfh(bitcoin.address_to_script(to_address)),
-                               value=total - fee)]
     if locktime is None:
         locktime = get_locktime_for_new_transaction(network)
 
-    tx = PartialTransaction.from_io(inputs, outputs, locktime=locktime, version=tx_version)
-    tx.set_rbf(True)
+    tx = _make_sweep_tx(inputs, network=network, to_address=to_address, fee=fee,
+                        locktime=locktime, tx_version=tx_version)
     tx.sign(keypairs)
     return tx
 
 
+def _split_sweep_inputs(inputs: Sequence[PartialTxInput], *, to_address: str,
+                        max_inputs: int, max_vsize: int) -> List[List[PartialTxInput]]:
+    # fixed part: version, locktime, counts, segwit marker and the output
+    base_weight = 4 * (4 + 4 + 1 + 1 + Transaction.estimated_output_size(to_address)) + 2
+    max_weight = 4 * max_vsize
+    chunks = []  # type: List[List[PartialTxInput]]
+    chunk, weight = [], base_weight
+    for txin in inputs:
+        txin_weight = Transaction.estimated_input_weight(txin, True)
+        if chunk and (len(chunk) >= max_inputs or weight + txin_weight > max_weight):
+            chunks.append(chunk)
+            chunk, weight = [], base_weight
+        chunk.append(txin)
+        weight += txin_weight
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _sign_sweep_tx(tx: PartialTransaction, keypairs: dict) -> PartialTransaction:
+    keys = {txin.pubkeys[0].hex() for txin in tx.inputs()}
+    tx.sign({pubkey: keypairs[pubkey] for pubkey in keys})
+    return tx
+
+
+def sweep_batch(privkeys, *, network: 'Network', config: Optional['SimpleConfig'],
+                to_address: str, fee_per_kb: int = None,
+                max_inputs: int = SWEEP_MAX_TX_INPUTS, max_vsize: int = SWEEP_MAX_TX_VSIZE,
+                locktime=None, tx_version=None) -> List[PartialTransaction]:
+    """Sweeps many private keys at once.
+
+    All scripthashes are looked up concurrently, and the coins found are
+    spent by several transactions, each having at most max_inputs inputs
+    and an estimated size of at most max_vsize. The transactions are
+    signed in parallel, and are not broadcast.
+    """
+    inputs, keypairs = sweep_preparations(privkeys, network, imax=None)
+    return make_sweep_batch(inputs, keypairs, network=network, config=config,
+                            to_address=to_address, fee_per_kb=fee_per_kb,
+                            max_inputs=max_inputs, max_vsize=max_vsize,
+                            locktime=locktime, tx_version=tx_version)
+
+
+def make_sweep_batch(inputs: Sequence[PartialTxInput], keypairs: dict, *,
+                     network: 'Network', config: Optional['SimpleConfig'],
+                     to_address: str, fee_per_kb: int = None,
+                     max_inputs: int = SWEEP_MAX_TX_INPUTS, max_vsize: int = SWEEP_MAX_TX_VSIZE,
+                     locktime=None, tx_version=None) -> List[PartialTransaction]:
+    """Spends inputs found by sweep_preparations, as sweep_batch does."""
+    if fee_per_kb is None:
+        fee_per_kb = config.fee_per_kb()
+        if fee_per_kb is None:
+            raise NoDynamicFeeEstimates()
+    if locktime is None:
+        locktime = get_locktime_for_new_transaction(network)
+    txs = []
+    for chunk in _split_sweep_inputs(inputs, to_address=to_address,
+                                     max_inputs=max_inputs, max_vsize=max_vsize):
+        outputs = [PartialTxOutput(scriptpubkey=bfh(bitcoin.address_to_script(to_address)),
+                                   value=sum(txin.value_sats() for txin in chunk))]
+        size = PartialTransaction.from_io(chunk, outputs).estimated_size()
+        fee = SimpleConfig.estimate_fee_for_feerate(fee_per_kb, size)
+        txs.append(_make_sweep_tx(chunk, network=network, to_address=to_address, fee=fee,
+                                  locktime=locktime, tx_version=tx_version))
+    if len(txs) == 1:
+        _sign_sweep_tx(txs[0], keypairs)
+    else:
+        max_workers = min(len(txs), os.cpu_count() or 1)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                   thread_name_prefix='sweep_sign') as executor:
+            list(executor.map(partial(_sign_sweep_tx, keypairs=keypairs), txs))
+    return txs
+
+
 def get_locktime_for_new_transaction(network: 'Network') -> int:
     # if no network or not up to date, just set locktime to zero
     if not network:
@@ -212,6 +343,135 @@ class TxWalletDetails(NamedTuple):
     mempool_depth_bytes: Optional[int]
 
 
+class PagedHistory(Sequence):
+    """The history of a wallet, by index, for paginating through it.
+    Only one window of items is kept: reading outside of it loads the
+    window that starts there."""
+
+    def __init__(self, wallet: 'Abstract_Wallet', start: int):
+        self.wallet = wallet
+        self.version, self.length, self.window_start, self.window = wallet.get_history_window(start)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index: int) -> HistoryItem:
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        if not 0 <= index - self.window_start < len(self.window):
+            _, _, self.window_start, self.window = self.wallet.get_history_window(index)
+        return self.window[index - self.window_start]
+
+
+class FiatValuation:
+    """Fiat prices for the on-chain history of a wallet.
+
+    Rates for all history items are looked up in one batch, and the
+    acquisition price of each transaction spending our coins is
+    computed once, reusing the prices of its parents.
+    """
+
+    def __init__(self, wallet: 'Abstract_Wallet', fx: 'FxThread'):
+        self.wallet = wallet
+        self.fx = fx
+        self.ccy = fx.ccy
+        self.now = time.time()
+        self._average_prices = {}  # type: Dict[str, Decimal]
+        history = wallet.get_history()
+        txids = [hist_item.txid for hist_item in history]
+        timestamps = [hist_item.tx_mined_status.timestamp or self.now for hist_item in history]
+        self._rates = dict(zip(txids, fx.timestamp_rates(timestamps)))  # type: Dict[str, Decimal]
+        for txid in txids:
+            if wallet.db.get_txi_addresses(txid):
+                self.average_price(txid)
+
+    def rate(self, txid: str) -> Decimal:
+        """Fiat price of bitcoin at the time tx got confirmed."""
+        rate = self._rates.get(txid)
+        if rate is None:
+            timestamp = self.wallet.get_tx_height(txid).timestamp
+            rate = self.fx.timestamp_rates([timestamp or self.now])[0]
+            self._rates[txid] = rate
+        return rate
+
+    def default_fiat_value(self, txid: str, value_sat) -> Decimal:
+        return value_sat / Decimal(COIN) * self.rate(txid)
+
+    def _get_inputs(self, txid: str) -> List[Tuple[str, int]]:
+        db = self.wallet.db
+        return [(ser.split(':')[0], v)
+                for addr in db.get_txi_addresses(txid)
+                for ser, v in db.get_txi_addr(txid, addr)]
+
+    def average_price(self, txid: str) -> Decimal:
+        """Average acquisition price of the inputs of a transaction"""
+        db = self.wallet.db
+        memo = self._average_prices
+        # iterative depth-first walk over parents that spend our coins too
+        stack = [txid]
+        while stack:
+            cur = stack[-1]
+            if cur in memo:
+                stack.pop()
+                continue
+            inputs = self._get_inputs(cur)
+            parents = [prev_txid for prev_txid, v in inputs
+                       if prev_txid not in memo and v is not None and db.get_txi_addresses(prev_txid)]
+            if parents:
+                stack.extend(parents)
+                continue
+            stack.pop()
+            input_value = 0
+            total_price = 0
+            for prev_txid, v in inputs:
+                input_value += v
+                total_price += self.coin_price(prev_txid, v)
+            memo[cur] = total_price / (input_value/Decimal(COIN))
+        return memo[txid]
+
+    def coin_price(self, txid: str, txin_value) -> Decimal:
+        """
+        Acquisition price of a coin.
+        This assumes that either all inputs are mine, or no input is mine.
+        """
+        if txin_value is None:
+            return Decimal('NaN')
+        if self.wallet.db.get_txi_addresses(txid):
+            return self.average_price(txid) * txin_value/Decimal(COIN)
+        fiat_value = self.wallet.get_fiat_value(txid, self.ccy)
+        if fiat_value is not None:
+            return fiat_value
+        return self.rate(txid) * txin_value/Decimal(COIN)
+
+    def get_tx_item_fiat(self, tx_hash: str, value, tx_fee) -> dict:
+        ccy = self.ccy
+        item = {}
+        fiat_value = self.wallet.get_fiat_value(tx_hash, ccy)
+        fiat_default = fiat_value is None
+        fiat_rate = self.rate(tx_hash)
+        fiat_value = fiat_value if fiat_value is not None else self.default_fiat_value(tx_hash, value)
+        fiat_fee = tx_fee / Decimal(COIN) * fiat_rate if tx_fee is not None else None
+        item['fiat_currency'] = ccy
+        item['fiat_rate'] = Fiat(fiat_rate, ccy)
+        item['fiat_value'] = Fiat(fiat_value, ccy)
+        item['fiat_fee'] = Fiat(fiat_fee, ccy) if fiat_fee else None
+        item['fiat_default'] = fiat_default
+        if value < 0:
+            acquisition_price = - value / Decimal(COIN) * self.average_price(tx_hash)
+            liquidation_price = - fiat_value
+            item['acquisition_price'] = Fiat(acquisition_price, ccy)
+            cg = liquidation_price - acquisition_price
+            item['capital_gain'] = Fiat(cg, ccy)
+        return item
+
+    def unrealized_gains(self, domain) -> Decimal:
+        coins = self.wallet.get_utxos(domain)
+        p = self.fx.timestamp_rates([time.time()])[0]
+        ap = sum(self.coin_price(coin.prevout.txid.hex(), self.wallet.txin_value(coin)) for coin in coins)
+        lp = sum([coin.value_sats() for coin in coins]) * p / Decimal(COIN)
+        return lp - ap
+
+
 class Abstract_Wallet(AddressSynchronizer, ABC):
     """
     Wallet classes are created to handle various address generation methods.
@@ -254,7 +514,8 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         if self.db.get('wallet_type') is None:
             self.db.put('wallet_type', self.wallet_type)
         self.contacts = Contacts(self.db)
-        self._coin_price_cache = {}
+        self._fiat_valuation = None  # type: Optional[Tuple[Any, FiatValuation]]
+        self._history_window = None  # type: Optional[Tuple[Tuple[int, int], int, int, Sequence[HistoryItem]]]
         # lightning
         ln_xprv = self.db.get('lightning_privkey2')
         self.lnworker = LNWallet(self, ln_xprv) if ln_xprv else None
@@ -397,6 +658,7 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
             if ccy not in self.fiat_value:
                 self.fiat_value[ccy] = {}
             self.fiat_value[ccy][txid] = text
+        self._fiat_valuation = None  # invalidate cache
         return reset
 
     def get_fiat_value(self, txid, ccy):
@@ -562,19 +824,63 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
 
     def get_onchain_history(self, *, domain=None):
         for hist_item in self.get_history(domain=domain):
-            yield {
-                'txid': hist_item.txid,
-                'fee_sat': hist_item.fee,
-                'height': hist_item.tx_mined_status.height,
-                'confirmations': hist_item.tx_mined_status.conf,
-                'timestamp': hist_item.tx_mined_status.timestamp,
-                'incoming': True if hist_item.delta>0 else False,
-                'bc_value': Satoshis(hist_item.delta),
-                'bc_balance': Satoshis(hist_item.balance),
-                'date': timestamp_to_datetime(hist_item.tx_mined_status.timestamp),
-                'label': self.get_label(hist_item.txid),
-                'txpos_in_block': hist_item.tx_mined_status.txpos,
-            }
+            yield self._get_onchain_history_item(hist_item)
+
+    def _get_onchain_history_item(self, hist_item: HistoryItem) -> dict:
+        return {
+            'txid': hist_item.txid,
+            'fee_sat': hist_item.fee,
+            'height': hist_item.tx_mined_status.height,
+            'confirmations': hist_item.tx_mined_status.conf,
+            'timestamp': hist_item.tx_mined_status.timestamp,
+            'incoming': True if hist_item.delta>0 else False,
+            'bc_value': Satoshis(hist_item.delta),
+            'bc_balance': Satoshis(hist_item.balance),
+            'date': timestamp_to_datetime(hist_item.tx_mined_status.timestamp),
+            'label': self.get_label(hist_item.txid),
+            'txpos_in_block': hist_item.tx_mined_status.txpos,
+        }
+
+    def get_history_window(self, index: int) -> Tuple[int, int, int, Sequence[HistoryItem]]:
+        """Up to HISTORY_WINDOW items of the history of the whole wallet,
+        from index. Returns the history version, the length of the history,
+        the index of the first item of the window, and its items.
+        The last window is cached until the version or the local height
+        changes, so that consecutive pages do not rebuild the history.
+        New blocks change the confirmations of the items, not the version."""
+        version = self.get_history_version()
+        key = version, self.get_local_height()
+        cached = self._history_window
+        if cached is None or cached[0] != key or not 0 <= index - cached[2] < len(cached[3]):
+            history = self.get_history()
+            cached = self._history_window = key, len(history), index, history[index:index + HISTORY_WINDOW]
+        return (version,) + cached[1:]
+
+    def make_history_filter(self, *, from_timestamp=None, to_timestamp=None,
+                            from_height=None, to_height=None, address=None,
+                            min_amount=None) -> Callable[[HistoryItem], bool]:
+        """Predicate on history items. Unconfirmed transactions are
+        dated now, and min_amount applies to the absolute value."""
+        now = time.time()
+        txids = {txid for txid, height in self.get_address_history(address)} if address else None
+
+        def f(hist_item: HistoryItem) -> bool:
+            timestamp = hist_item.tx_mined_status.timestamp or now
+            height = hist_item.tx_mined_status.height
+            if from_timestamp is not None and timestamp < from_timestamp:
+                return False
+            if to_timestamp is not None and timestamp >= to_timestamp:
+                return False
+            if from_height is not None and not (0 < height and from_height <= height):
+                return False
+            if to_height is not None and not (0 < height < to_height):
+                return False
+            if txids is not None and hist_item.txid not in txids:
+                return False
+            if min_amount is not None and (hist_item.delta is None or abs(hist_item.delta) < min_amount):
+                return False
+            return True
+        return f
 
     def create_invoice(self, outputs: List[PartialTxOutput], message, pr, URI):
         if '!' in (x.value for x in outputs):
@@ -743,9 +1049,11 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
             item['value'] = Satoshis(value)
             balance += value
             item['balance'] = Satoshis(balance)
-            if fx:
-                timestamp = item['timestamp'] or now
-                fiat_value = value / Decimal(bitcoin.COIN) * fx.timestamp_rate(timestamp)
+        if fx:
+            items = transactions.values()
+            rates = fx.timestamp_rates([item['timestamp'] or now for item in items])
+            for item, rate in zip(items, rates):
+                fiat_value = item['value'].value / Decimal(bitcoin.COIN) * rate
                 item['fiat_value'] = Fiat(fiat_value, fx.ccy)
                 item['fiat_default'] = True
         return transactions
@@ -762,33 +1070,24 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         fiat_income = Decimal(0)
         fiat_expenditures = Decimal(0)
         now = time.time()
+        show_fiat = fx and fx.is_enabled() and fx.get_history_config()
+        valuation = self.get_fiat_valuation(fx) if show_fiat else None
         for item in self.get_onchain_history():
             timestamp = item['timestamp']
             if from_timestamp and (timestamp or now) < from_timestamp:
                 continue
             if to_timestamp and (timestamp or now) >= to_timestamp:
                 continue
-            tx_hash = item['txid']
-            tx = self.db.get_transaction(tx_hash)
-            tx_fee = item['fee_sat']
-            item['fee'] = Satoshis(tx_fee) if tx_fee is not None else None
-            if show_addresses:
-                item['inputs'] = list(map(lambda x: x.to_json(), tx.inputs()))
-                item['outputs'] = list(map(lambda x: {'address': x.get_ui_address_str(), 'value': Satoshis(x.value)},
-                                           tx.outputs()))
-            # fixme: use in and out values
+            self._add_history_item_details(item, show_addresses=show_addresses, valuation=valuation)
             value = item['bc_value'].value
             if value < 0:
                 expenditures += -value
             else:
                 income += value
-            # fiat computations
-            if fx and fx.is_enabled() and fx.get_history_config():
-                fiat_fields = self.get_tx_item_fiat(tx_hash, value, fx, tx_fee)
-                fiat_value = fiat_fields['fiat_value'].value
-                item.update(fiat_fields)
+            if show_fiat:
+                fiat_value = item['fiat_value'].value
                 if value < 0:
-                    capital_gains += fiat_fields['capital_gain'].value
+                    capital_gains += item['capital_gain'].value
                     fiat_expenditures += -fiat_value
                 else:
                     fiat_income += fiat_value
@@ -812,8 +1111,8 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
                 'incoming': Satoshis(income),
                 'outgoing': Satoshis(expenditures)
             }
-            if fx and fx.is_enabled() and fx.get_history_config():
-                unrealized = self.unrealized_gains(None, fx.timestamp_rate, fx.ccy)
+            if show_fiat:
+                unrealized = valuation.unrealized_gains(None)
                 summary['fiat_currency'] = fx.ccy
                 summary['fiat_capital_gains'] = Fiat(capital_gains, fx.ccy)
                 summary['fiat_incoming'] = Fiat(fiat_income, fx.ccy)
@@ -830,28 +1129,56 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
             'summary': summary
         }
 
+    def _add_history_item_details(self, item: dict, *, show_addresses=False,
+                                  valuation: 'FiatValuation' = None) -> None:
+        tx_hash = item['txid']
+        tx_fee = item['fee_sat']
+        item['fee'] = Satoshis(tx_fee) if tx_fee is not None else None
+        if show_addresses:
+            tx = self.db.get_transaction(tx_hash)
+            item['inputs'] = list(map(lambda x: x.to_json(), tx.inputs()))
+            item['outputs'] = list(map(lambda x: {'address': x.get_ui_address_str(), 'value': Satoshis(x.value)},
+                                       tx.outputs()))
+        # fiat computations
+        if valuation is not None:
+            # fixme: use in and out values
+            item.update(valuation.get_tx_item_fiat(tx_hash, item['bc_value'].value, tx_fee))
+
+    def get_detailed_history_page(self, *, start=0, limit=100, fx=None, show_addresses=False,
+                                  **filters) -> Tuple[int, List[dict], Optional[int]]:
+        """A page of the detailed history, without summary.
+        Returns the history version, the items, and the start of the next
+        page, if any. Filters (see make_history_filter) are applied before
+        items are built.
+        """
+        history = PagedHistory(self, start)
+        predicate = self.make_history_filter(**filters) if filters else None
+        page, next_start = paginate(history, start, limit, predicate)
+        show_fiat = fx and fx.is_enabled() and fx.get_history_config()
+        valuation = self.get_fiat_valuation(fx) if show_fiat else None
+        out = []
+        for hist_item in page:
+            item = self._get_onchain_history_item(hist_item)
+            self._add_history_item_details(item, show_addresses=show_addresses, valuation=valuation)
+            out.append(item)
+        return history.version, out, next_start
+
     def default_fiat_value(self, tx_hash, fx, value_sat):
         return value_sat / Decimal(COIN) * self.price_at_timestamp(tx_hash, fx.timestamp_rate)
 
+    def get_fiat_valuation(self, fx: 'FxThread') -> FiatValuation:
+        """Returns fiat prices for the history, cached until either
+        the history or the exchange rates change."""
+        key = (fx.history_rates_key(), self.get_history_version())
+        cached = self._fiat_valuation
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        valuation = FiatValuation(self, fx)
+        self._fiat_valuation = key, valuation
+        return valuation
+
     def get_tx_item_fiat(self, tx_hash, value, fx, tx_fee):
-        item = {}
-        fiat_value = self.get_fiat_value(tx_hash, fx.ccy)
-        fiat_default = fiat_value is None
-        fiat_rate = self.price_at_timestamp(tx_hash, fx.timestamp_rate)
-        fiat_value = fiat_value if fiat_value is not None else self.default_fiat_value(tx_hash, fx, value)
-        fiat_fee = tx_fee / Decimal(COIN) * fiat_rate if tx_fee is not None else None
-        item['fiat_currency'] = fx.ccy
-        item['fiat_rate'] = Fiat(fiat_rate, fx.ccy)
-        item['fiat_value'] = Fiat(fiat_value, fx.ccy)
-        item['fiat_fee'] = Fiat(fiat_fee, fx.ccy) if fiat_fee else None
-        item['fiat_default'] = fiat_default
-        if value < 0:
-            acquisition_price = - value / Decimal(COIN) * self.average_price(tx_hash, fx.timestamp_rate, fx.ccy)
-            liquidation_price = - fiat_value
-            item['acquisition_price'] = Fiat(acquisition_price, fx.ccy)
-            cg = liquidation_price - acquisition_price
-            item['capital_gain'] = Fiat(cg, fx.ccy)
-        return item
+        return self.get_fiat_valuation(fx).get_tx_item_fiat(tx_hash, value, tx_fee)
 
     def get_label(self, tx_hash: str) -> str:
         return self.labels.get(tx_hash, '') or self.get_default_label(tx_hash)
@@ -1656,6 +1983,39 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         out.sort(key=operator.itemgetter('time'))
         return out
 
+    def get_requests_page(self, *, after: Tuple[int, str] = None, limit=100, status=None,
+                          from_timestamp=None, to_timestamp=None,
+                          min_amount=None) -> Tuple[List[dict], Optional[Tuple[int, str]]]:
+        """Requests sorted by (timestamp, key), starting after the given
+        position. Returns the page and the position of its last item if
+        there may be more. Only the requests in the page are completed
+        with their status, except when filtering on status.
+        """
+        keys = []
+        for key, req in list(self.receive_requests.items()):
+            timestamp = req.get('time', 0)
+            if after is not None and (timestamp, key) <= tuple(after):
+                continue
+            if from_timestamp is not None and timestamp < from_timestamp:
+                continue
+            if to_timestamp is not None and timestamp >= to_timestamp:
+                continue
+            if min_amount is not None and (req.get('amount') or 0) < min_amount:
+                continue
+            keys.append((timestamp, key))
+        keys.sort()
+        out = []
+        out_position = None
+        for position in keys:
+            if len(out) >= limit:
+                return out, out_position
+            req = self.get_request(position[1])
+            if req is None or status is not None and req.get('status') != status:
+                continue
+            out.append(req)
+            out_position = position
+        return out, None
+
     @abstractmethod
     def get_fingerprint(self):
         pass
@@ -1768,50 +2128,11 @@ class Abstract_Wallet(AddressSynchronizer, ABC):
         timestamp = self.get_tx_height(txid).timestamp
         return price_func(timestamp if timestamp else time.time())
 
-    def unrealized_gains(self, domain, price_func, ccy):
-        coins = self.get_utxos(domain)
-        now = time.time()
-        p = price_func(now)
-        ap = sum(self.coin_price(coin.prevout.txid.hex(), price_func, ccy, self.txin_value(coin)) for coin in coins)
-        lp = sum([coin.value_sats() for coin in coins]) * p / Decimal(COIN)
-        return lp - ap
-
-    def average_price(self, txid, price_func, ccy):
-        """ Average acquisition price of the inputs of a transaction """
-        input_value = 0
-        total_price = 0
-        for addr in self.db.get_txi_addresses(txid):
-            d = self.db.get_txi_addr(txid, addr)
-            for ser, v in d:
-                input_value += v
-                total_price += self.coin_price(ser.split(':')[0], price_func, ccy, v)
-        return total_price / (input_value/Decimal(COIN))
+    def unrealized_gains(self, domain, fx: 'FxThread'):
+        return self.get_fiat_valuation(fx).unrealized_gains(domain)
 
     def clear_coin_price_cache(self):
-        self._coin_price_cache = {}
-
-    def coin_price(self, txid, price_func, ccy, txin_value):
-        """
-        Acquisition price of a coin.
-        This assumes that either all inputs are mine, or no input is mine.
-        """
-        if txin_value is None:
-            return Decimal('NaN')
-        cache_key = "{}:{}:{}".format(str(txid), str(ccy), str(txin_value))
-        result = self._coin_price_cache.get(cache_key, None)
-        if result is not None:
-            return result
-        if self.db.get_txi_addresses(txid):
-            result = self.average_price(txid, price_func, ccy) * txin_value/Decimal(COIN)
-            self._coin_price_cache[cache_key] = result
-            return result
-        else:
-            fiat_value = self.get_fiat_value(txid, ccy)
-            if fiat_value is not None:
-                return fiat_value
-            else:
-                p = self.price_at_timestamp(txid, price_func)
-                return p * txin_value/Decimal(COIN)
+        self._fiat_valuation = None
 
     def is_billing_address(self, addr):
         # overridden for TrustedCoin wallets
@@ -1969,6 +2290,7 @@ class Imported_Wallet(Simple_Wallet):
                         transactions_new.add(tx_hash)
             transactions_to_remove -= transactions_new
             self.db.remove_addr_history(address)
+            self._bump_history_version(addresses=[address])
             for tx_hash in transactions_to_remove:
                 self.remove_transaction(tx_hash)
         self.set_label(address, None)
@@ -31,7 +31,7 @@ from collections import defaultdict
 from typing import Dict, Optional, List, Tuple, Set, Iterable, NamedTuple, Sequence, TYPE_CHECKING
 import binascii
 
-from . import util, bitcoin
+from . import util, bitcoin, metrics
 from .util import profiler, WalletFileException, multisig_type, TxMinedInfo, bfh, PR_TYPE_ONCHAIN
 from .keystore import bip44_derivation
 from .transaction import Transaction, TxOutpoint, tx_from_any, PartialTransaction, PartialTxOutput
@@ -1012,7 +1012,10 @@ class WalletDB(JsonDB):
             return
         if not self.modified():
             return
-        storage.write(self.dump())
+        with metrics.timer('wallet_db.write'):
+            data = self.dump()
+            storage.write(data)
+        metrics.inc('wallet_db.bytes_written', len(data))
         self.set_modified(False)
 
     def is_ready_to_be_used_by_wallet(self):
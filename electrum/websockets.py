@@ -22,107 +22,200 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-import threading
-import os
-import json
-from collections import defaultdict
 import asyncio
-from typing import Dict, List, Tuple, TYPE_CHECKING
-import traceback
-import sys
+import json
+import os
+from collections import defaultdict, OrderedDict
+from typing import Dict, Set, Tuple, Optional, TYPE_CHECKING
 
-try:
-    from SimpleWebSocketServer import WebSocket, SimpleSSLWebSocketServer
-except ImportError:
-    sys.exit("install SimpleWebSocketServer")
+from aiohttp import web, WSMsgType
 
-from .util import PrintError
 from . import bitcoin
+from .logging import Logger
 from .synchronizer import SynchronizerBase
+from .util import ignore_exceptions, log_exceptions
 
 if TYPE_CHECKING:
     from .network import Network
     from .simple_config import SimpleConfig
 
 
-request_queue = asyncio.Queue()
-
-
-class ElectrumWebSocket(WebSocket, PrintError):
-
-    def handleMessage(self):
-        assert self.data[0:3] == 'id:'
-        self.print_error("message received", self.data)
-        request_id = self.data[3:]
-        asyncio.run_coroutine_threadsafe(
-            request_queue.put((self, request_id)), asyncio.get_event_loop())
-
-    def handleConnected(self):
-        self.print_error("connected", self.address)
-
-    def handleClose(self):
-        self.print_error("closed", self.address)
+class BalanceMonitor(SynchronizerBase):
+    """Tell websocket clients when the requests they watch are paid.
 
+    All clients watching the same address share a single scripthash
+    subscription, and a single balance query per status change.
+    Request metadata is read from disk once and kept in memory.
+    """
 
-class BalanceMonitor(SynchronizerBase):
+    REQUEST_CACHE_SIZE = 10000
 
     def __init__(self, config: 'SimpleConfig', network: 'Network'):
-        SynchronizerBase.__init__(self, network)
         self.config = config
-        self.expected_payments = defaultdict(list)  # type: Dict[str, List[Tuple[WebSocket, int]]]
+        self.watchers = defaultdict(set)  # type: Dict[str, Set[Tuple[web.WebSocketResponse, int]]]
+        self.ws_addresses = defaultdict(set)  # type: Dict[web.WebSocketResponse, Set[str]]
+        self.requests = OrderedDict()  # type: OrderedDict[str, Tuple[str, int]]
+        SynchronizerBase.__init__(self, network)
 
-    def make_request(self, request_id):
-        # read json file
+    def _reset(self):
+        super()._reset()
+        self.subscribed = set()
+        self.statuses = {}  # type: Dict[str, Optional[str]]  # addr -> last status seen
+        self.balances = {}  # type: Dict[str, Tuple[str, asyncio.Future]]  # addr -> (status, balance)
+
+    async def stop(self):
+        await super().stop()
+        self.watchers.clear()
+        self.ws_addresses.clear()
+        self.subscribed.clear()
+        self.statuses.clear()
+        self.balances.clear()
+
+    def get_request(self, request_id: str) -> Tuple[str, int]:
+        r = self.requests.get(request_id)
+        if r is not None:
+            self.requests.move_to_end(request_id)
+            return r
         rdir = self.config.get('requests_dir')
         n = os.path.join(rdir, 'req', request_id[0], request_id[1], request_id, request_id + '.json')
         with open(n, encoding='utf-8') as f:
-            s = f.read()
-        d = json.loads(s)
-        addr = d.get('address')
-        amount = d.get('amount')
-        return addr, amount
+            d = json.loads(f.read())
+        r = self.requests[request_id] = d.get('address'), d.get('amount') or 0
+        if len(self.requests) > self.REQUEST_CACHE_SIZE:
+            self.requests.popitem(last=False)
+        return r
+
+    async def watch(self, ws: web.WebSocketResponse, request_id: str) -> None:
+        addr, amount = self.get_request(request_id)
+        self.watchers[addr].add((ws, amount))
+        self.ws_addresses[ws].add(addr)
+        if addr in self.statuses:
+            # already subscribed: no need to wait for the next status change
+            await self._on_address_status(addr, self.statuses[addr])
+        else:
+            await self._add_address(addr)
+
+    def unwatch(self, ws: web.WebSocketResponse) -> None:
+        for addr in self.ws_addresses.pop(ws, ()):
+            watchers = self.watchers.get(addr)
+            if watchers is None:
+                continue
+            for item in [item for item in watchers if item[0] is ws]:
+                watchers.discard(item)
+            if not watchers:
+                del self.watchers[addr]
+                self._forget(addr)
+
+    async def _add_address(self, addr: str):
+        if addr in self.subscribed:
+            return
+        self.subscribed.add(addr)
+        await super()._add_address(addr)
+
+    def _forget(self, addr: str) -> None:
+        """Drop what we know about an address nobody watches anymore."""
+        # note: we can't unsubscribe from the server; its notifications
+        # for this address are ignored by handle_status
+        self.subscribed.discard(addr)
+        self.statuses.pop(addr, None)
+        self.balances.pop(addr, None)
+        h = bitcoin.address_to_scripthash(addr)
+        self.scripthash_to_address.pop(h, None)
+        session = self.interface.session if self.interface else None
+        if session:
+            session.unsubscribe_from('blockchain.scripthash.subscribe', [h], self.status_queue)
 
     async def main(self):
         # resend existing subscriptions if we were restarted
-        for addr in self.expected_payments:
-            await self._add_address(addr)
-        # main loop
-        while True:
-            ws, request_id = await request_queue.get()
-            try:
-                addr, amount = self.make_request(request_id)
-            except Exception:
-                traceback.print_exc(file=sys.stderr)
-                continue
-            self.expected_payments[addr].append((ws, amount))
+        for addr in list(self.watchers):
             await self._add_address(addr)
 
-    async def _on_address_status(self, addr, status):
-        self.print_error('new status for addr {}'.format(addr))
-        sh = bitcoin.address_to_scripthash(addr)
-        balance = await self.network.get_balance_for_scripthash(sh)
-        for ws, amount in self.expected_payments[addr]:
-            if not ws.closed:
-                if sum(balance.values()) >= amount:
-                    ws.sendMessage('paid')
+    async def _get_balance(self, addr: str, status: Optional[str]) -> int:
+        if status is None:
+            return 0  # no history
+        cached = self.balances.get(addr)
+        if cached is None or cached[0] != status:
+            sh = bitcoin.address_to_scripthash(addr)
+            fut = asyncio.ensure_future(self.network.get_balance_for_scripthash(sh))
+            cached = self.balances[addr] = (status, fut)
+        try:
+            balance = await asyncio.shield(cached[1])
+        except Exception:
+            if self.balances.get(addr) is cached:
+                del self.balances[addr]
+            raise
+        return sum(balance.values())
 
-
-class WebSocketServer(threading.Thread):
+    async def _on_address_status(self, addr, status):
+        if not self.watchers.get(addr):
+            self._forget(addr)
+            return
+        self.statuses[addr] = status
+        try:
+            balance = await self._get_balance(addr, status)
+        except Exception as e:
+            self.logger.info(f'cannot get balance for {addr}: {repr(e)}')
+            return
+        paid = []
+        for item in list(self.watchers.get(addr, ())):
+            ws, amount = item
+            if ws.closed:
+                self.watchers[addr].discard(item)
+            elif balance > 0 and balance >= amount:
+                self.watchers[addr].discard(item)
+                paid.append(ws)
+        if not self.watchers.get(addr):
+            self.watchers.pop(addr, None)
+            self._forget(addr)
+        if paid:
+            self.logger.info(f'{addr} paid, notifying {len(paid)} clients')
+            await asyncio.gather(*[ws.send_str('paid') for ws in paid], return_exceptions=True)
+
+
+class WebSocketServer(Logger):
+    """Websocket server for the payment request pages.
+
+    Clients send 'id:<request_id>' and receive 'paid' once the address
+    of the request has received the requested amount. Runs on the
+    network event loop.
+    """
+
+    WS_HEARTBEAT = 30  # seconds between websocket pings
 
     def __init__(self, config: 'SimpleConfig', network: 'Network'):
-        threading.Thread.__init__(self)
+        Logger.__init__(self)
         self.config = config
         self.network = network
-        asyncio.set_event_loop(network.asyncio_loop)
-        self.daemon = True
         self.balance_monitor = BalanceMonitor(self.config, self.network)
-        self.start()
 
-    def run(self):
-        asyncio.set_event_loop(self.network.asyncio_loop)
+    @ignore_exceptions
+    @log_exceptions
+    async def run(self):
         host = self.config.get('websocket_server')
         port = self.config.get('websocket_port', 9999)
-        certfile = self.config.get('ssl_chain')
-        keyfile = self.config.get('ssl_privkey')
-        self.server = SimpleSSLWebSocketServer(host, port, ElectrumWebSocket, certfile, keyfile)
-        self.server.serveforever()
+        app = web.Application()
+        app.add_routes([web.get('/', self.handle)])
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host=host, port=port, ssl_context=self.config.get_ssl_context())
+        await site.start()
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse(heartbeat=self.WS_HEARTBEAT)
+        await ws.prepare(request)
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    break
+                if not msg.data.startswith('id:'):
+                    await ws.send_str('error: expected id:<request_id>')
+                    continue
+                request_id = msg.data[3:]
+                try:
+                    await self.balance_monitor.watch(ws, request_id)
+                except Exception as e:
+                    self.logger.info(f'cannot watch request {request_id}: {repr(e)}')
+                    await ws.send_str('unknown request')
+        finally:
+            self.balance_monitor.unwatch(ws)
+        return ws
@@ -23,9 +23,13 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import calendar
 import hashlib
+import json
+import os
 import time
 from datetime import datetime
+from typing import Dict, List, Optional
 
 from . import util
 from .util import profiler, bh2u
@@ -340,6 +344,118 @@ def load_certificates(ca_path):
     return ca_list, ca_keyID
 
 
+# bump this when the format of the CA index changes
+CA_INDEX_VERSION = 1
+
+
+class CAStore:
+    """Trusted CA certificates, by fingerprint, and their fingerprints by keyID.
+
+    Behaves like the ca_list and ca_keyID dicts returned by
+    load_certificates, but certificates are only parsed when they are
+    used. The entries are kept in an index, which can be saved to disk
+    and reused as long as the bundle does not change.
+    """
+
+    def __init__(self, entries: List[dict], bundle_hash: Optional[str] = None):
+        self.entries = entries
+        self.bundle_hash = bundle_hash
+        self._ders = {}  # type: Dict[bytes, bytes]
+        self._parsed = {}  # type: Dict[bytes, X509]
+        self.key_ids = {}  # type: Dict[str, bytes]
+        now = time.time()
+        for entry in entries:
+            if not (entry['not_before'] <= now < entry['not_after']):
+                continue
+            fp = bytes.fromhex(entry['fingerprint'])
+            self._ders[fp] = bytes.fromhex(entry['der'])
+            self.key_ids[entry['key_id']] = fp
+
+    def __len__(self):
+        return len(self._ders)
+
+    def __contains__(self, fp: bytes):
+        return fp in self._ders
+
+    def __getitem__(self, fp: bytes) -> 'X509':
+        x = self._parsed.get(fp)
+        if x is None:
+            x = self._parsed[fp] = X509(self._ders[fp])
+        return x
+
+    def get(self, fp: bytes, default=None) -> Optional['X509']:
+        return self[fp] if fp in self._ders else default
+
+    @classmethod
+    def from_bundle(cls, data: bytes, bundle_hash: Optional[str] = None) -> 'CAStore':
+        from . import pem
+        entries = []
+        for b in pem.dePemList(data.decode('utf-8'), "CERTIFICATE"):
+            try:
+                x = X509(b)
+            except BaseException as e:
+                _logger.info(f"cert error: {e}")
+                continue
+            entries.append({
+                'fingerprint': x.getFingerprint().hex(),
+                'key_id': x.get_keyID(),
+                'not_before': calendar.timegm(x.notBefore),
+                'not_after': calendar.timegm(x.notAfter),
+                'der': bytes(b).hex(),
+            })
+        return cls(entries, bundle_hash)
+
+
+def _index_matches_bundle(entries: List[dict], data: bytes) -> bool:
+    """Whether each entry of a CA index holds a certificate of the bundle,
+    under its own fingerprint. The other fields of an entry are derived
+    from the certificate; they are checked when it is used.
+    """
+    from . import pem
+    ders = set(bytes(b) for b in pem.dePemList(data.decode('utf-8'), "CERTIFICATE"))
+    for entry in entries:
+        der = bytes.fromhex(entry['der'])
+        if der not in ders or hashlib.sha1(der).hexdigest() != entry['fingerprint']:
+            return False
+    return True
+
+
+@profiler
+def load_ca_store(ca_path: str, index_path: Optional[str] = None) -> CAStore:
+    """Loads the CA bundle at ca_path, using the index at index_path
+    if it was built from the same bundle, and (re)writing it otherwise.
+    """
+    with open(ca_path, 'rb') as f:
+        data = f.read()
+    bundle_hash = hashlib.sha256(data).hexdigest()
+    if index_path:
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.loads(f.read())
+            if index.get('version') == CA_INDEX_VERSION and index.get('bundle_hash') == bundle_hash:
+                if _index_matches_bundle(index['certificates'], data):
+                    return CAStore(index['certificates'], bundle_hash)
+                _logger.info("CA index does not match the bundle")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            _logger.info(f"cannot read CA index: {e!r}")
+    store = CAStore.from_bundle(data, bundle_hash)
+    if index_path:
+        index = {
+            'version': CA_INDEX_VERSION,
+            'bundle_hash': bundle_hash,
+            'certificates': store.entries,
+        }
+        temp_path = "%s.tmp.%s" % (index_path, os.getpid())
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(index))
+            os.replace(temp_path, index_path)
+        except OSError as e:
+            _logger.info(f"cannot write CA index: {e!r}")
+    return store
+
 if __name__ == "__main__":
     import certifi
 